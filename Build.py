@@ -0,0 +1,275 @@
+#!/bin/python3
+"""
+Pack the scripts Configure.py runs on remote hosts, and optionally pure-Python packages, into one versioned
+zipapp: dist/AutoSan-<version>-<digest>.pyz.  The bundle carries the bytecode of every module, so a host needs one
+file (plus Options.json next to it) and a bare python3 instead of the repository tree and a virtualenv.
+
+    python3 Build.py                                  # build the bundle (an identical one is reused)
+    python3 Build.py --with requests                  # also bundle a pure-Python package, installed with pip
+    python3 Build.py --python /usr/bin/python3.8      # bytecode and packages for another interpreter
+    python3 Build.py --check-imports --budget 50      # fail when a module imports too slowly or too much
+
+Scripts are flattened into the root of the archive, as in /tmp/ez_scripts, and run through Launcher.py:
+python3 AutoSan-<version>-<digest>.pyz Optimize.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import zipfile
+
+from Executor import LocalExecutor
+from Launcher import bytecode
+
+BUNDLE_NAME = "AutoSan"
+DIST_DIR = "dist"
+SHEBANG = b"#!/usr/bin/env python3\n"
+# Fixed entry timestamps keep the archive byte-for-byte identical for identical contents
+ENTRY_DATE = (1980, 1, 1, 0, 0, 0)
+
+# Runnable through the launcher
+SCRIPTS = [
+    "MLXDriverConfig/DriverConfig.py",
+    "MLXDriverConfig/QosPlan.py",
+    "ESXi/Optimize.py",
+    "ESXi/RDMA.py",
+    "TrueNas/EnableISER.py",
+    "TrueNas/ModulePlan.py",
+    "TrueNas/CreateZvols.py",
+    "TrueNas/BlocksizeAdvisor.py",
+    "TrueNas/TuneZfs.py",
+    "TrueNas/TuneNetwork.py",
+    "TrueNas/AutoTuneNic.py",
+    "TrueNas/ScstMonitor.py",
+    "TrueNas/ScstExporter.py",
+    "TrueNas/GenerateScstConf.py",
+    "TrueNas/ScstReconcile.py",
+    "TrueNas/API/CreateISCSITarget.py",
+    "TrueNas/API/ReconcileISCSI.py",
+    "VM/ResizeDisk.py",
+    "VM/TuneBlockQueues.py",
+    "VM/GenerateInitiatorConf.py",
+    "VM/IscsiLogin.py",
+]
+# Imported by the scripts only
+LIBRARIES = [
+    "OptionsFile.py",
+    "TrueNas/API/TrueNasClient.py",
+    "TrueNas/API/TrueNasWebSocket.py",
+]
+PACKAGES = ["Executor"]
+
+# Importing a module may take this long (cumulative, including what it imports) ...
+IMPORT_BUDGET_MS = 50
+# Fastest of this many imports counts, so a busy machine does not fail the check
+IMPORT_RUNS = 3
+# ... and must not load these: they belong inside the functions that need them
+HEAVY_MODULES = ("paramiko", "cryptography", "nacl", "cffi", "requests", "urllib3", "websocket", "pyVmomi", "pyVim")
+# Modules outside the bundle held to the same rules
+CHECKED_TREE_MODULES = ["Configure"]
+
+executor = LocalExecutor(timeout=60)
+
+
+class BuildError(Exception):
+    pass
+
+
+def get_script_path():
+    """
+    Returns the directory path of this script (the repository root).
+    """
+    return os.path.dirname(os.path.realpath(__file__))
+
+
+def module_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def git_version(root):
+    """
+    git describe of the tree, or "unknown" outside a git checkout.
+    """
+    result = executor.run(["git", "-C", root, "describe", "--tags", "--always", "--dirty"], timeout=10)
+    return result.stdout.strip() if result.ok and result.stdout.strip() else "unknown"
+
+
+def collect_sources(root):
+    """
+    Returns {name in the archive: contents}: the scripts and libraries flattened, the packages as directories.
+    """
+    sources = {}
+    for path in SCRIPTS + LIBRARIES:
+        name = os.path.basename(path)
+        if name in sources:
+            raise BuildError(f"{path}: a bundled file is already named {name}")
+        with open(os.path.join(root, path), "rb") as f:
+            sources[name] = f.read()
+    for package in PACKAGES:
+        for directory, subdirectories, files in os.walk(os.path.join(root, package)):
+            subdirectories[:] = sorted(d for d in subdirectories if d != "__pycache__")
+            for file in sorted(files):
+                if file.endswith(".py"):
+                    path = os.path.join(directory, file)
+                    with open(path, "rb") as f:
+                        sources[os.path.relpath(path, root).replace(os.sep, "/")] = f.read()
+    return sources
+
+
+def install_packages(packages, python):
+    """
+    pip install packages (and their dependencies) for python into a scratch directory and return its files as
+    {name in the archive: contents}.  Raises BuildError for compiled extensions: zipimport cannot load them.
+    """
+    import tempfile
+    with tempfile.TemporaryDirectory() as target:
+        result = executor.run([python, "-m", "pip", "install", "--quiet", "--no-compile", "--target", target]
+                              + list(packages), timeout=600)
+        if not result.ok:
+            raise BuildError(f"pip install {' '.join(packages)} failed: {(result.stderr or result.stdout).strip()}")
+        files = {}
+        for directory, subdirectories, names in os.walk(target):
+            subdirectories[:] = sorted(d for d in subdirectories if d not in ("__pycache__", "bin"))
+            for file in sorted(names):
+                path = os.path.join(directory, file)
+                name = os.path.relpath(path, target).replace(os.sep, "/")
+                if file.endswith((".so", ".pyd", ".dylib")):
+                    raise BuildError(f"{name} is a compiled extension; only pure-Python packages can be bundled")
+                with open(path, "rb") as f:
+                    files[name] = f.read()
+        return files
+
+
+def build(root=None, packages=(), output_dir=None, python=None):
+    """
+    Build the bundle and return its path.  The name carries a digest of the contents, so an existing file of
+    that name is the same bundle and is reused.
+    """
+    root = root or get_script_path()
+    output_dir = output_dir or os.path.join(root, DIST_DIR)
+    contents = collect_sources(root)
+    if packages:
+        for name, data in install_packages(packages, python or sys.executable).items():
+            contents.setdefault(name, data)  # The repository's own files win
+    version = git_version(root)
+    with open(os.path.join(root, "Launcher.py"), "rb") as f:
+        contents["__main__.py"] = f.read()
+    contents["_bundle.py"] = (f"VERSION = {version!r}\n"
+                              f"SCRIPTS = {[module_name(path) for path in SCRIPTS]!r}\n").encode()
+
+    digest = hashlib.sha256()
+    for name in sorted(contents):
+        digest.update(name.encode() + b"\0" + contents[name] + b"\0")
+    path = os.path.join(output_dir, f"{BUNDLE_NAME}-{version}-{digest.hexdigest()[:10]}.pyz")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(output_dir, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"  # Parallel uploads may build at the same time
+    with open(temporary, "wb") as f:
+        f.write(SHEBANG)
+        with zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for name in sorted(contents):
+                bundle.writestr(zipfile.ZipInfo(name, ENTRY_DATE), contents[name], zipfile.ZIP_DEFLATED)
+                if name.endswith(".py"):
+                    bundle.writestr(zipfile.ZipInfo(name + "c", ENTRY_DATE), bytecode(contents[name], name),
+                                    zipfile.ZIP_DEFLATED)
+    os.chmod(temporary, 0o755)
+    os.replace(temporary, path)
+    return path
+
+
+def compile_for(path, python):
+    """
+    Replace the bytecode in the bundle with python's (which must be able to run it).
+    """
+    result = executor.run([python, path, "--compile"], timeout=300)
+    if not result.ok:
+        raise BuildError(f"{python} could not compile {path}: {(result.stderr or result.stdout).strip()}")
+    return result.stdout.strip()
+
+
+def import_time(path, module, python):
+    """
+    Import module with path first on sys.path in a fresh interpreter.  Returns (cumulative microseconds,
+    [every module the import loaded]) from -X importtime.
+    """
+    code = f"import sys; sys.path.insert(0, {path!r}); import {module}"
+    result = executor.run([python, "-X", "importtime", "-c", code], timeout=60)
+    if not result.ok:
+        raise BuildError(f"import {module} failed: {(result.stderr.strip().splitlines() or ['timed out'])[-1]}")
+
+    # "import time: self [us] | cumulative | imported package": a module is listed after the modules it imported,
+    # which are indented one level deeper
+    loaded = []
+    cumulative = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, total, field = line.split("|")
+        name = field.strip()
+        if name == module:
+            cumulative = int(total)
+            break
+        if field[1:] == name:
+            loaded = []  # Another top-level import (interpreter startup) ended
+        else:
+            loaded.append(name)
+    if cumulative is None:
+        raise BuildError(f"import {module}: no timing reported")
+    return cumulative, loaded
+
+
+def check_imports(path, python=None, budget_ms=IMPORT_BUDGET_MS, root=None):
+    """
+    Import every module of the bundle at path, and CHECKED_TREE_MODULES from the tree, one interpreter each.
+    Returns the problems found: imports over budget and heavy modules loaded at import time.
+    """
+    python = python or sys.executable
+    root = root or get_script_path()
+    modules = [(path, module_name(name)) for name in SCRIPTS + LIBRARIES] + [(path, package) for package in PACKAGES]
+    modules += [(root, module) for module in CHECKED_TREE_MODULES]
+    problems = []
+    for location, module in modules:
+        microseconds, loaded = min(import_time(location, module, python) for _ in range(IMPORT_RUNS))
+        heavy = sorted({name.split(".")[0] for name in loaded} & set(HEAVY_MODULES))
+        print(f"{module:<22} {microseconds / 1000:7.1f} ms{'  loads ' + ', '.join(heavy) if heavy else ''}")
+        if microseconds > budget_ms * 1000:
+            problems.append(f"{module}: import took {microseconds / 1000:.1f} ms (budget {budget_ms} ms)")
+        if heavy:
+            problems.append(f"{module}: imports {', '.join(heavy)} at load time")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the single-file AutoSan bundle (.pyz).")
+    parser.add_argument("--with", dest="packages", action="append", default=[], metavar="PACKAGE",
+                        help="Also bundle a pure-Python package (pip requirement syntax, repeatable)")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Interpreter the bundle is compiled, installed and checked for (default: this one)")
+    parser.add_argument("--output", default=None, help=f"Output directory (default: {DIST_DIR}/)")
+    parser.add_argument("--check-imports", action="store_true",
+                        help="Fail when a module imports slower than the budget or loads a heavy dependency")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_MS, help="Import-time budget in ms")
+    args = parser.parse_args()
+
+    try:
+        path = build(packages=args.packages, output_dir=args.output, python=args.python)
+        print(f"Built {path} ({os.path.getsize(path) // 1024} KiB)")
+        if os.path.realpath(args.python) != os.path.realpath(sys.executable):
+            print(compile_for(path, args.python))
+        if args.check_imports:
+            problems = check_imports(path, args.python, args.budget)
+            if problems:
+                print("\nImport check failed:\n  " + "\n  ".join(problems))
+                sys.exit(1)
+            print("\nImport check passed.")
+    except BuildError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,21 @@
 import os
 import sys
 import time
-import subprocess
+import json
 
-# Import Paramiko if available
-try:
-    import paramiko
-    paramiko_available = True
-except ImportError:
-    paramiko_available = False
+from Executor import LocalExecutor, SSHExecutor
+
+REMOTE_DIR = "/tmp/ez_scripts"
+# The bundle carries everything the scripts import, so the host's own interpreter is enough
+REMOTE_PYTHON = "python3"
+
+local_executor = LocalExecutor()
+
+
+class UploadError(Exception):
+    """
+    The script bundle could not be built or copied to the remote host.
+    """
 
 
 def get_script_path():
@@ -19,24 +26,20 @@ def get_script_path():
     return os.path.dirname(os.path.realpath(__file__))
 
 
-def get_python_interpreter(connection_type, ssh_client=None):
+def get_python_interpreter(connection_type):
     """
-    Detect the Python interpreter to use on the remote host.
-    Priority:
-    1. Uses /tmp/ez_scripts/.env/venv/bin/python if it exists.
-    2. Falls back to python3.
+    The Python interpreter that runs the scripts: this one locally, python3 on a remote host.
     """
-    try:
-        if connection_type == "local":
-            return sys.executable
-        stdin, stdout, stderr = ssh_client.exec_command(
-            "test -f /tmp/ez_scripts/.env/venv/bin/python && echo 'exists' || echo 'not_found'"
-        )
-        result = stdout.read().decode().strip()
-        return "/tmp/ez_scripts/.env/venv/bin/python" if result == "exists" else "python3"
-    except Exception as e:
-        print(f"Error detecting remote Python interpreter: {e}")
-        return "python3"
+    return sys.executable if connection_type == "local" else REMOTE_PYTHON
+
+
+def paramiko_available():
+    """
+    Whether paramiko is installed, without importing it: with cryptography, nacl and cffi it takes longer to load
+    than the rest of the tool, and local runs never need it.  SSHExecutor.connect() imports it.
+    """
+    import importlib.util
+    return importlib.util.find_spec("paramiko") is not None
 
 
 def is_host_online(host):
@@ -44,13 +47,8 @@ def is_host_online(host):
     Check if the host is online by pinging it.
     """
     print(f"Pinging {host} to check if it is online...")
-    try:
-        ping_count = "-c" if os.name != "nt" else "-n"
-        response = subprocess.run(["ping", ping_count, "1", host], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return response.returncode == 0
-    except Exception as e:
-        print(f"Error while pinging {host}: {e}")
-        return False
+    ping_count = "-c" if os.name != "nt" else "-n"
+    return local_executor.run(["ping", ping_count, "1", host], timeout=10).ok
 
 
 
@@ -78,7 +76,7 @@ def connect_to_remote_host(host):
     Connect to a remote host using SSH.
     Automatically uploads necessary files after a successful connection.
     """
-    if not paramiko_available:
+    if not paramiko_available():
         print("Paramiko library is not available. Exiting.")
         sys.exit(1)
 
@@ -86,180 +84,180 @@ def connect_to_remote_host(host):
     password = input(f"Enter the password for {host} (Leave Empty for Key Auth): ").strip()
 
     try:
-        ssh_client = paramiko.SSHClient()
-        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh_client.connect(hostname=host, username=username, password=password)
+        executor = open_ssh_session(host, username, password)
         print(f"Connected to {host}.")
-        upload_required_files_to_remote(ssh_client, get_script_path(), "/tmp/ez_scripts")
-        return ssh_client
+        upload_bundle(executor)
+        return executor
     except Exception as e:
         print(f"Failed to connect to {host}: {e}")
         sys.exit(1)
 
 
-def upload_required_files_to_remote(ssh_client, local_dir, remote_dir):
+def open_ssh_session(host, username, password):
+    """
+    Open an SSH session without prompting and return an executor on it; raises on failure.
+    """
+    return SSHExecutor.connect(host, username, password)
+
+
+def upload_bundle(executor, force=False):
     """
-    Upload necessary files to the remote host.
+    Upload the single-file bundle of the scripts (built by Build.py, on demand) and Options.json to the remote
+    host.  Bundle names are versioned, so one already on the host is reused unless force is set; Options.json is
+    not part of the bundle and is uploaded every time.  Returns the remote path of the bundle; raises UploadError.
     """
-    files = [
-        "Options.json",
-        "MLXDriverConfig/DriverConfig.py",
-        "ESXi/Optimize.py",
-        "ESXi/RDMA.py",
-        "TrueNas/EnableISER.py",
-        "TrueNas/CreateZvols.py",
-        "VM/ResizeDisk.py",
-    ]
+    import Build  # Only remote runs need it
     try:
-        sftp = ssh_client.open_sftp()
-        try:
-            sftp.mkdir(remote_dir)
-        except IOError:
-            pass  # Directory already exists
-
-        for file in files:
-            local_path = os.path.join(local_dir, file)
-            remote_path = os.path.join(remote_dir, os.path.basename(file))
-            sftp.put(local_path, remote_path)
-            print(f"Uploaded: {local_path} -> {remote_path}")
-        sftp.close()
+        bundle = Build.build(get_script_path())
+    except (Build.BuildError, OSError) as e:
+        raise UploadError(f"Failed to build the script bundle: {e}")
+    remote_bundle = f"{REMOTE_DIR}/{os.path.basename(bundle)}"
+    upload = force or not executor.run(["test", "-f", remote_bundle], timeout=30).ok
+
+    options_file = os.path.join(get_script_path(), "Options.json")
+    transfers = [(options_file, f"{REMOTE_DIR}/Options.json")]
+    if upload:
+        transfers.insert(0, (bundle, remote_bundle))
+    try:
+        executor.upload(transfers, on_file=lambda local_path, remote_path:
+                        print(f"Uploaded: {local_path} -> {remote_path}"))
     except Exception as e:
-        print(f"Failed to upload files to remote: {e}")
-        sys.exit(1)
+        raise UploadError(f"Failed to upload files to remote: {e}")
+    if upload:
+        # Store bytecode for the host's interpreter in the bundle, once, instead of compiling on every start
+        result = executor.run([REMOTE_PYTHON, remote_bundle, "--compile"], timeout=300)
+        print(result.stdout.strip() if result.ok else
+              f"Bytecode not compiled: {(result.stderr or 'timed out').strip()}")
+    return remote_bundle
+
+
+def run_script(connection_type, executor, directory, script_name):
+    """
+    Run one of the scripts interactively, from the tree when local or from the bundle when remote.
+    """
+    python_interpreter = get_python_interpreter(connection_type)
+    if connection_type == "local":
+        command = [python_interpreter, os.path.join(get_script_path(), directory, script_name)]
+    else:
+        command = [python_interpreter, upload_bundle(executor), os.path.splitext(script_name)[0]]
+    returncode, _ = executor.run_interactive(command)
+    if returncode != 0:
+        raise RuntimeError(f"{script_name} exited with status {returncode}")
 
 
-def configure_driver(connection_type, ssh_client=None):
+def offer_reboot(connection_type, executor, message):
+    """
+    Ask whether to reboot the host; if so, reboot it and exit.
+    """
+    if input(f"\n{message} Do you want to reboot the host? (yes/no): ").strip().lower() != "yes":
+        return
+    if connection_type == "local":
+        print("Rebooting the local machine...")
+        print("Reboot in progress...")
+        executor.run(["reboot"])
+        sys.exit(0)  # Exit after sending the reboot command
+    print("Rebooting the remote host...")
+    executor.run(["reboot"], timeout=10)  # The connection may drop before reboot returns
+    print("Reboot in progress...")
+    executor.close()  # Close the SSH connection immediately after issuing the reboot command
+    sys.exit(0)  # Exit the program since no further waiting is needed
+
+
+def configure_driver(connection_type, executor):
     """
     Configure drivers using DriverConfig.py.
     After configuration, ask if the user wants to reboot the host.
     """
     try:
-        python_interpreter = get_python_interpreter(connection_type, ssh_client)
-        if connection_type == "local":
-            script = os.path.join(get_script_path(), "MLXDriverConfig", "DriverConfig.py")
-            subprocess.run([python_interpreter, script], check=True)
-        else:
-            remote_script = "/tmp/ez_scripts/DriverConfig.py"
-            command = f"{python_interpreter} {remote_script}"
-            execute_remote_command(ssh_client, command)
-
-        # Ask user if they want to reboot the host
-        if input("\nDriver configuration complete. Do you want to reboot the host? (yes/no): ").strip().lower() == "yes":
-            if connection_type == "local":
-                print("Rebooting the local machine...")
-                print("Reboot in progress...")
-                os.system("reboot")
-                sys.exit(0)  # Exit after sending the reboot command
-            else:
-                print("Rebooting the remote host...")
-                execute_remote_command(ssh_client, "reboot", allow_input=True)
-                print("Reboot in progress...")
-                ssh_client.close()  # Close SSH client immediately after issuing reboot command
-                sys.exit(0)  # Exit the program since no further waiting is needed
-
+        run_script(connection_type, executor, "MLXDriverConfig", "DriverConfig.py")
+        offer_reboot(connection_type, executor, "Driver configuration complete.")
     except Exception as e:
         print(f"Error while configuring drivers: {e}")
 
 
-def check_maintenance_mode(ssh_client):
+def check_maintenance_mode(executor):
     """
     Check if the host is in maintenance mode using esxcli.
     """
-    try:
-        command = "esxcli system maintenanceMode get"
-        print("Checking if the host is in maintenance mode...")
-        result = execute_remote_command(ssh_client, command)
-
-        if result.lower() != "enabled":
-            print("The host is NOT in maintenance mode. Returning to the main menu.")
-            return False
-        return True
-    except Exception as e:
-        print(f"Error while checking maintenance mode: {e}")
+    print("Checking if the host is in maintenance mode...")
+    result = executor.run(["esxcli", "system", "maintenanceMode", "get"], timeout=30)
+    if not result.ok:
+        print(f"Error while checking maintenance mode: {(result.stderr or result.stdout).strip() or 'timed out'}")
         return False
+    if result.stdout.strip().lower() != "enabled":
+        print("The host is NOT in maintenance mode. Returning to the main menu.")
+        return False
+    return True
 
 
-def execute_truenas_script(connection_type, ssh_client, script_name):
+def execute_truenas_script(connection_type, executor, script_name):
     """
     Execute a TrueNAS script by name.
     """
     try:
-        python_interpreter = get_python_interpreter(connection_type, ssh_client)
-        if connection_type == "local":
-            script = os.path.join(get_script_path(), "TrueNas", script_name)
-            subprocess.run([python_interpreter, script], check=True)
-        else:
-            remote_script = f"/tmp/ez_scripts/{script_name}"
-            command = f"{python_interpreter} {remote_script}"
-            execute_remote_command(ssh_client, command)
+        run_script(connection_type, executor, "TrueNas", script_name)
     except Exception as e:
         print(f"Error executing TrueNAS script {script_name}: {e}")
 
 
-def handle_interactive_session(stdin, stdout):
+def grow_remote_disks(host, username, password):
     """
-    Handles input/output for interactive sessions.
-    Provides input from the user for remote scripts requiring interaction.
-    Returns the output of the interactive session.
+    Run ResizeDisk.py --auto on one VM and return its JSON summary.
     """
-    output = ""  # Initialize output to capture all the remote responses
+    executor = open_ssh_session(host, username, password)
     try:
-        while not stdout.channel.exit_status_ready():
-            if stdout.channel.recv_ready():
-                # Read and capture stdout from the remote command
-                data = stdout.channel.recv(1024).decode()
-                output += data
-                print(data, end="")
-
-                # If the remote script prompts for input, collect and send user input
-                if data.strip().endswith((":", "?", ">")):
-
-                    user_input = input("Input required (for remote): ").strip()
-                    stdin.write(user_input + "\n")
-                    stdin.flush()
-        return output
-    except KeyboardInterrupt:
-        print("\nInteractive session interrupted by user.")
-        raise
-    except Exception as e:
-        print(f"Error during interactive session: {e}")
-        return output  # Return the output collected so far
+        remote_bundle = upload_bundle(executor)
+        result = executor.run([get_python_interpreter("remote"), remote_bundle, "ResizeDisk", "--auto", "--json"])
+        output = result.stdout.strip()
+        if not output:
+            raise RuntimeError(result.stderr.strip() or f"ResizeDisk.py exited with status {result.returncode}")
+        return json.loads(output.splitlines()[-1])
+    finally:
+        executor.close()
 
 
-def execute_remote_command(ssh_client, command, allow_input=True):
+def grow_vm_disks(hosts, username, password, max_workers=16):
     """
-    Execute a command on a remote host via SSH.
-    If allow_input=True, handle interactive input/output between the remote shell and the user.
+    Grow the disks of many VMs at once after their virtual disks were extended.
     """
-    stdin, stdout, stderr = ssh_client.exec_command(command, get_pty=allow_input)
+    if not paramiko_available():
+        print("Paramiko library is not available.")
+        return
+    from concurrent.futures import ThreadPoolExecutor
+
+    def grow(host):
+        try:
+            return host, grow_remote_disks(host, username, password), None
+        except Exception as e:
+            return host, None, e
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(hosts)))) as executor:
+        for host, summary, error in executor.map(grow, hosts):
+            if error is not None or summary["errors"]:
+                failed += 1
+                print(f"{host}: FAILED {error if error is not None else '; '.join(summary['errors'])}")
+            elif summary["grown"]:
+                print(f"{host}: grew {', '.join(summary['grown'])}")
+            else:
+                print(f"{host}: nothing to grow")
+    print(f"\nDisk growth finished on {len(hosts) - failed} of {len(hosts)} hosts.")
 
-    output = ""  # Initialize output to avoid undefined variable error
-    try:
-        if allow_input:
-            output = handle_interactive_session(stdin, stdout)
-        else:
-            output = stdout.read().decode()
-            error = stderr.read().decode()
-            if error:
-                print(f"Error during execution: {error}")
-        return output.strip()
-    except Exception as e:
-        print(f"Error executing remote command: {e}")
-        raise
 
 def show_menu():
     """
     Display the main menu.
     """
     print("\nMain Menu:")
-    print("1. Upload All Scripts to Remote Host")
+    print("1. Upload Script Bundle to Remote Host")
     print("2. Configure Drivers")
     print("3. ESXi")
     print("4. TrueNAS")
-    print("5. Exit")
+    print("5. Grow VM Disks (many hosts)")
+    print("6. Exit")
 
 
-def esxi_menu(connection_type, ssh_client):
+def esxi_menu(connection_type, executor):
     """
     Show the ESXi menu.
     """
@@ -270,16 +268,16 @@ def esxi_menu(connection_type, ssh_client):
         print("3. Back to Main Menu")
         choice = input("Select an option (1-3): ").strip()
         if choice == "1":
-            optimize_system(connection_type, ssh_client)
+            optimize_system(connection_type, executor)
         elif choice == "2":
-            configure_rdma_iser(connection_type, ssh_client)
+            configure_rdma_iser(connection_type, executor)
         elif choice == "3":
             break
         else:
             print("Invalid option. Please try again.")
 
 
-def truenas_menu(connection_type, ssh_client=None):
+def truenas_menu(connection_type, executor=None):
     """
     Show the TrueNAS menu.
     """
@@ -287,97 +285,84 @@ def truenas_menu(connection_type, ssh_client=None):
         print("\nTrueNAS Menu:")
         print("1. Enable ISER")
         print("2. Create Zvols")
-        print("3. Back to Main Menu")
-        choice = input("Select an option (1-3): ").strip()
+        print("3. Tune Network Interfaces")
+        print("4. Back to Main Menu")
+        choice = input("Select an option (1-4): ").strip()
         if choice == "1":
-            execute_truenas_script(connection_type, ssh_client, "EnableISER.py")
+            execute_truenas_script(connection_type, executor, "EnableISER.py")
         elif choice == "2":
-            execute_truenas_script(connection_type, ssh_client, "CreateZvols.py")
+            execute_truenas_script(connection_type, executor, "CreateZvols.py")
         elif choice == "3":
+            execute_truenas_script(connection_type, executor, "TuneNetwork.py")
+        elif choice == "4":
             break
         else:
             print("Invalid option. Please try again.")
 
 
-def optimize_system(connection_type, ssh_client=None):
+def optimize_system(connection_type, executor):
     """
     Optimize the system by running Optimize.py.
     After optimization, ask if the user wants to reboot the host.
     """
     try:
-        python_interpreter = get_python_interpreter(connection_type, ssh_client)
-        if connection_type == "local":
-            script = os.path.join(get_script_path(), "ESXi", "Optimize.py")
-            subprocess.run([python_interpreter, script], check=True)
-        else:
-            remote_script = "/tmp/ez_scripts/Optimize.py"
-            command = f"{python_interpreter} {remote_script}"
-            execute_remote_command(ssh_client, command)
-
-        # Ask user if they want to reboot the host
-        if input("\nOptimization complete. Do you want to reboot the host? (yes/no): ").strip().lower() == "yes":
-            if connection_type == "local":
-                print("Rebooting the local machine...")
-                print("Reboot in progress...")
-                os.system("reboot")
-                sys.exit(0)  # Exit after sending the reboot command
-            else:
-                print("Rebooting the remote host...")
-                execute_remote_command(ssh_client, "reboot", allow_input=True)
-                print("Reboot in progress...")
-                ssh_client.close()  # Close SSH client immediately after issuing reboot command
-                sys.exit(0)
+        run_script(connection_type, executor, "ESXi", "Optimize.py")
+        offer_reboot(connection_type, executor, "Optimization complete.")
     except Exception as e:
         print(f"Error optimizing the system: {e}")
 
 
-def configure_rdma_iser(connection_type, ssh_client=None):
+def configure_rdma_iser(connection_type, executor):
     """
     Configure RDMA/iSER by running RDMA.py.
 
     """
     try:
-        python_interpreter = get_python_interpreter(connection_type, ssh_client)
-        if connection_type == "local":
-            script = os.path.join(get_script_path(), "ESXi", "RDMA.py")
-            subprocess.run([python_interpreter, script], check=True)
-        else:
-            remote_script = "/tmp/ez_scripts/RDMA.py"
-            command = f"{python_interpreter} {remote_script}"
-            execute_remote_command(ssh_client, command)
+        run_script(connection_type, executor, "ESXi", "RDMA.py")
     except Exception as e:
         print(f"Error configuring RDMA/iSER: {e}")
 
 
 if __name__ == "__main__":
     print("EZ Configuration Tool for ESXi and TrueNAS (Another Skeen Skript)")
-    ssh_client = None
+    executor = local_executor
 
     connection_type = input("Configure locally or remotely? (local/remote): ").strip().lower()
     if connection_type == "remote":
         host = input("Enter remote host (IP/hostname): ").strip()
         if is_host_online(host):
-            ssh_client = connect_to_remote_host(host)
+            executor = connect_to_remote_host(host)
         else:
             print(f"Host {host} is unreachable.")
             sys.exit(1)
 
     while True:
         show_menu()
-        choice = input("Select an option (1-5): ").strip()
+        choice = input("Select an option (1-6): ").strip()
         if choice == "1":
-            upload_required_files_to_remote(ssh_client, get_script_path(), "/tmp/ez_scripts") if ssh_client else print("Remote only.")
+            if connection_type != "remote":
+                print("Remote only.")
+                continue
+            try:
+                upload_bundle(executor, force=True)
+            except UploadError as e:
+                print(e)
         elif choice == "2":
-            configure_driver(connection_type, ssh_client)
+            configure_driver(connection_type, executor)
         elif choice == "3":
-            if check_maintenance_mode(ssh_client) == True:
-                esxi_menu(connection_type, ssh_client)
+            if check_maintenance_mode(executor) == True:
+                esxi_menu(connection_type, executor)
         elif choice == "4":
-            truenas_menu(connection_type, ssh_client)
+            truenas_menu(connection_type, executor)
         elif choice == "5":
+            hosts = [host.strip() for host in input("Enter VM hosts (comma-separated): ").split(",") if host.strip()]
+            if hosts:
+                username = input("Enter the username for the VMs: ").strip()
+                password = input("Enter the password for the VMs (Leave Empty for Key Auth): ").strip()
+                grow_vm_disks(hosts, username, password)
+        elif choice == "6":
             print("Exiting. Goodbye!")
-            if ssh_client:
-                ssh_client.close()
+            executor.close()
             sys.exit(0)
         else:
             print("Invalid option. Please try again.")
\ No newline at end of file
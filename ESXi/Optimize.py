@@ -1,10 +1,24 @@
-import subprocess
+import os
 import json
+import sys
+
+# QosPlan.py sits beside this script once uploaded, or in MLXDriverConfig/ in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "MLXDriverConfig"))
+from QosPlan import compile_esxi_parameters, load_valid_qos_spec
+
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+
+executor = LocalExecutor(timeout=15)
 
 
 def get_user_inputs():
     """
     Get user input for optimization parameters with validation against minimum and maximum allowed values.
+    trust_state is not prompted for; it comes from the QoS plan ("qos" in Options.json).
     :return: A dictionary containing all validated user inputs for the optimization parameters.
     esxcli system module parameters set -m nmlx5_core -p 'max_vfs=8 GEN_RSS=4 RSS=16 DRSS=32 DYN_RSS=1 max_queues=32'
     More conservative:
@@ -17,7 +31,6 @@ def get_user_inputs():
         "DYN_RSS": {"min": 0, "max": 1},
         "DRSS": {"min": 1, "max": 32},
         "GEN_RSS":{"min":0, "max": 4},
-        "trust_state": {"min",1, "max":2 }
     }
     user_inputs = {}
     print("Welcome to ESXi Optimization Configuration!")
@@ -43,32 +56,28 @@ def get_user_inputs():
 
 def execute_command(command):
     """
-    Execute a shell command and return the output using subprocess with a 15-second timeout.
+    Execute a command (argv list, no shell) with a 15-second timeout.
     :param command: Command to be executed.
-    :return: Output of the command execution or None if an error occurs.
+    :return: Output of the command execution ("" if it printed nothing) or None if an error occurs.
     """
-    try:
-        result = subprocess.run(command, shell=True, text=True, capture_output=True, timeout=15)
-        if result.returncode != 0:
-            print(f"Command failed with return code {result.returncode}: {result.stderr.strip()}")
-            return None
-        return result.stdout.strip() if result.stdout else None
-    except subprocess.TimeoutExpired:
-        print(f"Error: Command '{command}' timed out after 15 seconds.")
+    result = executor.run(command)
+    if result.timed_out:
+        print(f"Error: Command '{' '.join(command)}' timed out after 15 seconds.")
         return None
-    except Exception as e:
-        print(f"Unexpected error executing command '{command}': {e}")
+    if not result.ok:
+        print(f"Command failed with return code {result.returncode}: {result.stderr.strip()}")
         return None
+    return result.stdout.strip()
 
 
 def execute_commands(commands, execute_command_fn):
     """
     Helper function to execute a list of commands using the provided command execution function.
-    :param commands: List of shell commands to execute.
+    :param commands: List of commands (argv lists) to execute.
     :param execute_command_fn: Function that executes a command and returns its output.
     """
     for command in commands:
-        print(f"Executing: {command}")
+        print(f"Executing: {' '.join(command)}")
         output = execute_command_fn(command)
         if output:
             print(output)
@@ -80,77 +89,86 @@ def optimize_esxi():
     """
     print("Starting ESXi optimization...")
     user_inputs = get_user_inputs()
+    qos_parameters = compile_esxi_parameters(load_valid_qos_spec())
     required_modules = ["nmlx5_core", "nmlx5_rdma", "iser", "vrdma"]
     print("\nChecking and loading required kernel modules...")
+    module_list = execute_command(["esxcli", "system", "module", "list"]) or ""
+    loaded_modules = {line.split()[0].lower() for line in module_list.splitlines()
+                      if len(line.split()) > 1 and line.split()[1].lower() == "true"}
     for module in required_modules:
-        output = execute_command(f"esxcli system module list | grep -i {module}")
-        if "true" not in output.lower():
+        if module not in loaded_modules:
             print(f"Loading {module} module...")
-            execute_command(f"esxcli system module load -m {module}")
+            execute_command(["esxcli", "system", "module", "load", "-m", module])
         else:
             print(f"{module} module is already loaded.")
     print("\nSetting parameters for nmlx5_core module...")
-    execute_command((
-        f'esxcli system module parameters set -m nmlx5_core '
-        f'-p "max_vfs={user_inputs["max_vfs"]} '
-        f'max_queues={user_inputs["max_queues"]} RSS={user_inputs["RSS"]} '
-        f'DYN_RSS={user_inputs["DYN_RSS"]} DRSS={user_inputs["DRSS"]} GEN_RSS={user_inputs["GEN_RSS"]} trust_state={user_inputs["trust_state"]}"'
-    ))
-    print("\nSetting nmlx5_rdma priority 3...")
-    execute_command("esxcli system module parameters set -m nmlx5_rdma")
+    # `parameters set` replaces the whole list, so trust and PFC from the QoS plan go in the same call
+    qos_core = " ".join(f"{key}={value}" for key, value in qos_parameters["nmlx5_core"].items())
+    execute_command([
+        "esxcli", "system", "module", "parameters", "set", "-m", "nmlx5_core",
+        "-p", f'max_vfs={user_inputs["max_vfs"]} '
+              f'max_queues={user_inputs["max_queues"]} RSS={user_inputs["RSS"]} '
+              f'DYN_RSS={user_inputs["DYN_RSS"]} DRSS={user_inputs["DRSS"]} GEN_RSS={user_inputs["GEN_RSS"]} {qos_core}'
+    ])
     print("\nVerifying nmlx5_core module parameters...")
-    execute_command("esxcli system module parameters list -m nmlx5_core")
+    execute_command(["esxcli", "system", "module", "parameters", "list", "-m", "nmlx5_core"])
     print("\nIncreasing iSER Max Command Queue")
-    execute_command("esxcli system module parameters set -m iser -p 'iser_LunQDepth=254'")
+    execute_command(["esxcli", "system", "module", "parameters", "set", "-m", "iser", "-p", "iser_LunQDepth=254"])
 
 
+    qos_rdma = " ".join(f"{key}={value}" for key, value in qos_parameters["nmlx5_rdma"].items())
+    advanced = ["esxcli", "system", "settings", "advanced", "set", "-o"]
     iscsi_commands = [
-        "esxcli system module parameters set -m nmlx5_rdma -p 'enable_nmlx_debug=1 dscp_force=48'",
-        "esxcli system settings advanced set -o /ISCSI/SocketRcvBufLenKB -i 2048",
-        "esxcli system settings advanced set -o /ISCSI/SocketSndBufLenKB -i 2048",
-        "esxcli system settings advanced set -o /Disk/SchedQControlSeqReqs -i 128",
-        "esxcli system settings advanced set -o /ISCSI/MaxIoSizeKB -i 256", # this is regular iscsi's max
-        "esxcli system settings advanced set -o /Net/NetSchedHClkMQ -i 1",
-        "esxcli system module parameters set -m iscsi_vmk -p 'iscsivmk_LunQDepth=128 iscsivmk_HostQDepth=1024 iscsivmk_InitialR2T=1 iscsivmk_MaxChannels=4 iscsivmk_MaxR2T=4 iscsivmk_ImmData=1'",
-        "esxcli system settings advanced set -o /Disk/SchedCostUnit -i 65536",
-        "esxcli system settings advanced set -o /Disk/SchedQCleanupInterval -i 120",
-        "esxcli system settings advanced set -o /Disk/QFullThreshold -i 8",
-        "esxcli system settings advanced set -o /Disk/ReqCallThreshold -i 8",
-        "esxcli system settings advanced set -o /Disk/SchedQuantum -i 16" # use 32 for 32 i/o's a world
+        ["esxcli", "system", "module", "parameters", "set", "-m", "nmlx5_rdma", "-p", f"enable_nmlx_debug=1 {qos_rdma}"],
+        advanced + ["/ISCSI/SocketRcvBufLenKB", "-i", "2048"],
+        advanced + ["/ISCSI/SocketSndBufLenKB", "-i", "2048"],
+        advanced + ["/Disk/SchedQControlSeqReqs", "-i", "128"],
+        advanced + ["/ISCSI/MaxIoSizeKB", "-i", "256"], # this is regular iscsi's max
+        advanced + ["/Net/NetSchedHClkMQ", "-i", "1"],
+        ["esxcli", "system", "module", "parameters", "set", "-m", "iscsi_vmk", "-p",
+         "iscsivmk_LunQDepth=128 iscsivmk_HostQDepth=1024 iscsivmk_InitialR2T=1 iscsivmk_MaxChannels=4 iscsivmk_MaxR2T=4 iscsivmk_ImmData=1"],
+        advanced + ["/Disk/SchedCostUnit", "-i", "65536"],
+        advanced + ["/Disk/SchedQCleanupInterval", "-i", "120"],
+        advanced + ["/Disk/QFullThreshold", "-i", "8"],
+        advanced + ["/Disk/ReqCallThreshold", "-i", "8"],
+        advanced + ["/Disk/SchedQuantum", "-i", "16"] # use 32 for 32 i/o's a world
     ]
     print("\nSetting iSCSI buffers and Queues...")
     execute_commands(iscsi_commands, execute_command)
     tcp_commands = [
-        "esxcli system settings advanced set -o /Net/TcpipHeapMax -i 1024",
-        "esxcli system settings advanced set -o /Net/TcpipHeapSize -i 32",
-        "esxcli system settings advanced set -o /Net/TcpipRxDispatchQueues -i 4"
+        advanced + ["/Net/TcpipHeapMax", "-i", "1024"],
+        advanced + ["/Net/TcpipHeapSize", "-i", "32"],
+        advanced + ["/Net/TcpipRxDispatchQueues", "-i", "4"],
         # For network ring sizes
-        "esxcli network nic ring current set -n vmnic6 -r 1024 -t 1024",
-        "esxcli network nic ring current set -n vmnic7 -r 1024 -t 1024",
-        "esxcli network nic coalesce set -n vmnic6 -t 3 -T 32 -r 3 -R 64",
-        "esxcli network nic coalesce set -n vmnic7 -t 3 -T 32 -r 3 -R 64",
+        ["esxcli", "network", "nic", "ring", "current", "set", "-n", "vmnic6", "-r", "1024", "-t", "1024"],
+        ["esxcli", "network", "nic", "ring", "current", "set", "-n", "vmnic7", "-r", "1024", "-t", "1024"],
+        ["esxcli", "network", "nic", "coalesce", "set", "-n", "vmnic6", "-t", "3", "-T", "32", "-r", "3", "-R", "64"],
+        ["esxcli", "network", "nic", "coalesce", "set", "-n", "vmnic7", "-t", "3", "-T", "32", "-r", "3", "-R", "64"],
     ]
     print("\nSetting TCP/IP stack and receive queue configurations...")
     execute_commands(tcp_commands, execute_command)
 
     print("\nSetting Path options for AULA and PSP")
     alua_commands = [
-#         "esxcli storage nmp satp rule add -s VMW_SATP_ALUA -c tpgs_on -P VMW_PSP_FIXED -e 'CTMS DC' -f",
-        "esxcli storage nmp satp rule add -s VMW_SATP_ALUA -V 'CTMS-SAN' -c tpgs_on -O 'policy=latency;samplingCycles=32;latencyEvalTime=180000;useANO=1' -P VMW_PSP_RR -o throttle_sll -e 'CTMS DC RR' -f",
-#         "esxcli storage nmp satp set -s VMW_SATP_ALUA -P VMW_PSP_FIXED -b"
-        "esxcli storage nmp satp set -s VMW_SATP_ALUA -P VMW_PSP_RR -b"
+#         ["esxcli", "storage", "nmp", "satp", "rule", "add", "-s", "VMW_SATP_ALUA", "-c", "tpgs_on", "-P", "VMW_PSP_FIXED", "-e", "CTMS DC", "-f"],
+        ["esxcli", "storage", "nmp", "satp", "rule", "add", "-s", "VMW_SATP_ALUA", "-V", "CTMS-SAN", "-c", "tpgs_on",
+         "-O", "policy=latency;samplingCycles=32;latencyEvalTime=180000;useANO=1", "-P", "VMW_PSP_RR", "-o", "throttle_sll",
+         "-e", "CTMS DC RR", "-f"],
+#         ["esxcli", "storage", "nmp", "satp", "set", "-s", "VMW_SATP_ALUA", "-P", "VMW_PSP_FIXED", "-b"],
+        ["esxcli", "storage", "nmp", "satp", "set", "-s", "VMW_SATP_ALUA", "-P", "VMW_PSP_RR", "-b"]
     ]
     execute_commands(alua_commands, execute_command)
 
     print("\nSetting VAAI Rules")
+    claimrule = ["esxcli", "storage", "core", "claimrule"]
     vaai_commands = [
-        "esxcli storage core claimrule add -t vendor -V 'LIO-ORG' -P VAAI_FILTER -c Filter --autoassign",
-        "esxcli storage core claimrule add -t vendor -V 'CTMS-SAN' -P VAAI_FILTER -c Filter --autoassign",
-        "esxcli storage core claimrule load -c Filter",
-        "esxcli storage core claimrule add -t vendor -V 'LIO-ORG' -P VMW_VAAIP_T10 -c VAAI --autoassign -e -a -s",
-        "esxcli storage core claimrule add -t vendor -V 'CTMS-SAN' -P VMW_VAAIP_T10 -c VAAI --autoassign -e -a -s",
-        "esxcli storage core claimrule load -c VAAI",
-        "esxcli storage core claimrule run --claimrule-class=Filter"
+        claimrule + ["add", "-t", "vendor", "-V", "LIO-ORG", "-P", "VAAI_FILTER", "-c", "Filter", "--autoassign"],
+        claimrule + ["add", "-t", "vendor", "-V", "CTMS-SAN", "-P", "VAAI_FILTER", "-c", "Filter", "--autoassign"],
+        claimrule + ["load", "-c", "Filter"],
+        claimrule + ["add", "-t", "vendor", "-V", "LIO-ORG", "-P", "VMW_VAAIP_T10", "-c", "VAAI", "--autoassign", "-e", "-a", "-s"],
+        claimrule + ["add", "-t", "vendor", "-V", "CTMS-SAN", "-P", "VMW_VAAIP_T10", "-c", "VAAI", "--autoassign", "-e", "-a", "-s"],
+        claimrule + ["load", "-c", "VAAI"],
+        claimrule + ["run", "--claimrule-class=Filter"]
     ]
 
     execute_commands(vaai_commands, execute_command)
@@ -178,7 +196,7 @@ def add_dynamic_discovery():
     Add a dynamic discovery address to an ISCSI/ISER adapter.
     """
     print("\nStarting dynamic discovery configuration for ISCSI/ISER adapters...")
-    adapter_list = execute_command("esxcli iscsi adapter list")
+    adapter_list = execute_command(["esxcli", "iscsi", "adapter", "list"])
     if not adapter_list:
         print("No adapters found or unable to retrieve the list of adapters.")
         return
@@ -211,7 +229,7 @@ def add_dynamic_discovery():
         response = input(f"\nDo you want to add discovery address '{address}' to adapter '{selected_adapter}'? (yes/no): ").strip().lower()
         if response in ["yes", "y"]:
             print(f"Adding discovery address '{address}' to adapter '{selected_adapter}'...")
-            command = f"esxcli iscsi adapter discovery sendtarget add -a {address} -A {selected_adapter}"
+            command = ["esxcli", "iscsi", "adapter", "discovery", "sendtarget", "add", "-a", address, "-A", selected_adapter]
             result = execute_command(command)
             if result is not None:
                 print(f"Successfully added discovery address '{address}' to adapter '{selected_adapter}'.")
@@ -249,5 +267,5 @@ def show_main_menu():
             print("\nInvalid choice. Please select a valid option (1-3).")
 
 
-# Start the menu
-show_main_menu()
\ No newline at end of file
+if __name__ == "__main__":
+    show_main_menu()
\ No newline at end of file
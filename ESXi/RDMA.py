@@ -1,5 +1,13 @@
+import os
 import sys
-import subprocess
+
+try:
+    from Executor import CommandError, LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import CommandError, LocalExecutor
+
+executor = LocalExecutor(timeout=15)
 
 
 def check_and_load_iser_module():
@@ -8,45 +16,41 @@ def check_and_load_iser_module():
     """
     print("Checking if 'iser' module is loaded...")
     command_check = ["esxcli", "system", "module", "list"]
-    try:
-        result = subprocess.run(command_check, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=15)
-        if result.returncode != 0:
-            print(f"Failed to check system modules. Error: {result.stderr.strip()}")
-            return False
-
-        # Check if the 'iser' module is present and loaded
-        iser_loaded = False
-        for line in result.stdout.strip().split("\n"):
-            if "iser" in line and "true" in line.lower():
-                iser_loaded = True
-                break
-
-        if not iser_loaded:
-            print("'iser' module is not loaded.")
-            load = input("Would you like to attempt to load the 'iser' module? (yes/no): ").strip().lower()
-            if load in ["yes", "y"]:
-                command_load = ["esxcli", "system", "module", "load", "-m", "iser"]
-                load_result = subprocess.run(command_load, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=15)
-                if load_result.returncode == 0:
-                    print("'iser' module successfully loaded.")
-                    return True
-                else:
-                    print(f"Failed to load 'iser' module. Error: {load_result.stderr.strip()}")
-                    return False
-            else:
-                print("Skipping 'iser' module loading.")
-                return False
-        else:
-            print("'iser' module is already loaded.")
-            return True
-
-    except subprocess.TimeoutExpired:
+    result = executor.run(command_check)
+    if result.timed_out:
         print("The operation to check/load 'iser' module has timed out.")
         return False
-    except Exception as e:
-        print(f"An error occurred while checking/loading 'iser' module: {e}")
+    if not result.ok:
+        print(f"Failed to check system modules. Error: {result.stderr.strip()}")
         return False
 
+    # Check if the 'iser' module is present and loaded
+    iser_loaded = False
+    for line in result.stdout.strip().split("\n"):
+        if "iser" in line and "true" in line.lower():
+            iser_loaded = True
+            break
+
+    if iser_loaded:
+        print("'iser' module is already loaded.")
+        return True
+
+    print("'iser' module is not loaded.")
+    load = input("Would you like to attempt to load the 'iser' module? (yes/no): ").strip().lower()
+    if load not in ["yes", "y"]:
+        print("Skipping 'iser' module loading.")
+        return False
+    command_load = ["esxcli", "system", "module", "load", "-m", "iser"]
+    load_result = executor.run(command_load)
+    if load_result.timed_out:
+        print("The operation to check/load 'iser' module has timed out.")
+        return False
+    if load_result.ok:
+        print("'iser' module successfully loaded.")
+        return True
+    print(f"Failed to load 'iser' module. Error: {load_result.stderr.strip()}")
+    return False
+
 
 def list_rdma_devices():
     """
@@ -54,27 +58,23 @@ def list_rdma_devices():
     """
     print("Fetching available RDMA devices...")
     command = ["esxcli", "rdma", "device", "list"]
-    try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=15)
-        if result.returncode != 0:
-            error_message = result.stderr.strip()
-            print(f"Failed to fetch RDMA devices. Error: {error_message}")
-            return []
-
-        devices = []
-        lines = result.stdout.strip().split("\n")
-        for line in lines[2:]:  # Skip the first two lines (header)
-            parts = line.split()
-            if len(parts) > 0:
-                devices.append(parts[0])  # Assuming the device name is the first column
-        return devices
-    except subprocess.TimeoutExpired:
+    result = executor.run(command)
+    if result.timed_out:
         print("The operation to list RDMA devices has timed out.")
         return []
-    except Exception as e:
-        print(f"An error occurred while listing RDMA devices: {e}")
+    if not result.ok:
+        error_message = result.stderr.strip()
+        print(f"Failed to fetch RDMA devices. Error: {error_message}")
         return []
 
+    devices = []
+    lines = result.stdout.strip().split("\n")
+    for line in lines[2:]:  # Skip the first two lines (header)
+        parts = line.split()
+        if len(parts) > 0:
+            devices.append(parts[0])  # Assuming the device name is the first column
+    return devices
+
 
 def enable_rdma_iser_local(device):
     """
@@ -82,25 +82,21 @@ def enable_rdma_iser_local(device):
     """
     print(f"Enabling RDMA/iSER locally for device: {device}...")
     command = ["esxcli", "rdma", "iser", "add", "-d", device]
-    try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=15)
-        if result.returncode != 0:
-            error_message = result.stderr.strip()
-            print(f"Failed to enable RDMA/iSER for device {device}.\nError: {error_message}")
-            return False
-        print(f"Successfully enabled RDMA/iSER for device {device}.")
-        print(
-            "\n** Next Step Required **"
-            "\nPlease log into the vSphere Client and bind the RDMA adapter to a VMkernel (VMK) interface."
-            "\nThis step is necessary for the RDMA/iSER configuration to become active."
-        )
-        return True
-    except subprocess.TimeoutExpired:
+    result = executor.run(command)
+    if result.timed_out:
         print(f"The operation to enable RDMA/iSER for device {device} has timed out.")
         return False
-    except Exception as e:
-        print(f"An error occurred while enabling RDMA/iSER locally for device {device}: {e}")
+    if not result.ok:
+        error_message = result.stderr.strip()
+        print(f"Failed to enable RDMA/iSER for device {device}.\nError: {error_message}")
         return False
+    print(f"Successfully enabled RDMA/iSER for device {device}.")
+    print(
+        "\n** Next Step Required **"
+        "\nPlease log into the vSphere Client and bind the RDMA adapter to a VMkernel (VMK) interface."
+        "\nThis step is necessary for the RDMA/iSER configuration to become active."
+    )
+    return True
 
 
 def disable_rdma_iser_local(device):
@@ -109,20 +105,16 @@ def disable_rdma_iser_local(device):
     """
     print(f"Disabling RDMA/iSER locally for device: {device}...")
     command = ["esxcli", "rdma", "iser", "delete", "-d", device]
-    try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=15)
-        if result.returncode != 0:
-            error_message = result.stderr.strip()
-            print(f"Failed to disable RDMA/iSER for device {device}.\nError: {error_message}")
-            return False
-        print(f"Successfully disabled RDMA/iSER for device {device}.")
-        return True
-    except subprocess.TimeoutExpired:
+    result = executor.run(command)
+    if result.timed_out:
         print(f"The operation to disable RDMA/iSER for device {device} has timed out.")
         return False
-    except Exception as e:
-        print(f"An error occurred while disabling RDMA/iSER locally for device {device}: {e}")
+    if not result.ok:
+        error_message = result.stderr.strip()
+        print(f"Failed to disable RDMA/iSER for device {device}.\nError: {error_message}")
         return False
+    print(f"Successfully disabled RDMA/iSER for device {device}.")
+    return True
 
 
 def get_iscsi_adapters():
@@ -134,7 +126,7 @@ def get_iscsi_adapters():
     """
     try:
         command = ["esxcli", "iscsi", "adapter", "list"]
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        result = executor.run(command, timeout=60, check=True)
         adapters = []
 
         # Extract adapter names from the output
@@ -145,10 +137,8 @@ def get_iscsi_adapters():
                 adapters.append(parts[0])  # Assuming adapter name is the first column
 
         return adapters
-    except subprocess.CalledProcessError as e:
+    except CommandError as e:
         print(f"Failed to retrieve iSCSI adapters. Error: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
 
     return []
 
@@ -167,28 +157,26 @@ def set_iscsi_buffer_size(adapter_name, max_recv=8192, max_xmit=8192):
             "esxcli", "iscsi", "adapter", "param", "set",
             "-A", adapter_name, "-k", "MaxRecvDataSegment", "-v", str(max_recv)
         ]
-        subprocess.run(recv_command, check=True, text=True)
+        executor.run(recv_command, timeout=60, check=True)
         print(f"Set MaxRecvDataSegLen to {max_recv} for adapter {adapter_name}.")
 
         send_command = [
             "esxcli", "iscsi", "adapter", "param", "set",
             "-A", adapter_name, "-k", "MaxBurstLength", "-v", "65536"
         ]
-        subprocess.run(send_command, check=True, text=True)
+        executor.run(send_command, timeout=60, check=True)
 
         first_command = [
             "esxcli", "iscsi", "adapter", "param", "set",
             "-A", adapter_name, "-k", "FirstBurstLength", "-v", "65536"
         ]
-        subprocess.run(first_command, check=True, text=True)
+        executor.run(first_command, timeout=60, check=True)
         print(f"Set MaxBurstLength to {max_xmit} for adapter {adapter_name}.")
         print(f"Set FirstBurstLength to {max_xmit} for adapter {adapter_name}.")
 
 
-    except subprocess.CalledProcessError as e:
+    except CommandError as e:
         print(f"Failed to set iSCSI buffer sizes for adapter {adapter_name}. Error: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
 
 def configure_all_iscsi_adapters(max_recv=8192, max_xmit=8192):
     """
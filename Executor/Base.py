@@ -0,0 +1,110 @@
+"""
+Result type and the backend-independent part of every executor.
+"""
+
+import time
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class CommandError(Exception):
+    """
+    Raised by run(check=True) when a command fails or times out.
+    """
+
+    def __init__(self, result):
+        if result.timed_out:
+            message = f"{' '.join(result.args)}: timed out after {result.seconds:.0f}s"
+        else:
+            message = f"{' '.join(result.args)}: exit {result.returncode}: {(result.stderr or result.stdout).strip()}"
+        super().__init__(message)
+        self.result = result
+
+
+class Result:
+    """
+    Outcome of one command.  returncode is None when the command could not be started or timed out.
+    """
+
+    def __init__(self, args, returncode, stdout="", stderr="", seconds=0.0, timed_out=False, ok_codes=(0,)):
+        self.args = list(args)
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.seconds = seconds
+        self.timed_out = timed_out
+        self.ok = returncode in ok_codes and not timed_out
+
+    def __repr__(self):
+        return f"Result({self.args!r}, returncode={self.returncode}, ok={self.ok}, seconds={self.seconds:.2f})"
+
+
+def check_argv(args):
+    """
+    Commands are argv lists; a string would need a shell to split it.
+    """
+    if isinstance(args, (str, bytes)) or not args:
+        raise TypeError(f"command must be a non-empty argv list, not {args!r}")
+    return [str(arg) for arg in args]
+
+
+class Executor:
+    """
+    Backends implement _execute(args, timeout, input_text, on_output) and _interact(args).
+
+    timeout is the default per command (None: no limit) and can be overridden per call; max_workers bounds the
+    commands run_many() runs at the same time.
+    """
+
+    def __init__(self, timeout=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, args, timeout=None, input_text=None, check=False, ok_codes=(0,), on_output=None):
+        """
+        Run one command and return its Result.  on_output(line, stream) is called for every line of stdout
+        ("stdout") and stderr ("stderr") as it arrives; the full output is still collected in the Result.
+        """
+        args = check_argv(args)
+        started = time.monotonic()
+        returncode, stdout, stderr, timed_out = self._execute(args, timeout or self.timeout, input_text, on_output)
+        result = Result(args, returncode, stdout, stderr, time.monotonic() - started, timed_out, ok_codes)
+        if check and not result.ok:
+            raise CommandError(result)
+        return result
+
+    def run_interactive(self, args):
+        """
+        Run a command the user talks to (prompts, menus).  Returns (returncode, output captured, if any).
+        """
+        return self._interact(check_argv(args))
+
+    def run_many(self, commands, max_workers=None, **kwargs):
+        """
+        Run many commands concurrently (at most max_workers at a time).  Returns their Results in order.
+        """
+        commands = [check_argv(args) for args in commands]
+        if not commands:
+            return []
+        from concurrent.futures import ThreadPoolExecutor  # Loads logging; only callers of run_many pay for it
+        workers = max(1, min(max_workers or self.max_workers, len(commands)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda args: self.run(args, **kwargs), commands))
+
+    def _execute(self, args, timeout, input_text, on_output):
+        """
+        Returns (returncode, stdout, stderr, timed_out).
+        """
+        raise NotImplementedError
+
+    def _interact(self, args):
+        raise NotImplementedError
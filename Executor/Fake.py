@@ -0,0 +1,49 @@
+"""
+In-memory executor for trying out scripts and plans without touching the system.
+
+Responses are matched on the longest registered argv prefix; every call is recorded in calls.
+"""
+
+import threading
+import time
+
+from Executor.Base import DEFAULT_MAX_WORKERS, Executor
+
+
+class FakeExecutor(Executor):
+    def __init__(self, timeout=None, max_workers=DEFAULT_MAX_WORKERS, default_returncode=127):
+        super().__init__(timeout, max_workers)
+        self.responses = {}
+        self.calls = []
+        self.default_returncode = default_returncode
+        self.lock = threading.Lock()
+
+    def add(self, prefix, stdout="", stderr="", returncode=0, seconds=0.0):
+        """
+        Answer commands starting with prefix (an argv list).  seconds delays the answer, and a command whose
+        seconds exceed its timeout is reported as timed out.
+        """
+        self.responses[tuple(prefix)] = (stdout, stderr, returncode, seconds)
+        return self
+
+    def _interact(self, args):
+        returncode, stdout, stderr, _ = self._execute(args, None, None, None)
+        print(stdout, end="")
+        return returncode, stdout
+
+    def _execute(self, args, timeout, input_text, on_output):
+        with self.lock:
+            self.calls.append((list(args), input_text))
+        matches = [prefix for prefix in self.responses if tuple(args[:len(prefix)]) == prefix]
+        if not matches:
+            return self.default_returncode, "", f"{args[0]}: no fake response", False
+        stdout, stderr, returncode, seconds = self.responses[max(matches, key=len)]
+        if timeout and seconds > timeout:
+            time.sleep(timeout)
+            return None, "", "", True
+        time.sleep(seconds)
+        if on_output:
+            for stream, text in (("stdout", stdout), ("stderr", stderr)):
+                for line in text.splitlines():
+                    on_output(line, stream)
+        return returncode, stdout, stderr, False
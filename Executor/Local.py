@@ -0,0 +1,89 @@
+"""
+Run commands on this machine, without a shell.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+
+from Executor.Base import DEFAULT_MAX_WORKERS, Executor
+
+
+INTERRUPT_GRACE = 5  # seconds an interrupted command gets to exit before its process group is killed
+
+
+def stop_group(process, sig, grace=0):
+    """
+    Send sig to the command's process group and give the command up to grace seconds to exit; whatever is left
+    of the group then (the command, or children that ignore the signal, as background jobs of a shell ignore
+    SIGINT) is killed.
+    """
+    try:
+        os.killpg(process.pid, sig)
+        if sig != signal.SIGKILL:
+            try:
+                process.wait(grace)
+            except subprocess.TimeoutExpired:
+                pass
+            os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def read_lines(pipe, stream, chunks, on_output):
+    for line in iter(pipe.readline, ""):
+        chunks.append(line)
+        if on_output:
+            on_output(line.rstrip("\n"), stream)
+    pipe.close()
+
+
+class LocalExecutor(Executor):
+    def __init__(self, timeout=None, max_workers=DEFAULT_MAX_WORKERS, env=None):
+        super().__init__(timeout, max_workers)
+        self.env = env
+
+    def _interact(self, args):
+        # The command gets this terminal; its output is not captured
+        try:
+            return subprocess.run(args, env=self.env).returncode, ""
+        except OSError as e:
+            print(f"{args[0]}: {e}")
+            return None, ""
+
+    def _execute(self, args, timeout, input_text, on_output):
+        # Every command gets its own session, so a timeout or Ctrl-C can stop it together with its children
+        try:
+            process = subprocess.Popen(args, stdin=subprocess.PIPE if input_text is not None else subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=self.env,
+                                       start_new_session=True)
+        except OSError as e:
+            return None, "", str(e), False
+        stdout, stderr = [], []
+        readers = [threading.Thread(target=read_lines, args=(process.stdout, "stdout", stdout, on_output)),
+                   threading.Thread(target=read_lines, args=(process.stderr, "stderr", stderr, on_output))]
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+        timed_out = False
+        try:
+            if input_text is not None:
+                try:
+                    process.stdin.write(input_text)
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            # Kill the whole process group: a child that inherited the pipes would keep the readers waiting
+            stop_group(process, signal.SIGKILL)
+            timed_out = True
+        except BaseException:
+            # Ctrl-C at the terminal does not reach the command's session; pass it on before giving up
+            stop_group(process, signal.SIGINT, INTERRUPT_GRACE)
+            raise
+        for reader in readers:
+            reader.join()
+        return None if timed_out else process.returncode, "".join(stdout), "".join(stderr), timed_out
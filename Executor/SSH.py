@@ -0,0 +1,139 @@
+"""
+Run commands on a remote host over one shared SSH connection (paramiko).
+
+Every command gets its own channel on the same transport, so concurrent commands do not open new connections.
+OpenSSH allows 10 sessions per connection by default (MaxSessions), hence the default of 8 workers.  The remote
+side always starts commands through the login shell; every argument is quoted so it arrives unchanged.
+"""
+
+import posixpath
+import shlex
+import time
+
+from Executor.Base import DEFAULT_MAX_WORKERS, Executor
+
+READ_SIZE = 32768
+
+
+class LineBuffer:
+    """
+    Collects a byte stream and hands complete lines to on_output as they arrive.
+    """
+
+    def __init__(self, stream, on_output):
+        self.stream = stream
+        self.on_output = on_output
+        self.data = b""
+        self.pending = b""
+
+    def feed(self, data):
+        self.data += data
+        if self.on_output:
+            self.pending += data
+            *lines, self.pending = self.pending.split(b"\n")
+            for line in lines:
+                self.on_output(line.decode(errors="replace"), self.stream)
+
+    def text(self):
+        if self.on_output and self.pending:
+            self.on_output(self.pending.decode(errors="replace"), self.stream)
+            self.pending = b""
+        return self.data.decode(errors="replace")
+
+
+class SSHExecutor(Executor):
+    def __init__(self, client, timeout=None, max_workers=DEFAULT_MAX_WORKERS, owns_client=False):
+        super().__init__(timeout, max_workers)
+        self.client = client
+        self.owns_client = owns_client
+
+    @classmethod
+    def connect(cls, host, username, password=None, **kwargs):
+        """
+        Open a connection (password, or key authentication when the password is empty); close() closes it.
+        """
+        import paramiko
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=host, username=username, password=password or None)
+        return cls(client, owns_client=True, **kwargs)
+
+    def close(self):
+        if self.owns_client:
+            self.client.close()
+
+    def upload(self, files, on_file=None):
+        """
+        Copy [(local path, remote path)] over one SFTP session, creating missing remote directories.
+        on_file(local path, remote path) is called after each file.
+        """
+        sftp = self.client.open_sftp()
+        try:
+            created = set()
+            for local_path, remote_path in files:
+                directory = posixpath.dirname(remote_path)
+                if directory and directory not in created:
+                    try:
+                        sftp.mkdir(directory)
+                    except IOError:
+                        pass  # Directory already exists
+                    created.add(directory)
+                sftp.put(local_path, remote_path)
+                if on_file:
+                    on_file(local_path, remote_path)
+        finally:
+            sftp.close()
+
+    def _interact(self, args):
+        """
+        Run on a pseudo-terminal and echo the output; when it ends in a prompt (":", "?" or ">") ask the user
+        for the answer and send it.
+        """
+        stdin, stdout, _ = self.client.exec_command(shlex.join(args), get_pty=True)
+        channel = stdout.channel
+        output = ""
+        while not channel.exit_status_ready() or channel.recv_ready():
+            if not channel.recv_ready():
+                time.sleep(0.05)
+                continue
+            data = channel.recv(1024).decode(errors="replace")
+            output += data
+            print(data, end="")
+            if data.strip().endswith((":", "?", ">")):
+                stdin.write(input("Input required (for remote): ").strip() + "\n")
+                stdin.flush()
+        return channel.recv_exit_status(), output
+
+    def _execute(self, args, timeout, input_text, on_output):
+        try:
+            channel = self.client.get_transport().open_session()
+            channel.exec_command(shlex.join(args))
+            if input_text is not None:
+                channel.sendall(input_text.encode())
+            channel.shutdown_write()
+        except Exception as e:  # paramiko.SSHException and socket errors
+            return None, "", str(e), False
+
+        stdout, stderr = LineBuffer("stdout", on_output), LineBuffer("stderr", on_output)
+        deadline = time.monotonic() + timeout if timeout else None
+        timed_out = False
+        try:
+            while True:
+                busy = False
+                if channel.recv_ready():
+                    stdout.feed(channel.recv(READ_SIZE))
+                    busy = True
+                if channel.recv_stderr_ready():
+                    stderr.feed(channel.recv_stderr(READ_SIZE))
+                    busy = True
+                if not busy:
+                    if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                        break
+                    if deadline and time.monotonic() >= deadline:
+                        timed_out = True
+                        break
+                    time.sleep(0.01)
+            returncode = None if timed_out else channel.recv_exit_status()
+        finally:
+            channel.close()
+        return returncode, stdout.text(), stderr.text(), timed_out
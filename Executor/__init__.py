@@ -0,0 +1,26 @@
+"""
+One command runner for every script, with interchangeable backends.
+
+    LocalExecutor   subprocess on this machine, argv lists only (never a shell)
+    SSHExecutor     commands on a remote host over one shared paramiko connection, one channel per command
+    FakeExecutor    canned answers from memory, records the calls
+
+All of them take argv lists, stream output lines to an optional callback, apply a per-call timeout (falling
+back to the executor's), and run_many() runs a batch concurrently with at most max_workers at a time:
+
+    from Executor import LocalExecutor
+    executor = LocalExecutor(timeout=30)
+    result = executor.run(["zpool", "list", "-H"])
+    if result.ok:
+        print(result.stdout)
+
+Scripts in a subdirectory import it after adding the repository root to sys.path.  Remote runs need no copy of
+it: Configure.py uploads only the .pyz bundle built by Build.py, which carries the package, and Options.json.
+"""
+
+from Executor.Base import CommandError, Executor, Result
+from Executor.Fake import FakeExecutor
+from Executor.Local import LocalExecutor
+from Executor.SSH import SSHExecutor
+
+__all__ = ["CommandError", "Executor", "FakeExecutor", "LocalExecutor", "Result", "SSHExecutor"]
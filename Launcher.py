@@ -0,0 +1,112 @@
+"""
+Entry point of the single-file bundle; Build.py copies it into the .pyz as __main__.py.
+
+    python3 AutoSan-<version>.pyz <script> [arguments]    # run a bundled script, e.g. Optimize or ResizeDisk --auto
+    python3 AutoSan-<version>.pyz --list                  # list the bundled scripts
+    python3 AutoSan-<version>.pyz --compile               # store bytecode for this interpreter in the bundle
+
+zipimport reads bytecode only from a .pyc next to each .py inside the archive and never writes one, so a bundle
+without it compiles every module it imports on every start.  --compile rewrites the bundle with bytecode for the
+interpreter running it; Configure.py does this once after each upload.
+"""
+
+import os
+import sys
+
+# pyc flags (PEP 552): hash-based and not checked against the source, which cannot change inside the bundle
+PYC_UNCHECKED_HASH = 0b01
+
+
+def bytecode(source, filename):
+    """
+    Contents of a .pyc for source (bytes) for the running interpreter.
+    """
+    import importlib.util
+    import marshal
+    code = compile(source, filename, "exec", dont_inherit=True)
+    return (importlib.util.MAGIC_NUMBER + PYC_UNCHECKED_HASH.to_bytes(4, "little")
+            + importlib.util.source_hash(source) + marshal.dumps(code))
+
+
+def is_compiled(archive):
+    """
+    Whether the bytecode in archive was written for the running interpreter.
+    """
+    import importlib.util
+    import zipfile
+    with zipfile.ZipFile(archive) as bundle:
+        if "__main__.pyc" not in bundle.namelist():
+            return False
+        with bundle.open("__main__.pyc") as pyc:
+            return pyc.read(4) == importlib.util.MAGIC_NUMBER
+
+
+def compile_bundle(archive, output=None):
+    """
+    Write archive (or a copy at output) with a .pyc for every .py, compiled by the running interpreter.  Modules
+    this interpreter cannot compile keep their source only.  Returns the number of modules compiled.
+    """
+    import zipfile
+    output = output or archive
+    temporary = f"{output}.tmp"
+    compiled = 0
+    with open(archive, "rb") as source_file:
+        shebang = source_file.readline()
+    if not shebang.startswith(b"#!"):
+        shebang = b""
+    with zipfile.ZipFile(archive) as source, open(temporary, "wb") as target_file:
+        target_file.write(shebang)
+        with zipfile.ZipFile(target_file, "w", zipfile.ZIP_DEFLATED) as target:
+            names = set(source.namelist())
+            for info in source.infolist():
+                if info.filename.endswith(".pyc") and info.filename[:-1] in names:
+                    continue  # Replaced below
+                data = source.read(info)
+                target.writestr(info, data)
+                if not info.filename.endswith(".py"):
+                    continue
+                try:
+                    pyc = bytecode(data, f"{output}/{info.filename}")
+                except SyntaxError as e:
+                    print(f"Not compiled: {info.filename}: {e}", file=sys.stderr)
+                    continue
+                target.writestr(zipfile.ZipInfo(info.filename + "c", info.date_time), pyc, zipfile.ZIP_DEFLATED)
+                compiled += 1
+    os.chmod(temporary, os.stat(archive).st_mode)
+    os.replace(temporary, output)
+    return compiled
+
+
+def main(argv):
+    from _bundle import SCRIPTS, VERSION
+
+    if not argv or argv[0] in ("-h", "--help"):
+        print(f"AutoSan {VERSION}\nusage: python3 {os.path.basename(os.path.dirname(__file__))} "
+              f"<script> [arguments] | --list | --compile | --version\n\nscripts: {', '.join(SCRIPTS)}")
+        return 0 if argv else 2
+    if argv[0] == "--version":
+        print(VERSION)
+        return 0
+    if argv[0] == "--list":
+        print("\n".join(SCRIPTS))
+        return 0
+    if argv[0] == "--compile":
+        archive = os.path.dirname(os.path.realpath(__file__))
+        if is_compiled(archive):
+            print(f"{archive}: bytecode is up to date.")
+        else:
+            print(f"{archive}: compiled {compile_bundle(archive)} modules for Python {sys.version.split()[0]}.")
+        return 0
+
+    name = argv[0][:-3] if argv[0].endswith(".py") else argv[0]
+    if name not in SCRIPTS:
+        print(f"Unknown script: {argv[0]} (one of {', '.join(SCRIPTS)})", file=sys.stderr)
+        return 2
+    import runpy
+    sys.argv = [f"{name}.py"] + argv[1:]
+    runpy.run_module(name, run_name="__main__")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
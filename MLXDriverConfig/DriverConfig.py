@@ -1,25 +1,32 @@
 #!/bin/python3
+import glob
 import os
 import re
-import subprocess
+import sys
 
+from QosPlan import compile_firmware_settings, load_valid_qos_spec
 
-def run_command(command, timeout=30):
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+
+executor = LocalExecutor(timeout=30)
+
+
+def run_command(command, timeout=None):
     """
-    Executes a shell command and returns the output.
-    Provides safe error handling and timeouts.
+    Executes a command (argv list, no shell) and returns the output, or None if it failed or timed out.
     """
-    try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
-        if result.returncode != 0:
-            print(f"Command failed: {' '.join(command)}\nError: {result.stderr.strip()}")
-            return None
-        return result.stdout.strip()
-    except subprocess.TimeoutExpired:
+    result = executor.run(command, timeout=timeout)
+    if result.timed_out:
         print(f"Command timed out: {' '.join(command)}")
-    except Exception as e:
-        print(f"Unexpected error while running command {' '.join(command)}: {e}")
-    return None
+        return None
+    if not result.ok:
+        print(f"Command failed: {' '.join(command)}\nError: {result.stderr.strip()}")
+        return None
+    return result.stdout.strip()
 
 
 def ensure_mstflint_installed():
@@ -41,19 +48,18 @@ def ensure_mstflint_installed():
 
     print(f"Found boot-pool path: {boot_pool_path}")
     print(f"Remounting {boot_pool_path} as read-write...")
-    run_command(f"mount -o remount,rw {boot_pool_path}")
+    run_command(["mount", "-o", "remount,rw", boot_pool_path])
 
     print("Modifying PATH to temporarily enable apt and dpkg...")
     os.environ['PATH'] = "/usr/bin:/usr/sbin"
 
     print("Making apt and dpkg executable...")
-    run_command("chmod +x /bin/apt*")
-    run_command("chmod +x /usr/bin/dpkg")
+    run_command(["chmod", "+x", *glob.glob("/bin/apt*"), "/usr/bin/dpkg"])
 
-    run_command(["apt", "update"])
+    run_command(["apt", "update"], timeout=600)
     # Install mstflint (this assumes a pkg-based system like FreeBSD/TrueNAS)
     install_command = ["apt", "install", "-y", "mstflint"]
-    result = run_command(install_command)
+    result = run_command(install_command, timeout=600)
     if result:
         print("mstflint successfully installed.")
         return True
@@ -70,10 +76,12 @@ def find_boot_pool_root_from_df():
     """
     try:
         # Run `df -h` command and capture the output
-        result = subprocess.run(['df', '-h'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        output = run_command(['df', '-h'])
+        if output is None:
+            return None
 
         # Parse the output line by line
-        for line in result.stdout.splitlines():
+        for line in output.splitlines():
             # Look for lines containing boot-pool/ROOT and /usr
             if "boot-pool/ROOT" in line and "/usr" in line:
                 # Extract the mount path (usually the last column in df -h output)
@@ -81,8 +89,6 @@ def find_boot_pool_root_from_df():
                 mount_path = parts[0]  # The mount point is in the last column
                 return mount_path
 
-    except subprocess.CalledProcessError as e:
-        print(f"Error running 'df -h': {e}")
     except Exception as e:
         print(f"Unexpected error: {e}")
 
@@ -295,11 +301,9 @@ def check_and_configure_mellanox_devices(binary_path, is_truenas):
         "NUM_OF_PFC_P2": "8",
         "PF_LOG_BAR_SIZE": "6",
         "VF_LOG_BAR_SIZE": "1",
-        "CNP_DSCP_P2": "48",
-        "CNP_DSCP_P1": "48",
-        "CNP_802P_PRIO_P2": "6",
-        "CNP_802P_PRIO_P1": "6",
     }
+    # CNP marking comes from the shared QoS plan so it matches the ESXi and Linux sides
+    required_settings.update(compile_firmware_settings(load_valid_qos_spec()))
 
     if is_truenas:
         if not ensure_mstflint_installed():
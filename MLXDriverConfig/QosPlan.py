@@ -0,0 +1,445 @@
+#!/bin/python3
+"""
+RoCE lossless QoS plan compiler and consistency checker.
+
+One declarative spec (Options.json "qos") drives every place the fabric's priorities are set:
+    - HCA firmware (mlxconfig/mstconfig CNP keys)           -> DriverConfig.py
+    - ESXi nmlx5_core / nmlx5_rdma module parameters          -> ESXi/Optimize.py
+    - Linux mlnx_qos, cma_roce_tos and sysfs traffic_class    -> 60-set_qos dispatcher script
+
+The checker reads the live state on whichever side it runs and reports every mismatch,
+since a single disagreement silently turns the lossless fabric lossy.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+executor = LocalExecutor(timeout=30)
+
+DEFAULT_QOS_SPEC = {
+    "traffic_dscp": 48,     # DSCP carried by RoCE/iSER data
+    "pfc_priority": 6,      # Lossless priority the data DSCP maps to
+    "cnp_dscp": 56,         # DSCP of congestion notification packets
+    "cnp_priority": 7,      # 802.1p priority of CNPs, kept off the lossless priority so they are never paused
+    "trust": "dscp",        # dscp or pcp
+    "cable_len": 3,
+    "lossless_tc": 2,
+    "tc_bandwidth": {"0": 50, "2": 50},
+    "ports": 2,
+}
+TRUST_STATES = {"pcp": 1, "dscp": 2}
+
+
+def load_qos_spec(path=None):
+    """
+    Load the "qos" section of Options.json on top of the defaults.
+    """
+    spec = dict(DEFAULT_QOS_SPEC)
+    path = path or find_options_file()
+    if not path:
+        print("Options.json file not found! Using the default QoS plan.")
+        return spec
+    try:
+        with open(path, "r") as file:
+            spec.update(json.load(file).get("qos", {}))
+    except json.JSONDecodeError:
+        print("Failed to parse Options.json! Using the default QoS plan.")
+    return spec
+
+
+def validate_spec(spec):
+    """
+    Check a QoS spec for internal contradictions.
+    Returns (errors, warnings) as lists of strings.
+    """
+    errors, warnings = [], []
+    for key in ("traffic_dscp", "cnp_dscp"):
+        if not 0 <= int(spec[key]) <= 63:
+            errors.append(f"{key}={spec[key]} is outside the DSCP range 0-63")
+    for key in ("pfc_priority", "cnp_priority"):
+        if not 0 <= int(spec[key]) <= 7:
+            errors.append(f"{key}={spec[key]} is outside the priority range 0-7")
+    if spec["trust"] not in TRUST_STATES:
+        errors.append(f"trust must be one of {', '.join(TRUST_STATES)}, not '{spec['trust']}'")
+
+    prio_tc = priority_to_tc(spec)
+    bandwidth = tc_bandwidth(spec)
+    if sum(bandwidth) != 100:
+        errors.append(f"tc_bandwidth adds up to {sum(bandwidth)}%, not 100%")
+    lossless_tc = prio_tc[int(spec["pfc_priority"])]
+    if bandwidth[lossless_tc] == 0:
+        errors.append(f"priority {spec['pfc_priority']} is lossless but TC{lossless_tc} has no bandwidth")
+    for priority, tc in enumerate(prio_tc):
+        if bandwidth[tc] == 0 and tc != 0:
+            warnings.append(f"priority {priority} maps to TC{tc}, which has no bandwidth")
+    if spec["traffic_dscp"] == spec["cnp_dscp"] and spec["pfc_priority"] != spec["cnp_priority"]:
+        errors.append("traffic and CNPs share a DSCP but are mapped to different priorities")
+    if spec["cnp_priority"] == spec["pfc_priority"]:
+        warnings.append("CNPs share the lossless priority; they can be paused along with the traffic they throttle")
+    return errors, warnings
+
+
+def load_valid_qos_spec(path=None):
+    """
+    Load the QoS spec and validate it: print the warnings, and the errors before exiting if there are any.
+    """
+    spec = load_qos_spec(path)
+    errors, warnings = validate_spec(spec)
+    for warning in warnings:
+        print(f"Warning: {warning}", file=sys.stderr)
+    if errors:
+        for error in errors:
+            print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+    return spec
+
+
+def priority_to_tc(spec):
+    """
+    Priority -> traffic class map.  The lossless priority gets its own TC, the rest share TC0
+    unless the spec gives an explicit "prio_tc" list.
+    """
+    if "prio_tc" in spec:
+        return [int(tc) for tc in spec["prio_tc"]]
+    prio_tc = [0] * 8
+    prio_tc[int(spec["pfc_priority"])] = int(spec["lossless_tc"])
+    return prio_tc
+
+
+def tc_bandwidth(spec):
+    bandwidth = [0] * 8
+    for tc, percent in spec["tc_bandwidth"].items():
+        bandwidth[int(tc)] = int(percent)
+    return bandwidth
+
+
+def compile_firmware_settings(spec):
+    """
+    mlxconfig/mstconfig keys, in the same form as DriverConfig.py's required settings.
+    """
+    settings = {}
+    for port in range(1, int(spec["ports"]) + 1):
+        settings[f"CNP_DSCP_P{port}"] = str(spec["cnp_dscp"])
+        settings[f"CNP_802P_PRIO_P{port}"] = str(spec["cnp_priority"])
+    return settings
+
+
+def compile_esxi_parameters(spec):
+    """
+    ESXi module parameters: nmlx5_core owns trust and PFC, nmlx5_rdma owns the RoCE marking.
+    """
+    pfc_mask = f"0x{1 << int(spec['pfc_priority']):02x}"
+    core = {
+        "trust_state": TRUST_STATES[spec["trust"]],
+        "pfctx": pfc_mask,
+        "pfcrx": pfc_mask,
+    }
+    if spec["trust"] == "dscp":
+        rdma = {"dscp_force": spec["traffic_dscp"]}
+    else:
+        rdma = {"pcp_force": spec["pfc_priority"]}
+    return {"nmlx5_core": core, "nmlx5_rdma": rdma}
+
+
+def compile_linux_commands(spec, interface, device=None):
+    """
+    Commands for one Linux netdev (and its RDMA device) as argument lists.
+    """
+    pfc = ",".join("1" if priority == int(spec["pfc_priority"]) else "0" for priority in range(8))
+    commands = [
+        ["mlnx_qos", "-i", interface, f"--cable_len={spec['cable_len']}", f"--trust={spec['trust']}", "--pfc", pfc],
+        ["mlnx_qos", "-i", interface, "--tsa=" + ",".join(["ets"] * 8),
+         "--prio_tc=" + ",".join(str(tc) for tc in priority_to_tc(spec)),
+         "--tcbw=" + ",".join(str(bw) for bw in tc_bandwidth(spec))],
+    ]
+    if spec["trust"] == "dscp":
+        commands.append(["mlnx_qos", "-i", interface, f"--dscp2prio=set,{spec['traffic_dscp']},{spec['pfc_priority']}"])
+        if spec["cnp_dscp"] != spec["traffic_dscp"]:
+            commands.append(["mlnx_qos", "-i", interface, f"--dscp2prio=set,{spec['cnp_dscp']},{spec['cnp_priority']}"])
+    if device:
+        commands.append(["cma_roce_tos", "-d", device, "-t", str(traffic_class(spec))])
+    return commands
+
+
+def compile_sysfs_writes(spec, interface, device=None):
+    """
+    sysfs (path, value) pairs for one Linux netdev and its RDMA device.
+    """
+    writes = [(f"/sys/class/net/{interface}/settings/pfc_stall_prevention", "auto")]
+    if device:
+        writes.append((f"/sys/class/infiniband/{device}/tc/1/traffic_class", str(traffic_class(spec))))
+    return writes
+
+
+def traffic_class(spec):
+    """
+    The IP TOS byte for the traffic DSCP (ECN bits left clear).
+    """
+    return int(spec["traffic_dscp"]) << 2
+
+
+def render_dispatcher_script(spec):
+    """
+    Render the networkd-dispatcher script that applies the Linux side of the plan.
+    """
+    lines = [
+        "#!/bin/bash",
+        "# Generated by MLXDriverConfig/QosPlan.py from the \"qos\" section of Options.json - do not edit by hand.",
+        "# this goes into /etc/networkd-dispatcher/routable.d",
+        "if ! command -v rdma &> /dev/null; then",
+        '  echo "rdma command not found..."',
+        "  exit 1",
+        "fi",
+        "",
+        "# Extract interfaces and devices from `rdma link show`",
+        "interfaces=($(rdma link show | awk '/netdev/ {print $NF}'))",
+        "devices=($(rdma link show | awk '{print $2}' | cut -d'/' -f1 | sort -u))",
+        "",
+        'for iface in "${interfaces[@]}"; do',
+        "  echo 'auto' > /sys/class/net/$iface/settings/pfc_stall_prevention",
+        '  echo "Configuring QoS interface $iface..."',
+    ]
+    for command in compile_linux_commands(spec, "$iface"):
+        lines.append("  " + " ".join(f'"{arg}"' if arg == "$iface" else arg for arg in command))
+    lines += [
+        "done",
+        "",
+        'for device in "${devices[@]}"; do',
+        '  echo "Configuring device $device..."',
+        f'  cma_roce_tos -d "$device" -t {traffic_class(spec)}',
+        f"  echo {traffic_class(spec)} > /sys/class/infiniband/$device/tc/1/traffic_class",
+        "done",
+        "",
+        "exit 0",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def run_command(command, timeout=None):
+    """
+    Executes a command and returns the output, or None on failure.
+    """
+    result = executor.run(command, timeout=timeout)
+    if result.timed_out:
+        print(f"Command timed out: {' '.join(command)}")
+        return None
+    if not result.ok:
+        print(f"Command failed: {' '.join(command)}\nError: {result.stderr.strip()}")
+        return None
+    return result.stdout.strip()
+
+
+def parse_mlxconfig_value(output, key):
+    match = re.search(fr"{key}\s+([^\s]+)", output or "")
+    if not match:
+        return None
+    numeric = re.search(r"\((\d+)\)", match.group(1))
+    return numeric.group(1) if numeric else match.group(1)
+
+
+def check_firmware(spec, device, binary):
+    """
+    Compare the CNP keys burned into the HCA against the plan.
+    """
+    output = run_command([binary, "-d", device, "q"])
+    if output is None:
+        return [f"{device}: unable to query firmware settings"]
+    mismatches = []
+    for key, expected in compile_firmware_settings(spec).items():
+        actual = parse_mlxconfig_value(output, key)
+        if actual is None:
+            continue
+        if actual != expected:
+            mismatches.append(f"{device}: firmware {key}={actual}, plan expects {expected}")
+    return mismatches
+
+
+def parse_esxcli_parameters(output):
+    """
+    Parse `esxcli system module parameters list` output into {name: value}.
+    The table is sliced at the offsets of the dashed rule under its header: an unset parameter leaves the Value
+    column blank, and splitting on whitespace would take the first word of its description instead.
+    """
+    lines = (output or "").splitlines()
+    if len(lines) < 2:
+        return {}
+    columns = [match.start() for match in re.finditer(r"-+", lines[1])]
+    if len(columns) < 4:
+        return {}
+    values = {}
+    for line in lines[2:]:
+        name = line[:columns[1]].strip()
+        kind = line[columns[1]:columns[2]].strip()
+        if name and kind in ("int", "uint", "string", "bool", "array"):
+            values[name] = line[columns[2]:columns[3]].strip()
+    return values
+
+
+def same_number(actual, expected):
+    try:
+        return int(str(actual), 0) == int(str(expected), 0)
+    except ValueError:
+        return str(actual) == str(expected)
+
+
+def check_esxi(spec):
+    """
+    Compare the nmlx5 module parameters on an ESXi host against the plan.
+    """
+    mismatches = []
+    for module, expected in compile_esxi_parameters(spec).items():
+        actual = parse_esxcli_parameters(run_command(["esxcli", "system", "module", "parameters", "list", "-m", module]))
+        for key, value in expected.items():
+            if not actual.get(key):
+                mismatches.append(f"{module}: {key} is unset, plan expects {value}")
+            elif not same_number(actual[key], value):
+                mismatches.append(f"{module}: {key}={actual[key]}, plan expects {value}")
+    return mismatches
+
+
+def parse_mlnx_qos(output):
+    """
+    Pull trust state, PFC enable vector, DSCP->priority map and priority->TC map out of `mlnx_qos -i <if>`.
+    """
+    state = {"dscp2prio": {}, "prio_tc": {}, "tc_bw": {}}
+    current_tc = None
+    lines = (output or "").splitlines()
+    for index, line in enumerate(lines):
+        text = line.strip()
+        if text.startswith("Priority trust state:"):
+            state["trust"] = text.split(":", 1)[1].strip()
+        elif text.startswith("enabled") and "pfc" not in state:
+            state["pfc"] = [int(value) for value in text.split()[1:9]]
+        elif text.startswith("prio:") and "dscp:" in text:
+            prio_part, dscp_part = text.split("dscp:", 1)
+            priority = int(prio_part.split(":")[1].strip().rstrip(","))
+            for dscp in dscp_part.replace(",", " ").split():
+                state["dscp2prio"][int(dscp)] = priority
+        elif text.startswith("tc:"):
+            match = re.match(r"tc:\s*(\d+).*bw:\s*(\d+)", text)
+            if match:
+                current_tc = int(match.group(1))
+                state["tc_bw"][current_tc] = int(match.group(2))
+        elif text.startswith("priority:") and current_tc is not None:
+            for priority in text.split(":", 1)[1].split():
+                state["prio_tc"][int(priority)] = current_tc
+    return state
+
+
+def read_traffic_class(device):
+    try:
+        with open(f"/sys/class/infiniband/{device}/tc/1/traffic_class", "r") as file:
+            numbers = re.findall(r"\d+", file.read())
+            return int(numbers[-1]) if numbers else None
+    except OSError:
+        return None
+
+
+def find_rdma_links():
+    """
+    Map each RDMA device to its netdevs from sysfs (what `rdma link show` reports).
+    """
+    links = {}
+    ib_root = "/sys/class/infiniband"
+    if os.path.isdir(ib_root):
+        for device in sorted(os.listdir(ib_root)):
+            net_dir = os.path.join(ib_root, device, "device", "net")
+            if os.path.isdir(net_dir):
+                links[device] = sorted(os.listdir(net_dir))
+    return links
+
+
+def check_linux(spec):
+    """
+    Compare mlnx_qos state and RoCE traffic class of every RDMA interface against the plan.
+    """
+    mismatches = []
+    pfc_priority = int(spec["pfc_priority"])
+    expected_pfc = [1 if priority == pfc_priority else 0 for priority in range(8)]
+    expected_tc = priority_to_tc(spec)
+    expected_bw = tc_bandwidth(spec)
+    for device, interfaces in find_rdma_links().items():
+        tclass = read_traffic_class(device)
+        if tclass is not None and tclass != traffic_class(spec):
+            mismatches.append(f"{device}: traffic_class={tclass}, plan expects {traffic_class(spec)}")
+        for iface in interfaces:
+            state = parse_mlnx_qos(run_command(["mlnx_qos", "-i", iface]))
+            if state.get("trust") and state["trust"] != spec["trust"]:
+                mismatches.append(f"{iface}: trust={state['trust']}, plan expects {spec['trust']}")
+            if "pfc" in state and state["pfc"] != expected_pfc:
+                mismatches.append(f"{iface}: PFC enabled on {state['pfc']}, plan expects {expected_pfc}")
+            actual_prio = state["dscp2prio"].get(int(spec["traffic_dscp"]))
+            if spec["trust"] == "dscp" and actual_prio is not None and actual_prio != pfc_priority:
+                mismatches.append(f"{iface}: DSCP {spec['traffic_dscp']} maps to priority {actual_prio}, "
+                                  f"plan expects {pfc_priority}")
+            if state["prio_tc"].get(pfc_priority, expected_tc[pfc_priority]) != expected_tc[pfc_priority]:
+                mismatches.append(f"{iface}: priority {pfc_priority} is on TC{state['prio_tc'][pfc_priority]}, "
+                                  f"plan expects TC{expected_tc[pfc_priority]}")
+            for tc, bandwidth in state["tc_bw"].items():
+                if bandwidth != expected_bw[tc]:
+                    mismatches.append(f"{iface}: TC{tc} bandwidth {bandwidth}%, plan expects {expected_bw[tc]}%")
+    return mismatches
+
+
+def print_plan(spec):
+    print("Firmware (mlxconfig/mstconfig):")
+    print("  " + " ".join(f"{key}={value}" for key, value in compile_firmware_settings(spec).items()))
+    print("ESXi module parameters:")
+    for module, params in compile_esxi_parameters(spec).items():
+        print(f"  esxcli system module parameters set -m {module} -p '"
+              + " ".join(f"{key}={value}" for key, value in params.items()) + "'")
+    print("Linux (per RDMA interface/device):")
+    for command in compile_linux_commands(spec, "<iface>", "<device>"):
+        print("  " + " ".join(command))
+    for path, value in compile_sysfs_writes(spec, "<iface>", "<device>"):
+        print(f"  echo {value} > {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile and check the RoCE lossless QoS plan.")
+    parser.add_argument("action", choices=["plan", "script", "check"], nargs="?", default="plan")
+    parser.add_argument("--options", help="Path to Options.json")
+    parser.add_argument("--side", choices=["linux", "esxi", "firmware"], default="linux",
+                        help="Which live state to check")
+    parser.add_argument("--device", action="append", default=[], help="HCA device for --side firmware")
+    parser.add_argument("--binary", default="mstconfig", help="mlxconfig or mstconfig path for --side firmware")
+    args = parser.parse_args()
+
+    spec = load_valid_qos_spec(args.options)
+
+    if args.action == "plan":
+        print_plan(spec)
+    elif args.action == "script":
+        sys.stdout.write(render_dispatcher_script(spec))
+    else:
+        if args.side == "esxi":
+            mismatches = check_esxi(spec)
+        elif args.side == "firmware":
+            mismatches = []
+            for device in args.device:
+                mismatches += check_firmware(spec, device, args.binary)
+        else:
+            mismatches = check_linux(spec)
+        for mismatch in mismatches:
+            print(f"MISMATCH {mismatch}")
+        if mismatches:
+            sys.exit(2)
+        print(f"{args.side}: live QoS state matches the plan.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Where the scripts find Options.json.
+
+In the source tree this module sits next to Options.json in the repository root; in the flattened
+/tmp/ez_scripts layout next to the scripts and the uploaded Options.json; inside the bundle its directory is the
+.pyz itself, whose parent holds the uploaded Options.json.
+"""
+
+import os
+
+
+def find_options_file(name="Options.json"):
+    """
+    Path of Options.json in this module's directory or the one above it, or None.
+    """
+    module_dir = os.path.dirname(os.path.realpath(__file__))
+    for directory in (module_dir, os.path.dirname(module_dir)):
+        candidate = os.path.join(directory, name)
+        if os.path.exists(candidate):
+            return candidate
+    return None
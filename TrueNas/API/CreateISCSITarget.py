@@ -1,88 +1,10 @@
 #!/usr/bin/python3
 
-import requests
-import json
-
-# Configuration
-# Create an api key at https://<trunas-ip>/ui/apikeys
-TRUENAS_HOST = "https://<truenas-ip>"  # Replace with your TrueNAS Scale IP or hostname
-API_KEY = "<your-api-key>"  # Replace with your TrueNAS Scale API key
-
-HEADERS = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {API_KEY}"
-}
-
-
-def create_extent(name, zvol_path, rpm, disable_pblock):
-    """
-    Create an iSCSI extent for the given ZVOL with user-defined RPM and optional disabling of physical block size reporting.
-    """
-    url = f"{TRUENAS_HOST}/api/v2.0/iscsi/extent/"
-    data = {
-        "name": name,
-        "type": "DISK",
-        "disk": zvol_path,
-        "blocksize": 512,  # Default block size; can be adjusted as needed
-        "naa": None,
-        "rpm": rpm,  # User-defined RPM
-        "pblocksize": not disable_pblock,  # True = Enable physical block size, False = Disable
-    }
-
-    try:
-        response = requests.post(url, headers=HEADERS, json=data, verify=False)
-    except Exception as e:
-        print("Error during extent creation:", e)
-        return None
-
-    if response.status_code == 200:
-        print(f"Extent '{name}' created successfully.")
-        return response.json()
-    else:
-        print(f"Failed to create extent. {response.status_code}: {response.text}")
-        return None
-
-
-def create_target(name):
-    """Create an iSCSI target."""
-    url = f"{TRUENAS_HOST}/api/v2.0/iscsi/target/"
-    data = {
-        "name": name,
-    }
-
-    try:
-        response = requests.post(url, headers=HEADERS, json=data, verify=False)
-    except Exception as e:
-        print("Error during target creation:", e)
-        return None
-
-    if response.status_code == 200:
-        print(f"Target '{name}' created successfully.")
-        return response.json()
-    else:
-        print(f"Failed to create target. {response.status_code}: {response.text}")
-        return None
-
-
-def associate_extent_to_target(target_id, extent_id, lun_id):
-    """Associate an extent to a target using a specific LUN ID."""
-    url = f"{TRUENAS_HOST}/api/v2.0/iscsi/targetextent/"
-    data = {
-        "target": target_id,
-        "extent": extent_id,
-        "lunid": lun_id,
-    }
-
-    try:
-        response = requests.post(url, headers=HEADERS, json=data, verify=False)
-    except Exception as e:
-        print("Error during extent-to-target association:", e)
-        return
+import argparse
+import sys
 
-    if response.status_code == 200:
-        print(f"Extent ID {extent_id} associated with Target ID {target_id} at LUN {lun_id}.")
-    else:
-        print(f"Failed to associate extent. {response.status_code}: {response.text}")
+from ReconcileISCSI import reconcile
+from TrueNasClient import TrueNasApiError, client_from_environment
 
 
 def get_user_input_for_extent(name):
@@ -102,36 +24,46 @@ def get_user_input_for_extent(name):
 
 
 def main():
-    # Suppress SSL warnings if using self-signed certificates.
-    requests.packages.urllib3.disable_warnings()
-
-    print("Creating iSCSI configuration for LUNs...")
-
-    # Get user inputs for both extents
-    rpm1, disable_pblock1 = get_user_input_for_extent("lun16k_extent")
-    rpm2, disable_pblock2 = get_user_input_for_extent("lun128k_extent")
+    parser = argparse.ArgumentParser(description="Create the iSCSI extents, target and LUN mappings on TrueNAS.")
+    parser.add_argument("--host", help="TrueNAS address, e.g. https://10.15.1.47 (default: $TRUENAS_HOST)")
+    parser.add_argument("--api-key", help="TrueNAS API key (default: $TRUENAS_API_KEY)")
+    parser.add_argument("--transport", choices=("rest", "websocket"), default="rest",
+                        help="REST API or one multiplexed middleware WebSocket session")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent API requests")
+    args = parser.parse_args()
 
-    # 1. Create extents for the ZVOLs with user-defined options
-    extent1 = create_extent("lun16k_extent", "zvol/dpool/lun16k", rpm1, disable_pblock1)
-    extent2 = create_extent("lun128k_extent", "zvol/dpool/lun128k", rpm2, disable_pblock2)
-
-    if not extent1 or not extent2:
-        print("Failed to create one or more extents. Exiting.")
-        return
+    try:
+        client = client_from_environment(args.host, args.api_key, args.transport, max_workers=args.workers)
+    except (ValueError, TrueNasApiError) as e:
+        print(e)
+        sys.exit(1)
 
-    # 2. Create an iSCSI target named "san_dpool"
-    target = create_target("san_dpool")
-    if not target:
-        print("Failed to create target. Exiting.")
-        return
+    print("Creating iSCSI configuration for LUNs...")
 
-    # 3. Associate extents to target with LUN IDs 16 and 128
-    target_id = target["id"]
-    associate_extent_to_target(target_id, extent1["id"], 16)  # LUN ID 16
-    associate_extent_to_target(target_id, extent2["id"], 128)  # LUN ID 128
+    # (extent name, zvol path, LUN ID)
+    luns = [
+        ("lun16k_extent", "zvol/dpool/lun16k", 16),
+        ("lun128k_extent", "zvol/dpool/lun128k", 128),
+    ]
+
+    # Get user inputs for the extents
+    options = {name: get_user_input_for_extent(name) for name, _, _ in luns}
+
+    # Describe the end state and let the reconciler create only what is missing, so a re-run after a
+    # partial failure completes the configuration instead of duplicating extents and mappings
+    spec = {
+        "extents": [{"name": name, "disk": zvol_path, "rpm": options[name][0], "pblocksize": not options[name][1]}
+                    for name, zvol_path, _ in luns],
+        "targets": [{"name": "san_dpool", "luns": {str(lun_id): name for name, _, lun_id in luns}}],
+    }
+    with client:
+        failures = reconcile(client, spec)
+    if failures:
+        print("iSCSI configuration is incomplete; re-run to retry the failed steps.")
+        sys.exit(1)
 
     print("iSCSI configuration completed successfully.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+"""
+Idempotent reconciler for TrueNAS iSCSI extents, targets and target/extent associations.
+
+Existing objects are fetched with one paginated list per type and indexed by name, disk path and
+(target, lunid).  The declarative spec is compared against those indexes and only the minimal set of
+creates, updates and (with prune) deletes is sent, so a re-run after a partial failure finishes the job
+instead of duplicating objects, and a re-run of a finished configuration makes no write calls at all.
+
+Spec ("iscsi_api" in Options.json):
+    {"extents": [{"name": "lun16k_extent", "disk": "zvol/dpool/lun16k", "rpm": "SSD", "pblocksize": true}],
+     "targets": [{"name": "san_dpool", "luns": {"16": "lun16k_extent"}}]}
+Extent and target entries may carry any other API field; only fields named in the spec are compared.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+    from OptionsFile import find_options_file
+
+from TrueNasClient import TrueNasApiError, client_from_environment
+
+PAGE_SIZE = 500
+EXTENT_DEFAULTS = {"type": "DISK", "blocksize": 512}
+
+
+def list_all(client, namespace, page_size=PAGE_SIZE):
+    """
+    Every object of one type, fetched page by page.
+    """
+    objects, offset = [], 0
+    while True:
+        page = client.query(namespace, limit=page_size, offset=offset) or []
+        objects.extend(page)
+        if len(page) < page_size:
+            return objects
+        offset += page_size
+
+
+class IscsiState:
+    """
+    Indexed snapshot of the existing iSCSI objects.
+    """
+
+    def __init__(self, extents, targets, associations):
+        self.extents_by_name = {extent["name"]: extent for extent in extents}
+        self.extents_by_disk = {extent["disk"]: extent for extent in extents if extent.get("disk")}
+        self.targets_by_name = {target["name"]: target for target in targets}
+        self.by_target_lun = {(item["target"], item["lunid"]): item for item in associations}
+        self.by_target_extent = {(item["target"], item["extent"]): item for item in associations}
+
+    @classmethod
+    def fetch(cls, client):
+        # The three lists are independent; fetch them together
+        results = client.map(lambda namespace: list_all(client, namespace),
+                             ("iscsi.extent", "iscsi.target", "iscsi.targetextent"))
+        for namespace, _, error in results:
+            if error:
+                raise TrueNasApiError(error.status, f"listing {namespace}: {error.text}")
+        return cls(*(objects for _, objects, _ in results))
+
+
+def differing_fields(current, wanted):
+    return {key: value for key, value in wanted.items() if current.get(key) != value}
+
+
+def plan_objects(spec, state):
+    """
+    Extent and target changes.  Returns (creates, updates) as lists of (namespace, object id or None, data).
+    """
+    creates, updates = [], []
+    for extent in spec.get("extents", []):
+        wanted = dict(EXTENT_DEFAULTS, **extent)
+        current = state.extents_by_name.get(wanted["name"])
+        if current is None and wanted.get("disk") in state.extents_by_disk:
+            # Same zvol under another name: TrueNAS allows one extent per disk, so rename it
+            current = state.extents_by_disk[wanted["disk"]]
+        if current is None:
+            creates.append(("iscsi.extent", None, wanted))
+        else:
+            delta = differing_fields(current, wanted)
+            if delta:
+                updates.append(("iscsi.extent", current["id"], delta))
+    for target in spec.get("targets", []):
+        wanted = {key: value for key, value in target.items() if key != "luns"}
+        current = state.targets_by_name.get(wanted["name"])
+        if current is None:
+            creates.append(("iscsi.target", None, wanted))
+        else:
+            delta = differing_fields(current, wanted)
+            if delta:
+                updates.append(("iscsi.target", current["id"], delta))
+    return creates, updates
+
+
+def plan_associations(spec, state, extent_ids, target_ids, prune=False):
+    """
+    Target/extent association changes once every extent and target has an id.
+    Returns (creates, updates, deletes).
+    """
+    creates, updates, deletes = [], [], []
+    for target in spec.get("targets", []):
+        target_id = target_ids[target["name"]]
+        wanted = {int(lunid): extent_ids[name] for lunid, name in target.get("luns", {}).items()}
+        for lunid, extent_id in sorted(wanted.items()):
+            at_lun = state.by_target_lun.get((target_id, lunid))
+            if at_lun is not None:
+                if at_lun["extent"] != extent_id:
+                    updates.append(("iscsi.targetextent", at_lun["id"], {"extent": extent_id}))
+                continue
+            elsewhere = state.by_target_extent.get((target_id, extent_id))
+            if elsewhere is not None and elsewhere["lunid"] not in wanted:
+                updates.append(("iscsi.targetextent", elsewhere["id"], {"lunid": lunid}))
+            else:
+                creates.append(("iscsi.targetextent", None,
+                                {"target": target_id, "extent": extent_id, "lunid": lunid}))
+        if prune:
+            moved = {item[1] for item in updates}
+            for (mapped_target, lunid), item in sorted(state.by_target_lun.items()):
+                if mapped_target == target_id and lunid not in wanted and item["id"] not in moved:
+                    deletes.append(("iscsi.targetextent", item["id"], None))
+    return creates, updates, deletes
+
+
+def describe(action, namespace, object_id, data):
+    detail = json.dumps(data, sort_keys=True) if data else ""
+    return f"{action} {namespace}{f' id {object_id}' if object_id is not None else ''} {detail}".rstrip()
+
+
+def execute(client, action, changes, dry_run):
+    """
+    Run independent changes concurrently.  Returns ({name or id: result}, errors).
+    """
+    if dry_run:
+        for namespace, object_id, data in changes:
+            print(f"Would {describe(action, namespace, object_id, data)}")
+        return {}, []
+
+    def apply(change):
+        namespace, object_id, data = change
+        if action == "create":
+            return client.create(namespace, data)
+        if action == "update":
+            return client.update(namespace, object_id, data)
+        return client.delete(namespace, object_id)
+
+    results, errors = {}, []
+    for change, result, error in client.map(apply, changes):
+        namespace, object_id, data = change
+        if error:
+            print(f"Failed to {describe(action, namespace, object_id, data)}: {error}")
+            errors.append(error)
+        else:
+            name = (data or {}).get("name", object_id)
+            label = name if name is not None else json.dumps(data, sort_keys=True)
+            print(f"{action.capitalize()}d {namespace} {label}")
+            results[(namespace, name)] = result
+    return results, errors
+
+
+def reconcile(client, spec, prune=False, dry_run=False):
+    """
+    Bring the iSCSI objects in line with spec.  Returns the number of failed API calls.
+    """
+    state = IscsiState.fetch(client)
+    creates, updates = plan_objects(spec, state)
+    created, errors = execute(client, "create", creates, dry_run)
+    _, update_errors = execute(client, "update", updates, dry_run)
+    errors += update_errors
+
+    extent_ids = {name: extent["id"] for name, extent in state.extents_by_name.items()}
+    for extent in spec.get("extents", []):
+        current = state.extents_by_disk.get(extent.get("disk"))
+        if extent["name"] not in extent_ids and current is not None:
+            extent_ids[extent["name"]] = current["id"]
+    target_ids = {name: target["id"] for name, target in state.targets_by_name.items()}
+    for (namespace, name), result in created.items():
+        (extent_ids if namespace == "iscsi.extent" else target_ids)[name] = result["id"]
+
+    if dry_run:
+        # Objects that would be created have no id yet; stand in with their names
+        for namespace, _, data in creates:
+            (extent_ids if namespace == "iscsi.extent" else target_ids)[data["name"]] = f"<{data['name']}>"
+    missing = [name for target in spec.get("targets", []) for name in target.get("luns", {}).values()
+               if name not in extent_ids] + [target["name"] for target in spec.get("targets", [])
+                                             if target["name"] not in target_ids]
+    if missing:
+        print(f"Skipping LUN mappings: {', '.join(sorted(set(missing)))} could not be created.")
+        return len(errors) + len(missing)
+
+    assoc_creates, assoc_updates, assoc_deletes = plan_associations(spec, state, extent_ids, target_ids, prune)
+    for action, changes in (("delete", assoc_deletes), ("update", assoc_updates), ("create", assoc_creates)):
+        _, action_errors = execute(client, action, changes, dry_run)
+        errors += action_errors
+    if not (creates or updates or assoc_creates or assoc_updates or assoc_deletes):
+        print("iSCSI configuration already matches the spec.")
+    return len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile TrueNAS iSCSI extents, targets and LUN mappings.")
+    parser.add_argument("--host", help="TrueNAS address (default: $TRUENAS_HOST)")
+    parser.add_argument("--api-key", help="TrueNAS API key (default: $TRUENAS_API_KEY)")
+    parser.add_argument("--transport", choices=("rest", "websocket"), default="rest")
+    parser.add_argument("--options", default=find_options_file(), help="Options.json with an iscsi_api section")
+    parser.add_argument("--prune", action="store_true", help="Remove LUN mappings of spec targets not in the spec")
+    parser.add_argument("--dry-run", action="store_true", help="Print the changes without making them")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent API requests")
+    args = parser.parse_args()
+
+    if not args.options:
+        print("Options.json file not found!")
+        sys.exit(1)
+    with open(args.options, "r") as file:
+        spec = json.load(file).get("iscsi_api", {})
+    try:
+        with client_from_environment(args.host, args.api_key, args.transport, max_workers=args.workers) as client:
+            failures = reconcile(client, spec, args.prune, args.dry_run)
+    except (ValueError, TrueNasApiError) as e:
+        print(e)
+        sys.exit(1)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
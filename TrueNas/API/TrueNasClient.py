@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+"""
+REST client for the TrueNAS SCALE API (v2.0).
+
+One requests.Session with a keep-alive connection pool is shared by every call, so a provisioning run pays
+for the TCP/TLS handshake once per pooled connection instead of once per request.  Transient failures
+(connection errors, 429 and 5xx) are retried with exponential backoff, honouring Retry-After.  map() fans
+independent calls out over a bounded thread pool.
+
+Objects are addressed by their middleware namespace ("iscsi.extent", "iscsi.target", ...), which maps to
+/api/v2.0/iscsi/extent/ and so on.
+"""
+
+import os
+import time
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+JOB_DONE_STATES = ("SUCCESS", "FAILED", "ABORTED")
+
+
+class TrueNasApiError(Exception):
+    """
+    An API call failed: status is the HTTP status, or None when the server could not be reached.
+    """
+
+    def __init__(self, status, text):
+        super().__init__(f"{status}: {text}" if status is not None else text)
+        self.status = status
+        self.text = text
+
+
+def job_result(job):
+    if job["state"] == "SUCCESS":
+        return job.get("result")
+    raise TrueNasApiError(None, f"job {job['id']} ({job.get('method')}) {job['state']}: {job.get('error')}")
+
+
+class ApiClient:
+    """
+    What the provisioning scripts need from a transport: create/query/update/delete by middleware
+    namespace, job() for long-running calls and map() for bounded fan-out.
+    """
+    max_workers = 8
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def map(self, function, items):
+        """
+        Call function(item) for every item on up to max_workers threads.
+        Returns [(item, result, error)] in input order; error is None on success.
+        """
+        def call(item):
+            try:
+                return item, function(item), None
+            except TrueNasApiError as e:
+                return item, None, e
+
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [call(item) for item in items]
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(call, items))
+
+
+class TrueNasClient(ApiClient):
+    """
+    Pooled, retrying TrueNAS REST client.  Use as a context manager or call close().
+    """
+
+    def __init__(self, host, api_key, verify=False, max_workers=8, retries=5, backoff=0.5, timeout=30):
+        if not host.startswith(("http://", "https://")):
+            host = f"https://{host}"
+        self.base_url = f"{host.rstrip('/')}/api/v2.0"
+        self.timeout = timeout
+        self.max_workers = max_workers
+        # requests and urllib3 take longer to import than the scripts themselves; load them with the first client
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        self.request_errors = requests.RequestException
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.headers.update({"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"})
+        # A retried POST after a 5xx may already have been applied; callers that must not duplicate
+        # objects look them up first.
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset({"GET", "POST", "PUT", "DELETE"}),
+                      respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_workers, 1), max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if not verify:
+            requests.packages.urllib3.disable_warnings()
+
+    def close(self):
+        self.session.close()
+
+    def request(self, method, path, data=None, params=None):
+        """
+        Send one request and return the decoded JSON body.  Raises TrueNasApiError on a non-2xx answer.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        try:
+            response = self.session.request(method, url, json=data, params=params, timeout=self.timeout)
+        except self.request_errors as e:
+            raise TrueNasApiError(None, f"{method} {url}: {e}")
+        if not 200 <= response.status_code < 300:
+            raise TrueNasApiError(response.status_code, response.text)
+        if not response.content:
+            return None
+        return response.json()
+
+    @staticmethod
+    def namespace_path(namespace):
+        return "/".join(namespace.split(".")) + "/"
+
+    def query(self, namespace, filters=None, limit=None, offset=None):
+        params = dict(filters or {})
+        if limit is not None:
+            params["limit"] = limit
+        if offset is not None:
+            params["offset"] = offset
+        return self.request("GET", self.namespace_path(namespace), params=params or None)
+
+    def create(self, namespace, data):
+        return self.request("POST", self.namespace_path(namespace), data)
+
+    def update(self, namespace, object_id, data):
+        return self.request("PUT", f"{self.namespace_path(namespace)}id/{object_id}", data)
+
+    def delete(self, namespace, object_id, data=None):
+        return self.request("DELETE", f"{self.namespace_path(namespace)}id/{object_id}", data)
+
+    def job(self, method, data=None, timeout=3600, poll_interval=1.0):
+        """
+        Start a middleware job ("pool.create" -> POST pool/, "service.restart" -> POST service/restart)
+        and poll core/get_jobs until it finishes.
+        """
+        namespace, _, verb = method.rpartition(".")
+        path = self.namespace_path(namespace) if verb == "create" else method.replace(".", "/")
+        job_id = self.request("POST", path, data)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            jobs = self.request("GET", "core/get_jobs", params={"id": job_id})
+            if jobs and jobs[0]["state"] in JOB_DONE_STATES:
+                return job_result(jobs[0])
+            time.sleep(poll_interval)
+        raise TrueNasApiError(None, f"job {job_id} did not finish within {timeout}s")
+
+
+def client_from_environment(host=None, api_key=None, transport="rest", **kwargs):
+    """
+    Build a REST or WebSocket client from explicit values or TRUENAS_HOST / TRUENAS_API_KEY.
+    Create an API key at https://<truenas-ip>/ui/apikeys.
+    """
+    host = host or os.environ.get("TRUENAS_HOST")
+    api_key = api_key or os.environ.get("TRUENAS_API_KEY")
+    if not host or not api_key:
+        raise ValueError("TrueNAS host and API key are required (--host/--api-key or TRUENAS_HOST/TRUENAS_API_KEY)")
+    if transport == "websocket":
+        from TrueNasWebSocket import TrueNasWebSocketClient
+        return TrueNasWebSocketClient(host, api_key, **kwargs)
+    return TrueNasClient(host, api_key, **kwargs)
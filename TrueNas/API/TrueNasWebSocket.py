@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+"""
+WebSocket JSON-RPC 2.0 transport for the TrueNAS middleware (wss://<host>/api/current).
+
+One authenticated WebSocket session carries every call.  A reader thread matches responses to requests by
+id, so any number of calls can be in flight at once (map() threads simply wait on their own reply).
+Long-running calls return a job id; instead of polling, the session subscribes to core.get_jobs once and
+job() waits for the job's collection_update event.
+
+Offers the same create/query/update/delete/job/map interface as the REST TrueNasClient, so
+CreateISCSITarget's functions run unchanged on either transport.  Requires the websocket-client package.
+"""
+
+import itertools
+import json
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from TrueNasClient import JOB_DONE_STATES, ApiClient, TrueNasApiError, job_result
+
+MAX_TRACKED_JOBS = 1000
+
+
+class TrueNasWebSocketClient(ApiClient):
+    """
+    Multiplexed JSON-RPC session.  Use as a context manager or call close().
+    """
+
+    def __init__(self, host, api_key, verify=False, max_workers=8, timeout=30, url=None):
+        if url is None:
+            address = host.split("://", 1)[-1].rstrip("/")
+            scheme = "ws" if host.startswith(("http://", "ws://")) else "wss"
+            url = f"{scheme}://{address}/api/current"
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.jobs = {}
+        self.job_events = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.closed = False
+        import websocket  # Loaded with the first session, not with the scripts that import this module
+        # What a broken or closed socket raises
+        self.socket_errors = (OSError, websocket.WebSocketException)
+        import ssl
+        sslopt = None if verify else {"cert_reqs": ssl.CERT_NONE, "check_hostname": False}
+        try:
+            self.socket = websocket.create_connection(url, timeout=timeout, sslopt=sslopt)
+        except self.socket_errors as e:
+            raise TrueNasApiError(None, f"unable to connect to {url}: {e}")
+        self.socket.settimeout(None)
+        self.reader = threading.Thread(target=self._read_loop, name="truenas-ws-reader", daemon=True)
+        self.reader.start()
+        if not self.call("auth.login_with_api_key", api_key):
+            self.close()
+            raise TrueNasApiError(None, "API key was rejected")
+        self.call("core.subscribe", "core.get_jobs")
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.socket.close()
+            except self.socket_errors:
+                pass
+            self.reader.join(timeout=5)
+
+    def _read_loop(self):
+        error = "connection closed"
+        try:
+            while True:
+                message = self.socket.recv()
+                if not message:
+                    break
+                self._dispatch(json.loads(message))
+        except self.socket_errors + (ValueError,) as e:
+            error = str(e) or error
+        # Nobody else will answer the calls still waiting
+        for future in list(self.pending.values()):
+            if not future.done():
+                future.set_exception(TrueNasApiError(None, f"WebSocket session ended: {error}"))
+        with self.job_events:
+            self.closed = True
+            self.job_events.notify_all()
+
+    def _dispatch(self, message):
+        if "id" in message and message["id"] in self.pending:
+            future = self.pending.pop(message["id"])
+            if "error" in message and message["error"] is not None:
+                error = message["error"]
+                data = error.get("data") or {}
+                future.set_exception(TrueNasApiError(error.get("code"), data.get("reason") or error.get("message")))
+            else:
+                future.set_result(message.get("result"))
+        elif message.get("method") == "collection_update":
+            update = message.get("params", {})
+            if update.get("collection") == "core.get_jobs" and update.get("fields"):
+                with self.job_events:
+                    job = self.jobs.setdefault(update["id"], {"id": update["id"]})
+                    job.update(update["fields"])
+                    if len(self.jobs) > MAX_TRACKED_JOBS:
+                        # Forget finished jobs nobody waited for (other clients' jobs show up here too)
+                        for job_id in [key for key, value in self.jobs.items()
+                                       if value.get("state") in JOB_DONE_STATES and key != update["id"]]:
+                            del self.jobs[job_id]
+                    self.job_events.notify_all()
+
+    def call_async(self, method, *params):
+        """
+        Send one call and return a Future for its result; calls from many threads share the socket.
+        """
+        request_id = next(self.ids)
+        future = Future()
+        self.pending[request_id] = future
+        payload = json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": list(params)})
+        try:
+            with self.send_lock:
+                self.socket.send(payload)
+        except self.socket_errors as e:
+            self.pending.pop(request_id, None)
+            future.set_exception(TrueNasApiError(None, f"{method}: {e}"))
+        return future
+
+    def call(self, method, *params, timeout=None):
+        try:
+            return self.call_async(method, *params).result(timeout or self.timeout)
+        except FutureTimeout:
+            raise TrueNasApiError(None, f"{method} did not answer within {timeout or self.timeout}s")
+
+    def query(self, namespace, filters=None, limit=None, offset=None):
+        options = {key: value for key, value in (("limit", limit), ("offset", offset)) if value is not None}
+        conditions = [[key, "=", value] for key, value in (filters or {}).items()]
+        return self.call(f"{namespace}.query", conditions, options)
+
+    def create(self, namespace, data):
+        return self.call(f"{namespace}.create", data)
+
+    def update(self, namespace, object_id, data):
+        return self.call(f"{namespace}.update", object_id, data)
+
+    def delete(self, namespace, object_id, data=None):
+        return self.call(f"{namespace}.delete", object_id, *([data] if data is not None else []))
+
+    def job(self, method, data=None, timeout=3600):
+        """
+        Start a middleware job (e.g. "pool.create") and wait for its core.get_jobs event instead of polling.
+        """
+        job_id = self.call(method, *([data] if data is not None else []))
+        with self.job_events:
+            finished = self.job_events.wait_for(
+                lambda: self.closed or self.jobs.get(job_id, {}).get("state") in JOB_DONE_STATES, timeout)
+            job = self.jobs.pop(job_id, None)
+        if not finished or job is None or job.get("state") not in JOB_DONE_STATES:
+            raise TrueNasApiError(None, f"job {job_id} did not finish")
+        return job_result(job)
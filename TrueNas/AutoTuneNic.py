@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+"""
+Adaptive ring and interrupt-coalescing tuner driven by NIC drop counters.
+
+Samples the driver statistics (`ethtool -S`, read through the SIOCETHTOOL ioctl) and packet rates of
+each RDMA interface, then:
+    - raises the rx ring when the host runs out of receive buffers (rx_out_of_buffer) or the port
+      starts discarding/crossing its buffer threshold,
+    - steps rx/tx coalescing between the "latency" and "throughput" targets according to packet rate.
+
+All moves stay inside the bounds under "network.autotune" in Options.json and every change is printed
+(and optionally appended to a JSON lines log) with the counter deltas that caused it.  --once takes a
+single measurement window and only prints recommendations.
+"""
+
+import argparse
+import array
+import ctypes
+import fcntl
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+from TuneNetwork import FixtureBackend, NetlinkBackend, find_rdma_interfaces
+
+SIOCETHTOOL = 0x8946
+ETHTOOL_GSTRINGS = 0x1B
+ETHTOOL_GSTATS = 0x1D
+ETHTOOL_GSSET_INFO = 0x37
+ETH_SS_STATS = 1
+ETH_GSTRING_LEN = 32
+
+DEFAULT_AUTOTUNE = {
+    "interval": 5,
+    "cooldown": 3,            # intervals between two changes on the same interface
+    "quiet_intervals": 3,     # drop-free intervals before coalescing may move toward throughput
+    "rings": {"min": 1024, "max": 8192},
+    "latency": {"rx_usecs": 3, "rx_max_frames": 32, "tx_usecs": 3, "tx_max_frames": 32},
+    "throughput": {"rx_usecs": 32, "rx_max_frames": 256, "tx_usecs": 16, "tx_max_frames": 128},
+    "coalesce_steps": 4,
+    "low_pps": 50000,
+    "high_pps": 500000,
+}
+
+# Counters that mean the host could not keep up with the receive rate
+BUFFER_COUNTERS = ("rx_out_of_buffer",)
+# Counters that mean the port itself is filling up.  Pause frames are not among them: on the lossless
+# RoCE priority (QosPlan.py) PFC pause is the fabric's normal flow control, not a sign of a short ring.
+PRESSURE_COUNTERS = ("rx_discards_phy", "rx_buffer_passed_thres_phy")
+
+
+class EthtoolStatsReader:
+    """
+    Reads `ethtool -S` counters through SIOCETHTOOL without forking ethtool.
+    Counter names are fetched once per interface; each sample is a single GSTATS ioctl.
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.names = {}
+
+    def close(self):
+        self.sock.close()
+
+    def _ioctl(self, iface, buffer):
+        ifreq = struct.pack("16sP", iface.encode()[:15], ctypes.addressof(buffer))
+        fcntl.ioctl(self.sock.fileno(), SIOCETHTOOL, ifreq.ljust(40, b"\0"))
+
+    def _stat_names(self, iface):
+        if iface not in self.names:
+            info = ctypes.create_string_buffer(struct.pack("=IIQI", ETHTOOL_GSSET_INFO, 0, 1 << ETH_SS_STATS, 0))
+            self._ioctl(iface, info)
+            count = struct.unpack_from("=I", info.raw, 16)[0]
+            strings = ctypes.create_string_buffer(struct.pack("=III", ETHTOOL_GSTRINGS, ETH_SS_STATS, count)
+                                                  + b"\0" * (count * ETH_GSTRING_LEN))
+            self._ioctl(iface, strings)
+            raw = strings.raw[12:]
+            self.names[iface] = [raw[i * ETH_GSTRING_LEN:(i + 1) * ETH_GSTRING_LEN].split(b"\0", 1)[0].decode()
+                                 for i in range(count)]
+        return self.names[iface]
+
+    def sample(self, iface):
+        names = self._stat_names(iface)
+        stats = ctypes.create_string_buffer(struct.pack("=II", ETHTOOL_GSTATS, len(names)) + b"\0" * (8 * len(names)))
+        self._ioctl(iface, stats)
+        values = array.array("Q", stats.raw[8:8 + 8 * len(names)])
+        return dict(zip(names, values))
+
+
+class FixtureStatsReader:
+    """
+    Replays counter samples recorded in a fixture ("stats_samples" per interface), one per call.
+    The last sample repeats once the recording runs out.
+    """
+
+    def __init__(self, state):
+        self.samples = {iface: list(data.get("stats_samples", [{}])) for iface, data in state.items()}
+
+    def close(self):
+        pass
+
+    def sample(self, iface):
+        samples = self.samples.get(iface) or [{}]
+        return samples.pop(0) if len(samples) > 1 else dict(samples[0])
+
+
+def load_autotune_config(options):
+    config = json.loads(json.dumps(DEFAULT_AUTOTUNE))
+    for key, value in options.get("network", {}).get("autotune", {}).items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+def counter_deltas(previous, current, elapsed):
+    """
+    Per-second rates for every counter present in both samples (counter resets read as zero).
+    """
+    return {name: max(current[name] - previous[name], 0) / elapsed for name in current if name in previous}
+
+
+def sum_matching(rates, names):
+    return sum(rates.get(name, 0) for name in names)
+
+
+def pause_rate(rates):
+    """
+    Pause frames per second: global pause (*_pause_ctrl_phy) and per-priority PFC (rx_prio6_pause, ...).
+    Reported as evidence only.
+    """
+    return sum(rate for name, rate in rates.items() if name.endswith("_pause") or name.endswith("_pause_ctrl_phy"))
+
+
+def coalesce_level(coalesce, config):
+    """
+    Locate the current rx_usecs on the latency..throughput ladder (0 = latency end).
+    """
+    steps = config["coalesce_steps"]
+    low, high = config["latency"]["rx_usecs"], config["throughput"]["rx_usecs"]
+    if high == low:
+        return 0
+    level = round((coalesce.get("rx_usecs", low) - low) * steps / (high - low))
+    return max(0, min(steps, level))
+
+
+def coalesce_target(level, config):
+    """
+    Interpolate every coalescing key between the latency and throughput targets.
+    """
+    steps = config["coalesce_steps"]
+    target = {}
+    for key, low in config["latency"].items():
+        high = config["throughput"].get(key, low)
+        target[key] = int(round(low + (high - low) * level / steps))
+    return target
+
+
+def recommend(iface, current, rates, config, history):
+    """
+    Decide the ring and coalescing changes for one interface from one window of counter rates.
+    Returns (changes, evidence) where changes uses the TuneNetwork category layout.
+    """
+    changes, evidence = {}, {}
+    rings = current.get("rings", {})
+    coalesce = current.get("coalesce", {})
+    buffer_drops = sum_matching(rates, BUFFER_COUNTERS)
+    pressure = sum_matching(rates, PRESSURE_COUNTERS)
+    pps = rates.get("rx_packets", 0) + rates.get("tx_packets", 0)
+    evidence.update({"pps": round(pps), "buffer_drops_per_s": round(buffer_drops, 2),
+                     "pressure_per_s": round(pressure, 2), "pause_per_s": round(pause_rate(rates), 2)})
+    evidence.update({name: round(rates[name], 2) for name in BUFFER_COUNTERS + PRESSURE_COUNTERS
+                     if rates.get(name)})
+
+    if buffer_drops or pressure:
+        history["quiet"] = 0
+    else:
+        history["quiet"] = history.get("quiet", 0) + 1
+
+    # Rings: grow (never shrink automatically; a ring change restarts the channels)
+    if (buffer_drops or pressure) and "rx" in rings:
+        ceiling = min(config["rings"]["max"], rings.get("rx_max", config["rings"]["max"]))
+        wanted = min(max(rings["rx"] * 2, config["rings"]["min"]), ceiling)
+        if wanted > rings["rx"]:
+            changes["rings"] = {"rx": wanted}
+            evidence["reason"] = "receive drops/pressure: growing rx ring"
+
+    # Coalescing: only when the driver's adaptive moderation is not in charge of it
+    if coalesce and not coalesce.get("use_adaptive_rx"):
+        level = coalesce_level(coalesce, config)
+        if buffer_drops:
+            new_level = max(level - 1, 0)
+            reason = "receive drops: interrupting sooner"
+        elif pps >= config["high_pps"] and history["quiet"] >= config["quiet_intervals"]:
+            new_level = min(level + 1, config["coalesce_steps"])
+            reason = "high packet rate without drops: coalescing more"
+        elif pps <= config["low_pps"]:
+            new_level = max(level - 1, 0)
+            reason = "low packet rate: favouring latency"
+        else:
+            new_level = level
+            reason = None
+        target = coalesce_target(new_level, config)
+        delta = {key: value for key, value in target.items() if key in coalesce and coalesce[key] != value}
+        if delta:
+            changes["coalesce"] = delta
+            evidence["reason"] = "; ".join(filter(None, [evidence.get("reason"), reason]))
+    elif coalesce and history.get("adaptive_noted") is None:
+        print(f"{iface}: adaptive-rx is on, leaving coalescing to the driver.")
+        history["adaptive_noted"] = True
+    return changes, evidence
+
+
+def log_change(log_file, iface, current, changes, evidence, applied):
+    """
+    Print a change with its counter evidence and append it to the JSON lines log if one is configured.
+    """
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    for category, values in changes.items():
+        for key, value in sorted(values.items()):
+            print(f"[{stamp}] {iface}: {category} {key} {current.get(category, {}).get(key)} -> {value}"
+                  f"{'' if applied else ' (recommended)'}")
+    print(f"[{stamp}] {iface}: evidence {json.dumps(evidence, sort_keys=True)}")
+    if log_file:
+        log_file.write(json.dumps({"time": stamp, "interface": iface, "changes": changes,
+                                   "evidence": evidence, "applied": applied}, sort_keys=True) + "\n")
+        log_file.flush()
+
+
+def run(backend, stats_reader, interfaces, config, once=False, log_file=None):
+    """
+    Sampling loop.  With once=True, measures a single interval and prints recommendations only.
+    """
+    history = {iface: {"cooldown": 0} for iface in interfaces}
+    previous = {iface: stats_reader.sample(iface) for iface in interfaces}
+    last = time.monotonic()
+    while True:
+        time.sleep(config["interval"])
+        now = time.monotonic()
+        elapsed, last = now - last, now
+        state = backend.read_state(interfaces)
+        pending = {}
+        for iface in interfaces:
+            sample = stats_reader.sample(iface)
+            rates = counter_deltas(previous[iface], sample, elapsed)
+            previous[iface] = sample
+            changes, evidence = recommend(iface, state[iface], rates, config, history[iface])
+            if history[iface]["cooldown"] > 0 and not once:
+                history[iface]["cooldown"] -= 1
+                continue
+            if changes:
+                log_change(log_file, iface, state[iface], changes, evidence, applied=not once)
+                pending[iface] = changes
+                history[iface]["cooldown"] = config["cooldown"]
+        if once:
+            if not pending:
+                print("No changes recommended; counters are clean for the current settings.")
+            return
+        if pending:
+            for (iface, category), error in sorted(backend.apply(pending).items()):
+                print(f"{iface}: failed to apply {category}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adapt NIC rings and coalescing to observed drop counters.")
+    parser.add_argument("interfaces", nargs="*", help="Interfaces to watch (default: netdevs of RDMA devices)")
+    parser.add_argument("--options", default=find_options_file(), help="Path to Options.json")
+    parser.add_argument("--once", action="store_true", help="Measure one interval and only print recommendations")
+    parser.add_argument("--interval", type=float, help="Sampling interval in seconds (overrides Options.json)")
+    parser.add_argument("--log", help="Append every change and its evidence to this JSON lines file")
+    parser.add_argument("--fixture", help="Use a recorded JSON fixture instead of the kernel")
+    args = parser.parse_args()
+
+    options = {}
+    if args.options:
+        with open(args.options, "r") as file:
+            options = json.load(file)
+    config = load_autotune_config(options)
+    if args.interval:
+        config["interval"] = args.interval
+
+    try:
+        backend = FixtureBackend(args.fixture) if args.fixture else NetlinkBackend()
+        stats_reader = FixtureStatsReader(backend.state) if args.fixture else EthtoolStatsReader()
+    except OSError as e:
+        print(f"Unable to open the tuning backend: {e}")
+        sys.exit(1)
+    interfaces = args.interfaces or (list(backend.state) if args.fixture else find_rdma_interfaces())
+    if not interfaces:
+        print("No RDMA network interfaces found.")
+        sys.exit(0)
+
+    log_file = open(args.log, "a") if args.log else None
+    try:
+        run(backend, stats_reader, interfaces, config, once=args.once, log_file=log_file)
+    except KeyboardInterrupt:
+        print("\nStopping the tuner.")
+    finally:
+        if log_file:
+            log_file.close()
+        stats_reader.close()
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
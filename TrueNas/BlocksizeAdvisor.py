@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+"""
+volblocksize and SCST block size advisor.
+
+Reads the I/O sizes and offsets a LUN actually sees and, for every candidate volblocksize, models what ZFS
+has to move for them:
+    - write amplification: whole records are written even for a partial-record write,
+    - read-modify-write: a write that does not cover a record start/end reads that record first,
+    - read amplification: a read returns whole records,
+    - metadata: one 128 byte block pointer per record,
+    - compression: a compressed record still occupies whole 2^ashift sectors, so small records gain nothing.
+The cheapest candidate is recommended together with the SCST blocksize and lb_per_pb_exp to export.
+
+Inputs (one or more, each I/O labelled with the LUN or disk it belongs to):
+    --fio FILE        fio per-I/O log (write_lat_log/write_iolog with log_offset=1: time, value, ddir, bs, offset)
+    --biosnoop FILE   bcc biosnoop output (header with DISK, T, SECTOR, BYTES)
+    --blkparse FILE   blkparse text output of a blktrace capture (Q events)
+    --histogram FILE  CSV with lun,direction,size,offset,count
+    --scst SECONDS    per-LUN mean read/write size from two SCST sysfs samples (alignment not known)
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+from CreateZvols import expand_zvol_specs, parse_size
+
+CANDIDATES = [4096 << shift for shift in range(6)]     # 4K .. 128K
+BLOCK_POINTER_SIZE = 128
+
+
+def merge_counts(target, source):
+    for key, count in source.items():
+        target[key] = target.get(key, 0) + count
+
+
+def parse_fio_log(path, lun=None):
+    lun = lun or os.path.basename(path).split(".")[0]
+    ios = {}
+    with open(path, "r") as file:
+        for line in file:
+            fields = [field.strip() for field in line.split(",")]
+            if len(fields) < 5 or not fields[3].isdigit():
+                continue
+            direction = {"0": "read", "1": "write"}.get(fields[2])
+            if direction:
+                key = (lun, direction, int(fields[3]), int(fields[4]))
+                ios[key] = ios.get(key, 0) + 1
+    return ios
+
+
+def parse_biosnoop(path):
+    ios = {}
+    columns = None
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split()
+            if "SECTOR" in fields and "BYTES" in fields:
+                columns = {name: index for index, name in enumerate(fields)}
+                continue
+            if not columns or len(fields) < len(columns):
+                continue
+            # COMM may contain spaces; index the numeric columns from the right
+            offset = len(fields) - len(columns)
+            try:
+                disk = fields[columns["DISK"] + offset]
+                kind = fields[columns["T"] + offset]
+                sector = int(fields[columns["SECTOR"] + offset])
+                size = int(fields[columns["BYTES"] + offset])
+            except (KeyError, ValueError):
+                continue
+            direction = "write" if "W" in kind else "read" if "R" in kind else None
+            if direction and size:
+                key = (disk, direction, size, sector * 512)
+                ios[key] = ios.get(key, 0) + 1
+    return ios
+
+
+def parse_blkparse(path):
+    ios = {}
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split()
+            # dev cpu seq time pid action rwbs sector + sectors [process]
+            if len(fields) < 10 or fields[5] != "Q" or fields[8] != "+":
+                continue
+            rwbs = fields[6]
+            direction = "write" if "W" in rwbs else "read" if "R" in rwbs else None
+            try:
+                sector, sectors = int(fields[7]), int(fields[9])
+            except ValueError:
+                continue
+            if direction and sectors:
+                key = (fields[0], direction, sectors * 512, sector * 512)
+                ios[key] = ios.get(key, 0) + 1
+    return ios
+
+
+def parse_histogram(path):
+    ios = {}
+    with open(path, "r", newline="") as file:
+        for row in csv.DictReader(file):
+            key = (row["lun"], row["direction"].strip().lower(), parse_size(row["size"]),
+                   parse_size(row.get("offset") or 0))
+            ios[key] = ios.get(key, 0) + int(row.get("count") or 1)
+    return ios
+
+
+def sample_scst(seconds, root=None):
+    """
+    Mean I/O size per LUN device and direction over an interval, from SCST's session counters.
+
+    SCST counts I/O per session; its per-session LUN directories (lunN/) hold active_commands only.  LUN counters
+    are used where a tree has them; otherwise a session's I/O is attributed to its LUN's device when it sees one
+    LUN, and to the target when it sees several.
+    """
+    from ScstMonitor import SCST_ROOT, ScstSysfs
+    sysfs = ScstSysfs(root or SCST_ROOT)
+    before = sysfs.sample()
+    time.sleep(seconds)
+    after = sysfs.sample()
+    sysfs.close()
+
+    def add(device, values, old):
+        for direction in ("read", "write"):
+            commands = (values.get(f"{direction}_cmd_count") or 0) - (old.get(f"{direction}_cmd_count") or 0)
+            kb = (values.get(f"{direction}_io_count_kb") or 0) - (old.get(f"{direction}_io_count_kb") or 0)
+            if commands > 0:
+                total = totals.setdefault((device, direction), [0, 0])
+                total[0] += commands
+                total[1] += kb
+
+    totals = {}
+    for key, data in after.items():
+        driver, target, session = key
+        previous = before.get(key, {"values": {}, "luns": {}})
+        counted = [lun for lun, values in data["luns"].items() if "read_cmd_count" in values]
+        for lun in counted:
+            device = data["devices"].get(lun) or f"{target}/lun{lun}"
+            add(device, data["luns"][lun], previous["luns"].get(lun, {}))
+        if counted:
+            continue
+        if len(data["luns"]) == 1:
+            [lun] = data["luns"]
+            device = data["devices"].get(lun) or f"{target}/lun{lun}"
+        else:
+            device = target
+        add(device, data["values"], previous["values"])
+    ios = {}
+    for (device, direction), (commands, kb) in totals.items():
+        size = max(512, int(round(kb * 1024 / commands / 512)) * 512)
+        ios[(device, direction, size, 0)] = commands
+    return ios
+
+
+def model(ios, volblocksize, compress_ratio=1.0, ashift=12):
+    """
+    Bytes moved per logical byte for one LUN's I/O mix at one volblocksize.
+    ios is {(direction, size, offset): count}.
+    """
+    logical = written = rmw_read = read = rmw_ios = total_ios = 0
+    for (direction, size, offset), count in ios.items():
+        first = offset // volblocksize
+        last = (offset + size - 1) // volblocksize
+        records = last - first + 1
+        logical += size * count
+        total_ios += count
+        if direction == "write":
+            written += records * volblocksize * count
+            head = offset % volblocksize != 0
+            tail = (offset + size) % volblocksize != 0
+            partial = head + tail - (1 if head and tail and records == 1 else 0)
+            rmw_read += partial * volblocksize * count
+            rmw_ios += count if partial else 0
+        else:
+            read += records * volblocksize * count
+    sector = 1 << ashift
+    stored = math.ceil(volblocksize / compress_ratio / sector) * sector
+    effective_ratio = volblocksize / min(stored, volblocksize)
+    physical_writes = written / effective_ratio
+    metadata = (written / volblocksize) * BLOCK_POINTER_SIZE
+    cost = (physical_writes + rmw_read + read / effective_ratio + metadata) / logical if logical else 0
+    write_logical = sum(size * count for (direction, size, _), count in ios.items() if direction == "write")
+    read_logical = logical - write_logical
+    return {
+        "volblocksize": volblocksize,
+        "write_amplification": round(written / write_logical, 2) if write_logical else None,
+        "read_amplification": round(read / read_logical, 2) if read_logical else None,
+        "rmw_percent": round(100.0 * rmw_ios / total_ios, 1) if total_ios else 0,
+        "metadata_percent": round(100.0 * BLOCK_POINTER_SIZE / volblocksize, 2),
+        "compression": round(effective_ratio, 2),
+        "cost": round(cost, 3),
+    }
+
+
+def recommend_scst(ios, volblocksize, initiator="esxi"):
+    """
+    SCST blocksize and lb_per_pb_exp for the recommended volblocksize.
+    ESXi only understands 512n, 512e (4K physical) and 4Kn, so the exposed physical block is capped at 4K there.
+    """
+    total = sum(ios.values())
+    aligned = sum(count for (_, size, offset), count in ios.items() if size % 4096 == 0 and offset % 4096 == 0)
+    blocksize = 4096 if initiator == "linux" and total and aligned / total >= 0.99 else 512
+    physical = min(volblocksize, 4096) if initiator == "esxi" else volblocksize
+    return {"blocksize": blocksize, "lb_per_pb_exp": max(0, int(math.log2(physical // blocksize))),
+            "aligned_percent": round(100.0 * aligned / total, 1) if total else 0}
+
+
+def advise(ios_by_lun, current, compress_ratio=1.0, ashift=12, initiator="esxi"):
+    reports = []
+    for lun, ios in sorted(ios_by_lun.items()):
+        candidates = [model(ios, size, compress_ratio, ashift) for size in CANDIDATES]
+        # Cheapest wins; on a tie the larger record (less metadata, better compression) is preferred
+        best = min(candidates, key=lambda item: (item["cost"], -item["volblocksize"]))
+        report = {"lun": lun, "ios": sum(ios.values()), "candidates": candidates, "recommended": best,
+                  "scst": recommend_scst(ios, best["volblocksize"], initiator)}
+        if lun in current:
+            now = next((item for item in candidates if item["volblocksize"] == current[lun]), None)
+            if now is None:
+                now = model(ios, current[lun], compress_ratio, ashift)
+            report["current"] = now
+            report["gain_percent"] = round(100.0 * (now["cost"] - best["cost"]) / now["cost"], 1) if now["cost"] else 0
+        reports.append(report)
+    return reports
+
+
+def format_size(value):
+    return f"{value // 1024}K" if value >= 1024 else str(value)
+
+
+def format_report(reports):
+    lines = []
+    for report in reports:
+        lines.append(f"LUN {report['lun']} ({report['ios']} I/Os)")
+        lines.append(f"  {'volblocksize':>12} {'write amp':>9} {'read amp':>8} {'RMW %':>6} {'meta %':>6} "
+                     f"{'compr':>5} {'cost':>6}")
+        for item in report["candidates"]:
+            marks = []
+            if item is report["recommended"]:
+                marks.append("recommended")
+            if report.get("current", {}).get("volblocksize") == item["volblocksize"]:
+                marks.append("current")
+            lines.append(f"  {format_size(item['volblocksize']):>12} {str(item['write_amplification'] or '-'):>9} "
+                         f"{str(item['read_amplification'] or '-'):>8} {item['rmw_percent']:>6} "
+                         f"{item['metadata_percent']:>6} {item['compression']:>5} {item['cost']:>6}"
+                         f"  {', '.join(marks)}")
+        scst = report["scst"]
+        lines.append(f"  -> volblocksize={format_size(report['recommended']['volblocksize'])}, SCST blocksize "
+                     f"{scst['blocksize']}, lb_per_pb_exp {scst['lb_per_pb_exp']} "
+                     f"({scst['aligned_percent']}% of I/Os 4K aligned)")
+        if "gain_percent" in report:
+            lines.append(f"  -> expected reduction in bytes moved vs current "
+                         f"{format_size(report['current']['volblocksize'])}: {report['gain_percent']}%")
+        lines.append("")
+    return lines
+
+
+def current_blocksizes(options_path):
+    """
+    {zvol name: volblocksize in bytes} from the Options.json zvol spec.
+    """
+    if not options_path:
+        return {}
+    with open(options_path, "r") as file:
+        zvols = expand_zvol_specs(json.load(file).get("zvols", []))
+    return {zvol["name"]: parse_size(zvol["volblocksize"]) for zvol in zvols if "volblocksize" in zvol}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend volblocksize and SCST block sizes from observed I/O.")
+    parser.add_argument("--fio", action="append", default=[], help="fio per-I/O log (repeatable)")
+    parser.add_argument("--fio-lun", help="LUN name for the fio logs (default: log file name)")
+    parser.add_argument("--biosnoop", action="append", default=[], help="biosnoop output (repeatable)")
+    parser.add_argument("--blkparse", action="append", default=[], help="blkparse text output (repeatable)")
+    parser.add_argument("--histogram", action="append", default=[], help="CSV histogram (repeatable)")
+    parser.add_argument("--scst", type=float, metavar="SECONDS", help="Sample SCST LUN counters for this long")
+    parser.add_argument("--scst-root", help="SCST sysfs root")
+    parser.add_argument("--current", action="append", default=[], metavar="LUN=SIZE",
+                        help="Current volblocksize of a LUN (default: from Options.json zvols)")
+    parser.add_argument("--options", default=find_options_file(), help="Path to Options.json")
+    parser.add_argument("--compress-ratio", type=float, default=1.0, help="Data compressibility (e.g. 1.6)")
+    parser.add_argument("--ashift", type=int, default=12, help="Pool ashift")
+    parser.add_argument("--initiator", choices=("esxi", "linux"), default="esxi", help="Initiator type")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    ios = {}
+    for path in args.fio:
+        merge_counts(ios, parse_fio_log(path, args.fio_lun))
+    for path in args.biosnoop:
+        merge_counts(ios, parse_biosnoop(path))
+    for path in args.blkparse:
+        merge_counts(ios, parse_blkparse(path))
+    for path in args.histogram:
+        merge_counts(ios, parse_histogram(path))
+    if args.scst:
+        merge_counts(ios, sample_scst(args.scst, args.scst_root))
+    if not ios:
+        print("No I/O samples given (use --fio, --biosnoop, --blkparse, --histogram or --scst).")
+        sys.exit(1)
+
+    ios_by_lun = {}
+    for (lun, direction, size, offset), count in ios.items():
+        lun_ios = ios_by_lun.setdefault(lun, {})
+        lun_ios[(direction, size, offset)] = lun_ios.get((direction, size, offset), 0) + count
+
+    current = current_blocksizes(args.options)
+    for item in args.current:
+        lun, _, size = item.partition("=")
+        current[lun] = parse_size(size)
+
+    reports = advise(ios_by_lun, current, args.compress_ratio, args.ashift, args.initiator)
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print("\n".join(format_report(reports)))
+
+
+if __name__ == "__main__":
+    main()
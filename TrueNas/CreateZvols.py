@@ -1,53 +1,229 @@
 #!/usr/bin/python3
+"""
+Bulk zvol provisioning from the "zvols" section of Options.json.
 
+Pool properties ("zfs.pool_properties") are set in one `zfs set` call, every missing zvol is created with
+all of its properties in a single `zfs create` (several in parallel), existing zvols only get the properties
+that differ, and the result is verified with one `zfs get -Hp` for just the properties in the spec.
+"""
+
+import argparse
+import json
 import os
-import subprocess
+import sys
+
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+# zvol spec keys that map onto ZFS properties (set with -o at creation time)
+ZVOL_PROPERTIES = ("compression", "sync", "logbias", "primarycache", "secondarycache")
+DEFAULT_POOL_PROPERTIES = {"compression": "lz4", "atime": "off", "dedup": "off", "sync": "standard"}
+SIZE_UNITS = {"": 1, "B": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40, "P": 1 << 50}
+
+executor = LocalExecutor()
+
 
 # Function to execute system commands
 def run_command(command):
-    try:
-        print(f"Running command: {command}")
-        subprocess.run(command, shell=True, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Command failed: {e}")
+    print(f"Running command: {' '.join(command)}")
+    result = executor.run(command, on_output=lambda line, stream: print(line))
+    if not result.ok:
+        print(f"Command failed: {' '.join(command)} (exit {result.returncode})")
         exit(1)
 
-def main():
-    pool_name = "dpool"  # Assume the pool already exists
-    zvol1_name = "lun4k"
-    zvol1_blocksize = "4k"
-    zvol2_name = "lun128k"
-    zvol2_blocksize = "64k"
 
-    # Prompt the user to specify ZVOL sizes
-    zvol1_size = input(f"Enter the size for the ZVOL '{zvol1_name}' (e.g., 1G, 500M): ")
-    zvol2_size = input(f"Enter the size for the ZVOL '{zvol2_name}' (e.g., 1G, 500M): ")
+def expand_zvol_specs(zvol_specs):
+    """
+    Expand the "zvols" entries of Options.json into one dict per zvol.
+    An entry either names a single zvol ("name") or a series ("pattern" with "count" and optional "start"),
+    e.g. {"pool": "dpool", "pattern": "lun{index:02d}", "count": 4}. Every other key is copied to each zvol;
+    a series gets consecutive "lun" numbers when it has a "lun" start value.
+    """
+    zvols = []
+    for entry in zvol_specs:
+        common = {key: value for key, value in entry.items() if key not in ("name", "pattern", "count", "start")}
+        if "pattern" in entry:
+            start = int(entry.get("start", 0))
+            for offset in range(int(entry.get("count", 1))):
+                zvol = dict(common, name=entry["pattern"].format(index=start + offset))
+                if "lun" in entry:
+                    zvol["lun"] = int(entry["lun"]) + offset
+                zvols.append(zvol)
+        else:
+            zvols.append(dict(common, name=entry["name"]))
+    return zvols
+
+
+def parse_size(text):
+    """
+    "1T", "500M", "64k", "4096" -> bytes.
+    """
+    value = str(text).strip().upper()
+    if value.endswith("IB"):
+        value = value[:-2]
+    unit = value[-1] if value and value[-1] in SIZE_UNITS else ""
+    number = value[:-1] if unit else value
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+def zvol_properties(zvol):
+    return {key: str(zvol[key]) for key in ZVOL_PROPERTIES if key in zvol}
+
+
+def list_existing_zvols(pools):
+    """
+    Names of all volumes in the given pools, from a single `zfs list`.
+    """
+    result = executor.run(["zfs", "list", "-H", "-o", "name", "-t", "volume", "-r", *sorted(pools)])
+    if not result.ok:
+        print(f"Unable to list zvols: {result.stderr.strip()}")
+        sys.exit(1)
+    return set(result.stdout.split())
+
+
+def create_command(zvol):
+    command = ["zfs", "create", "-V", str(zvol["size"])]
+    if zvol.get("sparse", True):
+        command.append("-s")
+    if "volblocksize" in zvol:
+        command += ["-b", str(zvol["volblocksize"])]
+    for key, value in zvol_properties(zvol).items():
+        command += ["-o", f"{key}={value}"]
+    return command + [f"{zvol['pool']}/{zvol['name']}"]
 
-    # Check if the script is run as root
-    if os.geteuid() != 0:
-        print("This script must be run as root. Please use sudo.")
-        exit(1)
 
-    # Set ZFS pool properties (skipping pool creation, assuming it exists)
-    print(f"Configuring ZFS pool '{pool_name}' with lz4 compression, atime off, dedup off, and sync=default...")
-    run_command(f"zfs set compression=lz4 {pool_name}")
-    run_command(f"zfs set atime=off {pool_name}")
-    run_command(f"zfs set dedup=off {pool_name}")
-    run_command(f"zfs set sync=standard {pool_name}")
+def get_properties(datasets, properties):
+    """
+    {dataset: {property: value}} from one `zfs get -Hp` covering every dataset.
+    """
+    result = executor.run(["zfs", "get", "-Hp", "-o", "name,property,value", ",".join(properties), *datasets])
+    values = {}
+    for line in result.stdout.splitlines():
+        name, prop, value = line.split("\t")
+        values.setdefault(name, {})[prop] = value
+    return values
 
-    # Create ZVOLs with the specified sizes and block sizes
-    print(f"Creating ZVOL '{pool_name}/{zvol1_name}' with block size {zvol1_blocksize} and size {zvol1_size}...")
-    run_command(f"zfs create -V {zvol1_size} -s -b {zvol1_blocksize} {pool_name}/{zvol1_name}")
 
-    print(f"Creating ZVOL '{pool_name}/{zvol2_name}' with block size {zvol2_blocksize} and size {zvol2_size}...")
-    run_command(f"zfs create -V {zvol2_size} -s -b {zvol2_blocksize} {pool_name}/{zvol2_name}")
+def verify_zvols(zvols, actual):
+    """
+    Compare the created zvols with their spec.  Returns a list of mismatch descriptions.
+    """
+    problems = []
+    for zvol in zvols:
+        dataset = f"{zvol['pool']}/{zvol['name']}"
+        values = actual.get(dataset)
+        if values is None:
+            problems.append(f"{dataset}: does not exist")
+            continue
+        if "volblocksize" in zvol and int(values.get("volblocksize", 0)) != parse_size(zvol["volblocksize"]):
+            problems.append(f"{dataset}: volblocksize is {values.get('volblocksize')}, wanted {zvol['volblocksize']}")
+        if "size" in zvol:
+            wanted, have = parse_size(zvol["size"]), int(values.get("volsize", 0))
+            # volsize is rounded up to a multiple of volblocksize
+            if have < wanted or have - wanted >= int(values.get("volblocksize", 0) or 1):
+                problems.append(f"{dataset}: volsize is {have}, wanted {wanted}")
+        for key, value in zvol_properties(zvol).items():
+            if values.get(key) != value:
+                problems.append(f"{dataset}: {key} is {values.get(key)}, wanted {value}")
+    return problems
+
+
+def provision(zvols, pool_properties, jobs=8, dry_run=False, existing=None):
+    """
+    Create or update every zvol in the expanded spec.  Returns True when everything matches afterwards.
+    existing is the list_existing_zvols() result, when the caller already has it.
+    """
+    pools = sorted({zvol["pool"] for zvol in zvols})
+    if existing is None:
+        existing = list_existing_zvols(pools)
+    commands = []
+    if pool_properties:
+        settings = [f"{key}={value}" for key, value in pool_properties.items()]
+        commands += [["zfs", "set", *settings, pool] for pool in pools]
+
+    creates, updates = [], []
+    current = get_properties(sorted(existing & {f"{z['pool']}/{z['name']}" for z in zvols}), ZVOL_PROPERTIES) \
+        if existing else {}
+    for zvol in zvols:
+        dataset = f"{zvol['pool']}/{zvol['name']}"
+        if dataset not in existing:
+            creates.append(create_command(zvol))
+            continue
+        differing = [f"{key}={value}" for key, value in zvol_properties(zvol).items()
+                     if current.get(dataset, {}).get(key) != value]
+        if differing:
+            updates.append(["zfs", "set", *differing, dataset])
+
+    if dry_run:
+        for command in commands + creates + updates:
+            print(f"Would run: {' '.join(command)}")
+        if not creates and not updates:
+            print("All zvols already exist with the requested properties.")
+        return True
+
+    for command in commands:
+        run_command(command)
+    print(f"Creating {len(creates)} zvol(s) and updating {len(updates)} with up to {jobs} in parallel...")
+    failed = False
+    for result in executor.run_many(creates + updates, max_workers=jobs):
+        if not result.ok:
+            print(f"Command failed: {' '.join(result.args)}: {result.stderr.strip()}")
+            failed = True
+        else:
+            print(f"Done: {' '.join(result.args)}")
 
-    # Verify the configuration
     print("Verifying ZVOL properties...")
-    run_command(f"zfs get all {pool_name}/{zvol1_name}")
-    run_command(f"zfs get all {pool_name}/{zvol2_name}")
+    properties = ("volsize", "volblocksize") + ZVOL_PROPERTIES
+    actual = get_properties([f"{zvol['pool']}/{zvol['name']}" for zvol in zvols], properties)
+    problems = verify_zvols(zvols, actual)
+    for problem in problems:
+        print(problem)
+    return not failed and not problems
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the zvols described in Options.json.")
+    parser.add_argument("--options", default=find_options_file(), help="Path to Options.json")
+    parser.add_argument("--jobs", type=int, default=8, help="zfs create commands to run in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="Print the zfs commands without running them")
+    args = parser.parse_args()
+
+    if not args.options:
+        print("Options.json file not found!")
+        exit(1)
+    with open(args.options, "r") as file:
+        options = json.load(file)
+    zvols = expand_zvol_specs(options.get("zvols", []))
+    if not zvols:
+        print("No zvols defined in Options.json.")
+        exit(0)
+
+    # Check if the script is run as root
+    if os.geteuid() != 0 and not args.dry_run:
+        print("This script must be run as root. Please use sudo.")
+        exit(1)
+
+    # Prompt the user for the sizes the spec leaves open, only for zvols that will be created; an existing zvol
+    # without a size in the spec keeps (and is not verified against) the size it has
+    existing = list_existing_zvols({zvol["pool"] for zvol in zvols})
+    for zvol in zvols:
+        if "size" not in zvol and f"{zvol['pool']}/{zvol['name']}" not in existing:
+            zvol["size"] = input(f"Enter the size for the ZVOL '{zvol['name']}' (e.g., 1G, 500M): ").strip()
+
+    pool_properties = options.get("zfs", {}).get("pool_properties", DEFAULT_POOL_PROPERTIES)
+    if not provision(zvols, pool_properties, args.jobs, args.dry_run, existing):
+        print("ZVOL provisioning finished with errors.")
+        exit(1)
     print("ZVOL creation and configuration completed successfully.")
 
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,79 +1,149 @@
 #!/usr/bin/python3
 
+import functools
+import glob
+import json
 import os
-import subprocess
+import re
 import sys
+from urllib.parse import unquote
+
+from ModulePlan import REQUIRED_MODULES, reload_modules
+from ScstMonitor import SCST_ROOT
+from ScstReconcile import ScstConfigError, parse_config, reconcile
+
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+executor = LocalExecutor()
 
 
 def run_command(command, check=True):
     """
-    Run a shell command and optionally check for errors.
+    Run a command (argv list, no shell), showing its output as it runs, and optionally check for errors.
     """
-    try:
-        print(f"Running command: {command}")
-        subprocess.run(command, shell=True, check=check)
-    except subprocess.CalledProcessError as e:
-        print(f"Command failed: {e}")
+    print(f"Running command: {' '.join(command)}")
+    result = executor.run(command, on_output=lambda line, stream: print(line))
+    if check and not result.ok:
+        print(f"Command failed: {' '.join(command)} (exit {result.returncode})")
         sys.exit(1)
 
 
-def is_package_installed(package_name):
+def read_installed_packages(package_names, status_path="/var/lib/dpkg/status"):
     """
-    Check if a package is already installed using dpkg-query.
+    Return the subset of package_names that dpkg reports as "install ok installed".
+    The dpkg status database is read once; if it cannot be read, a single dpkg-query covers all names.
     """
+    wanted = set(package_names)
+    installed = set()
     try:
-        result = subprocess.run(
-            f"dpkg-query -W -f='${{Status}}' {package_name} 2>/dev/null | grep -q 'install ok installed'",
-            shell=True
-        )
-        return result.returncode == 0
-    except Exception as e:
-        print(f"Error checking package '{package_name}' installation status: {e}")
-        return False
-
-
-def ensure_package_installed(package_name):
+        with open(status_path, "r", errors="replace") as file:
+            stanzas = file.read().split("\n\n")
+    except OSError as e:
+        print(f"Cannot read {status_path} ({e}); asking dpkg-query instead.")
+        result = executor.run(["dpkg-query", "-W", "-f=${Package} ${Status}\n", *sorted(wanted)])
+        for line in result.stdout.splitlines():
+            name, _, status = line.partition(" ")
+            if status == "install ok installed":
+                installed.add(name.split(":")[0])
+        return installed & wanted
+
+    for stanza in stanzas:
+        fields = {}
+        for line in stanza.splitlines():
+            if line and not line[0].isspace() and ":" in line:
+                key, _, value = line.partition(":")
+                fields[key] = value.strip()
+        if fields.get("Package") in wanted and fields.get("Status") == "install ok installed":
+            installed.add(fields["Package"])
+    return installed
+
+
+def _compare_version_part(a, b):
     """
-    Ensure a specific APT package is installed. If not, install it.
+    dpkg's comparison of one upstream version or revision: alternating non-digit and digit runs, where in the
+    non-digit runs '~' sorts before everything (even the end of the string) and letters sort before other symbols.
     """
-    if is_package_installed(package_name):
-        print(f"Package '{package_name}' is already installed. Skipping installation.")
-    else:
-        print(f"Package '{package_name}' is not installed. Installing it now...")
-        run_command(f"apt install -y -f {package_name}")
-
-
-def load_kernel_module(module):
+    def order(char):
+        if char == "~":
+            return -1
+        return ord(char) if char.isalpha() else ord(char) + 256
+
+    runs_a, runs_b = re.findall(r"(\D*)(\d*)", a), re.findall(r"(\D*)(\d*)", b)
+    for index in range(max(len(runs_a), len(runs_b))):
+        text_a, digits_a = runs_a[index] if index < len(runs_a) else ("", "")
+        text_b, digits_b = runs_b[index] if index < len(runs_b) else ("", "")
+        key_a, key_b = [order(char) for char in text_a] + [0], [order(char) for char in text_b] + [0]
+        if key_a != key_b:
+            return -1 if key_a < key_b else 1
+        if int(digits_a or 0) != int(digits_b or 0):
+            return -1 if int(digits_a or 0) < int(digits_b or 0) else 1
+    return 0
+
+
+def compare_deb_versions(a, b):
     """
-    Load a specific kernel module using modprobe.
+    Compare two Debian versions ([epoch:]upstream[-revision]) as `dpkg --compare-versions` does: -1, 0 or 1.
     """
-    try:
-        print(f"Loading kernel module '{module}'...")
-        run_command(f"modprobe {module}")
-        print(f"Kernel module '{module}' loaded successfully.")
-    except Exception as e:
-        print(f"Failed to load kernel module '{module}': {e}")
-        sys.exit(1)
+    def split(version):
+        epoch, _, rest = version.partition(":") if ":" in version else ("0", "", version)
+        upstream, _, revision = rest.rpartition("-") if "-" in rest else (rest, "", "0")
+        return int(epoch or 0), upstream, revision
 
+    epoch_a, upstream_a, revision_a = split(a)
+    epoch_b, upstream_b, revision_b = split(b)
+    if epoch_a != epoch_b:
+        return -1 if epoch_a < epoch_b else 1
+    return _compare_version_part(upstream_a, upstream_b) or _compare_version_part(revision_a, revision_b)
 
-def unload_kernel_module(module):
+
+def find_cached_debs(deb_cache, package_names):
     """
-    Unload a specific kernel module using modprobe -r.
+    Map package names to the newest .deb of each in the local cache directory.
+    Cache files are named <package>_<version>_<arch>.deb, with an epoch's ':' written as '%3a'.
+    The paths are absolute: apt only installs an argument as a local file when it contains a '/'.
     """
+    versions = {}
     try:
-        print(f"Unloading kernel module '{module}'...")
-        run_command(f"modprobe -r {module}")
-        print(f"Kernel module '{module}' unloaded successfully.")
-    except Exception as e:
-        print(f"Failed to unload kernel module '{module}': {e}")
-
-
-def reload_kernel_module(module):
+        entries = os.listdir(deb_cache)
+    except OSError:
+        return {}
+    for entry in entries:
+        parts = entry[:-len(".deb")].split("_") if entry.endswith(".deb") else []
+        if len(parts) == 3 and parts[0] in package_names:
+            versions.setdefault(parts[0], []).append((unquote(parts[1]), entry))
+    newest = functools.cmp_to_key(lambda a, b: compare_deb_versions(a[0], b[0]))
+    return {name: os.path.join(os.path.abspath(deb_cache), max(candidates, key=newest)[1])
+            for name, candidates in versions.items()}
+
+
+def install_packages(package_names, deb_cache=None):
     """
-    Reload a specific kernel module by first unloading it and then loading it again.
+    Install all missing packages in a single apt transaction.
+    With a deb cache, packages that have a .deb there are installed from it and everything apt downloads is
+    kept there, so the next run (e.g. after a TrueNAS update wiped the boot environment) needs no mirror.
     """
-    unload_kernel_module(module)
-    load_kernel_module(module)
+    if not package_names:
+        return
+    targets = list(package_names)
+    apt_options = []
+    if deb_cache:
+        deb_cache = os.path.abspath(deb_cache)
+        os.makedirs(os.path.join(deb_cache, "partial"), exist_ok=True)
+        cached = find_cached_debs(deb_cache, package_names)
+        targets = [cached.get(name, name) for name in package_names]
+        apt_options = ["-o", f"Dir::Cache::Archives={deb_cache}"]
+        if cached:
+            print(f"Installing {', '.join(sorted(cached))} from {deb_cache}.")
+    run_command(["apt", "install", "-y", "-f", *apt_options, *targets])
 
 
 def find_boot_pool_root_from_df():
@@ -84,7 +154,7 @@ def find_boot_pool_root_from_df():
     """
     try:
         # Run `df -h` command and capture the output
-        result = subprocess.run(['df', '-h'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        result = executor.run(['df', '-h'], check=True)
 
         # Parse the output line by line
         for line in result.stdout.splitlines():
@@ -95,18 +165,28 @@ def find_boot_pool_root_from_df():
                 mount_path = parts[0]  # The mount point is in the last column
                 return mount_path
 
-    except subprocess.CalledProcessError as e:
-        print(f"Error running 'df -h': {e}")
     except Exception as e:
         print(f"Unexpected error: {e}")
 
     return None
 
 
-def ensure_required_packages_installed():
+def load_deb_cache():
+    """
+    Local .deb cache directory from "packages.deb_cache" in Options.json (empty or missing: none).
+    Point it at a pool dataset so it survives TrueNAS updates.
+    """
+    options_path = find_options_file()
+    if not options_path:
+        return None
+    with open(options_path, "r") as file:
+        return json.load(file).get("packages", {}).get("deb_cache") or None
+
+
+def ensure_required_packages_installed(deb_cache=None):
     """
     Ensure a list of required packages is installed.
-    If a package fails, the script will continue to the next one.
+    Package state is read once and everything missing is installed in one apt run.
     """
     required_packages = [
         "byobu",            # Terminal management tool
@@ -121,47 +201,56 @@ def ensure_required_packages_installed():
         "mstflint",          # Mellanox firmware burning and query utility
     ]
 
+    installed = read_installed_packages(required_packages)
+    missing = [package for package in required_packages if package not in installed]
     for package in required_packages:
-        try:
-            ensure_package_installed(package)
-        except Exception as e:
-            print(f"Failed to process package '{package}'. Error: {e}")
-
-
-def reload_all_required_kernel_modules():
-    """
-    Reload all required kernel modules.
-    """
-    required_modules = [
-        "isert_scst",       # SCSI target framework for iSER
-        "rdma_cm",          # RDMA Communication Manager
-        "ib_core",          # InfiniBand core support
-        "mlx5_ib",          # Driver for Mellanox InfiniBand adapter
-        "mlx5_core",        # Mellanox ConnectX-4/5 drivers
-        "ib_uverbs",        # User-level verbs for RDMA
-        "mlxfw",            # Mellanox firmware updates
-        "rdma_ucm",         # RDMA CM user-space module
-        "ib_umad",          # Management Datagram
-        "ib_iser",          # iSER functionality
-        "ib_ipoib",         # IP over InfiniBand
-        "ib_cm"             # InfiniBand Communication Manager
-    ]
-    for module in required_modules:
-        print(f"Reloading kernel module: {module}")
-        reload_kernel_module(module)
+        if package in installed:
+            print(f"Package '{package}' is already installed. Skipping installation.")
+    if missing:
+        print(f"Installing missing packages: {', '.join(missing)}")
+        install_packages(missing, deb_cache)
+    else:
+        print("All required packages are already installed.")
 
 
-def restart_scst_service():
+def reload_all_required_kernel_modules(refresh=()):
     """
-    Restart the SCST service (systemctl restart scst.service).
+    Load the required kernel modules.  Only missing modules (and any marked for refresh, together with
+    their dependents) are touched; see ModulePlan.py.
     """
     try:
-        print("Restarting SCST service...")
-        run_command("systemctl restart scst.service")
-        print("SCST service restarted successfully.")
-    except Exception as e:
-        print(f"Failed to restart SCST service: {e}")
+        success = reload_modules(REQUIRED_MODULES, refresh)
+    except OSError as e:
+        print(f"Unable to read kernel module information: {e}")
+        success = False
+    if not success:
+        print("Failed to load the required kernel modules.")
+        sys.exit(1)
+
+
+def apply_scst_config(config_path="/etc/scst.conf"):
+    """
+    Bring the running SCST in line with scst.conf without restarting scst.service.
+    Only the differences are written through sysfs (see ScstReconcile.py), so sessions to untouched LUNs
+    stay up; changes that need a restart are listed.  If SCST is not running yet it is started.
+    """
+    if not os.path.isdir(os.path.join(SCST_ROOT, "targets")):
+        print("SCST is not running; starting scst.service...")
+        run_command(["systemctl", "start", "scst.service"])
+        return
+    if not os.path.exists(config_path):
+        print(f"{config_path} not found; leaving the running SCST configuration as it is.")
+        return
+    try:
+        with open(config_path, "r") as file:
+            desired = parse_config(file.read())
+        reports = reconcile(desired, SCST_ROOT, apply=True)
+    except (ScstConfigError, OSError) as e:
+        print(f"Failed to apply {config_path}: {e}")
         sys.exit(1)
+    if reports:
+        print("Some changes need a restart of scst.service (or re-creating the device) to take effect; "
+              "schedule it for a maintenance window.")
 
 
 def get_user_input():
@@ -171,8 +260,8 @@ def get_user_input():
     print("\nWhat this script will do:")
     print("==========================")
     print("1. Ensure the required packages are installed.")
-    print("2. Reload required kernel modules.")
-    print("3. Restart the SCST service (scst.service).")
+    print("2. Load missing kernel modules (loaded, healthy modules are left alone).")
+    print("3. Apply /etc/scst.conf to the running SCST (no service restart).")
     print("==========================")
     print("\nOptions:")
     print("1. Proceed with these actions")
@@ -210,7 +299,7 @@ def main():
 
         # Step 2: Remount the target boot-pool directory as read-write
         print(f"Remounting {boot_pool_path} as read-write...")
-        run_command(f"mount -o remount,rw {boot_pool_path}")
+        run_command(["mount", "-o", "remount,rw", boot_pool_path])
 
         # Step 3: Modify PATH temporarily
         print("Modifying PATH to temporarily enable apt and dpkg...")
@@ -218,23 +307,22 @@ def main():
 
         # Step 4: Make apt and dpkg executable
         print("Making apt and dpkg executable...")
-        run_command("chmod +x /bin/apt*")
-        run_command("chmod +x /usr/bin/dpkg")
+        run_command(["chmod", "+x", *glob.glob("/bin/apt*"), "/usr/bin/dpkg"])
 
         # Step 5: Ensure required packages are installed
         print("Ensuring required packages are installed...")
-        ensure_required_packages_installed()
+        ensure_required_packages_installed(load_deb_cache())
 
-        # Step 6: Reload all required kernel modules
+        # Step 6: Load the required kernel modules
 
-        print("Reloading all required kernel modules...")
+        print("Loading required kernel modules...")
         reload_all_required_kernel_modules()
 
-        # Step 7: Restart SCST service
-        print("Restarting SCST service...")
-        restart_scst_service()
+        # Step 7: Apply the SCST configuration in place
+        print("Applying the SCST configuration...")
+        apply_scst_config()
 
-        print("All required packages are ensured, kernel modules reloaded, and SCST service restarted!")
+        print("All required packages are ensured, kernel modules loaded, and SCST configuration applied!")
 
     finally:
         # Restore the original PATH
@@ -0,0 +1,376 @@
+#!/usr/bin/python3
+"""
+Generate scst.conf from the declarative "zvols" and "scst" sections of Options.json.
+
+    "zvols": the pools and zvols to export (see CreateZvols.expand_zvol_specs), each optionally with a
+             "lun" number and an "scst" dict of per-device attribute overrides ("export": false skips it).
+    "scst":  the performance profile for device attributes, the targets with their transport and the
+             netplan interfaces their portals come from, and the ALUA device groups.
+
+The output is deterministic (devices sorted by name, LUNs by number) so successive runs diff cleanly, and
+conflicting LUN numbers, duplicate devices or unknown interfaces stop generation with an error.
+"""
+
+import argparse
+import difflib
+import json
+import os
+import sys
+
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+from CreateZvols import expand_zvol_specs
+
+# Per-device attribute defaults.  "balanced" reproduces zsh/etc/scst.conf.sample.
+DEVICE_PROFILES = {
+    "balanced": {
+        "blocksize": 512,
+        "read_only": 0,
+        "write_through": 1,
+        "iomode": "direct",
+        "rotational": 1,
+        "prod_id": "iSCSI Disk",
+        "t10_vend_id": "CTMS-SAN",
+        "max_tgt_dev_commands": 254,
+        "max_queue_depth": 254,
+    },
+    "ssd": {
+        "blocksize": 512,
+        "read_only": 0,
+        "write_through": 1,
+        "iomode": "direct",
+        "rotational": 0,
+        "prod_id": "iSCSI Disk",
+        "t10_vend_id": "CTMS-SAN",
+        "threads_num": 32,
+        "threads_pool_size": 32,
+        "max_tgt_dev_commands": 254,
+        "max_queue_depth": 254,
+    },
+    "nvme": {
+        "blocksize": 512,
+        "read_only": 0,
+        "write_through": 0,
+        "iomode": "direct",
+        "rotational": 0,
+        "prod_id": "iSCSI Disk",
+        "t10_vend_id": "CTMS-SAN",
+        "threads_num": 64,
+        "threads_pool_size": 64,
+        "max_tgt_dev_commands": 254,
+        "max_queue_depth": 254,
+    },
+}
+
+COMMON_TARGET_PARAMETERS = {
+    "FirstBurstLength": 65536,
+    "MaxBurstLength": 262144,
+    "MaxOutstandingR2T": 4,
+    "QueuedCommands": 254,
+    "InitialR2T": "Yes",
+    "ImmediateData": "Yes",
+    "DataPDUInOrder": "Yes",
+    "DataSequenceInOrder": "Yes",
+    "ErrorRecoveryLevel": 1,
+    "HeaderDigest": "None",
+    "DataDigest": "None",
+    "OFMarker": "No",
+    "IFMarker": "No",
+    "OFMarkInt": 2048,
+    "IFMarkInt": 2048,
+}
+TRANSPORT_PARAMETERS = {
+    "iscsi": {
+        "MaxRecvDataSegmentLength": 262144,
+        "MaxXmitDataSegmentLength": 262144,
+        "MaxConnections": 32,
+        "RDMAExtensions": "No",
+    },
+    "iser": {
+        "MaxRecvDataSegmentLength": 8192,
+        "MaxXmitDataSegmentLength": 8192,
+        "MaxConnections": 16,
+    },
+}
+
+
+# Order the iSCSI parameters are written in (as in the sample); unknown ones follow alphabetically
+PARAMETER_ORDER = (
+    "MaxRecvDataSegmentLength", "MaxXmitDataSegmentLength", "FirstBurstLength", "MaxBurstLength",
+    "MaxOutstandingR2T", "MaxConnections", "QueuedCommands", "InitialR2T", "ImmediateData", "DataPDUInOrder",
+    "DataSequenceInOrder", "ErrorRecoveryLevel", "HeaderDigest", "DataDigest", "OFMarker", "IFMarker",
+    "OFMarkInt", "IFMarkInt", "RDMAExtensions",
+)
+
+
+class ScstConfigError(Exception):
+    pass
+
+
+def parse_netplan_addresses(text):
+    """
+    Return {interface: [address, ...]} (prefix length stripped) from a netplan file.
+    Uses PyYAML when available and otherwise a small indentation-based reader that only
+    looks at network.ethernets.<iface>.addresses.
+    """
+    try:
+        import yaml
+        ethernets = (yaml.safe_load(text) or {}).get("network", {}).get("ethernets", {}) or {}
+        return {iface: [str(address).split("/")[0] for address in (config or {}).get("addresses", [])]
+                for iface, config in ethernets.items()}
+    except ImportError:
+        pass
+
+    addresses = {}
+    ethernets_indent = iface_indent = key_indent = None
+    iface = None
+    in_list = False
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        indent = len(raw) - len(raw.lstrip())
+        if line == "ethernets:":
+            ethernets_indent, iface_indent, iface = indent, None, None
+            continue
+        if ethernets_indent is None:
+            continue
+        if indent <= ethernets_indent:
+            ethernets_indent = iface = None
+            continue
+        if iface_indent is None or indent <= iface_indent:
+            iface_indent, key_indent, in_list = indent, None, False
+            iface = line.rstrip(":").strip("\"'")
+            addresses[iface] = []
+            continue
+        if key_indent is None:
+            key_indent = indent
+        if indent == key_indent:
+            # Only the interface's own "addresses:", not nameservers.addresses
+            in_list = line == "addresses:"
+        elif in_list and line.startswith("- "):
+            addresses[iface].append(line[2:].strip().strip("\"'").split("/")[0])
+    return addresses
+
+
+def load_netplan(path):
+    try:
+        with open(path, "r") as file:
+            return parse_netplan_addresses(file.read())
+    except OSError as e:
+        raise ScstConfigError(f"Unable to read netplan file {path}: {e}")
+
+
+def format_value(value):
+    text = str(value)
+    return f'"{text}"' if " " in text else text
+
+
+def build_model(zvols, scst_spec, netplan):
+    """
+    Resolve the spec into devices, targets and device groups, checking for conflicts.
+    """
+    profile_name = scst_spec.get("profile", "balanced")
+    profile = dict(DEVICE_PROFILES.get(profile_name) or {})
+    if not profile:
+        raise ScstConfigError(f"Unknown device profile '{profile_name}' (choose from {', '.join(DEVICE_PROFILES)})")
+    profile.update(scst_spec.get("device_defaults", {}))
+
+    devices = {}
+    for zvol in zvols:
+        name = zvol["name"]
+        if not zvol.get("export", True):
+            continue
+        if name in devices:
+            raise ScstConfigError(f"Device '{name}' is defined more than once")
+        attributes = {"filename": f"/dev/zvol/{zvol['pool']}/{name}"}
+        attributes.update(profile)
+        attributes["t10_dev_id"] = name
+        attributes.update(zvol.get("scst", {}))
+        devices[name] = {"attributes": attributes, "lun": zvol.get("lun")}
+
+    # LUN numbers: explicit ones first, then the lowest free number for the rest
+    used = {}
+    for name, device in sorted(devices.items()):
+        lun = device["lun"]
+        if lun is None:
+            continue
+        if lun in used:
+            raise ScstConfigError(f"LUN {lun} is assigned to both '{used[lun]}' and '{name}'")
+        used[lun] = name
+    next_lun = 0
+    for name, device in sorted(devices.items()):
+        if device["lun"] is None:
+            while next_lun in used:
+                next_lun += 1
+            device["lun"] = next_lun
+            used[next_lun] = name
+
+    iqn_prefix = scst_spec.get("iqn_prefix", "iqn.2025-05.RackZilla.ctl")
+    targets = []
+    rel_ids = {}
+    for index, target in enumerate(scst_spec.get("targets", []), start=1):
+        transport = target.get("transport", "iscsi")
+        if transport not in TRANSPORT_PARAMETERS:
+            raise ScstConfigError(f"Target '{target['name']}' has unknown transport '{transport}'")
+        portals = []
+        for iface in target.get("interfaces", []):
+            if not netplan.get(iface):
+                raise ScstConfigError(f"Interface '{iface}' of target '{target['name']}' has no netplan address")
+            portals.extend(netplan[iface])
+        portals += target.get("portals", [])
+        rel_tgt_id = int(target.get("rel_tgt_id", index))
+        if rel_tgt_id in rel_ids:
+            raise ScstConfigError(f"rel_tgt_id {rel_tgt_id} is used by '{rel_ids[rel_tgt_id]}' and '{target['name']}'")
+        rel_ids[rel_tgt_id] = target["name"]
+        names = target.get("zvols") or sorted(devices)
+        for name in names:
+            if name not in devices:
+                raise ScstConfigError(f"Target '{target['name']}' maps unknown device '{name}'")
+        parameters = dict(COMMON_TARGET_PARAMETERS)
+        parameters.update(TRANSPORT_PARAMETERS[transport])
+        parameters.update(target.get("parameters", {}))
+        targets.append({
+            "name": f"{iqn_prefix}:{target['name']}",
+            "short_name": target["name"],
+            "portals": portals,
+            "rel_tgt_id": rel_tgt_id,
+            "luns": sorted((devices[name]["lun"], name) for name in names),
+            "parameters": parameters,
+        })
+
+    target_names = {target["short_name"]: target["name"] for target in targets}
+    grouped = {}
+    groups = []
+    for group in scst_spec.get("device_groups", []):
+        members = group.get("devices") or sorted(devices)
+        for name in members:
+            if name not in devices:
+                raise ScstConfigError(f"Device group '{group['name']}' lists unknown device '{name}'")
+            if name in grouped:
+                raise ScstConfigError(f"Device '{name}' is in both '{grouped[name]}' and '{group['name']}'")
+            grouped[name] = group["name"]
+        target_groups = []
+        for target_group in group.get("target_groups", []):
+            members_of_group = []
+            for short_name in target_group.get("targets", []):
+                if short_name not in target_names:
+                    raise ScstConfigError(f"Target group '{target_group['name']}' lists unknown target '{short_name}'")
+                members_of_group.append(target_names[short_name])
+            target_groups.append(dict(target_group, targets=members_of_group))
+        groups.append({"name": group["name"], "devices": sorted(members), "target_groups": target_groups})
+
+    return {"devices": devices, "targets": targets, "device_groups": groups}
+
+
+def render(model):
+    """
+    Render the model in scst.conf syntax.
+    """
+    lines = ["# Generated by TrueNas/GenerateScstConf.py from Options.json - do not edit by hand.", ""]
+    devices = model["devices"]
+
+    lines += ["TARGET_DRIVER copy_manager {", "    TARGET copy_manager_tgt {"]
+    for copy_lun, name in enumerate(sorted(devices)):
+        lines.append(f"        LUN {copy_lun} {name}")
+    lines += ["    }", "}", ""]
+
+    lines.append("HANDLER vdisk_blockio {")
+    for name in sorted(devices):
+        lines.append(f"    DEVICE {name} {{")
+        for key, value in devices[name]["attributes"].items():
+            lines.append(f"        {key} {format_value(value)}")
+        lines += ["    }", ""]
+    if lines[-1] == "":
+        lines.pop()
+    lines += ["}", ""]
+
+    for group in model["device_groups"]:
+        lines.append(f"DEVICE_GROUP {group['name']} {{")
+        for name in group["devices"]:
+            lines.append(f"    DEVICE {name}")
+        for target_group in group["target_groups"]:
+            lines += ["", f"    TARGET_GROUP {target_group['name']} {{",
+                      f"        group_id {target_group['group_id']}",
+                      f"        state {target_group.get('state', 'optimized')}",
+                      f"        preferred {target_group.get('preferred', 0)}"]
+            if target_group["targets"]:
+                lines.append("")
+            for target in target_group["targets"]:
+                lines.append(f"        TARGET {target}")
+            lines.append("    }")
+        lines += ["}", ""]
+
+    listen = []
+    for target in model["targets"]:
+        listen += [portal for portal in target["portals"] if portal not in listen]
+    lines += ["TARGET_DRIVER iscsi {", "    enabled 1"]
+    if listen:
+        lines.append(f"    listen_address {format_value(' '.join(listen))}")
+    lines.append("    link_local 0")
+    for target in model["targets"]:
+        lines += ["", f"    TARGET {target['name']} {{"]
+        for portal in target["portals"]:
+            lines.append(f"        allowed_portal {portal}")
+        lines += [f"        rel_tgt_id {target['rel_tgt_id']}", "        enabled 1", ""]
+        for lun, name in target["luns"]:
+            lines.append(f"        LUN {lun} {name}")
+        lines.append("")
+        order = {key: index for index, key in enumerate(PARAMETER_ORDER)}
+        parameters = sorted(target["parameters"].items(), key=lambda item: (order.get(item[0], len(order)), item[0]))
+        for key, value in parameters:
+            lines.append(f"        {key} {format_value(value)}")
+        lines.append("    }")
+    lines += ["}"]
+    return "\n".join(lines) + "\n"
+
+
+def generate(options, netplan_path=None):
+    """
+    Build scst.conf text from a parsed Options.json.
+    """
+    scst_spec = options.get("scst", {})
+    netplan_path = netplan_path or scst_spec.get("netplan", "/etc/netplan/netplan.yaml")
+    netplan = load_netplan(netplan_path) if any(t.get("interfaces") for t in scst_spec.get("targets", [])) else {}
+    return render(build_model(expand_zvol_specs(options.get("zvols", [])), scst_spec, netplan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate scst.conf from Options.json.")
+    parser.add_argument("--options", default=find_options_file(), help="Path to Options.json")
+    parser.add_argument("--netplan", help="Netplan file the portal addresses come from (overrides scst.netplan)")
+    parser.add_argument("--output", help="Write the configuration here instead of stdout")
+    parser.add_argument("--diff", metavar="EXISTING", help="Show a unified diff against an existing scst.conf")
+    args = parser.parse_args()
+
+    if not args.options:
+        print("Options.json file not found!")
+        sys.exit(1)
+    with open(args.options, "r") as file:
+        options = json.load(file)
+
+    try:
+        config = generate(options, args.netplan)
+    except ScstConfigError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.diff:
+        with open(args.diff, "r") as file:
+            existing = file.read().splitlines(keepends=True)
+        sys.stdout.writelines(difflib.unified_diff(existing, config.splitlines(keepends=True),
+                                                   fromfile=args.diff, tofile="generated"))
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(config)
+        print(f"Wrote {args.output}")
+    elif not args.diff:
+        sys.stdout.write(config)
+
+
+if __name__ == "__main__":
+    main()
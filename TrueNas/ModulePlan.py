@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+"""
+Kernel module reload planner for the iSER stack.
+
+Builds the module dependency graph from /proc/modules (what is loaded and who uses it) and
+/lib/modules/<release>/modules.dep (what each module needs), then plans the smallest change:
+    - modules that are missing are loaded,
+    - modules marked for refresh are unloaded together with the loaded modules that depend on them,
+      and everything that was unloaded is loaded again,
+    - healthy loaded modules are left alone.
+Unloads go dependents-first in one rmmod call and loads dependencies-first in one modprobe -a call.
+"""
+
+import argparse
+import os
+import sys
+
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+
+executor = LocalExecutor()
+
+# The iSER target stack, as EnableISER.py has always required it
+REQUIRED_MODULES = [
+    "isert_scst",       # SCSI target framework for iSER
+    "rdma_cm",          # RDMA Communication Manager
+    "ib_core",          # InfiniBand core support
+    "mlx5_ib",          # Driver for Mellanox InfiniBand adapter
+    "mlx5_core",        # Mellanox ConnectX-4/5 drivers
+    "ib_uverbs",        # User-level verbs for RDMA
+    "mlxfw",            # Mellanox firmware updates
+    "rdma_ucm",         # RDMA CM user-space module
+    "ib_umad",          # Management Datagram
+    "ib_iser",          # iSER functionality
+    "ib_ipoib",         # IP over InfiniBand
+    "ib_cm",            # InfiniBand Communication Manager
+]
+
+
+def module_name(path):
+    """
+    kernel/drivers/infiniband/hw/mlx5/mlx5_ib.ko.zst -> mlx5_ib
+    """
+    name = os.path.basename(path.strip())
+    name = name.split(".ko", 1)[0]
+    return name.replace("-", "_")
+
+
+def read_loaded_modules(path="/proc/modules"):
+    """
+    {name: {"refcount": n, "used_by": [...], "state": "Live"}} from /proc/modules.
+    """
+    modules = {}
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) < 5:
+                continue
+            used_by = [] if fields[3] == "-" else [name for name in fields[3].split(",") if name]
+            refcount = int(fields[2]) if fields[2].isdigit() else 0
+            modules[fields[0]] = {"refcount": refcount, "used_by": used_by, "state": fields[4].rstrip(",")}
+    return modules
+
+
+def read_module_deps(release=None, base="/lib/modules"):
+    """
+    ({name: set(dependencies)}, builtin names) from modules.dep and modules.builtin.
+    modules.dep already lists the full (transitive) dependency set of each module.
+    """
+    directory = os.path.join(base, release or os.uname().release)
+    deps = {}
+    with open(os.path.join(directory, "modules.dep"), "r") as file:
+        for line in file:
+            if ":" not in line:
+                continue
+            module, _, needed = line.partition(":")
+            deps[module_name(module)] = {module_name(dep) for dep in needed.split()}
+    builtin = set()
+    try:
+        with open(os.path.join(directory, "modules.builtin"), "r") as file:
+            builtin = {module_name(line) for line in file if line.strip()}
+    except OSError:
+        pass
+    return deps, builtin
+
+
+def topological_order(modules, deps):
+    """
+    Order modules so that every module comes after the ones it depends on (ties broken by name).
+    """
+    modules = set(modules)
+    remaining = {module: {dep for dep in deps.get(module, ()) if dep in modules} for module in modules}
+    order = []
+    while remaining:
+        ready = sorted(module for module, needed in remaining.items() if not needed)
+        if not ready:
+            # A cycle cannot be loaded in order anyway; keep the rest alphabetical
+            ready = sorted(remaining)
+        for module in ready:
+            order.append(module)
+            del remaining[module]
+        for needed in remaining.values():
+            needed.difference_update(ready)
+    return order
+
+
+def plan_modules(required, loaded, deps, builtin=(), refresh=()):
+    """
+    Returns {"unload": [...], "load": [...], "unknown": [...], "unhealthy": [...]}.
+    "unload" is in removal order (dependents first), "load" in dependency order.
+    """
+    # Edges from both sources: modules.dep for what is installed, /proc/modules for what is loaded now
+    graph = {module: set(needed) for module, needed in deps.items()}
+    for module, info in loaded.items():
+        for user in info["used_by"]:
+            graph.setdefault(user, set()).add(module)
+
+    unknown = sorted(module for module in list(required) + list(refresh)
+                     if module not in deps and module not in loaded and module not in builtin)
+    unhealthy = sorted(module for module, info in loaded.items()
+                       if module in required and info["state"] != "Live")
+
+    # Everything loaded that sits on top of a refreshed module has to come out with it
+    unload = set()
+    for module in refresh:
+        if module in loaded:
+            unload.add(module)
+    changed = True
+    while changed:
+        changed = False
+        for module in loaded:
+            if module not in unload and graph.get(module, set()) & unload:
+                unload.add(module)
+                changed = True
+
+    load = {module for module in required if module not in builtin and module not in unknown
+            and (module not in loaded or module in unload)}
+    load |= unload
+    return {
+        "unload": list(reversed(topological_order(unload, graph))),
+        "load": topological_order(load, graph),
+        "unknown": unknown,
+        "unhealthy": unhealthy,
+    }
+
+
+def plan_commands(plan):
+    commands = []
+    if plan["unload"]:
+        commands.append(["rmmod", *plan["unload"]])
+    if plan["load"]:
+        commands.append(["modprobe", "-a", *plan["load"]])
+    return commands
+
+
+def describe_plan(plan):
+    lines = []
+    if plan["unload"]:
+        lines.append(f"Unload (dependents first): {', '.join(plan['unload'])}")
+    if plan["load"]:
+        lines.append(f"Load (dependencies first): {', '.join(plan['load'])}")
+    for module in plan["unknown"]:
+        lines.append(f"Module {module} is not installed for this kernel; skipping it.")
+    for module in plan["unhealthy"]:
+        lines.append(f"Module {module} is not Live; pass --refresh {module} to reload it.")
+    if not plan["unload"] and not plan["load"]:
+        lines.append("All required modules are loaded; nothing to do.")
+    return lines
+
+
+def reload_modules(required=REQUIRED_MODULES, refresh=(), dry_run=False, release=None):
+    """
+    Plan and (unless dry_run) execute the module changes.  Returns True when every command succeeded.
+    """
+    loaded = read_loaded_modules()
+    deps, builtin = read_module_deps(release)
+    plan = plan_modules(required, loaded, deps, builtin, refresh)
+    for line in describe_plan(plan):
+        print(line)
+    success = True
+    for command in plan_commands(plan):
+        print(f"{'Would run' if dry_run else 'Running command'}: {' '.join(command)}")
+        if dry_run:
+            continue
+        result = executor.run(command, on_output=lambda line, stream: print(line))
+        if not result.ok:
+            print(f"Command failed with exit code {result.returncode}: {' '.join(command)}")
+            success = False
+            break
+    return success
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the iSER kernel modules, reloading only what is needed.")
+    parser.add_argument("modules", nargs="*", help="Modules that must be loaded (default: the iSER stack)")
+    parser.add_argument("--refresh", action="append", default=[], metavar="MODULE",
+                        help="Reload this module and its dependents even if it is loaded (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the plan")
+    parser.add_argument("--release", help="Kernel release whose modules.dep to read (default: running kernel)")
+    args = parser.parse_args()
+
+    try:
+        success = reload_modules(args.modules or REQUIRED_MODULES, args.refresh, args.dry_run, args.release)
+    except OSError as e:
+        print(f"Unable to read module information: {e}")
+        sys.exit(1)
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+"""
+Prometheus/OpenMetrics exporter for SCST.
+
+Serves /metrics on a local port with per-target, per-LUN and per-session I/O counters, queued and active
+commands, max_tgt_dev_commands saturation and ALUA target group state, all read from the SCST sysfs tree
+(targets, devices, device_groups and sessions, as laid out by zsh/etc/scst.conf.sample).
+
+Scrapes are incremental: the tree layout is rescanned only every --rescan seconds (or when something
+disappears) and sampled attributes are re-read through descriptors that stay open (up to half of
+RLIMIT_NOFILE; the rest are opened and closed per scrape), so a scrape never walks directories.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+from ScstMonitor import SCST_ROOT, SESSION_COUNTERS, ScstSysfs
+
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# sysfs counter -> (metric suffix, help, scale)
+COUNTER_METRICS = {
+    "read_cmd_count": ("read_commands", "Read commands completed", 1),
+    "write_cmd_count": ("write_commands", "Write commands completed", 1),
+    "bidi_cmd_count": ("bidi_commands", "Bidirectional commands completed", 1),
+    "unknown_cmd_count": ("unknown_commands", "Commands with unknown data direction", 1),
+    "none_cmd_count": ("nodata_commands", "Commands without data transfer", 1),
+    "read_io_count_kb": ("read_bytes", "Bytes read", 1024),
+    "write_io_count_kb": ("write_bytes", "Bytes written", 1024),
+    "bidi_io_count_kb": ("bidi_bytes", "Bytes transferred by bidirectional commands", 1024),
+}
+ALUA_STATES = ("active", "nonoptimized", "optimized", "standby", "unavailable", "offline", "transitioning")
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricWriter:
+    """
+    Collects samples grouped by metric family and renders them in OpenMetrics or Prometheus text format.
+    """
+
+    def __init__(self):
+        self.families = {}
+
+    def add(self, name, metric_type, help_text, labels, value):
+        family = self.families.setdefault(name, {"type": metric_type, "help": help_text, "samples": []})
+        family["samples"].append((labels, value))
+
+    def render(self, openmetrics=True):
+        lines = []
+        for name, family in self.families.items():
+            counter = family["type"] == "counter"
+            family_name = name if openmetrics or not counter else f"{name}_total"
+            lines.append(f"# HELP {family_name} {family['help']}")
+            lines.append(f"# TYPE {family_name} {family['type']}")
+            sample_name = f"{name}_total" if counter else name
+            for labels, value in family["samples"]:
+                label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {value}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class ScstCollector:
+    """
+    Adds devices, LUN maps and ALUA groups to the cached session view of ScstSysfs.
+    """
+
+    def __init__(self, root=SCST_ROOT, rescan_interval=30):
+        self.sysfs = ScstSysfs(root, rescan_interval)
+        self.lock = threading.Lock()
+        self.devices = {}
+        self.alua_groups = []
+        self.layout_scan = 0
+
+    def close(self):
+        self.sysfs.close()
+
+    def scan_layout(self):
+        """
+        Devices and ALUA target groups; rescanned together with the sessions (which name each LUN's device).
+        """
+        sysfs = self.sysfs
+        self.devices = {}
+        for device in sysfs.listdir("devices"):
+            limit = sysfs.read_text("devices", device, "max_tgt_dev_commands")
+            self.devices[device] = {"max_tgt_dev_commands": limit if isinstance(limit, int) else None}
+
+        self.alua_groups = []
+        for group in sysfs.listdir("device_groups"):
+            for target_group in sysfs.listdir("device_groups", group, "target_groups"):
+                base = os.path.join(sysfs.root, "device_groups", group, "target_groups", target_group)
+                self.alua_groups.append({
+                    "device_group": group,
+                    "target_group": target_group,
+                    "group_id": sysfs.read_text("device_groups", group, "target_groups", target_group, "group_id"),
+                    "state_path": os.path.join(base, "state"),
+                    "preferred_path": os.path.join(base, "preferred"),
+                })
+        self.layout_scan = sysfs.last_scan
+
+    def collect(self):
+        with self.lock:
+            snapshot = self.sysfs.sample()
+            if self.layout_scan != self.sysfs.last_scan:
+                self.scan_layout()
+            return self.render(snapshot)
+
+    def render(self, snapshot):
+        writer = MetricWriter()
+        target_totals = {}
+        lun_totals = {}
+        for (driver, target, session), data in snapshot.items():
+            labels = {"driver": driver, "target": target, "session": session}
+            values = data["values"]
+            totals = target_totals.setdefault((driver, target), {"sessions": 0})
+            totals["sessions"] += 1
+            for counter in SESSION_COUNTERS:
+                if isinstance(values.get(counter), int):
+                    suffix, help_text, scale = COUNTER_METRICS[counter]
+                    writer.add(f"scst_session_{suffix}", "counter", help_text + " in the session", labels,
+                               values[counter] * scale)
+                    totals[counter] = totals.get(counter, 0) + values[counter]
+            for gauge, help_text in (("commands", "Commands queued in the session"),
+                                     ("active_commands", "Commands being processed in the session")):
+                if isinstance(values.get(gauge), int):
+                    writer.add(f"scst_session_{gauge}", "gauge", help_text, labels, values[gauge])
+                    totals[gauge] = totals.get(gauge, 0) + values[gauge]
+
+            for lun, lun_values in data["luns"].items():
+                device = data["devices"].get(lun, "")
+                lun_labels = dict(labels, lun=lun, device=device)
+                active = lun_values.get("active_commands")
+                if isinstance(active, int):
+                    writer.add("scst_session_lun_active_commands", "gauge",
+                               "Commands being processed for the LUN in the session", lun_labels, active)
+                    limit = self.devices.get(device, {}).get("max_tgt_dev_commands")
+                    if limit:
+                        writer.add("scst_session_lun_queue_saturation", "gauge",
+                                   "active_commands / max_tgt_dev_commands for the LUN in the session",
+                                   lun_labels, round(active / limit, 4))
+                lun_total = lun_totals.setdefault((driver, target, lun, device), {})
+                for counter, value in lun_values.items():
+                    if isinstance(value, int):
+                        lun_total[counter] = lun_total.get(counter, 0) + value
+
+        for (driver, target), totals in target_totals.items():
+            labels = {"driver": driver, "target": target}
+            writer.add("scst_target_sessions", "gauge", "Sessions logged into the target", labels, totals["sessions"])
+            for counter in SESSION_COUNTERS:
+                if counter in totals:
+                    suffix, help_text, scale = COUNTER_METRICS[counter]
+                    writer.add(f"scst_target_{suffix}", "counter", help_text + " across the target's sessions",
+                               labels, totals[counter] * scale)
+            if "active_commands" in totals:
+                writer.add("scst_target_active_commands", "gauge", "Commands being processed by the target",
+                           labels, totals["active_commands"])
+
+        for (driver, target, lun, device), totals in lun_totals.items():
+            labels = {"driver": driver, "target": target, "lun": lun, "device": device}
+            for counter, value in totals.items():
+                if counter in COUNTER_METRICS:
+                    suffix, help_text, scale = COUNTER_METRICS[counter]
+                    writer.add(f"scst_lun_{suffix}", "counter", help_text + " for the LUN", labels, value * scale)
+            if "active_commands" in totals:
+                writer.add("scst_lun_active_commands", "gauge", "Commands being processed for the LUN",
+                           labels, totals["active_commands"])
+
+        for device, info in self.devices.items():
+            if info["max_tgt_dev_commands"] is not None:
+                writer.add("scst_device_max_tgt_dev_commands", "gauge",
+                           "Per session queue limit of the device", {"device": device}, info["max_tgt_dev_commands"])
+
+        for group in self.alua_groups:
+            labels = {"device_group": group["device_group"], "target_group": group["target_group"],
+                      "group_id": group["group_id"]}
+            state = self.sysfs.read(group["state_path"])
+            for candidate in ALUA_STATES:
+                writer.add("scst_alua_target_group_state", "gauge", "ALUA state of the target group (1 = current)",
+                           dict(labels, state=candidate), int(state == candidate))
+            preferred = self.sysfs.read(group["preferred_path"])
+            if isinstance(preferred, int):
+                writer.add("scst_alua_target_group_preferred", "gauge", "Preferred flag of the target group",
+                           labels, preferred)
+        return writer
+
+
+def make_handler(collector):
+    from http.server import BaseHTTPRequestHandler  # Loads ssl and email; --once never needs it
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            started = time.monotonic()
+            writer = collector.collect()
+            writer.add("scst_exporter_scrape_duration_seconds", "gauge", "Time spent reading SCST sysfs",
+                       {}, round(time.monotonic() - started, 6))
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = writer.render(openmetrics).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export SCST target, LUN and session metrics.")
+    parser.add_argument("--listen", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=9887, help="Port to serve /metrics on")
+    parser.add_argument("--rescan", type=int, default=30, help="Seconds between sysfs layout rescans")
+    parser.add_argument("--root", default=SCST_ROOT, help="SCST sysfs root")
+    parser.add_argument("--once", action="store_true", help="Print one scrape to stdout and exit")
+    args = parser.parse_args()
+
+    if not os.path.isdir(os.path.join(args.root, "targets")):
+        print(f"SCST sysfs tree not found under {args.root}. Is scst loaded?")
+        sys.exit(1)
+
+    collector = ScstCollector(args.root, args.rescan)
+    if args.once:
+        sys.stdout.write(collector.collect().render(openmetrics=True))
+        collector.close()
+        return
+
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((args.listen, args.port), make_handler(collector))
+    print(f"Serving SCST metrics on http://{args.listen}:{args.port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        collector.close()
+
+
+if __name__ == "__main__":
+    main()
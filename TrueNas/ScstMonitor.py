@@ -0,0 +1,351 @@
+#!/usr/bin/python3
+"""
+Low-overhead SCST session monitor.
+
+Reads the session and LUN attributes under /sys/kernel/scst_tgt/targets/<driver>/<target>/sessions/
+directly instead of running scstadmin and awk.  A session directory holds the I/O counters and one lunN/
+directory per LUN it sees; SCST puts only active_commands there, so LUNs report the attributes they have.
+(sessions/<session>/luns is a link to the target's or initiator group's LUN map, used to name the device.)
+The directory layout is scanned once and attribute files stay open, up to half of RLIMIT_NOFILE, so a refresh
+costs one pread per attribute and no processes; attributes beyond that are opened, read and closed each time.
+Cumulative counters are turned into rates; gauges (commands, active_commands) are shown as read.
+
+Output is either a live table (only changed lines are redrawn) or JSON lines (--json).
+"""
+
+import argparse
+import errno
+import json
+import os
+import re
+import resource
+import sys
+import time
+
+SCST_ROOT = "/sys/kernel/scst_tgt"
+
+# Cumulative per-session counters (turned into rates)
+SESSION_COUNTERS = (
+    "read_cmd_count", "read_io_count_kb",
+    "write_cmd_count", "write_io_count_kb",
+    "bidi_cmd_count", "bidi_io_count_kb",
+    "unknown_cmd_count", "none_cmd_count",
+)
+# Point-in-time values
+SESSION_GAUGES = ("commands", "active_commands")
+LUN_ATTRIBUTES = ("active_commands",) + SESSION_COUNTERS
+COMMAND_COUNTERS = ("read_cmd_count", "write_cmd_count", "bidi_cmd_count", "unknown_cmd_count", "none_cmd_count")
+# (summary key, counter, divisor, decimals)
+RATES = (
+    ("read_iops", "read_cmd_count", 1, 1),
+    ("write_iops", "write_cmd_count", 1, 1),
+    ("read_mbps", "read_io_count_kb", 1024, 2),
+    ("write_mbps", "write_io_count_kb", 1024, 2),
+)
+LUN_DIRECTORY = re.compile(r"lun(\d+)")
+
+
+def parse_attribute(raw):
+    """
+    SCST attribute files hold the value on the first line, optionally followed by a "[key]" marker.
+    """
+    text = raw.decode(errors="replace").split("\n", 1)[0].strip()
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+class ScstSysfs:
+    """
+    Cached view of the SCST sysfs tree.  scan() discovers the layout; read() re-reads an
+    attribute through a file descriptor that is kept open between samples.  At most max_fds
+    descriptors are kept (default: half the soft RLIMIT_NOFILE); further attributes are read
+    with open/pread/close.
+    """
+
+    def __init__(self, root=SCST_ROOT, rescan_interval=10, max_fds=None):
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self.max_fds = resource.getrlimit(resource.RLIMIT_NOFILE)[0] // 2 if max_fds is None else max_fds
+        self.fds = {}
+        self.sessions = {}
+        self.last_scan = 0
+        self.stale = True
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+    def listdir(self, *parts):
+        path = os.path.join(self.root, *parts)
+        try:
+            return sorted(entry for entry in os.listdir(path) if entry != "mgmt")
+        except OSError:
+            return []
+
+    def _open(self, path):
+        """
+        Open an attribute.  When the process is out of descriptors, half of the cached ones are
+        closed and the cache stays at that size from then on.
+        """
+        try:
+            return os.open(path, os.O_RDONLY)
+        except OSError as e:
+            if e.errno not in (errno.EMFILE, errno.ENFILE) or not self.fds:
+                raise
+        self.max_fds = len(self.fds) // 2
+        for cached in list(self.fds)[self.max_fds:]:
+            os.close(self.fds.pop(cached))
+        return os.open(path, os.O_RDONLY)
+
+    def _failed(self, path, error):
+        if error.errno in (errno.ENOENT, errno.ENODEV):
+            self.stale = True
+        else:
+            print(f"Reading {path} failed: {error.strerror}", file=sys.stderr)
+
+    def read(self, path):
+        """
+        Read one attribute, reusing its open descriptor.  Returns None if it has disappeared or cannot be read.
+        """
+        fd = self.fds.get(path)
+        if fd is not None:
+            try:
+                return parse_attribute(os.pread(fd, 4096, 0))
+            except OSError as e:
+                os.close(self.fds.pop(path))
+                self._failed(path, e)
+                return None
+        try:
+            fd = self._open(path)
+        except OSError as e:
+            self._failed(path, e)
+            return None
+        try:
+            value = parse_attribute(os.pread(fd, 4096, 0))
+        except OSError as e:
+            os.close(fd)
+            self._failed(path, e)
+            return None
+        if len(self.fds) < self.max_fds:
+            self.fds[path] = fd
+        else:
+            os.close(fd)
+        return value
+
+    def read_text(self, *parts):
+        """
+        One-off read for attributes that are not sampled repeatedly.
+        """
+        try:
+            with open(os.path.join(self.root, *parts), "rb") as file:
+                return parse_attribute(file.read(4096))
+        except OSError:
+            return None
+
+    def lun_device(self, driver, target, session, lun):
+        """
+        Name of the device behind a session's LUN: the session's LUN map first (the initiator group's, for
+        grouped initiators), then the target's.  Empty when neither links one.
+        """
+        target_dir = os.path.join(self.root, "targets", driver, target)
+        for link in (os.path.join(target_dir, "sessions", session, "luns", lun, "device"),
+                     os.path.join(target_dir, "luns", lun, "device")):
+            try:
+                return os.path.basename(os.readlink(link))
+            except OSError:
+                continue
+        return ""
+
+    def scan(self):
+        """
+        Walk targets/<driver>/<target>/sessions/<session>[/lunN] once and remember the attribute paths that exist.
+        """
+        sessions = {}
+        for driver in self.listdir("targets"):
+            for target in self.listdir("targets", driver):
+                for session in self.listdir("targets", driver, target, "sessions"):
+                    session_dir = os.path.join(self.root, "targets", driver, target, "sessions", session)
+                    attributes = {name: os.path.join(session_dir, name)
+                                  for name in SESSION_COUNTERS + SESSION_GAUGES
+                                  if os.path.exists(os.path.join(session_dir, name))}
+                    luns = {}
+                    devices = {}
+                    for entry in self.listdir("targets", driver, target, "sessions", session):
+                        match = LUN_DIRECTORY.fullmatch(entry)
+                        if not match:
+                            continue
+                        lun = match.group(1)
+                        lun_dir = os.path.join(session_dir, entry)
+                        luns[lun] = {name: os.path.join(lun_dir, name) for name in LUN_ATTRIBUTES
+                                     if os.path.exists(os.path.join(lun_dir, name))}
+                        devices[lun] = self.lun_device(driver, target, session, lun)
+                    sessions[(driver, target, session)] = {"attributes": attributes, "luns": luns, "devices": devices}
+
+        # Drop descriptors of sessions that went away
+        live_paths = set()
+        for info in sessions.values():
+            live_paths.update(info["attributes"].values())
+            for lun_attributes in info["luns"].values():
+                live_paths.update(lun_attributes.values())
+        for path in [path for path in self.fds if path.startswith(self.root + "/targets/") and path not in live_paths]:
+            os.close(self.fds.pop(path))
+
+        self.sessions = sessions
+        self.last_scan = time.monotonic()
+        self.stale = False
+        return sessions
+
+    def refresh_layout(self):
+        if self.stale or time.monotonic() - self.last_scan >= self.rescan_interval:
+            self.scan()
+
+    def sample(self):
+        """
+        Read every cached session and LUN attribute.
+        Returns {(driver, target, session): {"values": {...}, "luns": {lun: {...}}, "devices": {lun: device}}}.
+        """
+        self.refresh_layout()
+        snapshot = {}
+        for key, info in self.sessions.items():
+            values = {name: self.read(path) for name, path in info["attributes"].items()}
+            luns = {lun: {name: self.read(path) for name, path in attributes.items()}
+                    for lun, attributes in info["luns"].items()}
+            snapshot[key] = {"values": values, "luns": luns, "devices": info["devices"]}
+        return snapshot
+
+
+def rate(previous, current, name, elapsed):
+    before, after = previous.get(name), current.get(name)
+    if not isinstance(before, int) or not isinstance(after, int) or after < before:
+        return 0.0
+    return (after - before) / elapsed
+
+
+def summarize(values, previous, elapsed):
+    """
+    Turn one session's (or LUN's) raw values into IOPS, MB/s and the current gauges.  Only the rates whose
+    counters were read are reported.
+    """
+    summary = {}
+    if any(name in values for name in COMMAND_COUNTERS):
+        summary["iops"] = round(sum(rate(previous, values, name, elapsed) for name in COMMAND_COUNTERS), 1)
+    for key, name, divisor, decimals in RATES:
+        if name in values:
+            summary[key] = round(rate(previous, values, name, elapsed) / divisor, decimals)
+    for gauge in SESSION_GAUGES:
+        if isinstance(values.get(gauge), int):
+            summary[gauge] = values[gauge]
+    return summary
+
+
+def compute_rates(previous, current, elapsed):
+    """
+    Per-session and per-LUN rates between two snapshots.  Sessions seen for the first time report zero rates.
+    """
+    results = []
+    for key, data in sorted(current.items()):
+        before = previous.get(key, data)
+        session = summarize(data["values"], before["values"], elapsed)
+        session["luns"] = {lun: summarize(values, before["luns"].get(lun, values), elapsed)
+                           for lun, values in sorted(data["luns"].items(), key=lambda item: int(item[0]))}
+        for lun, stats in session["luns"].items():
+            stats["device"] = data["devices"].get(lun, "")
+        driver, target, name = key
+        session.update({"driver": driver, "target": target, "session": name})
+        results.append(session)
+    return results
+
+
+def column(stats, key, width, decimals):
+    return f"{stats[key]:>{width}.{decimals}f}" if key in stats else " " * width
+
+
+def format_table(results, interval):
+    header = f"{'Target / Session / LUN':<58} {'IOPS':>9} {'R MB/s':>9} {'W MB/s':>9} {'Cmds':>6} {'Active':>6}"
+    lines = [f"SCST sessions - every {interval}s - {time.strftime('%Y-%m-%d %H:%M:%S')}", header, "-" * len(header)]
+    current_target = None
+    for session in results:
+        target = f"{session['driver']}/{session['target']}"
+        if target != current_target:
+            lines.append(target)
+            current_target = target
+        lines.append(f"  {session['session'][:56]:<56} {column(session, 'iops', 9, 1)} "
+                     f"{column(session, 'read_mbps', 9, 2)} {column(session, 'write_mbps', 9, 2)} "
+                     f"{session.get('commands', ''):>6} {session.get('active_commands', ''):>6}")
+        for lun, stats in session["luns"].items():
+            label = f"{lun} ({stats['device']})" if stats["device"] else lun
+            lines.append(f"    LUN {label[:50]:<50} {column(stats, 'iops', 9, 1)} {column(stats, 'read_mbps', 9, 2)} "
+                         f"{column(stats, 'write_mbps', 9, 2)} {'':>6} {stats.get('active_commands', ''):>6}")
+    if not results:
+        lines.append("No active sessions.")
+    return lines
+
+
+class TableScreen:
+    """
+    Redraws only the lines that changed since the previous frame.
+    """
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.previous = []
+        self.stream.write("\033[H\033[J")
+
+    def draw(self, lines):
+        output = []
+        for row, line in enumerate(lines, start=1):
+            if row > len(self.previous) or self.previous[row - 1] != line:
+                output.append(f"\033[{row};1H{line}\033[K")
+        if len(lines) < len(self.previous):
+            output.append(f"\033[{len(lines) + 1};1H\033[J")
+        self.stream.write("".join(output))
+        self.stream.flush()
+        self.previous = lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor SCST sessions and LUNs from sysfs.")
+    parser.add_argument("-i", "--interval", type=float, default=1.0, help="Refresh interval in seconds")
+    parser.add_argument("--json", action="store_true", help="Emit one JSON line per session per interval")
+    parser.add_argument("--count", type=int, default=0, help="Stop after this many intervals (0 = forever)")
+    parser.add_argument("--root", default=SCST_ROOT, help="SCST sysfs root (point at a fake tree for testing)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(os.path.join(args.root, "targets")):
+        print(f"SCST sysfs tree not found under {args.root}. Is scst loaded?")
+        sys.exit(1)
+
+    sysfs = ScstSysfs(args.root)
+    screen = None if args.json else TableScreen()
+    previous = sysfs.sample()
+    last = time.monotonic()
+    intervals = 0
+    try:
+        while not args.count or intervals < args.count:
+            time.sleep(args.interval)
+            current = sysfs.sample()
+            now = time.monotonic()
+            results = compute_rates(previous, current, now - last)
+            previous, last = current, now
+            intervals += 1
+            if args.json:
+                stamp = time.time()
+                for session in results:
+                    session["time"] = stamp
+                    sys.stdout.write(json.dumps(session, sort_keys=True) + "\n")
+                sys.stdout.flush()
+            else:
+                screen.draw(format_table(results, args.interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sysfs.close()
+        if screen:
+            sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
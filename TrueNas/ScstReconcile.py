@@ -0,0 +1,500 @@
+#!/usr/bin/python3
+"""
+Apply scst.conf to a running SCST without restarting scst.service.
+
+The desired configuration (an scst.conf, or the one GenerateScstConf.py builds from Options.json) is
+compared with the live tree under /sys/kernel/scst_tgt and only the difference is written through the
+sysfs mgmt files: devices, targets, portals, LUN mappings and ALUA groups are added or removed and
+attributes are changed in place.  Sessions on untouched LUNs keep running.
+
+Changes SCST cannot make at runtime (read-only attributes such as a device's filename or blocksize,
+driver settings without a sysfs attribute) are listed instead of being forced with a restart.  Objects
+that exist live but not in the configuration are only removed with --prune.
+
+Without --apply the plan is printed and nothing is written.
+"""
+
+import argparse
+import errno
+import json
+import os
+import shlex
+import stat
+import sys
+import time
+
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+from GenerateScstConf import ScstConfigError, generate
+from ScstMonitor import SCST_ROOT, parse_attribute
+
+# Drivers SCST manages by itself (copy_manager maps every device automatically)
+MANAGED_DRIVERS = ("copy_manager",)
+# Target attributes that may be given several times and are added/removed one value at a time
+MULTI_VALUE_ATTRIBUTES = ("allowed_portal", "IncomingUser", "OutgoingUser")
+# Device attributes that are passed to add_device (and can only be set that way)
+CREATION_ATTRIBUTES = ("filename", "blocksize", "nv_cache", "o_direct", "read_only", "removable", "rotational",
+                       "thin_provisioned", "write_through", "iomode", "dummy", "size", "size_mb")
+
+
+def strip_comment(line):
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == "#" and not quoted:
+            return line[:index]
+    return line
+
+
+def parse_config(text):
+    """
+    Parse scst.conf into
+        {"devices": {name: {"handler": h, "attributes": {...}}},
+         "drivers": {driver: {"attributes": {...}, "targets": {name: {"attributes": {...}, "luns": {n: device}}}}},
+         "device_groups": {name: {"devices": [...], "target_groups": {name: {"attributes": {...}, "targets": [...]}}}}}
+    Multi-value target attributes are lists, everything else is a string.
+    """
+    config = {"devices": {}, "drivers": {}, "device_groups": {}}
+    stack = []
+    for number, raw in enumerate(text.splitlines(), start=1):
+        line = strip_comment(raw).strip()
+        if not line:
+            continue
+        if line == "}":
+            if not stack:
+                raise ScstConfigError(f"line {number}: unexpected '}}'")
+            stack.pop()
+            continue
+        opens = line.endswith("{")
+        closes_inline = line.endswith("{}")
+        if closes_inline:
+            line, opens = line[:-2].strip(), True
+        elif opens:
+            line = line[:-1].strip()
+        try:
+            words = shlex.split(line)
+        except ValueError as e:
+            raise ScstConfigError(f"line {number}: {e}")
+        keyword, args = words[0], words[1:]
+        context = stack[-1] if stack else ("root", None)
+        kind, node = context
+
+        if opens:
+            if not args:
+                raise ScstConfigError(f"line {number}: {keyword} needs a name")
+            name = args[0]
+            if kind == "root" and keyword == "HANDLER":
+                child = ("handler", name)
+            elif kind == "handler" and keyword == "DEVICE":
+                device = config["devices"].setdefault(name, {"handler": node, "attributes": {}})
+                child = ("device", device)
+            elif kind == "root" and keyword == "TARGET_DRIVER":
+                child = ("driver", config["drivers"].setdefault(name, {"attributes": {}, "targets": {}}))
+            elif kind == "driver" and keyword == "TARGET":
+                child = ("target", node["targets"].setdefault(name, {"attributes": {}, "luns": {}}))
+            elif kind == "root" and keyword == "DEVICE_GROUP":
+                child = ("device_group", config["device_groups"].setdefault(
+                    name, {"devices": [], "target_groups": {}}))
+            elif kind == "device_group" and keyword == "TARGET_GROUP":
+                child = ("target_group", node["target_groups"].setdefault(name, {"attributes": {}, "targets": []}))
+            else:
+                # LUN/INITIATOR_GROUP sub-blocks and anything else are carried over untouched
+                child = ("ignored", None)
+            if not closes_inline:
+                stack.append(child)
+            continue
+
+        if kind == "ignored":
+            continue
+        if kind == "target" and keyword == "LUN" and len(args) >= 2:
+            node["luns"][args[0]] = args[1]
+        elif kind == "device_group" and keyword == "DEVICE" and args:
+            node["devices"].append(args[0])
+        elif kind == "target_group" and keyword == "TARGET" and args:
+            node["targets"].append(args[0])
+        elif kind in ("device", "driver", "target", "target_group"):
+            value = " ".join(args)
+            if kind == "target" and keyword in MULTI_VALUE_ATTRIBUTES:
+                node["attributes"].setdefault(keyword, []).append(value)
+            else:
+                node["attributes"][keyword] = value
+        else:
+            raise ScstConfigError(f"line {number}: unexpected '{line}'")
+    if stack:
+        raise ScstConfigError("unterminated block at end of file")
+    return config
+
+
+class LiveScst:
+    """
+    Reads the live configuration from the SCST sysfs tree and writes mgmt commands and attributes.
+    """
+
+    def __init__(self, root=SCST_ROOT):
+        self.root = root
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def list_dirs(self, *parts):
+        base = self.path(*parts)
+        try:
+            return sorted(entry for entry in os.listdir(base) if os.path.isdir(os.path.join(base, entry)))
+        except OSError:
+            return []
+
+    def read(self, *parts):
+        try:
+            with open(self.path(*parts), "rb") as file:
+                value = parse_attribute(file.read(4096))
+        except OSError:
+            return None
+        return str(value)
+
+    def exists(self, *parts):
+        return os.path.exists(self.path(*parts))
+
+    def writable(self, *parts):
+        try:
+            return bool(os.stat(self.path(*parts)).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        except OSError:
+            return False
+
+    def link_name(self, *parts):
+        try:
+            return os.path.basename(os.readlink(self.path(*parts)))
+        except OSError:
+            return None
+
+    def target_values(self, driver, target, attribute):
+        """
+        Multi-value attributes appear as attribute, attribute1, attribute2, ...
+        """
+        values = []
+        base = self.path("targets", driver, target)
+        try:
+            entries = sorted(os.listdir(base))
+        except OSError:
+            return values
+        for entry in entries:
+            if entry == attribute or (entry.startswith(attribute) and entry[len(attribute):].isdigit()):
+                value = self.read("targets", driver, target, entry)
+                if value:
+                    values.append(value)
+        return values
+
+    def read_state(self, desired):
+        """
+        Live objects plus the current value of every attribute the desired configuration mentions.
+        """
+        state = {"devices": {}, "drivers": {}, "device_groups": {}}
+        for device in self.list_dirs("devices"):
+            wanted = desired["devices"].get(device, {}).get("attributes", {})
+            state["devices"][device] = {
+                "handler": self.link_name("devices", device, "handler"),
+                "attributes": {key: self.read("devices", device, key) for key in wanted},
+            }
+        for driver in self.list_dirs("targets"):
+            wanted_driver = desired["drivers"].get(driver, {"attributes": {}, "targets": {}})
+            targets = {}
+            for target in self.list_dirs("targets", driver):
+                wanted = wanted_driver["targets"].get(target, {}).get("attributes", {})
+                attributes = {}
+                for key in wanted:
+                    if key in MULTI_VALUE_ATTRIBUTES:
+                        attributes[key] = self.target_values(driver, target, key)
+                    else:
+                        attributes[key] = self.read("targets", driver, target, key)
+                luns = {lun: self.link_name("targets", driver, target, "luns", lun, "device")
+                        for lun in self.list_dirs("targets", driver, target, "luns")}
+                targets[target] = {"attributes": attributes, "luns": luns}
+            state["drivers"][driver] = {
+                "attributes": {key: self.read("targets", driver, key) for key in wanted_driver["attributes"]},
+                "targets": targets,
+            }
+        for group in self.list_dirs("device_groups"):
+            wanted_group = desired["device_groups"].get(group, {"target_groups": {}})
+            target_groups = {}
+            for target_group in self.list_dirs("device_groups", group, "target_groups"):
+                wanted = wanted_group["target_groups"].get(target_group, {}).get("attributes", {})
+                target_groups[target_group] = {
+                    "attributes": {key: self.read("device_groups", group, "target_groups", target_group, key)
+                                   for key in wanted},
+                    "targets": self.list_dirs("device_groups", group, "target_groups", target_group),
+                }
+            state["device_groups"][group] = {
+                "devices": sorted(os.listdir(self.path("device_groups", group, "devices")))
+                if self.exists("device_groups", group, "devices") else [],
+                "target_groups": target_groups,
+            }
+        for group in state["device_groups"].values():
+            if "mgmt" in group["devices"]:
+                group["devices"].remove("mgmt")
+        return state
+
+    def write(self, path, text):
+        """
+        Write one mgmt command or attribute value.  SCST answers EAGAIN for commands it finishes
+        asynchronously; the result is then polled from last_sysfs_mgmt_res, as scstadmin does.
+        """
+        try:
+            with open(path, "w") as file:
+                file.write(text + "\n")
+            return
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        result_path = self.path("last_sysfs_mgmt_res")
+        for _ in range(600):
+            try:
+                with open(result_path, "r") as file:
+                    result = int(file.read().split()[0])
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+                result = -errno.EAGAIN
+            if result != -errno.EAGAIN:
+                if result:
+                    raise OSError(-result, os.strerror(-result), path)
+                return
+            time.sleep(0.1)
+        raise OSError(errno.ETIMEDOUT, "SCST did not finish the command", path)
+
+
+def same_value(live, wanted):
+    return live is not None and str(live).strip().strip('"') == str(wanted).strip().strip('"')
+
+
+def attribute_string(attributes):
+    return ";".join(f"{key}={value.strip(chr(34))}" for key, value in attributes.items())
+
+
+def plan_changes(desired, live, sysfs, prune=False):
+    """
+    Compare desired and live state.  Returns (steps, reports): steps are (path, text, description) writes in
+    the order they must be made, reports are changes that cannot be made without a restart or re-creation.
+    """
+    removals, additions, updates, enables, reports = [], [], [], [], []
+    root = sysfs.path
+
+    # Devices
+    for name, device in sorted(desired["devices"].items()):
+        current = live["devices"].get(name)
+        if current is None:
+            creation = {key: value for key, value in device["attributes"].items() if key in CREATION_ATTRIBUTES}
+            additions.append((root("handlers", device["handler"], "mgmt"),
+                              f"add_device {name} {attribute_string(creation)}".strip(),
+                              f"add device {name} ({device['handler']})"))
+            for key, value in device["attributes"].items():
+                if key not in CREATION_ATTRIBUTES:
+                    additions.append((root("devices", name, key), value.strip('"'), f"set {name} {key}={value}"))
+            continue
+        if current["handler"] and current["handler"] != device["handler"]:
+            reports.append(f"device {name} uses handler {current['handler']}, not {device['handler']}: "
+                           "delete and re-add it to change")
+            continue
+        for key, value in device["attributes"].items():
+            if same_value(current["attributes"].get(key), value):
+                continue
+            if sysfs.writable("devices", name, key):
+                updates.append((root("devices", name, key), value.strip('"'),
+                                f"set {name} {key} {current['attributes'].get(key)} -> {value}"))
+            else:
+                reports.append(f"device {name}: {key} is {current['attributes'].get(key)}, wants {value} "
+                               "(read-only at runtime; needs the device re-created)")
+
+    # Targets, portals and LUNs
+    for driver, driver_config in sorted(desired["drivers"].items()):
+        if driver in MANAGED_DRIVERS:
+            continue
+        live_driver = live["drivers"].get(driver)
+        if live_driver is None:
+            reports.append(f"target driver {driver} is not loaded (modprobe its module first)")
+            continue
+        for key, value in driver_config["attributes"].items():
+            current = live_driver["attributes"].get(key)
+            if same_value(current, value):
+                continue
+            if key == "enabled":
+                enables.append((root("targets", driver, key), value, f"set driver {driver} enabled={value}"))
+            elif sysfs.writable("targets", driver, key):
+                updates.append((root("targets", driver, key), value.strip('"'),
+                                f"set driver {driver} {key} {current} -> {value}"))
+            else:
+                reports.append(f"driver {driver}: {key} wants {value} but has no writable sysfs attribute "
+                               "(takes effect on the next scst.service restart)")
+
+        for target, target_config in sorted(driver_config["targets"].items()):
+            current = live_driver["targets"].get(target)
+            attributes = target_config["attributes"]
+            if current is None:
+                additions.append((root("targets", driver, "mgmt"), f"add_target {target}",
+                                  f"add target {target}"))
+                current = {"attributes": {}, "luns": {}}
+            for key, value in attributes.items():
+                if key in MULTI_VALUE_ATTRIBUTES:
+                    have = current["attributes"].get(key, [])
+                    for item in value:
+                        if item not in have:
+                            additions.append((root("targets", driver, "mgmt"),
+                                              f"add_target_attribute {target} {key}={item}",
+                                              f"add {key} {item} to {target}"))
+                    for item in have:
+                        if item not in value:
+                            removals.append((root("targets", driver, "mgmt"),
+                                             f"del_target_attribute {target} {key}={item}",
+                                             f"remove {key} {item} from {target}"))
+                    continue
+                if same_value(current["attributes"].get(key), value):
+                    continue
+                if key == "enabled":
+                    enables.append((root("targets", driver, target, key), value,
+                                    f"set {target} enabled={value}"))
+                elif key == "rel_tgt_id" and sysfs.read("targets", driver, target, "enabled") == "1":
+                    reports.append(f"target {target}: rel_tgt_id {current['attributes'].get(key)} -> {value} "
+                                   "can only change while the target is disabled")
+                elif target not in live_driver["targets"] or sysfs.writable("targets", driver, target, key):
+                    updates.append((root("targets", driver, target, key), value.strip('"'),
+                                    f"set {target} {key} {current['attributes'].get(key)} -> {value}"))
+                elif sysfs.exists("targets", driver, target, key):
+                    reports.append(f"target {target}: {key} wants {value} but is read-only at runtime")
+                else:
+                    reports.append(f"target {target}: {key} is not a sysfs attribute of {driver} targets")
+
+            for lun, device in sorted(target_config["luns"].items(), key=lambda item: int(item[0])):
+                have = current["luns"].get(lun)
+                luns_mgmt = root("targets", driver, target, "luns", "mgmt")
+                if have is None:
+                    additions.append((luns_mgmt, f"add {device} {lun}", f"map {device} as LUN {lun} of {target}"))
+                elif have != device:
+                    updates.append((luns_mgmt, f"replace {device} {lun}",
+                                    f"replace LUN {lun} of {target}: {have} -> {device}"))
+            for lun, device in sorted(current["luns"].items()):
+                if lun not in target_config["luns"]:
+                    if prune:
+                        removals.append((root("targets", driver, target, "luns", "mgmt"), f"del {lun}",
+                                         f"unmap LUN {lun} ({device}) from {target}"))
+                    else:
+                        reports.append(f"target {target}: LUN {lun} ({device}) is not in the configuration "
+                                       "(use --prune to remove it)")
+
+        for target in sorted(set(live_driver["targets"]) - set(driver_config["targets"])):
+            if prune:
+                removals.append((root("targets", driver, "mgmt"), f"del_target {target}", f"delete target {target}"))
+            else:
+                reports.append(f"target {target} is not in the configuration (use --prune to remove it)")
+
+    # ALUA device groups
+    for group, group_config in sorted(desired["device_groups"].items()):
+        current = live["device_groups"].get(group)
+        if current is None:
+            additions.append((root("device_groups", "mgmt"), f"create {group}", f"create device group {group}"))
+            current = {"devices": [], "target_groups": {}}
+        for device in group_config["devices"]:
+            if device not in current["devices"]:
+                additions.append((root("device_groups", group, "devices", "mgmt"), f"add {device}",
+                                  f"add {device} to device group {group}"))
+        for device in current["devices"]:
+            if device not in group_config["devices"] and (prune or device in desired["devices"]):
+                removals.append((root("device_groups", group, "devices", "mgmt"), f"del {device}",
+                                 f"remove {device} from device group {group}"))
+        for target_group, tg_config in sorted(group_config["target_groups"].items()):
+            live_tg = current["target_groups"].get(target_group)
+            if live_tg is None:
+                additions.append((root("device_groups", group, "target_groups", "mgmt"), f"add {target_group}",
+                                  f"add target group {target_group} to {group}"))
+                live_tg = {"attributes": {}, "targets": []}
+            tg_root = ("device_groups", group, "target_groups", target_group)
+            for key, value in tg_config["attributes"].items():
+                if not same_value(live_tg["attributes"].get(key), value):
+                    updates.append((root(*tg_root, key), value,
+                                    f"set {group}/{target_group} {key} {live_tg['attributes'].get(key)} -> {value}"))
+            for target in tg_config["targets"]:
+                if target not in live_tg["targets"]:
+                    additions.append((root(*tg_root, "mgmt"), f"add {target}",
+                                      f"add {target} to target group {target_group}"))
+            for target in live_tg["targets"]:
+                if target not in tg_config["targets"]:
+                    removals.append((root(*tg_root, "mgmt"), f"del {target}",
+                                     f"remove {target} from target group {target_group}"))
+        for target_group in sorted(set(current["target_groups"]) - set(group_config["target_groups"])):
+            removals.append((root("device_groups", group, "target_groups", "mgmt"), f"del {target_group}",
+                             f"remove target group {target_group} from {group}"))
+
+    # Devices that are gone from the configuration go last, after their LUNs and group memberships
+    for name in sorted(set(live["devices"]) - set(desired["devices"])):
+        if prune and live["devices"][name]["handler"]:
+            removals.append((root("handlers", live["devices"][name]["handler"], "mgmt"), f"del_device {name}",
+                             f"delete device {name}"))
+        elif not prune:
+            reports.append(f"device {name} is not in the configuration (use --prune to remove it)")
+
+    return removals + additions + updates + enables, reports
+
+
+def load_desired(args):
+    if args.config:
+        with open(args.config, "r") as file:
+            return parse_config(file.read())
+    options_path = args.options or find_options_file()
+    if not options_path:
+        raise ScstConfigError("Options.json file not found")
+    with open(options_path, "r") as file:
+        return parse_config(generate(json.load(file)))
+
+
+def reconcile(desired, root=SCST_ROOT, apply=False, prune=False):
+    """
+    Print the plan for bringing the live SCST in line with desired and, with apply=True, carry it out.
+    Returns the list of changes that need a restart or re-creation.
+    """
+    sysfs = LiveScst(root)
+    steps, reports = plan_changes(desired, sysfs.read_state(desired), sysfs, prune)
+    if not steps:
+        print("Live SCST configuration already matches.")
+    for path, text, description in steps:
+        if not apply:
+            print(f"Would {description}")
+            continue
+        print(f"{description[0].upper()}{description[1:]}...")
+        try:
+            sysfs.write(path, text)
+        except OSError as e:
+            print(f"Failed: echo '{text}' > {path}: {e}")
+            raise
+    for report in reports:
+        print(f"Not applied: {report}")
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply scst.conf changes to the running SCST without a restart.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--config", help="scst.conf to apply (default: generate from Options.json)")
+    source.add_argument("--options", help="Options.json to generate the configuration from")
+    parser.add_argument("--root", default=SCST_ROOT, help="SCST sysfs root")
+    parser.add_argument("--apply", action="store_true", help="Make the changes (default: only print the plan)")
+    parser.add_argument("--prune", action="store_true", help="Remove live devices, targets and LUNs not in the config")
+    args = parser.parse_args()
+
+    if not os.path.isdir(os.path.join(args.root, "targets")):
+        print(f"SCST sysfs tree not found under {args.root}. Is scst loaded?")
+        sys.exit(1)
+    try:
+        desired = load_desired(args)
+        reports = reconcile(desired, args.root, args.apply, args.prune)
+    except ScstConfigError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except OSError:
+        sys.exit(1)
+    sys.exit(2 if reports else 0)
+
+
+if __name__ == "__main__":
+    main()
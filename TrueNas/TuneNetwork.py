@@ -0,0 +1,648 @@
+#!/usr/bin/python3
+"""
+NIC tuning engine for the SAN network interfaces.
+
+Replaces the fork-heavy 50-set_network dispatcher script.  Rings, pause, coalesce,
+features, private flags and txqueuelen are read and written over ethtool-netlink and
+rtnetlink, with every request for every interface batched into a single send.  Only
+settings whose current value differs from the profile are written.
+
+Profiles come from Options.json under "network":
+    "profiles": {"default": {...}, "<iface>": {...}}   per-interface overrides
+    "options":  [{"opt": "-G", "value": "rx 8192 tx 8192"}]   legacy ethtool style
+"""
+
+import argparse
+import copy
+import errno
+import json
+import os
+import socket
+import struct
+import sys
+
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    try:
+        from OptionsFile import find_options_file
+    except ImportError:  # Installed on its own by 50-set_network, which passes --options
+        find_options_file = None
+
+# Netlink message framing
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLA_F_NESTED = 0x8000
+NLA_TYPE_MASK = 0x3FFF
+
+NETLINK_ROUTE = 0
+NETLINK_GENERIC = 16
+
+# Generic netlink controller
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+# rtnetlink
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+IFLA_TXQLEN = 13
+
+# ethtool-netlink commands (user space -> kernel)
+ETHTOOL_MSG_FEATURES_GET = 11
+ETHTOOL_MSG_FEATURES_SET = 12
+ETHTOOL_MSG_PRIVFLAGS_GET = 13
+ETHTOOL_MSG_PRIVFLAGS_SET = 14
+ETHTOOL_MSG_RINGS_GET = 15
+ETHTOOL_MSG_RINGS_SET = 16
+ETHTOOL_MSG_COALESCE_GET = 19
+ETHTOOL_MSG_COALESCE_SET = 20
+ETHTOOL_MSG_PAUSE_GET = 21
+ETHTOOL_MSG_PAUSE_SET = 22
+
+# Every ethtool message carries its request header as attribute 1
+ETHTOOL_A_HEADER = 1
+ETHTOOL_A_HEADER_DEV_NAME = 2
+
+# Bit set encoding (verbose form, so flags travel by name)
+ETHTOOL_A_BITSET_NOMASK = 1
+ETHTOOL_A_BITSET_BITS = 3
+ETHTOOL_A_BITSET_BITS_BIT = 1
+ETHTOOL_A_BITSET_BIT_NAME = 2
+ETHTOOL_A_BITSET_BIT_VALUE = 3
+
+ETHTOOL_A_FEATURES_HW = 2
+ETHTOOL_A_FEATURES_WANTED = 3
+ETHTOOL_A_FEATURES_ACTIVE = 4
+ETHTOOL_A_PRIVFLAGS_FLAGS = 2
+
+# Scalar attributes per category: name -> (attribute id, struct format)
+RINGS_ATTRS = {
+    "rx_max": (2, "I"),
+    "tx_max": (5, "I"),
+    "rx": (6, "I"),
+    "rx_jumbo": (8, "I"),
+    "tx": (9, "I"),
+}
+PAUSE_ATTRS = {
+    "autoneg": (2, "B"),
+    "rx": (3, "B"),
+    "tx": (4, "B"),
+}
+COALESCE_ATTRS = {
+    "rx_usecs": (2, "I"),
+    "rx_max_frames": (3, "I"),
+    "tx_usecs": (6, "I"),
+    "tx_max_frames": (7, "I"),
+    "use_adaptive_rx": (11, "B"),
+    "use_adaptive_tx": (12, "B"),
+}
+SCALAR_CATEGORIES = {
+    "rings": (ETHTOOL_MSG_RINGS_GET, ETHTOOL_MSG_RINGS_SET, RINGS_ATTRS),
+    "pause": (ETHTOOL_MSG_PAUSE_GET, ETHTOOL_MSG_PAUSE_SET, PAUSE_ATTRS),
+    "coalesce": (ETHTOOL_MSG_COALESCE_GET, ETHTOOL_MSG_COALESCE_SET, COALESCE_ATTRS),
+}
+READ_ONLY_KEYS = {"rx_max", "tx_max"}
+CATEGORIES = ("txqueuelen", "rings", "pause", "coalesce", "features", "privflags")
+
+# ethtool command line spellings -> kernel names used on netlink
+FEATURE_ALIASES = {
+    "ntuple-filters": "rx-ntuple-filter",
+    "ntuple": "rx-ntuple-filter",
+    "generic-receive-offload": "rx-gro",
+    "gro": "rx-gro",
+    "large-receive-offload": "rx-lro",
+    "lro": "rx-lro",
+    "receive-hashing": "rx-hashing",
+    "rxhash": "rx-hashing",
+    "tcp-segmentation-offload": "tx-tcp-segmentation",
+    "generic-segmentation-offload": "tx-generic-segmentation",
+}
+COALESCE_ALIASES = {
+    "rx-usecs": "rx_usecs",
+    "tx-usecs": "tx_usecs",
+    "rx-frames": "rx_max_frames",
+    "tx-frames": "tx_max_frames",
+    "adaptive-rx": "use_adaptive_rx",
+    "adaptive-tx": "use_adaptive_tx",
+}
+LEGACY_OPTIONS = {
+    "-G": "rings",
+    "--set-ring": "rings",
+    "-A": "pause",
+    "--pause": "pause",
+    "-C": "coalesce",
+    "--coalesce": "coalesce",
+    "-K": "features",
+    "--features": "features",
+    "--set-priv-flags": "privflags",
+}
+
+
+def parse_switch(value):
+    """
+    Convert ethtool style on/off values (and JSON booleans) to 1/0.
+    """
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().lower()
+    if text in ("on", "yes", "true"):
+        return 1
+    if text in ("off", "no", "false"):
+        return 0
+    return int(text)
+
+
+def normalize_category(category, settings):
+    """
+    Normalize one profile category to the engine's key names and value types.
+    """
+    normalized = {}
+    for key, value in settings.items():
+        if category == "features":
+            key = FEATURE_ALIASES.get(key, key)
+            normalized[key] = bool(parse_switch(value))
+        elif category == "privflags":
+            normalized[key] = bool(parse_switch(value))
+        elif category == "coalesce":
+            normalized[COALESCE_ALIASES.get(key, key.replace("-", "_"))] = parse_switch(value)
+        else:
+            normalized[key.replace("-", "_")] = parse_switch(value)
+    return normalized
+
+
+def parse_legacy_option(option):
+    """
+    Translate a legacy {"opt": "-G", "value": "rx 8192 tx 8192"} entry into (category, settings).
+    """
+    category = LEGACY_OPTIONS.get(option.get("opt"))
+    if not category:
+        print(f"Skipping unsupported network option: {option.get('opt')}")
+        return None, {}
+    words = str(option.get("value", "")).split()
+    if len(words) % 2:
+        print(f"Skipping malformed value for {option.get('opt')}: {option.get('value')}")
+        return None, {}
+    return category, normalize_category(category, dict(zip(words[::2], words[1::2])))
+
+
+def merge_profile(target, source):
+    """
+    Merge one profile into another, category by category.
+    """
+    for category, settings in source.items():
+        if category == "txqueuelen":
+            target["txqueuelen"] = int(settings)
+        elif category in CATEGORIES:
+            target.setdefault(category, {}).update(normalize_category(category, settings))
+        else:
+            print(f"Ignoring unknown profile category '{category}'.")
+    return target
+
+
+def load_network_profile(iface, options):
+    """
+    Build the desired settings for an interface.
+    Order of precedence: profiles.default < legacy network.options < profiles.<iface>.
+    """
+    network = options.get("network", {})
+    profiles = network.get("profiles", {})
+    desired = merge_profile({}, profiles.get("default", {}))
+    for option in network.get("options", []):
+        category, settings = parse_legacy_option(option)
+        if category:
+            desired.setdefault(category, {}).update(settings)
+    return merge_profile(desired, profiles.get(iface, {}))
+
+
+def find_rdma_interfaces():
+    """
+    List the netdevs backing RDMA devices from sysfs (what `rdma link show` reports, without forking).
+    """
+    interfaces = []
+    ib_root = "/sys/class/infiniband"
+    if not os.path.isdir(ib_root):
+        return interfaces
+    for device in sorted(os.listdir(ib_root)):
+        net_dir = os.path.join(ib_root, device, "device", "net")
+        if os.path.isdir(net_dir):
+            for iface in sorted(os.listdir(net_dir)):
+                if iface not in interfaces:
+                    interfaces.append(iface)
+    return interfaces
+
+
+# --- netlink encoding ---------------------------------------------------------------------------
+
+def nla(attr_type, payload):
+    """
+    Encode a netlink attribute, padded to 4 bytes.
+    """
+    length = 4 + len(payload)
+    return struct.pack("=HH", length, attr_type) + payload + b"\0" * ((4 - length % 4) % 4)
+
+
+def nla_nested(attr_type, *attrs):
+    return nla(attr_type | NLA_F_NESTED, b"".join(attrs))
+
+
+def nla_string(attr_type, value):
+    return nla(attr_type, value.encode() + b"\0")
+
+
+def parse_attrs(data):
+    """
+    Decode a run of netlink attributes into a dict of type -> raw payload (last one wins)
+    plus the ordered list, which repeated attributes like bit set entries need.
+    """
+    attrs, ordered, offset = {}, [], 0
+    while offset + 4 <= len(data):
+        length, attr_type = struct.unpack_from("=HH", data, offset)
+        if length < 4:
+            break
+        payload = data[offset + 4:offset + length]
+        attrs[attr_type & NLA_TYPE_MASK] = payload
+        ordered.append((attr_type & NLA_TYPE_MASK, payload))
+        offset += (length + 3) & ~3
+    return attrs, ordered
+
+
+def encode_bitset(flags):
+    """
+    Encode {name: bool} as a verbose bit set.  Without NOMASK only the listed bits change.
+    """
+    bits = []
+    for name, enabled in sorted(flags.items()):
+        entry = nla_string(ETHTOOL_A_BITSET_BIT_NAME, name)
+        if enabled:
+            entry += nla(ETHTOOL_A_BITSET_BIT_VALUE, b"")
+        bits.append(nla_nested(ETHTOOL_A_BITSET_BITS_BIT, entry))
+    return nla_nested(ETHTOOL_A_BITSET_BITS, *bits)
+
+
+def decode_bitset(payload):
+    """
+    Decode a verbose bit set into {name: bool}.  In list form (NOMASK) every listed bit is set;
+    otherwise bits listed without a VALUE flag are off.
+    """
+    attrs, _ = parse_attrs(payload)
+    list_form = ETHTOOL_A_BITSET_NOMASK in attrs
+    flags = {}
+    _, bits = parse_attrs(attrs.get(ETHTOOL_A_BITSET_BITS, b""))
+    for _, bit in bits:
+        bit_attrs, _ = parse_attrs(bit)
+        name = bit_attrs.get(ETHTOOL_A_BITSET_BIT_NAME, b"").rstrip(b"\0").decode()
+        if name:
+            flags[name] = list_form or ETHTOOL_A_BITSET_BIT_VALUE in bit_attrs
+    return flags
+
+
+def changeable_features(hw, active):
+    """
+    Current value of every feature user space can change.  The HW bit set lists fixed features too,
+    with their bit clear; only the set bits are changeable, and the active set gives their value.
+    """
+    active_flags = decode_bitset(active)
+    return {name: active_flags.get(name, False) for name, bit in decode_bitset(hw).items() if bit}
+
+
+class NetlinkBackend:
+    """
+    Reads and applies settings on real NICs through ethtool-netlink and rtnetlink.
+    All requests of one pass go out in a single datagram per netlink family.
+    """
+
+    def __init__(self):
+        self.genl = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self.genl.bind((0, 0))
+        self.route = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.route.bind((0, 0))
+        for sock in (self.genl, self.route):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.seq = 0
+        self.family = self._resolve_family("ethtool")
+
+    def close(self):
+        self.genl.close()
+        self.route.close()
+
+    def _next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def _message(self, msg_type, flags, seq, payload):
+        return struct.pack("=LHHLL", 16 + len(payload), msg_type, flags, seq, 0) + payload
+
+    def _genl_message(self, cmd, flags, seq, attrs):
+        return self._message(self.family, flags, seq, struct.pack("=BBH", cmd, 1, 0) + attrs)
+
+    def _exchange(self, sock, messages):
+        """
+        Send a batch of (seq, bytes) messages at once and collect replies by sequence number.
+        Returns {seq: (payload or None, errno)}.
+        """
+        pending = {seq for seq, _ in messages}
+        replies = {}
+        sock.send(b"".join(message for _, message in messages))
+        while pending:
+            data = sock.recv(1 << 20)
+            offset = 0
+            while offset + 16 <= len(data):
+                length, msg_type, _, seq, _ = struct.unpack_from("=LHHLL", data, offset)
+                body = data[offset + 16:offset + length]
+                offset += (length + 3) & ~3
+                if seq not in pending:
+                    continue
+                if msg_type == NLMSG_ERROR:
+                    error = -struct.unpack_from("=i", body)[0]
+                    payload = replies.get(seq, (None, 0))[0]
+                    replies[seq] = (payload, error)
+                    pending.discard(seq)
+                elif msg_type == NLMSG_DONE:
+                    pending.discard(seq)
+                else:
+                    replies[seq] = (body, 0)
+        return replies
+
+    def _resolve_family(self, name):
+        seq = self._next_seq()
+        message = self._message(GENL_ID_CTRL, NLM_F_REQUEST | NLM_F_ACK, seq,
+                                struct.pack("=BBH", CTRL_CMD_GETFAMILY, 1, 0)
+                                + nla_string(CTRL_ATTR_FAMILY_NAME, name))
+        payload, error = self._exchange(self.genl, [(seq, message)])[seq]
+        if error or payload is None:
+            raise OSError(error or errno.ENOENT, f"Generic netlink family '{name}' unavailable")
+        attrs, _ = parse_attrs(payload[4:])
+        return struct.unpack("=H", attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+
+    def _header(self, iface):
+        return nla_nested(ETHTOOL_A_HEADER, nla_string(ETHTOOL_A_HEADER_DEV_NAME, iface))
+
+    def read_state(self, interfaces):
+        """
+        Read every category for every interface with one ethtool batch and one rtnetlink batch.
+        """
+        state = {iface: {} for iface in interfaces}
+        requests = {}
+        genl_batch = []
+        for iface in interfaces:
+            for category, get_cmd in (("rings", ETHTOOL_MSG_RINGS_GET), ("pause", ETHTOOL_MSG_PAUSE_GET),
+                                      ("coalesce", ETHTOOL_MSG_COALESCE_GET),
+                                      ("features", ETHTOOL_MSG_FEATURES_GET),
+                                      ("privflags", ETHTOOL_MSG_PRIVFLAGS_GET)):
+                seq = self._next_seq()
+                requests[seq] = (iface, category)
+                genl_batch.append((seq, self._genl_message(get_cmd, NLM_F_REQUEST | NLM_F_ACK, seq,
+                                                           self._header(iface))))
+        route_batch = []
+        for iface in interfaces:
+            try:
+                ifinfo = struct.pack("=BxHiII", socket.AF_UNSPEC, 0, socket.if_nametoindex(iface), 0, 0)
+            except OSError:
+                print(f"{iface}: reading txqueuelen failed: {os.strerror(errno.ENODEV)}")
+                continue
+            seq = self._next_seq()
+            requests[seq] = (iface, "txqueuelen")
+            route_batch.append((seq, self._message(RTM_GETLINK, NLM_F_REQUEST | NLM_F_ACK, seq, ifinfo)))
+
+        replies = self._exchange(self.genl, genl_batch) if genl_batch else {}
+        if route_batch:
+            replies.update(self._exchange(self.route, route_batch))
+        for seq, (payload, error) in replies.items():
+            iface, category = requests[seq]
+            if error or payload is None:
+                if error != errno.EOPNOTSUPP:
+                    print(f"{iface}: reading {category} failed: {os.strerror(error or errno.ENODATA)}")
+                continue
+            if category == "txqueuelen":
+                attrs, _ = parse_attrs(payload[16:])
+                if IFLA_TXQLEN in attrs:
+                    state[iface]["txqueuelen"] = struct.unpack("=I", attrs[IFLA_TXQLEN][:4])[0]
+                continue
+            attrs, _ = parse_attrs(payload[4:])
+            if category in SCALAR_CATEGORIES:
+                values = {}
+                for key, (attr_id, fmt) in SCALAR_CATEGORIES[category][2].items():
+                    if attr_id in attrs:
+                        values[key] = struct.unpack("=" + fmt, attrs[attr_id][:struct.calcsize(fmt)])[0]
+                state[iface][category] = values
+            elif category == "features":
+                state[iface]["features"] = changeable_features(attrs.get(ETHTOOL_A_FEATURES_HW, b""),
+                                                               attrs.get(ETHTOOL_A_FEATURES_ACTIVE, b""))
+            elif category == "privflags":
+                state[iface]["privflags"] = decode_bitset(attrs.get(ETHTOOL_A_PRIVFLAGS_FLAGS, b""))
+        return state
+
+    def apply(self, changes):
+        """
+        Apply {iface: {category: {key: value}}} in one batch per netlink family.
+        Returns {(iface, category): error string} for the writes the kernel rejected.
+        """
+        requests = {}
+        errors = {}
+        genl_batch = []
+        route_batch = []
+        for iface, categories in changes.items():
+            for category, values in categories.items():
+                if category == "txqueuelen":
+                    try:
+                        ifinfo = struct.pack("=BxHiII", socket.AF_UNSPEC, 0, socket.if_nametoindex(iface), 0, 0)
+                    except OSError:
+                        errors[(iface, category)] = os.strerror(errno.ENODEV)
+                        continue
+                seq = self._next_seq()
+                requests[seq] = (iface, category)
+                if category == "txqueuelen":
+                    route_batch.append((seq, self._message(RTM_NEWLINK, NLM_F_REQUEST | NLM_F_ACK, seq,
+                                                           ifinfo + nla(IFLA_TXQLEN, struct.pack("=I", values)))))
+                    continue
+                attrs = self._header(iface)
+                if category in SCALAR_CATEGORIES:
+                    _, set_cmd, table = SCALAR_CATEGORIES[category]
+                    for key, value in values.items():
+                        attr_id, fmt = table[key]
+                        attrs += nla(attr_id, struct.pack("=" + fmt, value))
+                elif category == "features":
+                    set_cmd = ETHTOOL_MSG_FEATURES_SET
+                    attrs += nla(ETHTOOL_A_FEATURES_WANTED | NLA_F_NESTED, encode_bitset(values))
+                else:
+                    set_cmd = ETHTOOL_MSG_PRIVFLAGS_SET
+                    attrs += nla(ETHTOOL_A_PRIVFLAGS_FLAGS | NLA_F_NESTED, encode_bitset(values))
+                genl_batch.append((seq, self._genl_message(set_cmd, NLM_F_REQUEST | NLM_F_ACK, seq, attrs)))
+
+        replies = {}
+        if genl_batch:
+            replies.update(self._exchange(self.genl, genl_batch))
+        if route_batch:
+            replies.update(self._exchange(self.route, route_batch))
+        errors.update({requests[seq]: os.strerror(error) for seq, (_, error) in replies.items() if error})
+        return errors
+
+
+class FixtureBackend:
+    """
+    Replays NIC state recorded in a JSON fixture instead of talking to the kernel.
+    Applied changes update the in-memory state and are kept in `applied`, so profile
+    handling and change detection can be exercised on hosts without the NICs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "r") as file:
+            self.state = json.load(file)
+        self.applied = []
+
+    def close(self):
+        pass
+
+    def read_state(self, interfaces):
+        return {iface: copy.deepcopy(self.state.get(iface, {})) for iface in interfaces}
+
+    def apply(self, changes):
+        errors = {}
+        for iface, categories in changes.items():
+            if iface not in self.state:
+                for category in categories:
+                    errors[(iface, category)] = os.strerror(errno.ENODEV)
+                continue
+            for category, values in categories.items():
+                self.applied.append((iface, category, copy.deepcopy(values)))
+                if category == "txqueuelen":
+                    self.state[iface]["txqueuelen"] = values
+                else:
+                    self.state[iface].setdefault(category, {}).update(values)
+        return errors
+
+    def save(self, path=None):
+        with open(path or self.path, "w") as file:
+            json.dump(self.state, file, indent=2, sort_keys=True)
+
+
+def compute_changes(current, desired, iface):
+    """
+    Compare current and desired settings for one interface and return only what differs.
+    Ring sizes are clamped to the hardware maximum; unknown features and flags are reported and skipped.
+    """
+    changes = {}
+    if "txqueuelen" in desired and current.get("txqueuelen") != desired["txqueuelen"]:
+        changes["txqueuelen"] = desired["txqueuelen"]
+
+    for category in ("rings", "pause", "coalesce", "features", "privflags"):
+        wanted = desired.get(category)
+        if not wanted:
+            continue
+        if category not in current:
+            print(f"{iface}: {category} not supported by the driver, skipping.")
+            continue
+        have = current[category]
+        delta = {}
+        for key, value in wanted.items():
+            if key in READ_ONLY_KEYS:
+                continue
+            if key not in have:
+                print(f"{iface}: {category} setting '{key}' not available, skipping.")
+                continue
+            if category == "rings" and f"{key}_max" in have and value > have[f"{key}_max"]:
+                print(f"{iface}: ring {key}={value} exceeds hardware maximum {have[f'{key}_max']}, clamping.")
+                value = have[f"{key}_max"]
+            if have[key] != value:
+                delta[key] = value
+        if delta:
+            changes[category] = delta
+    return changes
+
+
+def describe_changes(iface, current, changes):
+    for category, values in changes.items():
+        if category == "txqueuelen":
+            print(f"{iface}: txqueuelen {current.get('txqueuelen')} -> {values}")
+            continue
+        for key, value in sorted(values.items()):
+            print(f"{iface}: {category} {key} {current[category].get(key)} -> {value}")
+
+
+def tune_interfaces(backend, interfaces, options, dry_run=False):
+    """
+    Read all interfaces, diff against their profiles, and apply the differences in one batch.
+    Interfaces whose settings cannot be read (missing or renamed) are skipped.
+    Returns True when every interface was read and every needed change was applied.
+    """
+    current = backend.read_state(interfaces)
+    changes = {}
+    skipped = False
+    for iface in interfaces:
+        if not current[iface]:
+            print(f"{iface}: no settings could be read, skipping.")
+            skipped = True
+            continue
+        iface_changes = compute_changes(current[iface], load_network_profile(iface, options), iface)
+        if iface_changes:
+            describe_changes(iface, current[iface], iface_changes)
+            changes[iface] = iface_changes
+        else:
+            print(f"{iface}: already matches its profile.")
+
+    if not changes or dry_run:
+        return not skipped
+
+    errors = backend.apply(changes)
+    for (iface, category), error in sorted(errors.items()):
+        print(f"{iface}: failed to apply {category}: {error}")
+    return not errors and not skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply per-interface NIC tuning profiles from Options.json.")
+    parser.add_argument("interfaces", nargs="*", help="Interfaces to tune (default: netdevs of RDMA devices)")
+    parser.add_argument("--options", help="Path to Options.json (default: the one next to the scripts)")
+    parser.add_argument("--dry-run", action="store_true", help="Show the changes without applying them")
+    parser.add_argument("--fixture", help="Use a recorded JSON fixture instead of the kernel")
+    parser.add_argument("--record-fixture", metavar="PATH", help="Write the current state of the interfaces to PATH")
+    args = parser.parse_args()
+
+    if not args.options and find_options_file:
+        args.options = find_options_file()
+    if not args.options:
+        print("Options.json file not found!")
+        sys.exit(1)
+    try:
+        with open(args.options, "r") as file:
+            options = json.load(file)
+    except json.JSONDecodeError:
+        print("Failed to parse Options.json! Please ensure the file is valid JSON.")
+        sys.exit(1)
+
+    try:
+        backend = FixtureBackend(args.fixture) if args.fixture else NetlinkBackend()
+    except OSError as e:
+        print(f"Unable to open the tuning backend: {e}")
+        sys.exit(1)
+
+    try:
+        interfaces = args.interfaces or (list(backend.state) if args.fixture else find_rdma_interfaces())
+        if not interfaces:
+            print("No RDMA network interfaces found.")
+            sys.exit(0)
+
+        if args.record_fixture:
+            with open(args.record_fixture, "w") as file:
+                json.dump(backend.read_state(interfaces), file, indent=2, sort_keys=True)
+            print(f"Recorded state of {', '.join(interfaces)} to {args.record_fixture}")
+            return
+
+        ok = tune_interfaces(backend, interfaces, options, dry_run=args.dry_run)
+        if args.fixture and not args.dry_run:
+            print(f"Fixture changes: {json.dumps(backend.applied)}")
+    finally:
+        backend.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/python3
+"""
+ZFS module tuning profiles for zvol-backed iSCSI/iSER targets.
+
+A profile sets ARC limits, the per-vdev I/O scheduler queue depths, the txg timeout, the dirty data limit and
+the zvol worker threads.  Values may be absolute or derived from the host:
+    {"ram_fraction": 0.5, "max": "64G"}     a share of physical memory, optionally clamped
+    {"ram_fraction": 0.75, "reserve": "8G"} a share of physical memory that leaves at least reserve free
+    {"per_vdev": 8, "min": 16, "max": 128}  scaled by the number of leaf vdevs
+The resolved profile is checked against RAM and the vdev count, then applied through
+/sys/module/zfs/parameters as one unit: every value is read back and, if any write or read-back fails,
+all parameters are restored to what they were.  --persist writes the same values to modprobe.d or as
+TrueNAS tunables so they survive a reboot.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+from CreateZvols import executor, parse_size
+from Executor import CommandError
+
+PARAMETERS_DIR = "/sys/module/zfs/parameters"
+MODPROBE_FILE = "/etc/modprobe.d/zfs-tuning.conf"
+# Memory the OS, middleware and SCST keep outside the ARC
+RESERVED_MEMORY = 8 << 30
+
+PROFILES = {
+    # Small synchronous writes and reads from ESXi: keep sync queues deep, async writes from
+    # the txg sync from crowding them out, and txgs small so a commit never stalls the initiator.
+    "iser-latency": {
+        "zfs_arc_max": {"ram_fraction": 0.75, "reserve": RESERVED_MEMORY},
+        "zfs_arc_min": {"ram_fraction": 0.25},
+        "zfs_vdev_sync_read_min_active": 16,
+        "zfs_vdev_sync_read_max_active": 32,
+        "zfs_vdev_sync_write_min_active": 16,
+        "zfs_vdev_sync_write_max_active": 32,
+        "zfs_vdev_async_write_min_active": 2,
+        "zfs_vdev_async_write_max_active": 8,
+        "zfs_txg_timeout": 5,
+        "zfs_dirty_data_max": {"ram_fraction": 0.05, "max": "4G"},
+        "zvol_threads": {"per_vdev": 8, "min": 32, "max": 128},
+    },
+    # Large sequential streams (backups, clones): deep async queues, bigger txgs and aggregation.
+    "bulk-throughput": {
+        "zfs_arc_max": {"ram_fraction": 0.75, "reserve": RESERVED_MEMORY},
+        "zfs_arc_min": {"ram_fraction": 0.25},
+        "zfs_vdev_sync_read_min_active": 10,
+        "zfs_vdev_sync_read_max_active": 10,
+        "zfs_vdev_sync_write_min_active": 10,
+        "zfs_vdev_sync_write_max_active": 10,
+        "zfs_vdev_async_write_min_active": 8,
+        "zfs_vdev_async_write_max_active": 32,
+        "zfs_vdev_aggregation_limit": 1048576,
+        "zfs_txg_timeout": 10,
+        "zfs_dirty_data_max": {"ram_fraction": 0.10, "max": "8G"},
+        "zvol_threads": {"per_vdev": 16, "min": 32, "max": 256},
+    },
+}
+QUEUE_CLASSES = ("sync_read", "sync_write", "async_read", "async_write", "scrub")
+
+
+def read_total_memory(path="/proc/meminfo"):
+    with open(path, "r") as file:
+        for line in file:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    raise OSError("MemTotal not found in /proc/meminfo")
+
+
+def count_leaf_vdevs(pools=None):
+    """
+    Number of leaf vdevs (disks and partitions) from `zpool list -vHP`.
+    """
+    result = executor.run(["zpool", "list", "-vHP", *(pools or [])])
+    if not result.ok:
+        raise OSError(f"zpool list failed: {result.stderr.strip()}")
+    return sum(1 for line in result.stdout.splitlines() if line.strip().startswith("/"))
+
+
+def resolve_value(spec, memory, vdevs):
+    if not isinstance(spec, dict):
+        return int(parse_size(spec)) if isinstance(spec, str) else int(spec)
+    if "ram_fraction" in spec:
+        value = int(memory * spec["ram_fraction"])
+    elif "per_vdev" in spec:
+        value = int(spec["per_vdev"] * max(vdevs, 1))
+    else:
+        value = int(parse_size(spec["value"]))
+    if "min" in spec:
+        value = max(value, int(parse_size(spec["min"])))
+    if "max" in spec:
+        value = min(value, int(parse_size(spec["max"])))
+    if "reserve" in spec:
+        value = min(value, memory - int(parse_size(spec["reserve"])))
+    return value
+
+
+def resolve_profile(profile, memory, vdevs, overrides=None):
+    merged = dict(profile)
+    merged.update(overrides or {})
+    return {name: resolve_value(spec, memory, vdevs) for name, spec in merged.items()}
+
+
+def validate(values, memory, vdevs, current):
+    """
+    Returns (errors, warnings) for a resolved profile.  current holds the live parameter values.
+    """
+    errors, warnings = [], []
+    arc_max = values.get("zfs_arc_max", current.get("zfs_arc_max"))
+    arc_min = values.get("zfs_arc_min", current.get("zfs_arc_min"))
+    if values.get("zfs_arc_max", 1) <= 0:
+        errors.append(f"{memory >> 30} GiB RAM leaves nothing for the ARC after the {RESERVED_MEMORY >> 30} GiB "
+                      f"kept outside it")
+    elif arc_max and arc_max > memory - RESERVED_MEMORY:
+        errors.append(f"zfs_arc_max {arc_max} leaves less than {RESERVED_MEMORY >> 30} GiB "
+                      f"of {memory >> 30} GiB RAM")
+    if arc_max and arc_min and arc_min >= arc_max:
+        errors.append(f"zfs_arc_min {arc_min} is not below zfs_arc_max {arc_max}")
+    dirty = values.get("zfs_dirty_data_max")
+    if dirty:
+        dirty_max_max = current.get("zfs_dirty_data_max_max")
+        if dirty_max_max and dirty > dirty_max_max:
+            errors.append(f"zfs_dirty_data_max {dirty} exceeds zfs_dirty_data_max_max {dirty_max_max}")
+        if arc_max and dirty > arc_max // 4:
+            warnings.append(f"zfs_dirty_data_max {dirty} is more than a quarter of the ARC")
+    for queue in QUEUE_CLASSES:
+        low = values.get(f"zfs_vdev_{queue}_min_active", current.get(f"zfs_vdev_{queue}_min_active"))
+        high = values.get(f"zfs_vdev_{queue}_max_active", current.get(f"zfs_vdev_{queue}_max_active"))
+        if low is not None and high is not None and low > high:
+            errors.append(f"zfs_vdev_{queue}_min_active {low} is above zfs_vdev_{queue}_max_active {high}")
+    vdev_max = values.get("zfs_vdev_max_active", current.get("zfs_vdev_max_active"))
+    if vdev_max:
+        per_vdev = sum(values.get(f"zfs_vdev_{queue}_min_active",
+                                  current.get(f"zfs_vdev_{queue}_min_active")) or 0 for queue in QUEUE_CLASSES)
+        if per_vdev > vdev_max:
+            warnings.append(f"the *_min_active queue depths add up to {per_vdev}, "
+                            f"above zfs_vdev_max_active {vdev_max}")
+    if vdevs == 0:
+        warnings.append("no imported pool found; per-vdev values use one vdev")
+    threads = values.get("zvol_threads")
+    if threads and vdevs and threads > vdevs * 32:
+        warnings.append(f"zvol_threads {threads} is far above what {vdevs} vdevs can keep busy")
+    return errors, warnings
+
+
+def read_parameter(name, directory=PARAMETERS_DIR):
+    with open(os.path.join(directory, name), "r") as file:
+        text = file.read().strip()
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def read_parameters(names, directory=PARAMETERS_DIR):
+    values = {}
+    for name in names:
+        try:
+            values[name] = read_parameter(name, directory)
+        except OSError:
+            values[name] = None
+    return values
+
+
+def writable(name, directory=PARAMETERS_DIR):
+    try:
+        return bool(os.stat(os.path.join(directory, name)).st_mode & 0o222)
+    except OSError:
+        return False
+
+
+def write_parameter(name, value, directory=PARAMETERS_DIR):
+    with open(os.path.join(directory, name), "w") as file:
+        file.write(f"{value}\n")
+
+
+def apply_parameters(values, directory=PARAMETERS_DIR):
+    """
+    Write and read back every runtime-writable parameter; on any failure restore all of them.
+    Returns (applied, load_time_only) where load_time_only lists parameters that are read-only at runtime.
+    """
+    runtime = {name: value for name, value in values.items() if writable(name, directory)}
+    load_time_only = sorted(name for name in values if name not in runtime)
+    previous = read_parameters(runtime, directory)
+    # ARC limits must stay ordered while they move: a growing ARC raises the max first, a shrinking one
+    # lowers the min first
+    order = sorted(name for name in runtime if name not in ("zfs_arc_max", "zfs_arc_min"))
+    arc = [name for name in ("zfs_arc_max", "zfs_arc_min") if name in runtime]
+    if "zfs_arc_max" in runtime and runtime["zfs_arc_max"] < (previous["zfs_arc_max"] or 0):
+        arc.reverse()
+    order = arc + order
+    written = []
+    try:
+        for name in order:
+            write_parameter(name, runtime[name], directory)
+            written.append(name)
+            readback = read_parameter(name, directory)
+            if readback != runtime[name]:
+                raise OSError(f"{name} reads back {readback} after writing {runtime[name]}")
+    except OSError as e:
+        print(f"Applying the profile failed ({e}); restoring the previous values...")
+        for name in reversed(written):
+            if previous.get(name) is not None:
+                try:
+                    write_parameter(name, previous[name], directory)
+                except OSError as restore_error:
+                    print(f"Unable to restore {name}: {restore_error}")
+        raise
+    return runtime, load_time_only
+
+
+def render_modprobe(values, profile_name):
+    options = " ".join(f"{name}={value}" for name, value in sorted(values.items()))
+    return f"# ZFS tuning profile '{profile_name}' (generated by TuneZfs.py)\noptions zfs {options}\n"
+
+
+def persist_truenas(values):
+    """
+    Create or update one TrueNAS "ZFS" tunable per parameter through the middleware.
+    """
+    for name, value in sorted(values.items()):
+        query = executor.run(["midclt", "call", "tunable.query", json.dumps([["var", "=", name]])], check=True)
+        existing = json.loads(query.stdout or "[]")
+        if existing:
+            if str(existing[0].get("value")) == str(value):
+                continue
+            command = ["midclt", "call", "-job", "tunable.update", str(existing[0]["id"]),
+                       json.dumps({"value": str(value)})]
+        else:
+            command = ["midclt", "call", "-job", "tunable.create",
+                       json.dumps({"type": "ZFS", "var": name, "value": str(value), "enabled": True})]
+        print(f"Running command: {' '.join(command)}")
+        executor.run(command, check=True, on_output=lambda line, stream: print(line))
+
+
+def load_tuning_options(options_path):
+    if not options_path:
+        return {}
+    with open(options_path, "r") as file:
+        return json.load(file).get("zfs", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply a ZFS module tuning profile.")
+    parser.add_argument("profile", nargs="?", help=f"Profile name ({', '.join(PROFILES)}; default from Options.json)")
+    parser.add_argument("--options", default=find_options_file(), help="Path to Options.json")
+    parser.add_argument("--pool", action="append", help="Count vdevs of this pool only (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Show the resolved values without writing them")
+    parser.add_argument("--persist", choices=("modprobe", "truenas"), help="Also make the values persistent")
+    parser.add_argument("--modprobe-file", default=MODPROBE_FILE, help="File written by --persist modprobe")
+    parser.add_argument("--parameters-dir", default=PARAMETERS_DIR, help="ZFS module parameter directory")
+    args = parser.parse_args()
+
+    tuning = load_tuning_options(args.options)
+    profile_name = args.profile or tuning.get("profile", "iser-latency")
+    if profile_name not in PROFILES:
+        print(f"Unknown profile '{profile_name}'. Choose from: {', '.join(PROFILES)}")
+        sys.exit(1)
+    if not os.path.isdir(args.parameters_dir):
+        print(f"{args.parameters_dir} not found. Is the zfs module loaded?")
+        sys.exit(1)
+
+    memory = read_total_memory()
+    try:
+        vdevs = count_leaf_vdevs(args.pool)
+    except OSError as e:
+        print(f"Warning: {e}")
+        vdevs = 0
+    values = resolve_profile(PROFILES[profile_name], memory, vdevs, tuning.get("overrides"))
+    # A parameter this ZFS version does not have would also stop the module from loading via modprobe.d
+    for name in sorted(values):
+        if not os.path.exists(os.path.join(args.parameters_dir, name)):
+            print(f"Warning: this ZFS version has no parameter {name}; skipping it.")
+            del values[name]
+    names = set(values) | {"zfs_dirty_data_max_max", "zfs_vdev_max_active", "zfs_arc_max", "zfs_arc_min"} | \
+        {f"zfs_vdev_{queue}_{bound}_active" for queue in QUEUE_CLASSES for bound in ("min", "max")}
+    current = read_parameters(sorted(names), args.parameters_dir)
+
+    print(f"Profile '{profile_name}' for {memory >> 30} GiB RAM and {vdevs} leaf vdev(s):")
+    for name, value in sorted(values.items()):
+        marker = "" if current.get(name) == value else f"   (now {current.get(name)})"
+        print(f"  {name:<36} {value}{marker}")
+    errors, warnings = validate(values, memory, vdevs, current)
+    for warning in warnings:
+        print(f"Warning: {warning}")
+    for error in errors:
+        print(f"Error: {error}")
+    if errors:
+        sys.exit(1)
+    if args.dry_run:
+        return
+
+    try:
+        applied, load_time_only = apply_parameters(values, args.parameters_dir)
+    except OSError:
+        sys.exit(1)
+    print(f"Applied and verified {len(applied)} parameter(s).")
+    if load_time_only:
+        print(f"Read-only at runtime (take effect when the zfs module is next loaded): {', '.join(load_time_only)}")
+
+    if args.persist == "modprobe":
+        with open(args.modprobe_file, "w") as file:
+            file.write(render_modprobe(values, profile_name))
+        print(f"Wrote {args.modprobe_file}")
+    elif args.persist == "truenas":
+        try:
+            persist_truenas(values)
+        except CommandError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
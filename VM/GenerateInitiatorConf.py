@@ -0,0 +1,271 @@
+#!/bin/python3
+"""
+Generate multipath.conf and open-iscsi settings for Linux initiators of our SCST targets.
+
+    multipath   device stanzas for vendors CTMS-SAN and LIO-ORG: ALUA priorities, group_by_prio, a
+                service-time (or round-robin) selector, rr_min_io_rq and no_path_retry
+    iscsid      iscsid.conf with the session/connection settings of the profile; with --base the existing
+                file is kept and only those keys are replaced or appended
+    apply       write both files, update every existing node record with iscsiadm -m node -o update (one
+                call per setting covers all nodes) and reconfigure multipathd
+
+Profiles and overrides come from Options.json under "initiator".  zsh/etc/multipath.conf.sample and
+zsh/etc/iscsid.conf.sample are the output for the shipped Options.json; check changes with --diff.
+"""
+
+import argparse
+import difflib
+import json
+import os
+import sys
+
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+SAN_VENDORS = ("CTMS-SAN", "LIO-ORG")
+MULTIPATH_CONF = "/etc/multipath.conf"
+ISCSID_CONF = "/etc/iscsi/iscsid.conf"
+
+MULTIPATH_DEFAULTS = {
+    "user_friendly_names": "yes",
+    "find_multipaths": "yes",
+}
+
+# Two-portal ALUA targets: keep I/O on the optimized group, spread it over all of its paths
+MULTIPATH_DEVICE = {
+    "product": ".*",
+    "path_grouping_policy": "group_by_prio",
+    "path_selector": "service-time 0",
+    "path_checker": "tur",
+    "hardware_handler": "1 alua",
+    "prio": "alua",
+    "failback": "immediate",
+    "rr_weight": "uniform",
+    "rr_min_io_rq": 1,
+    "no_path_retry": 12,
+    "fast_io_fail_tmo": 5,
+    "dev_loss_tmo": 60,
+}
+
+PROFILES = {
+    # Deep queues and 256 KB bursts to match /ISCSI/MaxIoSizeKB and max_tgt_dev_commands on the target
+    "throughput": {
+        "node.startup": "automatic",
+        "node.session.cmds_max": 1024,
+        "node.session.queue_depth": 128,
+        "node.session.nr_sessions": 4,
+        "node.session.timeo.replacement_timeout": 5,
+        "node.session.iscsi.InitialR2T": "No",
+        "node.session.iscsi.ImmediateData": "Yes",
+        "node.session.iscsi.FirstBurstLength": 262144,
+        "node.session.iscsi.MaxBurstLength": 16776192,
+        "node.conn[0].iscsi.MaxRecvDataSegmentLength": 262144,
+        "node.conn[0].iscsi.MaxXmitDataSegmentLength": 262144,
+        "node.conn[0].timeo.noop_out_interval": 5,
+        "node.conn[0].timeo.noop_out_timeout": 5,
+        "discovery.sendtargets.iscsi.MaxRecvDataSegmentLength": 32768,
+    },
+    "latency": {
+        "node.startup": "automatic",
+        "node.session.cmds_max": 256,
+        "node.session.queue_depth": 32,
+        "node.session.nr_sessions": 2,
+        "node.session.timeo.replacement_timeout": 5,
+        "node.session.iscsi.InitialR2T": "No",
+        "node.session.iscsi.ImmediateData": "Yes",
+        "node.session.iscsi.FirstBurstLength": 65536,
+        "node.session.iscsi.MaxBurstLength": 262144,
+        "node.conn[0].iscsi.MaxRecvDataSegmentLength": 65536,
+        "node.conn[0].iscsi.MaxXmitDataSegmentLength": 65536,
+        "node.conn[0].timeo.noop_out_interval": 2,
+        "node.conn[0].timeo.noop_out_timeout": 2,
+        "discovery.sendtargets.iscsi.MaxRecvDataSegmentLength": 32768,
+    },
+}
+
+PATH_SELECTORS = {"service-time": "service-time 0", "round-robin": "round-robin 0", "queue-length": "queue-length 0"}
+
+executor = LocalExecutor()
+
+
+class InitiatorConfigError(Exception):
+    pass
+
+
+def format_value(value):
+    text = str(value)
+    return f'"{text}"' if " " in text or text in ("", ".*") else text
+
+
+def multipath_settings(spec):
+    device = dict(MULTIPATH_DEVICE)
+    selector = spec.get("path_selector")
+    if selector:
+        if selector.split()[0] not in PATH_SELECTORS:
+            raise InitiatorConfigError(f"unknown path_selector '{selector}' ({', '.join(PATH_SELECTORS)})")
+        device["path_selector"] = PATH_SELECTORS.get(selector, selector)
+    device.update(spec.get("multipath", {}))
+    return device
+
+
+def render_multipath(spec):
+    """
+    multipath.conf text for the "initiator" section of Options.json.
+    """
+    device = multipath_settings(spec)
+    lines = ["# Generated by VM/GenerateInitiatorConf.py from Options.json", "defaults {"]
+    lines += [f"        {key} {format_value(value)}" for key, value in MULTIPATH_DEFAULTS.items()]
+    lines += ["}", "", "devices {"]
+    for vendor in spec.get("vendors", SAN_VENDORS):
+        lines += ["        device {", f'                vendor "{vendor}"']
+        lines += [f"                {key} {format_value(value)}" for key, value in device.items()]
+        lines.append("        }")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def iscsid_settings(spec):
+    profile_name = spec.get("profile", "throughput")
+    if profile_name not in PROFILES:
+        raise InitiatorConfigError(f"unknown initiator profile '{profile_name}' ({', '.join(PROFILES)})")
+    settings = dict(PROFILES[profile_name])
+    settings.update(spec.get("iscsid", {}))
+    return settings
+
+
+def render_iscsid(spec, base=None):
+    """
+    iscsid.conf text.  With base (an existing iscsid.conf) every key the profile sets replaces the first
+    matching line, commented out or not, and the rest of the file is kept; missing keys are appended.
+    """
+    settings = iscsid_settings(spec)
+    if base is None:
+        lines = ["# Generated by VM/GenerateInitiatorConf.py from Options.json"]
+        lines += [f"{key} = {value}" for key, value in settings.items()]
+        return "\n".join(lines) + "\n"
+    pending = dict(settings)
+    lines = []
+    for line in base.splitlines():
+        key = line.lstrip("# \t").split("=", 1)[0].strip() if "=" in line else None
+        if key in pending:
+            lines.append(f"{key} = {pending.pop(key)}")
+        elif key in settings and not line.lstrip().startswith("#"):
+            # A second active line for a key already set would override it
+            lines.append(f"# {line}")
+        else:
+            lines.append(line)
+    if pending:
+        lines += ["", "# Added by VM/GenerateInitiatorConf.py"] + [f"{key} = {value}" for key, value in pending.items()]
+    return "\n".join(lines) + "\n"
+
+
+def run_command(args, dry_run=False):
+    print(f"{'Would run' if dry_run else 'Running'}: {' '.join(args)}")
+    if dry_run:
+        return True
+    result = executor.run(args)
+    if result.returncode is None:
+        print(f"Error: {args[0]}: {result.stderr.strip()}")
+    elif not result.ok:
+        print(f"Error: {(result.stderr or result.stdout).strip()}")
+    return result.ok
+
+
+def update_nodes(settings, dry_run=False):
+    """
+    Update every existing node record, one iscsiadm call per setting (no -T/-p selects all nodes).
+    New values take effect at the next login.
+    """
+    failed = []
+    for key, value in settings.items():
+        if not key.startswith("node."):
+            continue
+        if not run_command(["iscsiadm", "-m", "node", "-o", "update", "-n", key, "-v", str(value)], dry_run):
+            failed.append(key)
+    return failed
+
+
+def write_file(path, text, dry_run=False):
+    if dry_run:
+        print(f"Would write {path}")
+        return
+    with open(path, "w") as file:
+        file.write(text)
+    print(f"Wrote {path}")
+
+
+def apply(spec, multipath_path=MULTIPATH_CONF, iscsid_path=ISCSID_CONF, dry_run=False):
+    base = None
+    if os.path.exists(iscsid_path):
+        with open(iscsid_path, "r") as file:
+            base = file.read()
+    write_file(multipath_path, render_multipath(spec), dry_run)
+    write_file(iscsid_path, render_iscsid(spec, base), dry_run)
+    failed = update_nodes(iscsid_settings(spec), dry_run)
+    if not run_command(["multipathd", "reconfigure"], dry_run):
+        failed.append("multipathd reconfigure")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate multipath.conf and iscsid.conf for SAN initiators.")
+    parser.add_argument("what", choices=("multipath", "iscsid", "apply"))
+    parser.add_argument("--options", default=find_options_file(), help="Path to Options.json")
+    parser.add_argument("--base", help="Existing iscsid.conf to update instead of writing a standalone one")
+    parser.add_argument("--output", help="Write the configuration here instead of stdout")
+    parser.add_argument("--diff", metavar="EXISTING", help="Show a unified diff against an existing file")
+    parser.add_argument("--dry-run", action="store_true", help="apply: show what would be written and run")
+    args = parser.parse_args()
+
+    if not args.options:
+        print("Options.json file not found!")
+        sys.exit(1)
+    with open(args.options, "r") as file:
+        spec = json.load(file).get("initiator", {})
+
+    try:
+        if args.what == "apply":
+            failed = apply(spec, dry_run=args.dry_run)
+            if failed:
+                print(f"Failed: {', '.join(failed)}")
+                sys.exit(1)
+            print("Node settings take effect at the next login of each session.")
+            return
+        if args.what == "multipath":
+            config = render_multipath(spec)
+        else:
+            base = None
+            if args.base:
+                with open(args.base, "r") as file:
+                    base = file.read()
+            config = render_iscsid(spec, base)
+    except InitiatorConfigError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.diff:
+        with open(args.diff, "r") as file:
+            existing = file.read().splitlines(keepends=True)
+        diff = list(difflib.unified_diff(existing, config.splitlines(keepends=True),
+                                         fromfile=args.diff, tofile="generated"))
+        sys.stdout.writelines(diff)
+        if diff and not args.output:
+            sys.exit(1)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(config)
+        print(f"Wrote {args.output}")
+    elif not args.diff:
+        sys.stdout.write(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/bin/python3
+"""
+Log a Linux initiator into every SCST portal at once, with several sessions per portal and transport.
+
+    1. make sure the iface records exist (built-in "default" = tcp and "iser", or named ones from Options.json)
+    2. sendtargets discovery against all ISCSI.discovery portals in parallel, through every iface
+    3. log in all (target, portal, iface) nodes in parallel with node.session.nr_sessions = N; nodes that
+       already have sessions only get the missing ones (iscsiadm -m session -r SID -o new)
+    4. wait until multipathd reports every new path, then print the total time and per-path states
+
+--reconnect logs everything out first (also in parallel), so a full reconnect costs about one login.
+Options.json: "ISCSI": {"discovery": [...], "ifaces": [{"name": "iser", "transport": "iser"}],
+"sessions_per_portal": 4}.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+ISCSI_SESSIONS = "/sys/class/iscsi_session"
+DEFAULT_IFACES = [{"name": "default", "transport": "tcp"}, {"name": "iser", "transport": "iser"}]
+MAX_PARALLEL = 64
+
+executor = LocalExecutor()
+
+
+def run_command(args):
+    """
+    Run a command without a shell.  Returns (success, stdout, stderr).
+    """
+    result = executor.run(args)
+    return result.ok, result.stdout.strip(), result.stderr.strip()
+
+
+def parallel(function, items):
+    """
+    [(item, result)] for function(item) run on up to MAX_PARALLEL threads.
+    """
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(items))) as executor:
+        return list(zip(items, executor.map(function, items)))
+
+
+def ensure_ifaces(ifaces):
+    """
+    Create the iface records that do not exist yet and set their transport (and netdev binding).
+    """
+    ok, output, _ = run_command(["iscsiadm", "-m", "iface"])
+    existing = {line.split()[0] for line in output.splitlines() if line.strip()} if ok else set()
+    for iface in ifaces:
+        if iface["name"] in existing:
+            continue
+        settings = [("iface.transport_name", iface.get("transport", "tcp"))]
+        if iface.get("netdev"):
+            settings.append(("iface.net_ifacename", iface["netdev"]))
+        commands = [["iscsiadm", "-m", "iface", "-I", iface["name"], "-o", "new"]]
+        commands += [["iscsiadm", "-m", "iface", "-I", iface["name"], "-o", "update", "-n", key, "-v", value]
+                     for key, value in settings]
+        for command in commands:
+            ok, _, error = run_command(command)
+            if not ok:
+                raise OSError(f"creating iface {iface['name']}: {error}")
+        print(f"Created iface {iface['name']} ({iface.get('transport', 'tcp')})")
+
+
+def discover(portal, iface_names):
+    """
+    sendtargets discovery of one portal through the given ifaces.  Returns ([(target, portal, iface)], error).
+    """
+    command = ["iscsiadm", "-m", "discovery", "-t", "sendtargets", "-p", portal]
+    for name in iface_names:
+        command += ["-I", name]
+    ok, output, error = run_command(command)
+    if not ok:
+        return [], error
+    nodes = []
+    for line in output.splitlines():
+        # "10.80.80.40:3260,1 iqn.2025-05.RackZilla.ctl:iscsi" (iser nodes are reported per iface)
+        parts = line.split()
+        if len(parts) >= 2:
+            address = parts[0].split(",")[0]
+            nodes.extend((parts[1], address, name) for name in iface_names)
+    return nodes, None
+
+
+def read_attribute(path):
+    try:
+        with open(path, "r") as file:
+            return file.read().strip()
+    except OSError:
+        return ""
+
+
+def read_sessions(root=ISCSI_SESSIONS):
+    """
+    {(target, portal, iface): [session ids]} of the logged-in sessions, straight from sysfs.
+    """
+    sessions = {}
+    for path in glob.glob(os.path.join(root, "session*")):
+        sid = os.path.basename(path)[len("session"):]
+        connections = glob.glob(os.path.join(path, "device", "connection*", "iscsi_connection", "connection*"))
+        address = port = ""
+        if connections:
+            address = read_attribute(os.path.join(connections[0], "persistent_address"))
+            port = read_attribute(os.path.join(connections[0], "persistent_port"))
+        key = (read_attribute(os.path.join(path, "targetname")), f"{address}:{port}",
+               read_attribute(os.path.join(path, "ifacename")) or "default")
+        sessions.setdefault(key, []).append(sid)
+    return sessions
+
+
+def session_devices(root=ISCSI_SESSIONS):
+    """
+    Block devices (sdX) of all iSCSI sessions.
+    """
+    return sorted({os.path.basename(path) for path in
+                   glob.glob(os.path.join(root, "session*", "device", "target*", "*", "block", "*"))})
+
+
+def login(node, sessions, count):
+    """
+    Bring one (target, portal, iface) node to count sessions.  Returns an error string or None.
+    """
+    target, portal, iface = node
+    existing = sessions.get(node, [])
+    if not existing:
+        update = ["iscsiadm", "-m", "node", "-T", target, "-p", portal, "-I", iface, "-o", "update",
+                  "-n", "node.session.nr_sessions", "-v", str(count)]
+        ok, _, error = run_command(update)
+        if ok:
+            ok, _, error = run_command(["iscsiadm", "-m", "node", "-T", target, "-p", portal, "-I", iface,
+                                        "--login"])
+        return None if ok else error
+    for _ in range(count - len(existing)):
+        ok, _, error = run_command(["iscsiadm", "-m", "session", "-r", existing[0], "-o", "new"])
+        if not ok:
+            return error
+    return None
+
+
+def logout(node):
+    target, portal, iface = node
+    ok, _, error = run_command(["iscsiadm", "-m", "node", "-T", target, "-p", portal, "-I", iface, "--logout"])
+    return None if ok else error
+
+
+def read_paths():
+    """
+    {device: (checker state, dm state, device state)} from multipathd.
+    """
+    ok, output, _ = run_command(["multipathd", "show", "paths", "raw", "format", "%d %T %t %o"])
+    paths = {}
+    if ok:
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) == 4:
+                paths[parts[0]] = tuple(parts[1:])
+    return paths
+
+
+def wait_for_paths(devices, timeout):
+    """
+    Poll multipathd until every device is a ready path or the timeout passes.  Returns the last path states.
+    """
+    run_command(["udevadm", "settle", f"--timeout={int(timeout)}"])
+    deadline = time.monotonic() + timeout
+    while True:
+        paths = read_paths()
+        if all(paths.get(device, ("",))[0] == "ready" for device in devices) or time.monotonic() >= deadline:
+            return paths
+        time.sleep(0.5)
+
+
+def load_iscsi_options(options_path):
+    if not options_path:
+        return {}
+    with open(options_path, "r") as file:
+        return json.load(file).get("ISCSI", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel multi-session iSCSI/iSER login to all discovery portals.")
+    parser.add_argument("--options", default=find_options_file(), help="Path to Options.json")
+    parser.add_argument("--portal", action="append", help="Portal ip:port (repeatable; default ISCSI.discovery)")
+    parser.add_argument("--sessions", type=int,
+                        help="Sessions per portal and iface (default ISCSI.sessions_per_portal)")
+    parser.add_argument("--reconnect", action="store_true", help="Log out of the discovered nodes first")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for multipath paths")
+    args = parser.parse_args()
+
+    options = load_iscsi_options(args.options)
+    portals = args.portal or options.get("discovery", [])
+    ifaces = options.get("ifaces", DEFAULT_IFACES)
+    count = args.sessions or options.get("sessions_per_portal", 4)
+    if not portals:
+        print("No discovery portals given (ISCSI.discovery in Options.json or --portal).")
+        sys.exit(1)
+
+    started = time.monotonic()
+    try:
+        ensure_ifaces(ifaces)
+    except OSError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    iface_names = [iface["name"] for iface in ifaces]
+    nodes, failures = [], []
+    for portal, (found, error) in parallel(lambda portal: discover(portal, iface_names), portals):
+        if error:
+            failures.append(f"discovery {portal}: {error}")
+        nodes.extend(found)
+    nodes = sorted(set(nodes))
+    print(f"Discovered {len(nodes)} node(s) on {len(portals)} portal(s) in {time.monotonic() - started:.1f}s")
+
+    if args.reconnect:
+        sessions = read_sessions()
+        for node, error in parallel(logout, [node for node in nodes if node in sessions]):
+            if error:
+                failures.append(f"logout {' '.join(node)}: {error}")
+
+    sessions = read_sessions()
+    for node, error in parallel(lambda node: login(node, sessions, count), nodes):
+        if error:
+            failures.append(f"login {' '.join(node)}: {error}")
+    logged_in = time.monotonic() - started
+
+    devices = session_devices()
+    paths = wait_for_paths(devices, args.timeout)
+    total = time.monotonic() - started
+
+    sessions = read_sessions()
+    for node in nodes:
+        print(f"  {node[0]} {node[1]} via {node[2]}: {len(sessions.get(node, []))}/{count} session(s)")
+    for device in devices:
+        checker, dm_state, device_state = paths.get(device, ("missing", "-", "-"))
+        print(f"  path {device}: {checker} {dm_state} {device_state}")
+    for failure in failures:
+        print(f"Failed: {failure}")
+    print(f"Logged in after {logged_in:.1f}s, multipath settled after {total:.1f}s")
+    not_ready = [device for device in devices if paths.get(device, ("",))[0] != "ready"]
+    sys.exit(1 if failures or not_ready else 0)
+
+
+if __name__ == "__main__":
+    main()
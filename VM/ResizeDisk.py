@@ -1,99 +1,332 @@
 #!/bin/python3
+"""
+Grow a guest's disks online after the backing virtual disk was extended.
 
+The block device tree is read once with `lsblk -J -b` and every growable chain is worked out from it:
+disk -> last partition -> LVM PV -> LV -> filesystem (any layer may be missing, e.g. ext4 straight on a
+partition or a PV on the whole disk).  Only the candidate disks are rescanned, and only disks whose size
+changed (or whose last partition stops short of the end after an interrupted run) are grown.  --dry-run does
+not rescan, so it reports what the kernel already knows.
+
+    ResizeDisk.py                      interactive: pick a disk, review the plan, apply it
+    ResizeDisk.py --auto [--json]      grow every disk that got bigger (what Configure.py runs on a fleet)
+    ResizeDisk.py --disk /dev/loop0    limit to given disks; loop devices are refreshed with losetup -c
+"""
+
+import argparse
+import json
 import os
-import subprocess
+import shutil
+import socket
 import sys
 
+try:
+    from Executor import LocalExecutor
+except ImportError:  # Run from the source tree: the package is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from Executor import LocalExecutor
+
+LSBLK_COLUMNS = "NAME,KNAME,PATH,TYPE,SIZE,FSTYPE,MOUNTPOINT"
+SYS_BLOCK = "/sys/class/block"
+DISK_TYPES = ("disk", "loop")
+SECTOR = 512
+# Unallocated space at the end of a disk smaller than this is alignment slack, not growth
+MIN_GROWTH = 1 << 20
+FILESYSTEMS = ("ext2", "ext3", "ext4", "xfs", "btrfs")
+
+executor = LocalExecutor()
+
+
+class ResizeError(Exception):
+    pass
+
+
+def run_command(args, ok_codes=(0,), input_text=None):
+    """
+    Run a command without a shell (through sudo when not root) and return its stdout.
+    """
+    if os.geteuid() != 0:
+        args = ["sudo", "-n"] + list(args)
+    result = executor.run(args, input_text=input_text, ok_codes=ok_codes)
+    if result.returncode is None:
+        raise ResizeError(f"{args[0]}: {result.stderr.strip()}")
+    if not result.ok:
+        raise ResizeError(f"{' '.join(args)}: {(result.stderr or result.stdout).strip()}")
+    return result.stdout.strip()
+
 
-def run_command(command, shell=True):
-    """Utility function to run shell commands."""
+def read_block_devices():
+    """
+    The lsblk device tree, sizes in bytes.
+    """
+    devices = json.loads(run_command(["lsblk", "-J", "-b", "-o", LSBLK_COLUMNS]))["blockdevices"]
+    # Without udev (containers, freshly attached loop devices) lsblk leaves FSTYPE empty; probe those leaves
+    # with a single blkid call
+    unknown, stack = {}, list(devices)
+    while stack:
+        node = stack.pop()
+        stack.extend(node.get("children", []))
+        if not node.get("fstype") and not node.get("children") and node["type"] in DISK_TYPES + ("part",):
+            unknown[node["path"]] = node
+    if unknown:
+        device = None
+        for line in run_command(["blkid", "-o", "export"] + sorted(unknown), ok_codes=(0, 2)).splitlines():
+            key, _, value = line.partition("=")
+            if key == "DEVNAME":
+                device = unknown.get(value)
+            elif key == "TYPE" and device is not None:
+                device["fstype"] = value
+    return devices
+
+
+def read_sysfs_int(kname, attribute):
     try:
-        result = subprocess.run(command, shell=shell, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return result.stdout.decode().strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error running command: {command}")
-        print(f"Error message: {e.stderr.decode().strip()}")
-        sys.exit(1)
+        with open(os.path.join(SYS_BLOCK, kname, attribute), "r") as file:
+            return int(file.read().strip())
+    except (OSError, ValueError):
+        return None
 
 
-def list_partitions():
-    """Lists all partitions and allows the user to select one."""
-    print("\nListing all available partitions:")
-    lsblk_output = run_command("lsblk -o NAME,SIZE,FSTYPE,MOUNTPOINT")
-    print(lsblk_output)
-    print("\nNote: Partition names usually look like 'sda1', 'sda2', etc.")
+def partition_number(partition, disk):
+    """
+    Partition number of e.g. sda12 or nvme0n1p3, from sysfs or else from the name after the disk's.
+    """
+    number = read_sysfs_int(partition["kname"], "partition")
+    if number is not None:
+        return number
+    suffix = partition["kname"][len(disk["kname"]):].lstrip("p")
+    if not suffix.isdigit():
+        raise ResizeError(f"cannot tell the partition number of {partition['path']}")
+    return int(suffix)
 
-    while True:
-        partition = input("Enter the partition name you want to resize (e.g., sda3): ").strip()
-        if run_command(f"lsblk | grep -w {partition}") != "":
-            return f"/dev/{partition}"
-        else:
-            print(f"Invalid partition name: {partition}. Please try again.")
 
+def volume_layers(node):
+    """
+    Layers above a partition or whole disk: PV -> LVs -> filesystems, or just a filesystem.
+    """
+    fstype = node.get("fstype")
+    if fstype == "LVM2_member":
+        layers = [{"layer": "pv", "path": node["path"]}]
+        volumes = [child for child in node.get("children", []) if child["type"] == "lvm"]
+        for volume in volumes:
+            layers.append({"layer": "lv", "path": volume["path"], "shared": len(volumes) > 1})
+            layers.extend(volume_layers(volume))
+        return layers
+    if fstype in FILESYSTEMS:
+        return [{"layer": "fs", "path": node["path"], "fstype": fstype, "mountpoint": node.get("mountpoint")}]
+    return []
 
-def main():
-    print("Starting the disk resizing process...\n")
 
-    # Step 1: List partitions and let the user choose one
-    full_partition_path = list_partitions()
-    print(f"\nYou have selected the partition: {full_partition_path}")
+def disk_chain(disk):
+    """
+    Growable layers of one disk, bottom up.  Only the partition that ends last can grow.
+    """
+    partitions = [child for child in disk.get("children", []) if child["type"] == "part"]
+    if not partitions:
+        return volume_layers(disk)
+    # lsblk lists partitions in table order; the start sector decides when they are not laid out in order
+    last = max(enumerate(partitions), key=lambda item: (read_sysfs_int(item[1]["kname"], "start") or 0, item[0]))[1]
+    start, sectors = read_sysfs_int(last["kname"], "start"), read_sysfs_int(last["kname"], "size")
+    layer = {"layer": "partition", "path": last["path"], "disk": disk["path"],
+             "number": partition_number(last, disk),
+             "end": (start + sectors) * SECTOR if start is not None and sectors is not None else None}
+    return [layer] + volume_layers(last)
 
-    # Extract device name (e.g., sda) from the full path
-    device = full_partition_path.replace("/dev/", "").rstrip("0123456789")
 
-    print(f"\nRescanning the device: /sys/block/{device}/device/rescan")
-    # Step 2: Rescan the device
-    run_command(f"echo 1 | sudo tee /sys/block/{device}/device/rescan")
+def find_candidates(devices, wanted=None):
+    """
+    {kname: {"disk", "chain"}} for disks that carry something growable (restricted to wanted paths/names).
+    """
+    candidates = {}
+    for disk in devices:
+        if disk["type"] not in DISK_TYPES:
+            continue
+        if wanted and not {disk["name"], disk["kname"], disk["path"]} & set(wanted):
+            continue
+        chain = disk_chain(disk)
+        if chain:
+            candidates[disk["kname"]] = {"disk": disk, "chain": chain}
+    return candidates
 
-    print("\nResizing the partition with parted...")
-    # Step 3: Resize the partition using parted
-    run_command(f"sudo parted /dev/{device} resizepart {full_partition_path[-1]} 100%")
 
-    print("\nResizing the physical volume...")
-    # Step 4: Resize the physical volume
-    run_command(f"sudo pvresize {full_partition_path}")
+def rescan(disk):
+    """
+    Make the kernel re-read the disk's capacity and return the new size in bytes.
+    """
+    rescan_path = f"/sys/block/{disk['kname']}/device/rescan"
+    if disk["type"] == "loop":
+        run_command(["losetup", "-c", disk["path"]])
+    elif os.path.exists(rescan_path):
+        # NVMe and virtio disks pick up a new capacity on their own
+        run_command(["tee", rescan_path], input_text="1\n")
+    sectors = read_sysfs_int(disk["kname"], "size")
+    return sectors * SECTOR if sectors is not None else disk["size"]
 
-    # Step 5: Check if the filesystem is LVM or XFS
-    while True:
-        fs_type_choice = input("\nIs the system using LVM or XFS? (type 'lvm' or 'xfs'): ").strip().lower()
-        if fs_type_choice in ["lvm", "xfs"]:
-            break
+
+def needs_growth(candidate, new_size):
+    old_size = candidate["disk"]["size"]
+    first = candidate["chain"][0]
+    if new_size > old_size:
+        return True
+    # Disk grew earlier but the partition did not follow (interrupted run)
+    return first["layer"] == "partition" and first["end"] is not None and new_size - first["end"] >= MIN_GROWTH
+
+
+def read_volume_groups():
+    """
+    {LV device path: free bytes in its VG}, from one lvs call.
+    """
+    report = json.loads(run_command(["lvs", "--reportformat", "json", "--units", "b", "--nosuffix",
+                                     "-o", "lv_path,lv_dm_path,vg_free"]))
+    free = {}
+    for volume in report["report"][0]["lv"]:
+        for key in ("lv_path", "lv_dm_path"):
+            if volume.get(key):
+                free[volume[key]] = int(float(volume["vg_free"]))
+    return free
+
+
+def grow_commands(layer):
+    """
+    Commands that grow one layer to fill the layer below it.
+    """
+    if layer["layer"] == "partition":
+        if shutil.which("growpart"):
+            # growpart exits 1 with NOCHANGE when the partition already fills the disk
+            return [(["growpart", layer["disk"], str(layer["number"])], (0, 1))]
+        return [(["parted", "-s", "-f", layer["disk"], "resizepart", str(layer["number"]), "100%"], (0,)),
+                (["partx", "-u", layer["disk"]], (0,))]
+    if layer["layer"] == "pv":
+        return [(["pvresize", layer["path"]], (0,))]
+    if layer["layer"] == "lv":
+        return [(["lvextend", "-l", "+100%FREE", layer["path"]], (0,))]
+    if layer["fstype"] in ("ext2", "ext3", "ext4"):
+        return [(["resize2fs", layer["path"]], (0,))]
+    if not layer["mountpoint"]:
+        raise ResizeError(f"{layer['fstype']} on {layer['path']} must be mounted to grow")
+    if layer["fstype"] == "xfs":
+        return [(["xfs_growfs", layer["mountpoint"]], (0,))]
+    return [(["btrfs", "filesystem", "resize", "max", layer["mountpoint"]], (0,))]
+
+
+def grow_chain(chain, dry_run=False):
+    """
+    Grow the layers bottom up.  Returns (grown paths, skipped notes); stops at the first failing layer.
+    """
+    grown, skipped = [], []
+    vg_free = None
+    for layer in chain:
+        if layer["layer"] == "lv":
+            if layer["shared"]:
+                skipped.append(f"{layer['path']}: volume group has several LVs on this PV, extend by hand")
+                break
+            if not dry_run:
+                vg_free = read_volume_groups() if vg_free is None else vg_free
+                if vg_free.get(layer["path"], 0) == 0:
+                    skipped.append(f"{layer['path']}: no free extents in its volume group")
+                    continue
+        for args, ok_codes in grow_commands(layer):
+            print(f"{'Would run' if dry_run else 'Running'}: {' '.join(args)}")
+            if not dry_run:
+                run_command(args, ok_codes)
+        grown.append(layer["path"])
+    return grown, skipped
+
+
+def plan_growth(wanted=None, dry_run=False):
+    """
+    Rescan the candidate disks.  Returns ([(disk, new size, chain)] for disks that got bigger, skipped notes).
+    """
+    plans, skipped = [], []
+    for kname, candidate in sorted(find_candidates(read_block_devices(), wanted).items()):
+        disk = candidate["disk"]
+        if dry_run:
+            sectors = read_sysfs_int(kname, "size")
+            new_size = sectors * SECTOR if sectors is not None else disk["size"]
         else:
-            print("Invalid input. Please type 'lvm' or 'xfs'.")
-
-    if fs_type_choice == "lvm":
-        lv_path = input("Enter the logical volume path (e.g., /dev/mapper/ubuntu--vg-ubuntu--lv): ").strip()
-        print("\nExtending the Logical Volume...")
-        run_command(f"sudo lvextend -l +100%FREE {lv_path}")
-
-        # Step 6: Detect the filesystem type
-        fs_type = run_command(f"lsblk -no FSTYPE {full_partition_path}").strip()
-        if fs_type == "ext4":
-            print("\nResizing the ext4 filesystem...")
-            run_command(f"sudo resize2fs {lv_path}")
-        elif fs_type == "xfs":
-            mount_point = input("Enter the mount point for the XFS filesystem (e.g., /mnt): ").strip()
-            print("\nGrowing the XFS filesystem...")
-            run_command(f"sudo xfs_growfs {mount_point}")
-            print("\nGetting XFS information...")
-            run_command(f"sudo xfs_info {full_partition_path}")
+            new_size = rescan(disk)
+        if needs_growth(candidate, new_size):
+            plans.append((disk, new_size, candidate["chain"]))
         else:
-            print("Unsupported filesystem type! Exiting.")
-            sys.exit(1)
-    elif fs_type_choice == "xfs":
-        mount_point = input("Enter the mount point for the XFS filesystem (e.g., /mnt): ").strip()
-        print("\nGrowing the XFS filesystem...")
-        run_command(f"sudo xfs_growfs {mount_point}")
-        print("\nGetting XFS information...")
-        run_command(f"sudo xfs_info {full_partition_path}")
+            skipped.append(f"{disk['path']}: size unchanged")
+    return plans, skipped
+
+
+def apply_growth(plans, dry_run=False):
+    """
+    Grow every planned chain; a failure on one disk does not stop the others.
+    """
+    summary = {"host": socket.gethostname(), "grown": [], "skipped": [], "errors": []}
+    for disk, new_size, chain in plans:
+        print(f"{disk['path']}: {disk['size']} -> {new_size} bytes")
+        try:
+            grown, skipped = grow_chain(chain, dry_run)
+            summary["grown"].extend(grown)
+            summary["skipped"].extend(skipped)
+        except ResizeError as e:
+            print(f"Error growing {disk['path']}: {e}")
+            summary["errors"].append(f"{disk['path']}: {e}")
+    return summary
 
-    # Step 7: Display the final disk state
-    print("\nFinal disk state:")
-    run_command("lsblk -o NAME,SIZE,LOG-SEC,PHY-SEC,OPT-IO,RA,TYPE,FSTYPE,MOUNTPOINTS,PATH,RQ-SIZE")
 
-    print("\nProcess completed successfully.")
-    sys.exit(0)
+def choose_disk(devices):
+    """
+    Show the disks and let the user pick one (by disk or partition name).
+    """
+    print("\nListing all available disks:")
+    print(run_command(["lsblk", "-o", "NAME,SIZE,FSTYPE,MOUNTPOINT"]))
+    names = {}
+    for disk in devices:
+        if disk["type"] in DISK_TYPES:
+            for node in [disk] + disk.get("children", []):
+                names[node["name"]] = names[node["path"]] = disk["path"]
+    while True:
+        choice = input("Enter the disk or partition to grow (e.g., sda, nvme0n1p3): ").strip()
+        if choice in names or f"/dev/{choice}" in names:
+            return names.get(choice) or names[f"/dev/{choice}"]
+        print(f"Invalid name: {choice}. Please try again.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grow partitions, LVM and filesystems after a disk was extended.")
+    parser.add_argument("--auto", action="store_true", help="Grow every disk that got bigger without prompting")
+    parser.add_argument("--disk", action="append", help="Limit to this disk (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the commands without running them")
+    parser.add_argument("--json", action="store_true", help="Print a JSON summary (for fleet runs)")
+    args = parser.parse_args()
+
+    try:
+        wanted = args.disk
+        interactive = not args.auto and not wanted
+        if interactive:
+            wanted = [choose_disk(read_block_devices())]
+            print(f"\nYou have selected the disk: {wanted[0]}")
+        plans, skipped = plan_growth(wanted, args.dry_run)
+        if interactive and plans and not args.dry_run:
+            # Show the plan before changing anything
+            apply_growth(plans, dry_run=True)
+            if input("\nApply? (yes/no): ").strip().lower() != "yes":
+                sys.exit(0)
+        summary = apply_growth(plans, args.dry_run)
+        summary["skipped"] = skipped + summary["skipped"]
+    except ResizeError as e:
+        if args.json:
+            # Configure.py reads the last line of the output as the summary
+            print(json.dumps({"host": socket.gethostname(), "grown": [], "skipped": [], "errors": [str(e)]}))
+        else:
+            print(f"Error: {e}")
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        for note in summary["skipped"]:
+            print(f"Skipped {note}")
+        if not args.dry_run:
+            print("\nFinal disk state:")
+            print(run_command(["lsblk", "-o", "NAME,SIZE,LOG-SEC,PHY-SEC,OPT-IO,RA,TYPE,FSTYPE,MOUNTPOINTS,PATH"]))
+    sys.exit(1 if summary["errors"] else 0)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
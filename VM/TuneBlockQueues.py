@@ -0,0 +1,270 @@
+#!/bin/python3
+"""
+Block-layer queue tuning for Linux guests and iSCSI/iSER initiators.
+
+Every whole disk under /sys/block is classified and gets its class profile written to queue/ in one pass,
+each value read back after the write:
+
+    ctms-san    LUNs exported by our SCST targets (vendor CTMS-SAN), paths and their multipath maps
+    nvme        NVMe namespaces
+    pvscsi      disks behind VMware's paravirtual SCSI controller
+    rotational  anything else that reports queue/rotational = 1
+
+max_sectors_kb for SAN LUNs matches the 256 KB /ISCSI/MaxIoSizeKB set on ESXi.  Values are capped by what
+the device allows: max_sectors_kb by max_hw_sectors_kb, and without an I/O scheduler nr_requests by the depth of
+the device's tag set, which is what nr_requests reads while the scheduler is none (the kernel rejects more).
+--udev writes matching udev rules so hotplugged disks and reboots get the same settings.  Per-class overrides
+come from Options.json under "block": {"overrides": {...}}.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+try:
+    from OptionsFile import find_options_file
+except ImportError:  # Run from the source tree: the module is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from OptionsFile import find_options_file
+
+SYS_BLOCK = "/sys/block"
+UDEV_RULES_FILE = "/etc/udev/rules.d/60-ctms-block-queue.rules"
+SAN_VENDORS = ("CTMS-SAN",)
+
+# Written in this order: the scheduler decides which nr_requests values are accepted
+ATTRIBUTE_ORDER = ("scheduler", "nr_requests", "max_sectors_kb", "read_ahead_kb", "rq_affinity", "nomerges")
+
+PROFILES = {
+    "ctms-san": {"scheduler": "none", "nr_requests": 256, "max_sectors_kb": 256, "read_ahead_kb": 256,
+                 "rq_affinity": 2, "nomerges": 0},
+    "nvme": {"scheduler": "none", "nr_requests": 1023, "read_ahead_kb": 128, "rq_affinity": 2, "nomerges": 2},
+    "pvscsi": {"scheduler": "none", "nr_requests": 254, "max_sectors_kb": 512, "read_ahead_kb": 128,
+               "rq_affinity": 2, "nomerges": 0},
+    "rotational": {"scheduler": "mq-deadline", "nr_requests": 256, "read_ahead_kb": 1024, "rq_affinity": 1,
+                   "nomerges": 0},
+}
+
+# udev match keys per class, first match wins
+UDEV_MATCHES = {
+    "ctms-san": ['KERNEL=="sd*"', 'ATTRS{vendor}=="CTMS-SAN*"'],
+    "nvme": ['KERNEL=="nvme*"'],
+    "pvscsi": ['KERNEL=="sd*"', 'DRIVERS=="vmw_pvscsi"'],
+    "rotational": ['ATTR{queue/rotational}=="1"'],
+}
+
+
+def read_attribute(path):
+    try:
+        with open(path, "r") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def current_value(name, text):
+    """
+    Normalise a queue attribute: the scheduler file lists all choices with the active one in brackets.
+    """
+    if text is None:
+        return None
+    if name == "scheduler":
+        for choice in text.split():
+            if choice.startswith("["):
+                return choice.strip("[]")
+        return text
+    return int(text) if text.lstrip("-").isdigit() else text
+
+
+def device_drivers(device, root=SYS_BLOCK):
+    """
+    Driver names bound anywhere on the device's path up the sysfs tree (scsi host, PCI function...).
+    """
+    drivers = set()
+    path = os.path.realpath(os.path.join(root, device, "device"))
+    while path not in ("/", "") and os.path.isdir(path):
+        link = os.path.join(path, "driver")
+        if os.path.islink(link):
+            drivers.add(os.path.basename(os.readlink(link)))
+        path = os.path.dirname(path)
+    return drivers
+
+
+def classify(device, root=SYS_BLOCK):
+    """
+    Profile class of one /sys/block entry, or None to leave it alone.
+    """
+    base = os.path.join(root, device)
+    if device.startswith("dm-"):
+        # Multipath maps take the class of their paths
+        if not (read_attribute(os.path.join(base, "dm", "uuid")) or "").startswith("mpath-"):
+            return None
+        slaves_dir = os.path.join(base, "slaves")
+        slaves = sorted(os.listdir(slaves_dir)) if os.path.isdir(slaves_dir) else []
+        classes = {classify(slave, root) for slave in slaves}
+        return classes.pop() if len(classes) == 1 else None
+    vendor = read_attribute(os.path.join(base, "device", "vendor"))
+    if vendor and vendor.startswith(SAN_VENDORS):
+        return "ctms-san"
+    if device.startswith("nvme"):
+        return "nvme"
+    if "vmw_pvscsi" in device_drivers(device, root):
+        return "pvscsi"
+    if read_attribute(os.path.join(base, "queue", "rotational")) == "1":
+        return "rotational"
+    return None
+
+
+def resolve_profile(device_class, overrides=None):
+    profile = dict(PROFILES[device_class])
+    profile.update((overrides or {}).get(device_class, {}))
+    return profile
+
+
+def plan_device(device, profile, root=SYS_BLOCK):
+    """
+    {attribute: (current, wanted)} for the attributes that differ and that this device has and allows writing.
+    """
+    queue = os.path.join(root, device, "queue")
+    wanted = dict(profile)
+    limit = current_value("max_hw_sectors_kb", read_attribute(os.path.join(queue, "max_hw_sectors_kb")))
+    if "max_sectors_kb" in wanted and isinstance(limit, int):
+        wanted["max_sectors_kb"] = min(wanted["max_sectors_kb"], limit)
+    schedulers = read_attribute(os.path.join(queue, "scheduler"))
+    if "scheduler" in wanted:
+        choices = (schedulers or "").replace("[", "").replace("]", "").split()
+        if wanted["scheduler"] not in choices:
+            # Request-based dm and some drivers offer only "none"; do not fight them
+            del wanted["scheduler"]
+    if "nr_requests" in wanted and current_value("scheduler", schedulers) == wanted.get("scheduler", "none") == "none":
+        depth = current_value("nr_requests", read_attribute(os.path.join(queue, "nr_requests")))
+        if isinstance(depth, int):
+            wanted["nr_requests"] = min(wanted["nr_requests"], depth)
+    changes = {}
+    for name in ATTRIBUTE_ORDER:
+        if name not in wanted:
+            continue
+        path = os.path.join(queue, name)
+        try:
+            if not os.stat(path).st_mode & 0o222:
+                continue
+        except OSError:
+            continue
+        current = current_value(name, read_attribute(path))
+        if current != wanted[name]:
+            changes[name] = (current, wanted[name])
+    return changes
+
+
+def apply_changes(device, changes, root=SYS_BLOCK):
+    """
+    Write the changes in ATTRIBUTE_ORDER and read each one back.  Returns a list of failure messages.
+    """
+    failures = []
+    queue = os.path.join(root, device, "queue")
+    for name in ATTRIBUTE_ORDER:
+        if name not in changes:
+            continue
+        wanted = changes[name][1]
+        path = os.path.join(queue, name)
+        if name == "nr_requests" and \
+                current_value("scheduler", read_attribute(os.path.join(queue, "scheduler"))) == "none":
+            # Switching to none just reset nr_requests to the tag set depth, the most it accepts now
+            depth = current_value(name, read_attribute(path))
+            if isinstance(depth, int) and depth <= wanted:
+                continue
+        try:
+            with open(path, "w") as file:
+                file.write(f"{wanted}\n")
+        except OSError as e:
+            failures.append(f"{device} {name}={wanted}: {e.strerror or e}")
+            continue
+        readback = current_value(name, read_attribute(path))
+        if readback != wanted:
+            failures.append(f"{device} {name}: reads back {readback} after writing {wanted}")
+    return failures
+
+
+def list_devices(root=SYS_BLOCK):
+    # Hidden entries are per-path NVMe namespaces below a native multipath head
+    return sorted(entry for entry in os.listdir(root) if not entry.startswith(("loop", "ram", "zram", "sr"))
+                  and read_attribute(os.path.join(root, entry, "hidden")) != "1")
+
+
+def render_udev_rules(overrides=None):
+    """
+    udev rules applying the same profiles on add/change events; the first matching class wins.
+    """
+    lines = ["# Block queue profiles (written by VM/TuneBlockQueues.py --udev)",
+             'ACTION!="add|change", GOTO="ctms_block_queue_end"',
+             'SUBSYSTEM!="block", GOTO="ctms_block_queue_end"',
+             'ENV{DEVTYPE}!="disk", GOTO="ctms_block_queue_end"']
+    for device_class, matches in UDEV_MATCHES.items():
+        profile = resolve_profile(device_class, overrides)
+        # Without a scheduler the tag set depth bounds nr_requests; a larger value only makes udev log EINVAL
+        assignments = [f'ATTR{{queue/{name}}}="{profile[name]}"' for name in ATTRIBUTE_ORDER if name in profile
+                       and not (name == "nr_requests" and profile.get("scheduler") == "none")]
+        lines.append(f"# {device_class}")
+        lines.append(", ".join(matches + assignments + ['GOTO="ctms_block_queue_end"']))
+    lines.append('ENV{DM_UUID}=="mpath-*", ATTR{queue/read_ahead_kb}="%s"'
+                 % resolve_profile("ctms-san", overrides)["read_ahead_kb"])
+    lines.append('LABEL="ctms_block_queue_end"')
+    return "\n".join(lines) + "\n"
+
+
+def load_block_options(options_path):
+    if not options_path:
+        return {}
+    with open(options_path, "r") as file:
+        return json.load(file).get("block", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply per-class block queue profiles to disks.")
+    parser.add_argument("devices", nargs="*", help="Devices to tune, e.g. sdb nvme0n1 (default: all disks)")
+    parser.add_argument("--options", default=find_options_file(), help="Path to Options.json")
+    parser.add_argument("--dry-run", action="store_true", help="Show the changes without writing them")
+    parser.add_argument("--udev", nargs="?", const=UDEV_RULES_FILE, metavar="PATH",
+                        help=f"Also write udev rules (default {UDEV_RULES_FILE})")
+    parser.add_argument("--sys-block", default=SYS_BLOCK, help="sysfs block directory")
+    args = parser.parse_args()
+
+    overrides = load_block_options(args.options).get("overrides", {})
+    unknown = sorted(set(overrides) - set(PROFILES))
+    if unknown:
+        print(f"Unknown device class(es) in block.overrides: {', '.join(unknown)}")
+        sys.exit(1)
+
+    failures = []
+    for device in args.devices or list_devices(args.sys_block):
+        device = os.path.basename(device)
+        device_class = classify(device, args.sys_block)
+        if device_class is None:
+            if args.devices:
+                print(f"{device}: no matching device class, left unchanged")
+            continue
+        changes = plan_device(device, resolve_profile(device_class, overrides), args.sys_block)
+        if not changes:
+            print(f"{device} ({device_class}): already tuned")
+            continue
+        summary = ", ".join(f"{name} {current} -> {wanted}" for name, (current, wanted) in changes.items())
+        print(f"{device} ({device_class}): {summary}")
+        if not args.dry_run:
+            failures.extend(apply_changes(device, changes, args.sys_block))
+
+    for failure in failures:
+        print(f"Failed: {failure}")
+
+    if args.udev:
+        rules = render_udev_rules(overrides)
+        if args.dry_run:
+            print(rules, end="")
+        else:
+            with open(args.udev, "w") as file:
+                file.write(rules)
+            print(f"Wrote {args.udev} (reload with: udevadm control --reload && udevadm trigger -s block)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
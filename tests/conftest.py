@@ -0,0 +1,91 @@
+"""
+The scripts import their siblings by flat name (as in /tmp/ez_scripts), so every script directory goes on sys.path.
+"""
+
+import os
+import resource
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+SCRIPT_DIRS = ["", "MLXDriverConfig", "ESXi", "TrueNas", "TrueNas/API", "VM"]
+
+for directory in reversed(SCRIPT_DIRS):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+class FakeScstTree:
+    """
+    A /sys/kernel/scst_tgt lookalike: one iSCSI target whose session sees two LUNs through an initiator group.
+    Attribute files hold "value\\n" like SCST's; set() rewrites one in place.
+    """
+
+    TARGET = "iqn.2024-01.lab:t1"
+    SESSION = "iqn.1998-01.com.vmware:esx1"
+
+    def __init__(self, root):
+        self.root = str(root)
+        target = self.target = os.path.join(self.root, "targets", "iscsi", self.TARGET)
+        self.session = os.path.join(target, "sessions", self.SESSION)
+        for device, limit in (("zvol0", 64), ("zvol1", 32)):
+            self.set(os.path.join("devices", device, "max_tgt_dev_commands"), limit)
+        group_luns = os.path.join(target, "ini_groups", "esx", "luns")
+        for lun, device in (("0", "zvol0"), ("1", "zvol1")):
+            os.makedirs(os.path.join(group_luns, lun))
+            os.symlink(os.path.join(self.root, "devices", device), os.path.join(group_luns, lun, "device"))
+            self.set(os.path.join(group_luns, lun, "read_only"), 0)
+        os.makedirs(self.session)
+        os.symlink(group_luns, os.path.join(self.session, "luns"))
+        self.set(os.path.join(target, "enabled"), 1)
+        self.write_session(read_cmd=100, read_kb=400, write_cmd=50, write_kb=3200, commands=4, active=2)
+        for lun, active in (("0", 1), ("1", 1)):
+            self.set(os.path.join(self.session, f"lun{lun}", "active_commands"), active)
+
+    def set(self, relative, value):
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(f"{value}\n")
+
+    def write_session(self, read_cmd, read_kb, write_cmd, write_kb, commands, active, session=None):
+        session_dir = os.path.join(self.target, "sessions", session) if session else self.session
+        for name, value in (("read_cmd_count", read_cmd), ("read_io_count_kb", read_kb),
+                            ("write_cmd_count", write_cmd), ("write_io_count_kb", write_kb),
+                            ("commands", commands), ("active_commands", active)):
+            self.set(os.path.join(session_dir, name), value)
+
+    def add_sessions(self, count):
+        """
+        Add count sessions without LUN directories next to the first one; returns their names.
+        """
+        names = [f"iqn.1998-01.com.vmware:host{n}" for n in range(count)]
+        for name in names:
+            self.write_session(read_cmd=100, read_kb=400, write_cmd=50, write_kb=3200, commands=4, active=2,
+                               session=name)
+        return names
+
+    def set_lun(self, lun, name, value):
+        self.set(os.path.join(self.session, f"lun{lun}", name), value)
+
+
+@pytest.fixture
+def scst_tree(tmp_path):
+    return FakeScstTree(tmp_path)
+
+
+@pytest.fixture
+def nofile_limit():
+    """
+    nofile_limit(n) lowers the soft RLIMIT_NOFILE to n descriptors more than the process has open.
+    The limit is restored after the test.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    def lower(extra):
+        resource.setrlimit(resource.RLIMIT_NOFILE, (len(os.listdir("/proc/self/fd")) + extra, hard))
+
+    yield lower
+    resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
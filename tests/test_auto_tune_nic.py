@@ -0,0 +1,59 @@
+from AutoTuneNic import load_autotune_config, recommend
+
+CONFIG = load_autotune_config({})
+
+
+def nic(rx=1024, rx_max=8192, rx_usecs=3, adaptive=0):
+    coalesce = {"rx_usecs": rx_usecs, "rx_max_frames": 32, "tx_usecs": 3, "tx_max_frames": 32,
+                "use_adaptive_rx": adaptive}
+    return {"rings": {"rx": rx, "rx_max": rx_max, "tx": 1024, "tx_max": 8192}, "coalesce": coalesce}
+
+
+def test_buffer_drops_grow_the_ring_and_shorten_coalescing():
+    history = {}
+    changes, evidence = recommend("eth0", nic(rx_usecs=10), {"rx_out_of_buffer": 40.0, "rx_packets": 1e6}, CONFIG,
+                                  history)
+    assert changes == {"rings": {"rx": 2048}, "coalesce": {"rx_usecs": 3}}
+    assert evidence["buffer_drops_per_s"] == 40.0
+    assert history["quiet"] == 0
+
+
+def test_ring_growth_stops_at_the_hardware_maximum():
+    changes, _ = recommend("eth0", nic(rx=4096, rx_max=6144), {"rx_discards_phy": 5.0}, CONFIG, {})
+    assert changes["rings"] == {"rx": 6144}
+    changes, _ = recommend("eth0", nic(rx=6144, rx_max=6144), {"rx_discards_phy": 5.0}, CONFIG, {})
+    assert "rings" not in changes
+
+
+def test_pfc_pause_on_the_lossless_priority_is_not_pressure():
+    history = {}
+    rates = {"rx_prio6_pause": 20000.0, "tx_prio6_pause": 15000.0, "rx_pause_ctrl_phy": 300.0,
+             "tx_pause_ctrl_phy": 200.0, "rx_packets": 3e5}
+    for _ in range(3):
+        changes, evidence = recommend("eth0", nic(), rates, CONFIG, history)
+        assert "rings" not in changes
+    assert history["quiet"] == 3
+    assert evidence["pressure_per_s"] == 0
+    # Global pause is counted once, next to the per-priority counters
+    assert evidence["pause_per_s"] == 35500.0
+
+
+def test_high_packet_rate_coalesces_more_only_after_quiet_intervals():
+    history = {}
+    rates = {"rx_packets": 4e5, "tx_packets": 2e5}
+    for _ in range(CONFIG["quiet_intervals"] - 1):
+        changes, _ = recommend("eth0", nic(), rates, CONFIG, history)
+        assert changes == {}
+    changes, evidence = recommend("eth0", nic(), rates, CONFIG, history)
+    assert changes == {"coalesce": {"rx_usecs": 10, "rx_max_frames": 88, "tx_usecs": 6, "tx_max_frames": 56}}
+    assert evidence["reason"] == "high packet rate without drops: coalescing more"
+
+
+def test_low_packet_rate_moves_back_toward_latency():
+    changes, _ = recommend("eth0", nic(rx_usecs=10), {"rx_packets": 1000.0}, CONFIG, {})
+    assert changes == {"coalesce": {"rx_usecs": 3}}
+
+
+def test_adaptive_moderation_is_left_alone():
+    changes, _ = recommend("eth0", nic(rx_usecs=10, adaptive=1), {"rx_packets": 1000.0}, CONFIG, {})
+    assert changes == {}
@@ -0,0 +1,84 @@
+import pytest
+
+import Build
+import Configure
+from Executor import FakeExecutor
+
+
+class UploadRecorder(FakeExecutor):
+    """
+    A FakeExecutor that also records upload() calls, as SSHExecutor's SFTP copies.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.uploads = []
+
+    def upload(self, files, on_file=None):
+        self.uploads.append([remote_path for local_path, remote_path in files])
+
+
+def fake_build(monkeypatch, tmp_path):
+    bundle = tmp_path / "AutoSan-1.0-abc123.pyz"
+    bundle.write_bytes(b"")
+    monkeypatch.setattr(Build, "build", lambda root: str(bundle))
+    return f"{Configure.REMOTE_DIR}/{bundle.name}"
+
+
+def test_new_bundle_is_uploaded_and_compiled(monkeypatch, tmp_path):
+    remote_bundle = fake_build(monkeypatch, tmp_path)
+    executor = UploadRecorder().add(["test", "-f"], returncode=1).add(["python3", remote_bundle, "--compile"])
+
+    assert Configure.upload_bundle(executor) == remote_bundle
+    assert executor.uploads == [[remote_bundle, f"{Configure.REMOTE_DIR}/Options.json"]]
+    assert [args for args, _ in executor.calls][-1] == ["python3", remote_bundle, "--compile"]
+
+
+def test_existing_bundle_still_gets_current_options(monkeypatch, tmp_path):
+    remote_bundle = fake_build(monkeypatch, tmp_path)
+    executor = UploadRecorder().add(["test", "-f"])
+
+    assert Configure.upload_bundle(executor) == remote_bundle
+    assert executor.uploads == [[f"{Configure.REMOTE_DIR}/Options.json"]]
+    assert [args for args, _ in executor.calls] == [["test", "-f", remote_bundle]]
+
+
+def test_failed_upload_raises_instead_of_exiting(monkeypatch, tmp_path):
+    fake_build(monkeypatch, tmp_path)
+
+    class BrokenUpload(UploadRecorder):
+        def upload(self, files, on_file=None):
+            raise OSError("No space left on device")
+
+    executor = BrokenUpload().add(["test", "-f"], returncode=1)
+    with pytest.raises(Configure.UploadError, match="No space left on device"):
+        Configure.upload_bundle(executor)
+
+
+def test_grow_vm_disks_reports_failures_per_host(monkeypatch, tmp_path, capsys):
+    fake_build(monkeypatch, tmp_path)
+    monkeypatch.setattr(Configure, "paramiko_available", lambda: True)
+
+    def open_session(host, username, password):
+        if host == "vm2":
+            raise OSError("Connection refused")
+        return UploadRecorder().add(["test", "-f"]).add(
+            ["python3"], stdout='{"grown": ["/dev/sda"], "errors": []}\n')
+
+    monkeypatch.setattr(Configure, "open_ssh_session", open_session)
+    Configure.grow_vm_disks(["vm1", "vm2"], "root", "")
+    output = capsys.readouterr().out
+    assert "vm1: grew /dev/sda" in output
+    assert "vm2: FAILED Connection refused" in output
+    assert "finished on 1 of 2 hosts" in output
+
+
+def test_grow_vm_disks_does_not_swallow_ctrl_c(monkeypatch):
+    monkeypatch.setattr(Configure, "paramiko_available", lambda: True)
+
+    def interrupted(host, username, password):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(Configure, "open_ssh_session", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        Configure.grow_vm_disks(["vm1"], "root", "")
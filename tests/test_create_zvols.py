@@ -0,0 +1,56 @@
+import json
+import sys
+
+import pytest
+
+import CreateZvols
+from Executor import FakeExecutor
+
+ZVOLS = [
+    {"pool": "dpool", "name": "lun4k", "lun": 0, "size": "1T", "volblocksize": "4K"},
+    {"pool": "dpool", "name": "lun128k", "volblocksize": "64K", "export": False},
+    {"pool": "dpool", "name": "scratch", "volblocksize": "16K"},
+]
+GET = ["zfs", "get", "-Hp", "-o", "name,property,value"]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeExecutor()
+    fake.add(["zfs", "list", "-H", "-o", "name", "-t", "volume", "-r", "dpool"], stdout="dpool/lun128k\n")
+    monkeypatch.setattr(CreateZvols, "executor", fake)
+    return fake
+
+
+def test_only_zvols_that_will_be_created_are_asked_for_a_size(fake, tmp_path, monkeypatch, capsys):
+    options = tmp_path / "Options.json"
+    options.write_text(json.dumps({"zvols": ZVOLS}))
+    asked = []
+    monkeypatch.setattr("builtins.input", lambda prompt: asked.append(prompt) or "200G")
+    monkeypatch.setattr(sys, "argv", ["CreateZvols.py", "--options", str(options), "--dry-run"])
+    CreateZvols.main()
+
+    assert asked == ["Enter the size for the ZVOL 'scratch' (e.g., 1G, 500M): "]
+    out = capsys.readouterr().out
+    assert "Would run: zfs create -V 1T -s -b 4K dpool/lun4k" in out
+    assert "Would run: zfs create -V 200G -s -b 16K dpool/scratch" in out
+    assert "lun128k" not in out
+    assert [args[:3] for args, _ in fake.calls].count(["zfs", "list", "-H"]) == 1
+
+
+def test_an_existing_zvol_without_a_size_is_not_checked_against_one(fake):
+    zvols = [dict(zvol) for zvol in ZVOLS[:2]]
+    fake.add(GET + [",".join(CreateZvols.ZVOL_PROPERTIES)], stdout="")
+    fake.add(GET + [",".join(("volsize", "volblocksize") + CreateZvols.ZVOL_PROPERTIES)], stdout="".join(
+        f"{dataset}\t{prop}\t{value}\n" for dataset, prop, value in (
+            ("dpool/lun4k", "volsize", 1 << 40), ("dpool/lun4k", "volblocksize", 4096),
+            ("dpool/lun128k", "volsize", 5 << 30), ("dpool/lun128k", "volblocksize", 65536))))
+    fake.add(["zfs", "set"])
+    fake.add(["zfs", "create"])
+
+    assert CreateZvols.provision(zvols, {"compression": "lz4"}, existing={"dpool/lun128k"})
+    creates = [args for args, _ in fake.calls if args[:2] == ["zfs", "create"]]
+    assert creates == [["zfs", "create", "-V", "1T", "-s", "-b", "4K", "dpool/lun4k"]]
+    assert CreateZvols.verify_zvols([dict(ZVOLS[1], size="1G")], {
+        "dpool/lun128k": {"volsize": str(5 << 30), "volblocksize": "65536"}}) == [
+        "dpool/lun128k: volsize is 5368709120, wanted 1073741824"]
@@ -0,0 +1,43 @@
+import os
+
+import EnableISER
+from EnableISER import compare_deb_versions, find_cached_debs, install_packages
+
+
+def test_versions_compare_as_dpkg_does():
+    assert compare_deb_versions("1.10-1", "1.9-1") == 1
+    assert compare_deb_versions("1.0~rc1-1", "1.0-1") == -1
+    assert compare_deb_versions("1:0.9-1", "2.0-1") == 1
+    assert compare_deb_versions("50.0-1", "50.0-1build1") == -1
+    assert compare_deb_versions("1.0-1", "1.0-1") == 0
+
+
+def test_cache_picks_the_newest_version_of_each_package(tmp_path):
+    for name in ("rdma-core_9.0-1_amd64.deb", "rdma-core_10.0-1_amd64.deb", "rdma-core_10.0~rc2-1_amd64.deb",
+                 "mstflint_4.26.0-1_amd64.deb", "mstflint_1%3a4.20.0-1_amd64.deb", "byobu_5.133-1_all.deb"):
+        (tmp_path / name).touch()
+    assert find_cached_debs(str(tmp_path), ["rdma-core", "mstflint"]) == {
+        "rdma-core": str(tmp_path / "rdma-core_10.0-1_amd64.deb"),
+        "mstflint": str(tmp_path / "mstflint_1%3a4.20.0-1_amd64.deb"),
+    }
+
+
+def test_colons_after_the_epoch_and_hyphens_before_the_revision_belong_to_the_upstream_version():
+    assert compare_deb_versions("1:2.0:1-1", "1:2.0:0-1") == 1
+    assert compare_deb_versions("1:2.0:1-1", "2:1.0-1") == -1
+    assert compare_deb_versions("1:2.0-beta-2", "1:2.0-beta-10") == -1
+
+
+def test_relative_cache_is_installed_by_absolute_path(tmp_path, monkeypatch):
+    commands = []
+    monkeypatch.setattr(EnableISER, "run_command", lambda command, check=True: commands.append(command))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "debs").mkdir()
+    (tmp_path / "debs" / "mstflint_4.26.0-1_amd64.deb").touch()
+
+    install_packages(["mstflint", "rdma-core"], "debs")
+
+    cache = str(tmp_path / "debs")
+    assert commands == [["apt", "install", "-y", "-f", "-o", f"Dir::Cache::Archives={cache}",
+                         os.path.join(cache, "mstflint_4.26.0-1_amd64.deb"), "rdma-core"]]
+    assert (tmp_path / "debs" / "partial").is_dir()
@@ -0,0 +1,120 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from Executor import CommandError, FakeExecutor, LocalExecutor
+
+
+def alive(pid):
+    """
+    True while pid runs (a zombie waiting for its reaper counts as gone).
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+    except FileNotFoundError:
+        return False
+
+
+def wait_gone(pid, seconds=2.0):
+    deadline = time.monotonic() + seconds
+    while alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return not alive(pid)
+
+
+def test_exit_codes_and_ok_codes():
+    executor = LocalExecutor()
+    assert executor.run(["sh", "-c", "echo out; echo err >&2; exit 3"]).ok is False
+    result = executor.run(["sh", "-c", "echo out; echo err >&2; exit 3"], ok_codes=(0, 3))
+    assert (result.ok, result.returncode, result.stdout, result.stderr) == (True, 3, "out\n", "err\n")
+    with pytest.raises(CommandError, match="exit 3: err"):
+        executor.run(["sh", "-c", "echo err >&2; exit 3"], check=True)
+    missing = executor.run(["/nonexistent/command"])
+    assert missing.returncode is None and not missing.timed_out
+    assert executor.run(["cat"], input_text="piped\n").stdout == "piped\n"
+
+
+def test_output_is_streamed_line_by_line_and_collected():
+    lines = []
+    result = LocalExecutor().run(["sh", "-c", "echo a; echo b >&2; echo c"],
+                                 on_output=lambda line, stream: lines.append((stream, line)))
+    assert [line for line in lines if line[0] == "stdout"] == [("stdout", "a"), ("stdout", "c")]
+    assert ("stderr", "b") in lines
+    assert result.stdout == "a\nc\n" and result.stderr == "b\n"
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_timeout_kills_children_holding_the_pipes(streaming):
+    lines = []
+    started = time.monotonic()
+    result = LocalExecutor(timeout=0.3).run(["sh", "-c", "sleep 30 & echo $!; wait"],
+                                            on_output=(lambda line, stream: lines.append(line)) if streaming else None)
+    assert time.monotonic() - started < 5
+    assert result.timed_out and result.returncode is None and not result.ok
+    assert wait_gone(int(result.stdout.split()[0]))
+
+
+def test_ctrl_c_stops_the_command_and_its_children():
+    pids = []
+    timer = threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGINT))
+    timer.start()
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            LocalExecutor().run(["sh", "-c", "sleep 30 & echo $$ $!; wait"],
+                                on_output=lambda line, stream: pids.extend(int(pid) for pid in line.split()))
+    finally:
+        timer.cancel()
+    assert len(pids) == 2
+    assert all(wait_gone(pid) for pid in pids)
+
+
+class CountingExecutor(FakeExecutor):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.running = self.peak = 0
+        self.counter_lock = threading.Lock()
+
+    def _execute(self, args, timeout, input_text, on_output):
+        with self.counter_lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            return super()._execute(args, timeout, input_text, on_output)
+        finally:
+            with self.counter_lock:
+                self.running -= 1
+
+
+def test_run_many_keeps_the_order_and_the_concurrency_bound():
+    executor = CountingExecutor(max_workers=3)
+    for n in range(8):
+        # Earlier commands take longer, so they finish last
+        executor.add(["job", str(n)], stdout=f"{n}\n", seconds=0.02 * (8 - n))
+    results = executor.run_many([["job", str(n)] for n in range(8)])
+    assert [result.stdout for result in results] == [f"{n}\n" for n in range(8)]
+    assert executor.peak == 3
+    executor.peak = 0
+    executor.run_many([["job", str(n)] for n in range(8)], max_workers=2)
+    assert executor.peak == 2
+
+
+def test_fake_matches_the_longest_prefix_and_records_calls():
+    executor = FakeExecutor()
+    executor.add(["zfs"], stdout="generic\n")
+    executor.add(["zfs", "list", "-H"], stdout="tank\n")
+    executor.add(["zfs", "snapshot"], returncode=1, stderr="dataset is busy\n")
+    executor.add(["sleep"], seconds=1.0)
+
+    assert executor.run(["zfs", "list", "-H", "-o", "name"]).stdout == "tank\n"
+    assert executor.run(["zfs", "get", "all"]).stdout == "generic\n"
+    assert executor.run(["zfs", "snapshot", "tank@now"]).stderr == "dataset is busy\n"
+    missing = executor.run(["zpool", "status"])
+    assert missing.returncode == 127 and missing.stderr == "zpool: no fake response"
+    assert executor.run(["sleep"], timeout=0.05).timed_out
+    assert [args for args, _ in executor.calls] == [
+        ["zfs", "list", "-H", "-o", "name"], ["zfs", "get", "all"], ["zfs", "snapshot", "tank@now"],
+        ["zpool", "status"], ["sleep"]]
@@ -0,0 +1,48 @@
+import json
+import os
+
+from GenerateInitiatorConf import PROFILES, render_iscsid, render_multipath
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def shipped_spec():
+    with open(os.path.join(ROOT, "Options.json")) as f:
+        return json.load(f).get("initiator", {})
+
+
+def golden(name):
+    with open(os.path.join(ROOT, "zsh", "etc", name)) as f:
+        return f.read()
+
+
+def test_multipath_conf_matches_the_sample():
+    assert render_multipath(shipped_spec()) == golden("multipath.conf.sample")
+
+
+def test_iscsid_conf_matches_the_sample():
+    assert render_iscsid(shipped_spec()) == golden("iscsid.conf.sample")
+
+
+def test_iscsid_merge_into_an_existing_file():
+    base = "\n".join([
+        "# iscsid.conf shipped with open-iscsi",
+        "iscsid.startup = /bin/systemctl start iscsid.socket",
+        "# node.startup = manual",
+        "node.session.queue_depth = 32",
+        "node.session.queue_depth = 64",
+        "#   node.session.cmds_max = 128",
+    ]) + "\n"
+    lines = render_iscsid({"profile": "latency"}, base).splitlines()
+
+    assert lines[:6] == [
+        "# iscsid.conf shipped with open-iscsi",
+        "iscsid.startup = /bin/systemctl start iscsid.socket",
+        "node.startup = automatic",
+        "node.session.queue_depth = 32",
+        "# node.session.queue_depth = 64",
+        "node.session.cmds_max = 256",
+    ]
+    assert lines[6:8] == ["", "# Added by VM/GenerateInitiatorConf.py"]
+    merged = set(PROFILES["latency"]) - {"node.startup", "node.session.queue_depth", "node.session.cmds_max"}
+    assert lines[8:] == [f"{key} = {PROFILES['latency'][key]}" for key in PROFILES["latency"] if key in merged]
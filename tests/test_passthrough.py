@@ -0,0 +1,81 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyVmomi")
+
+from pyVmomi import vim
+
+from vCenter.Passthrough import PassthroughIndex, device_requirements
+
+PF = "0000:3b:00.0"
+GPU = "0000:af:00.0"
+
+
+def host(moid, vfs=0, gpu=False):
+    passthru = []
+    if vfs:
+        passthru.append(vim.host.SriovInfo(id=PF, sriovEnabled=True, numVirtualFunction=vfs))
+    if gpu:
+        passthru.append(vim.host.PciPassthruInfo(id=GPU, passthruActive=True))
+    return {"kind": "host", "obj": SimpleNamespace(_moId=moid), "passthru": passthru}
+
+
+def vm(name, host_moid, vfs=0, gpu=False, power_state="poweredOn"):
+    backing = vim.vm.device.VirtualSriovEthernetCard.SriovBackingInfo(
+        physicalFunctionBacking=vim.vm.device.VirtualPCIPassthrough.DeviceBackingInfo(id=PF))
+    devices = [vim.vm.device.VirtualSriovEthernetCard(sriovBacking=backing) for _ in range(vfs)]
+    if gpu:
+        devices.append(vim.vm.device.VirtualPCIPassthrough(
+            backing=vim.vm.device.VirtualPCIPassthrough.DeviceBackingInfo(id=GPU)))
+    return {"kind": "vm", "name": name, "host": host_moid, "power_state": power_state, "pci": devices}
+
+
+def inventory(*records):
+    return SimpleNamespace(records={record["obj"]._moId if record["kind"] == "host" else record["name"]: record
+                                    for record in records})
+
+
+def uncached(index, vm_record):
+    needs = device_requirements(vm_record)
+    return {moid for moid in {m for hosts in index.capacity.values() for m in hosts}
+            if all(index.capacity.get(requirement, {}).get(moid, 0) >= count for requirement, count in needs.items())}
+
+
+def test_moves_update_the_cached_host_sets():
+    index = PassthroughIndex(inventory(host("host-1", vfs=2, gpu=True), host("host-2", vfs=1), host("host-3", gpu=True),
+                                       vm("gpu1", "host-1", gpu=True)))
+    two_vfs, gpu = vm("net2", None, vfs=2), vm("gpu2", "host-3", gpu=True)
+    cached = index.hosts_for(two_vfs)
+    assert cached == {"host-1"}
+    assert index.hosts_for(gpu) == {"host-3"}
+
+    index.move(vm("net1", None, vfs=1), None, "host-1")
+    assert index.hosts_for(two_vfs) is cached
+    assert cached == set()
+    # gpu1 leaves host-1: its passthrough device is free again
+    index.move(vm("gpu1", "host-1", gpu=True), "host-1", "host-3")
+    assert index.hosts_for(gpu) == {"host-1"}
+    assert index.missing(two_vfs, "host-1") == [f"virtual function on {PF}"]
+
+
+def test_cached_sets_match_a_fresh_scan_after_many_moves():
+    hosts = [host(f"host-{n}", vfs=4, gpu=n % 2 == 0) for n in range(6)]
+    index = PassthroughIndex(inventory(*hosts))
+    shapes = [vm("a", None, vfs=1), vm("b", None, vfs=3), vm("c", None, gpu=True), vm("d", None, vfs=2, gpu=True)]
+    for shape in shapes:
+        index.hosts_for(shape)
+    moids = [record["obj"]._moId for record in hosts]
+    placed = []
+    rng = random.Random(7)
+    for _ in range(200):
+        if placed and rng.random() < 0.4:
+            record, source = placed.pop(rng.randrange(len(placed)))
+            index.move(dict(record, host=source), source, rng.choice(moids))
+        else:
+            record, destination = rng.choice(shapes), rng.choice(moids)
+            index.move(dict(record, power_state="poweredOff"), None, destination)
+            placed.append((record, destination))
+        for shape in shapes:
+            assert index.hosts_for(shape) == uncached(index, shape)
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import QosPlan
+from QosPlan import DEFAULT_QOS_SPEC, check_esxi, load_valid_qos_spec, parse_esxcli_parameters
+
+ESXCLI_OUTPUT = """\
+Name                    Type  Value  Description
+----------------------  ----  -----  ------------------------------------------------------------
+DRSS                    int          Number of RSS queues for the default queue
+dscp_force              int   48     DSCP value to force on outgoing RoCE traffic
+pfcrx                   uint  0x40   Priority based Flow Control policy on RX
+pfctx                   uint         Priority based Flow Control policy on TX
+trust_state             int   2      Port policy to calculate the switch priority and packet color
+"""
+
+
+def test_unset_parameters_keep_an_empty_value():
+    assert parse_esxcli_parameters(ESXCLI_OUTPUT) == {
+        "DRSS": "", "dscp_force": "48", "pfcrx": "0x40", "pfctx": "", "trust_state": "2",
+    }
+
+
+def test_empty_or_missing_output_parses_to_nothing():
+    assert parse_esxcli_parameters(None) == {}
+    assert parse_esxcli_parameters("") == {}
+
+
+def test_unset_parameter_is_reported_as_unset(monkeypatch):
+    monkeypatch.setattr(QosPlan, "run_command", lambda command, timeout=None: ESXCLI_OUTPUT)
+    assert check_esxi(dict(DEFAULT_QOS_SPEC)) == ["nmlx5_core: pfctx is unset, plan expects 0x40"]
+
+
+def write_options(tmp_path, qos):
+    path = tmp_path / "Options.json"
+    path.write_text(json.dumps({"qos": qos}))
+    return str(path)
+
+
+def test_valid_spec_is_merged_on_the_defaults(tmp_path, capsys):
+    spec = load_valid_qos_spec(write_options(tmp_path, {"traffic_dscp": 26, "pfc_priority": 3}))
+    assert spec == dict(DEFAULT_QOS_SPEC, traffic_dscp=26, pfc_priority=3)
+    assert capsys.readouterr().err == ""
+
+
+def test_warnings_are_printed_and_the_spec_returned(tmp_path, capsys):
+    spec = load_valid_qos_spec(write_options(tmp_path, {"cnp_priority": 6}))
+    assert spec["cnp_priority"] == 6
+    assert "Warning: CNPs share the lossless priority" in capsys.readouterr().err
+
+
+def test_contradictory_spec_exits_with_every_error(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        load_valid_qos_spec(write_options(tmp_path, {"traffic_dscp": 64, "tc_bandwidth": {"0": 100}}))
+    assert exit_info.value.code == 1
+    err = capsys.readouterr().err
+    assert "Error: traffic_dscp=64 is outside the DSCP range 0-63" in err
+    assert "Error: priority 6 is lossless but TC2 has no bandwidth" in err
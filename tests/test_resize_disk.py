@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+
+import pytest
+
+import ResizeDisk
+from Executor import FakeExecutor
+from ResizeDisk import MIN_GROWTH, SECTOR, ResizeError, disk_chain, find_candidates, needs_growth, partition_number
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+GIB_SECTORS = (1 << 30) // SECTOR
+NVME_P3_START, NVME_P3_SECTORS = 6293504, 127924190
+
+
+def lsblk(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)["blockdevices"]
+
+
+@pytest.fixture
+def sysfs(tmp_path, monkeypatch):
+    """
+    /sys/class/block for both fixtures: the nvme partitions report their number, the sda ones only start and
+    size, and sda12 lies before sda11 on the disk.
+    """
+    def write(kname, **attributes):
+        os.makedirs(tmp_path / kname, exist_ok=True)
+        for attribute, value in attributes.items():
+            (tmp_path / kname / attribute).write_text(f"{value}\n")
+
+    write("nvme0n1", size=128 * GIB_SECTORS)
+    write("nvme0n1p1", partition=1, start=2048, size=GIB_SECTORS)
+    write("nvme0n1p2", partition=2, start=2048 + GIB_SECTORS, size=2 * GIB_SECTORS)
+    write("nvme0n1p3", partition=3, start=NVME_P3_START, size=NVME_P3_SECTORS)
+    for number in range(1, 13):
+        slot = {11: 11, 12: 10}.get(number, number - 1)
+        write(f"sda{number}", start=2048 + slot * GIB_SECTORS, size=GIB_SECTORS)
+    monkeypatch.setattr(ResizeDisk, "SYS_BLOCK", str(tmp_path))
+    return tmp_path
+
+
+def test_partition_numbers_from_sysfs_or_the_name(sysfs):
+    [nvme, _] = lsblk("lsblk_nvme_lvm.json")
+    [sda, _] = lsblk("lsblk_sda_partitions.json")
+    (sysfs / "nvme0n1p3" / "partition").unlink()
+    assert partition_number(nvme["children"][2], nvme) == 3
+    assert partition_number(sda["children"][11], sda) == 12
+    with pytest.raises(ResizeError, match="cannot tell the partition number of /dev/sdb"):
+        partition_number({"kname": "sdb", "path": "/dev/sdb"}, {"kname": "sda"})
+
+
+def test_nvme_chain_runs_through_lvm_to_the_root_filesystem(sysfs):
+    candidates = find_candidates(lsblk("lsblk_nvme_lvm.json"))
+    assert list(candidates) == ["nvme0n1"]
+    assert candidates["nvme0n1"]["chain"] == [
+        {"layer": "partition", "path": "/dev/nvme0n1p3", "disk": "/dev/nvme0n1", "number": 3,
+         "end": (NVME_P3_START + NVME_P3_SECTORS) * SECTOR},
+        {"layer": "pv", "path": "/dev/nvme0n1p3"},
+        {"layer": "lv", "path": "/dev/mapper/ubuntu--vg-ubuntu--lv", "shared": False},
+        {"layer": "fs", "path": "/dev/mapper/ubuntu--vg-ubuntu--lv", "fstype": "ext4", "mountpoint": "/"},
+    ]
+
+
+def test_the_partition_that_ends_last_is_grown_whatever_its_number(sysfs):
+    sda, loop = lsblk("lsblk_sda_partitions.json")
+    assert disk_chain(sda) == [
+        {"layer": "partition", "path": "/dev/sda11", "disk": "/dev/sda", "number": 11,
+         "end": (2048 + 12 * GIB_SECTORS) * SECTOR},
+        {"layer": "fs", "path": "/dev/sda11", "fstype": "xfs", "mountpoint": "/data"},
+    ]
+    assert disk_chain(loop) == [{"layer": "fs", "path": "/dev/loop0", "fstype": "ext4", "mountpoint": "/mnt/scratch"}]
+
+
+def test_growth_is_needed_for_a_bigger_disk_or_a_partition_left_short(sysfs):
+    candidate = find_candidates(lsblk("lsblk_nvme_lvm.json"))["nvme0n1"]
+    size = candidate["disk"]["size"]
+    assert needs_growth(candidate, 2 * size)
+    # The partition ends at the last usable sector: the GPT backup is not growth
+    assert not needs_growth(candidate, size)
+    # The disk grew in an earlier run that stopped before growpart
+    candidate["disk"]["size"] = 2 * size
+    assert needs_growth(candidate, 2 * size)
+    candidate["chain"][0]["end"] = 2 * size - MIN_GROWTH + SECTOR
+    assert not needs_growth(candidate, 2 * size)
+
+
+def test_json_summary_carries_the_error_when_planning_fails(monkeypatch, capsys):
+    fake = FakeExecutor()
+    for prefix in (["lsblk"], ["sudo", "-n", "lsblk"]):
+        fake.add(prefix, stderr="lsblk: failed to access sysfs directory: /sys/dev/block\n", returncode=32)
+    monkeypatch.setattr(ResizeDisk, "executor", fake)
+    monkeypatch.setattr(sys, "argv", ["ResizeDisk.py", "--auto", "--json"])
+    with pytest.raises(SystemExit) as exit_info:
+        ResizeDisk.main()
+
+    assert exit_info.value.code == 1
+    summary = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert summary["grown"] == [] and len(summary["errors"]) == 1
+    assert summary["errors"][0].endswith("lsblk: failed to access sysfs directory: /sys/dev/block")
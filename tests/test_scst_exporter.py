@@ -0,0 +1,61 @@
+from ScstExporter import ScstCollector
+
+
+def scrape(root):
+    collector = ScstCollector(root)
+    try:
+        return collector.collect().render(openmetrics=True)
+    finally:
+        collector.close()
+
+
+def samples(text, name):
+    return [line for line in text.splitlines() if line.startswith(name + "{")]
+
+
+def test_per_lun_series(scst_tree):
+    scst_tree.set_lun("0", "active_commands", 16)
+    text = scrape(scst_tree.root)
+    labels = f'driver="iscsi",target="{scst_tree.TARGET}",session="{scst_tree.SESSION}"'
+
+    assert samples(text, "scst_session_lun_active_commands") == [
+        f'scst_session_lun_active_commands{{{labels},lun="0",device="zvol0"}} 16',
+        f'scst_session_lun_active_commands{{{labels},lun="1",device="zvol1"}} 1',
+    ]
+    # 16 of zvol0's 64, 1 of zvol1's 32
+    assert samples(text, "scst_session_lun_queue_saturation") == [
+        f'scst_session_lun_queue_saturation{{{labels},lun="0",device="zvol0"}} 0.25',
+        f'scst_session_lun_queue_saturation{{{labels},lun="1",device="zvol1"}} 0.0312',
+    ]
+    assert samples(text, "scst_lun_active_commands") == [
+        f'scst_lun_active_commands{{driver="iscsi",target="{scst_tree.TARGET}",lun="0",device="zvol0"}} 16',
+        f'scst_lun_active_commands{{driver="iscsi",target="{scst_tree.TARGET}",lun="1",device="zvol1"}} 1',
+    ]
+
+
+def test_session_and_target_counters(scst_tree):
+    text = scrape(scst_tree.root)
+    assert f'scst_session_read_bytes_total{{driver="iscsi",target="{scst_tree.TARGET}",' \
+           f'session="{scst_tree.SESSION}"}} {400 * 1024}' in text
+    assert f'scst_target_write_commands_total{{driver="iscsi",target="{scst_tree.TARGET}"}} 50' in text
+    assert f'scst_target_sessions{{driver="iscsi",target="{scst_tree.TARGET}"}} 1' in text
+    assert text.endswith("# EOF\n")
+
+
+def test_lun_counters_are_exported_when_present(scst_tree):
+    scst_tree.set_lun("1", "write_cmd_count", 7)
+    text = scrape(scst_tree.root)
+    assert samples(text, "scst_lun_write_commands_total") == [
+        f'scst_lun_write_commands_total{{driver="iscsi",target="{scst_tree.TARGET}",lun="1",device="zvol1"}} 7',
+    ]
+
+
+def test_scrape_with_more_attributes_than_descriptors(scst_tree, nofile_limit):
+    scst_tree.add_sessions(299)
+    nofile_limit(200)
+    text = scrape(scst_tree.root)
+    target = f'driver="iscsi",target="{scst_tree.TARGET}"'
+
+    assert len(samples(text, "scst_session_read_commands_total")) == 300
+    assert f"scst_target_sessions{{{target}}} 300" in text
+    assert f"scst_target_read_commands_total{{{target}}} {300 * 100}" in text
@@ -0,0 +1,73 @@
+from ScstMonitor import ScstSysfs, compute_rates, format_table
+
+
+def test_scan_finds_lun_directories_and_devices(scst_tree):
+    sysfs = ScstSysfs(scst_tree.root)
+    sessions = sysfs.scan()
+    info = sessions[("iscsi", scst_tree.TARGET, scst_tree.SESSION)]
+    assert sorted(info["luns"]) == ["0", "1"]
+    assert list(info["luns"]["0"]) == ["active_commands"]
+    assert info["devices"] == {"0": "zvol0", "1": "zvol1"}
+    sysfs.close()
+
+
+def test_session_and_lun_rates(scst_tree):
+    sysfs = ScstSysfs(scst_tree.root)
+    before = sysfs.sample()
+    scst_tree.write_session(read_cmd=300, read_kb=2448, write_cmd=90, write_kb=7296, commands=6, active=3)
+    scst_tree.set_lun("0", "active_commands", 5)
+    after = sysfs.sample()
+    sysfs.close()
+
+    [session] = compute_rates(before, after, 2.0)
+    assert session["session"] == scst_tree.SESSION
+    assert session["iops"] == 120.0
+    assert session["read_iops"] == 100.0
+    assert session["write_iops"] == 20.0
+    assert session["read_mbps"] == 1.0
+    assert session["write_mbps"] == 2.0
+    assert session["commands"] == 6
+    assert session["active_commands"] == 3
+    # SCST has only active_commands per session LUN: no made-up zero rates
+    assert session["luns"]["0"] == {"active_commands": 5, "device": "zvol0"}
+    assert session["luns"]["1"] == {"active_commands": 1, "device": "zvol1"}
+
+
+def test_lun_counters_are_used_when_present(scst_tree):
+    scst_tree.set_lun("1", "write_cmd_count", 10)
+    sysfs = ScstSysfs(scst_tree.root)
+    before = sysfs.sample()
+    scst_tree.set_lun("1", "write_cmd_count", 30)
+    after = sysfs.sample()
+    sysfs.close()
+
+    [session] = compute_rates(before, after, 1.0)
+    assert session["luns"]["1"]["write_iops"] == 20.0
+    assert session["luns"]["1"]["iops"] == 20.0
+    assert "read_iops" not in session["luns"]["1"]
+    lines = format_table([session], 1)
+    assert any(line.strip().startswith("LUN 1 (zvol1)") for line in lines)
+
+
+
+def test_sessions_beyond_the_descriptor_limit_are_all_read(scst_tree, nofile_limit):
+    scst_tree.add_sessions(299)
+    nofile_limit(200)
+    sysfs = ScstSysfs(scst_tree.root)
+    for _ in range(2):
+        snapshot = sysfs.sample()
+        assert len(snapshot) == 300
+        assert all(value is not None for session in snapshot.values() for value in session["values"].values())
+        assert 0 < len(sysfs.fds) <= sysfs.max_fds < 200
+    sysfs.close()
+
+
+def test_running_out_of_descriptors_shrinks_the_cache(scst_tree, nofile_limit):
+    scst_tree.add_sessions(299)
+    nofile_limit(300)
+    sysfs = ScstSysfs(scst_tree.root, max_fds=10000)
+    snapshot = sysfs.sample()
+    sysfs.close()
+
+    assert sysfs.max_fds < 300
+    assert all(session["values"]["read_cmd_count"] == 100 for session in snapshot.values())
@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from TrueNasClient import TrueNasApiError, TrueNasClient
+
+
+class ScriptedApi(ThreadingHTTPServer):
+    """
+    A keep-alive HTTP server on localhost.  script(path, *answers) queues (status, headers) answers for a path;
+    once they are used up the path answers 200 with {"path", "method"}.  Every request is logged with the client
+    port it came from; paths under "slow/" take delay seconds.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.1):
+        super().__init__(("127.0.0.1", 0), ScriptedHandler)
+        self.delay = delay
+        self.answers = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def script(self, path, *answers):
+        self.answers[path] = list(answers)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self):
+        server = self.server
+        path = self.path.split("?")[0][len("/api/v2.0/"):]
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        with server.lock:
+            server.requests.append((self.command, path, self.client_address[1], time.monotonic()))
+            queued = server.answers.get(path)
+            status, headers = queued.pop(0) if queued else (200, {})
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        if path.startswith("slow/"):
+            time.sleep(server.delay)
+        body = json.dumps({"path": path, "method": self.command} if status == 200 else {"error": status}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.active -= 1
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+
+@pytest.fixture
+def api():
+    server = ScriptedApi()
+    yield server
+    server.stop()
+
+
+def gaps(requests):
+    return [later[3] - earlier[3] for earlier, later in zip(requests, requests[1:])]
+
+
+def test_5xx_is_retried_with_backoff_on_one_connection(api):
+    api.script("pool/", (503, {}), (502, {}), (500, {}))
+    with TrueNasClient(api.url, "key", backoff=0.1) as client:
+        assert client.query("pool") == {"path": "pool/", "method": "GET"}
+        assert client.create("iscsi.extent", {"name": "zvol0"}) == {"path": "iscsi/extent/", "method": "POST"}
+
+    assert [(method, path) for method, path, port, at in api.requests] == [("GET", "pool/")] * 4 + [
+        ("POST", "iscsi/extent/")]
+    # urllib3 retries the first failure at once, then waits backoff * 2 ** (n - 1)
+    first, second, third, _ = gaps(api.requests)
+    assert second >= 0.15
+    assert third >= 0.35
+    assert len({port for method, path, port, at in api.requests}) == 1
+
+
+def test_429_waits_for_retry_after(api):
+    api.script("iscsi/target/", (429, {"Retry-After": "1"}))
+    with TrueNasClient(api.url, "key", backoff=0) as client:
+        assert client.query("iscsi.target") == {"path": "iscsi/target/", "method": "GET"}
+
+    assert len(api.requests) == 2
+    assert gaps(api.requests)[0] >= 0.9
+
+
+def test_retries_give_up_with_the_last_status(api):
+    api.script("pool/", *[(503, {})] * 10)
+    with TrueNasClient(api.url, "key", retries=2, backoff=0) as client:
+        with pytest.raises(TrueNasApiError) as error:
+            client.query("pool")
+
+    assert error.value.status == 503
+    assert len(api.requests) == 3
+
+
+def test_map_is_bounded_by_max_workers(api):
+    with TrueNasClient(api.url, "key", max_workers=3) as client:
+        results = client.map(lambda n: client.query(f"slow.item{n}"), range(10))
+
+    assert [item for item, result, error in results] == list(range(10))
+    assert all(result == {"path": f"slow/item{item}/", "method": "GET"} and error is None
+               for item, result, error in results)
+    assert 2 <= api.peak <= 3
+    # The pool keeps one connection per worker
+    assert len({port for method, path, port, at in api.requests}) <= 3
+
+
+def test_map_reports_errors_per_item(api):
+    api.script("pool/", (404, {}))
+    with TrueNasClient(api.url, "key") as client:
+        results = client.map(lambda namespace: client.query(namespace), ["pool", "iscsi.target"])
+
+    [(_, _, error), (_, target, ok)] = results
+    assert error.status == 404
+    assert target == {"path": "iscsi/target/", "method": "GET"}
+    assert ok is None
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("websocket")
+
+from TrueNasClient import TrueNasApiError
+from TrueNasWebSocket import TrueNasWebSocketClient
+from truenas_ws_standin import CallError, StandinMiddleware
+
+
+@pytest.fixture
+def middleware():
+    server = StandinMiddleware()
+    yield server
+    server.stop()
+
+
+def connect(middleware, api_key="good-key", **kwargs):
+    return TrueNasWebSocketClient("127.0.0.1", api_key, url=middleware.url, **kwargs)
+
+
+def test_login_and_job_subscription(middleware):
+    with connect(middleware):
+        pass
+    assert middleware.calls == [("auth.login_with_api_key", ["good-key"]), ("core.subscribe", ["core.get_jobs"])]
+
+
+def test_rejected_api_key(middleware):
+    with pytest.raises(TrueNasApiError, match="API key was rejected"):
+        connect(middleware, api_key="wrong")
+    assert middleware.calls == [("auth.login_with_api_key", ["wrong"])]
+
+
+def test_answers_are_matched_by_id_with_many_calls_in_flight(middleware):
+    answered = []
+
+    def after(seconds, value):
+        time.sleep(seconds)
+        answered.append(value)
+        return {"value": value}
+
+    middleware.methods["test.after"] = after
+    with connect(middleware) as client:
+        # The first call sent takes longest, so the answers come back in reverse order
+        futures = [client.call_async("test.after", 0.2 - n * 0.02, n) for n in range(10)]
+        assert [future.result(5) for future in futures] == [{"value": n} for n in range(10)]
+    assert answered[0] != 0
+
+
+def test_map_shares_one_session(middleware):
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def slow(value):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return value * 2
+
+    middleware.methods["test.slow"] = slow
+    with connect(middleware, max_workers=4) as client:
+        results = client.map(lambda n: client.call("test.slow", n), range(12))
+    assert [(item, result, error) for item, result, error in results] == [(n, n * 2, None) for n in range(12)]
+    assert peak[0] == 4
+
+
+def test_errors_map_to_api_errors(middleware):
+    def create(data):
+        raise CallError(22, "[EINVAL] iscsi_extent_create.name: Extent name must be unique", "name exists")
+
+    def delete(object_id):
+        raise CallError(2, f"[ENOENT] Extent {object_id} does not exist")
+
+    middleware.methods.update({"iscsi.extent.create": create, "iscsi.extent.delete": delete})
+    with connect(middleware) as client:
+        with pytest.raises(TrueNasApiError) as error:
+            client.create("iscsi.extent", {"name": "zvol0"})
+        assert (error.value.status, error.value.text) == (22, "name exists")
+        with pytest.raises(TrueNasApiError) as error:
+            client.delete("iscsi.extent", 7)
+        assert (error.value.status, error.value.text) == (2, "[ENOENT] Extent 7 does not exist")
+        with pytest.raises(TrueNasApiError) as error:
+            client.query("iscsi.nothing")
+        assert error.value.status == -32601
+
+
+def test_job_finishes_on_its_get_jobs_event(middleware):
+    middleware.start_job("pool.create", [{"state": "RUNNING", "progress": {"percent": 50}},
+                                         {"state": "SUCCESS", "result": {"id": 1, "name": "tank"}}])
+    with connect(middleware) as client:
+        middleware.publish_job(1, id=1, method="other.job", state="SUCCESS")  # Another client's job
+        assert client.job("pool.create", {"name": "tank"}, timeout=5) == {"id": 1, "name": "tank"}
+        assert 101 not in client.jobs
+    assert ("pool.create", [{"name": "tank"}]) in middleware.calls
+    assert not any(method == "core.get_jobs" for method, params in middleware.calls)
+
+
+def test_failed_job_raises(middleware):
+    middleware.start_job("service.restart", [{"state": "FAILED", "error": "scst did not start"}])
+    with connect(middleware) as client:
+        with pytest.raises(TrueNasApiError, match="FAILED: scst did not start"):
+            client.job("service.restart", {"service": "iscsitarget"}, timeout=5)
+
+
+def test_pending_calls_fail_when_the_session_drops(middleware):
+    middleware.methods["test.hang"] = lambda: time.sleep(2)
+    with connect(middleware) as client:
+        future = client.call_async("test.hang")
+        time.sleep(0.05)
+        middleware.disconnect()
+        with pytest.raises(TrueNasApiError, match="WebSocket session ended"):
+            future.result(5)
@@ -0,0 +1,45 @@
+import os
+
+from TuneBlockQueues import PROFILES, apply_changes, plan_device, render_udev_rules
+
+
+def san_disk(root, scheduler, nr_requests):
+    queue = os.path.join(root, "sdb", "queue")
+    os.makedirs(queue)
+    os.makedirs(os.path.join(root, "sdb", "device"))
+    for name, value in (("scheduler", scheduler), ("nr_requests", nr_requests), ("max_sectors_kb", 512),
+                        ("max_hw_sectors_kb", 32767), ("read_ahead_kb", 128), ("rq_affinity", 1), ("nomerges", 0)):
+        with open(os.path.join(queue, name), "w") as f:
+            f.write(f"{value}\n")
+    with open(os.path.join(root, "sdb", "device", "vendor"), "w") as f:
+        f.write("CTMS-SAN\n")
+    return str(root)
+
+
+def test_nr_requests_is_capped_at_the_tag_depth_without_a_scheduler(tmp_path):
+    root = san_disk(tmp_path, "[none] mq-deadline", 128)
+    changes = plan_device("sdb", PROFILES["ctms-san"], root)
+    assert "nr_requests" not in changes
+    assert changes["max_sectors_kb"] == (512, 256)
+
+
+def test_nr_requests_is_lowered_to_the_profile(tmp_path):
+    root = san_disk(tmp_path, "[none] mq-deadline", 1024)
+    assert plan_device("sdb", PROFILES["ctms-san"], root)["nr_requests"] == (1024, 256)
+
+
+def test_nr_requests_is_not_raised_after_switching_to_none(tmp_path):
+    root = san_disk(tmp_path, "none [mq-deadline]", 64)
+    changes = plan_device("sdb", PROFILES["ctms-san"], root)
+    assert changes["scheduler"] == ("mq-deadline", "none")
+    # The kernel resets nr_requests to the tag depth on the switch; here that depth is the 64 left in the file
+    assert apply_changes("sdb", changes, root) == []
+    with open(os.path.join(root, "sdb", "queue", "nr_requests")) as f:
+        assert f.read().strip() == "64"
+
+
+def test_udev_rules_leave_nr_requests_to_the_kernel_without_a_scheduler():
+    rules = render_udev_rules().splitlines()
+    san, rotational = rules[rules.index("# ctms-san") + 1], rules[rules.index("# rotational") + 1]
+    assert "nr_requests" not in san
+    assert 'ATTR{queue/nr_requests}="256"' in rotational
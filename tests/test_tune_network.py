@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+from TuneNetwork import (FixtureBackend, NetlinkBackend, changeable_features, compute_changes, encode_bitset,
+                         load_network_profile, tune_interfaces)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "connectx6_dx.json")
+OPTIONS = {
+    "network": {
+        "options": [{"opt": "-G", "value": "rx 8192 tx 8192"}],
+        "profiles": {
+            "default": {
+                "txqueuelen": 3000,
+                "rings": {"rx": 1024, "tx": 1024},
+                "pause": {"rx": "on", "tx": "on"},
+                "coalesce": {"rx-usecs": 3, "tx-usecs": 3, "rx-frames": 64, "tx-frames": 32,
+                             "adaptive-tx": "off", "adaptive-rx": "on"},
+                "features": {"rx-gro-list": "on", "rx-udp-gro-forwarding": "on", "ntuple-filters": "on"},
+                "privflags": {"tx_xdp_hw_checksum": "on"},
+            },
+        },
+    },
+}
+
+
+class RecordingBackend(FixtureBackend):
+    def __init__(self, path):
+        super().__init__(path)
+        self.batches = []
+
+    def apply(self, changes):
+        self.batches.append(json.loads(json.dumps(changes)))
+        return super().apply(changes)
+
+
+def test_only_the_differences_from_the_profile_are_planned():
+    current = FixtureBackend(FIXTURE).read_state(["enp65s0f0np0", "enp65s0f1np1"])
+
+    def changes(iface):
+        return compute_changes(current[iface], load_network_profile(iface, OPTIONS), iface)
+
+    assert changes("enp65s0f0np0") == {
+        "txqueuelen": 3000,
+        "rings": {"rx": 8192, "tx": 8192},
+        "coalesce": {"rx_usecs": 3, "rx_max_frames": 64, "tx_usecs": 3, "tx_max_frames": 32, "use_adaptive_tx": 0},
+        "features": {"rx-gro-list": True, "rx-udp-gro-forwarding": True, "rx-ntuple-filter": True},
+        "privflags": {"tx_xdp_hw_checksum": True},
+    }
+    # The second port already runs the profile; its tx ring is clamped to the hardware maximum it is at
+    assert changes("enp65s0f1np1") == {"txqueuelen": 3000}
+
+
+def test_all_interfaces_are_set_in_one_batch_and_a_rerun_changes_nothing():
+    backend = RecordingBackend(FIXTURE)  # Applied changes only update the in-memory state
+
+    assert tune_interfaces(backend, ["enp65s0f0np0", "enp65s0f1np1"], OPTIONS, dry_run=True)
+    assert backend.batches == []
+
+    assert tune_interfaces(backend, ["enp65s0f0np0", "enp65s0f1np1"], OPTIONS)
+    [batch] = backend.batches
+    assert sorted(batch) == ["enp65s0f0np0", "enp65s0f1np1"]
+    assert sorted(batch["enp65s0f0np0"]) == ["coalesce", "features", "privflags", "rings", "txqueuelen"]
+    assert batch["enp65s0f1np1"] == {"txqueuelen": 3000}
+
+    assert tune_interfaces(backend, ["enp65s0f0np0", "enp65s0f1np1"], OPTIONS)
+    assert len(backend.batches) == 1
+
+
+def test_a_missing_interface_is_skipped_and_the_others_are_tuned(capsys):
+    backend = RecordingBackend(FIXTURE)
+    assert not tune_interfaces(backend, ["enp1s0", "enp65s0f1np1"], OPTIONS)
+    assert "enp1s0: no settings could be read, skipping." in capsys.readouterr().out
+    assert backend.batches == [{"enp65s0f1np1": {"txqueuelen": 3000}}]
+
+
+def test_netlink_reports_a_missing_interface_instead_of_raising():
+    try:
+        backend = NetlinkBackend()
+    except OSError as e:
+        pytest.skip(f"no ethtool netlink here: {e}")
+    try:
+        assert backend.read_state(["autosan-gone0"]) == {"autosan-gone0": {}}
+        assert backend.apply({"autosan-gone0": {"txqueuelen": 3000, "rings": {"rx": 1024}}}) == {
+            ("autosan-gone0", "txqueuelen"): "No such device",
+            ("autosan-gone0", "rings"): "No such device",
+        }
+    finally:
+        backend.close()
+
+
+def test_fixed_features_are_not_recorded_or_written():
+    # vlan-challenged is listed in the HW set with its bit clear: the driver does not let it change
+    hw = encode_bitset({"rx-gro": True, "rx-ntuple-filter": True, "vlan-challenged": False})
+    active = encode_bitset({"rx-gro": True, "rx-ntuple-filter": False, "vlan-challenged": True})
+    assert changeable_features(hw, active) == {"rx-gro": True, "rx-ntuple-filter": False}
+
+    # The recorded ports have no vlan-challenged feature, so a profile asking for it plans no write
+    current = FixtureBackend(FIXTURE).read_state(["enp65s0f1np1"])["enp65s0f1np1"]
+    assert compute_changes(current, {"features": {"vlan-challenged": False}}, "enp65s0f1np1") == {}
@@ -0,0 +1,27 @@
+import pytest
+
+from TuneZfs import PROFILES, RESERVED_MEMORY, resolve_profile, validate
+
+GIB = 1 << 30
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+@pytest.mark.parametrize("memory_gib", [16, 24, 32, 64, 256])
+def test_profiles_pass_their_own_validation(profile, memory_gib):
+    memory = memory_gib * GIB
+    values = resolve_profile(PROFILES[profile], memory, 12)
+    errors, warnings = validate(values, memory, 12, {})
+    assert errors == []
+    assert values["zfs_arc_max"] == min(memory * 3 // 4, memory - RESERVED_MEMORY)
+
+
+def test_arc_max_keeps_the_reserve_free_on_small_hosts():
+    values = resolve_profile(PROFILES["iser-latency"], 16 * GIB, 4)
+    assert values["zfs_arc_max"] == 8 * GIB
+    assert values["zfs_arc_min"] == 4 * GIB
+
+
+def test_no_memory_left_for_the_arc_is_an_error():
+    memory = 8 * GIB
+    errors, _ = validate(resolve_profile(PROFILES["iser-latency"], memory, 4), memory, 4, {})
+    assert any("leaves nothing for the ARC" in error for error in errors)
@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip("pyVmomi")
+
+from vCenter.Inventory import Inventory
+from vsphere_standin import StandinContent, StandinVM
+
+
+@pytest.fixture
+def content():
+    content = StandinContent()
+    content.esx1 = content.add_host("host-1", "esx1")
+    content.esx2 = content.add_host("host-2", "esx2")
+    content.vm1 = content.add_vm(StandinVM("vm-1"), "db1", content.esx1)
+    content.vm2 = content.add_vm(StandinVM("vm-2"), "web1", content.esx1)
+    return content
+
+
+def test_refresh_applies_only_what_changed(content):
+    with Inventory(content) as inventory:
+        assert inventory.refresh() == 4  # The first refresh re-reads everything to obtain a version
+        assert inventory.refresh() == 0
+
+        content.set(content.vm2, {"runtime.powerState": "poweredOff", "runtime.host": content.esx2})
+        content.set(content.esx2, {"runtime.inMaintenanceMode": True})
+        assert inventory.refresh() == 2
+        assert inventory.vm("web1")["power_state"] == "poweredOff"
+        assert [record["name"] for record in inventory.vms_on_host("host-2")] == ["web1"]
+        assert [record["name"] for record in inventory.vms_on_host("host-1")] == ["db1"]
+        assert inventory.host("esx2")["maintenance"]
+
+        content.remove(content.vm1)
+        assert inventory.refresh() == 1
+        assert inventory.vm("db1") is None
+
+
+def test_batch_migrations_start_from_the_refreshed_inventory(content):
+    from vSphere import run_batch
+
+    # While db1 migrates, someone powers web1 off; web1 waits for esx1's slot and must not power it off or on again
+    content.vm1.on_relocate = lambda: content.set(content.vm2, {"runtime.powerState": "poweredOff"})
+    with Inventory(content) as inventory:
+        results = run_batch(content, inventory, {"db1": content.esx2, "web1": content.esx2},
+                            max_per_host=1, max_per_cluster=4)
+
+    assert results["db1"]["ok"] and results["web1"]["ok"]
+    assert [method for method, spec in content.vm1.calls] == ["PowerOffVM_Task", "RelocateVM_Task", "PowerOnVM_Task"]
+    assert [method for method, spec in content.vm2.calls] == ["RelocateVM_Task"]
+
+
+def test_batch_migration_to_a_host_that_left_service_fails_untouched(content):
+    from vSphere import run_batch
+
+    content.vm1.on_relocate = lambda: content.set(content.esx2, {"runtime.inMaintenanceMode": True})
+    with Inventory(content) as inventory:
+        results = run_batch(content, inventory, {"db1": content.esx2, "web1": content.esx2},
+                            max_per_host=1, max_per_cluster=4)
+
+    assert results["db1"]["ok"]
+    assert results["web1"]["ok"] is False
+    assert results["web1"]["error"] == "host 'esx2' is no longer connected and out of maintenance mode"
+    assert content.vm2.calls == []
+
+
+def test_evacuating_a_host_leaves_powered_off_vms_off(content):
+    from vSphere import batch_plan, run_batch
+
+    content.set(content.vm2, {"runtime.powerState": "poweredOff"})
+    with Inventory(content) as inventory:
+        plan, skipped = batch_plan(inventory, [], ["esx1"], [])
+        assert set(plan) == {"db1", "web1"} and skipped == {}
+        results = run_batch(content, inventory, plan, max_per_host=2, max_per_cluster=4)
+
+    assert results["db1"]["ok"] and results["web1"]["ok"]
+    assert [method for method, spec in content.vm1.calls] == ["PowerOffVM_Task", "RelocateVM_Task", "PowerOnVM_Task"]
+    assert [method for method, spec in content.vm2.calls] == ["RelocateVM_Task"]
@@ -0,0 +1,141 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyVmomi")
+
+from pyVmomi import vim
+
+from vCenter.Migrations import MigrationLimits
+from vCenter.Tasks import TaskWaiter, run_pipelines
+from vsphere_standin import CANCELED, StandinContent, StandinHost, StandinTask, StandinVM
+
+
+def wait_all(waiter):
+    finished = {}
+    while len(waiter):
+        for entry in waiter.wait_any():
+            finished[entry["key"]] = entry
+    return finished
+
+
+def test_wait_any_reports_success_and_error():
+    content = StandinContent()
+    with TaskWaiter(content, max_wait_seconds=1, progress=None) as waiter:
+        waiter.add(StandinTask(0.05, result="vm-42"), "power on")
+        waiter.add(StandinTask(0.05, error="Insufficient resources"), "relocate")
+        finished = wait_all(waiter)
+
+    assert finished["power on"]["state"] == "success"
+    assert finished["power on"]["result"] == "vm-42"
+    assert finished["power on"]["error"] is None
+    assert finished["relocate"]["state"] == "error"
+    assert finished["relocate"]["error"] == "Insufficient resources"
+    collector = content.collector()
+    assert collector.filters == []
+    assert collector.destroyed
+
+
+def test_wait_any_cancels_a_task_past_its_timeout():
+    content = StandinContent()
+    task = StandinTask(None)
+    with TaskWaiter(content, max_wait_seconds=1, progress=None) as waiter:
+        waiter.add(StandinTask(0.01), "power off")
+        waiter.add(task, "relocate", timeout=0.2)
+        finished = wait_all(waiter)
+        assert content.collector().filters == []
+
+    assert finished["power off"]["state"] == "success"
+    assert finished["relocate"]["state"] == "timeout"
+    assert finished["relocate"]["error"] == "did not finish within 0s"
+    assert finished["relocate"]["seconds"] >= 0.2
+    assert task.cancelled
+    assert task.properties()["info.error"] == CANCELED
+
+
+def steps(*outcomes):
+    """
+    A pipeline yielding one task per (label, error) and collecting the results sent back.
+    """
+    results = []
+    for label, error in outcomes:
+        results.append((yield label, StandinTask(0.01, result=label, error=error)))
+    return results
+
+
+def test_failure_ends_only_its_pipeline():
+    content = StandinContent()
+    pipelines = {
+        "db1": steps(("power off", None), ("relocate", "No compatible host"), ("power on", None)),
+        "web1": steps(("power off", None), ("relocate", None), ("power on", None)),
+    }
+    with TaskWaiter(content, max_wait_seconds=1, progress=None) as waiter:
+        results = run_pipelines(waiter, pipelines)
+
+    assert results["db1"]["ok"] is False
+    assert results["db1"]["error"] == "relocate: No compatible host"
+    assert [step[:2] for step in results["db1"]["steps"]] == [("power off", "success"), ("relocate", "error")]
+    assert results["web1"]["ok"] is True
+    assert results["web1"]["error"] is None
+    assert [step[0] for step in results["web1"]["steps"]] == ["power off", "relocate", "power on"]
+    assert "started" not in results["web1"]
+
+
+def test_pci_device_is_readded_after_a_failed_relocate():
+    from vSphere import migrate_pipeline
+
+    vm = StandinVM(relocate_error="Host is in maintenance mode")
+    record = {"obj": vm, "name": "db1", "power_state": vim.VirtualMachinePowerState.poweredOn,
+              "pci": [vim.vm.device.VirtualPCIPassthrough()]}
+    content = StandinContent()
+    with TaskWaiter(content, max_wait_seconds=1, progress=None) as waiter:
+        results = run_pipelines(waiter, {"db1": migrate_pipeline(record, StandinHost("host-2", "esx2"))})
+
+    assert [step[:2] for step in results["db1"]["steps"]] == [
+        ("power off", "success"), ("remove PCI device", "success"), ("relocate", "error"),
+        ("re-add PCI device", "success"), ("power on", "success")]
+    assert results["db1"]["ok"] is False
+    assert results["db1"]["error"] == "relocate: Host is in maintenance mode"
+    assert [method for method, spec in vm.calls] == [
+        "PowerOffVM_Task", "ReconfigVM_Task", "RelocateVM_Task", "ReconfigVM_Task", "PowerOnVM_Task"]
+    removed, readded = vm.calls[1][1], vm.calls[3][1]
+    assert [change.operation for change in removed.deviceChange] == ["remove"]
+    assert [change.operation for change in readded.deviceChange] == ["add"]
+    assert readded.deviceChange[0].device is record["pci"][0]
+
+
+def test_limits_hold_pipelines_back_until_released():
+    inventory = SimpleNamespace(records={moid: {"cluster": None} for moid in ("host-1", "host-2", "host-3", "host-4")})
+    limits = MigrationLimits(inventory, max_per_host=1)
+    limits.register("vm1", "host-1", "host-2")
+    limits.register("vm2", "host-3", "host-4")
+    limits.register("vm3", "host-1", "host-4")
+    running, started = set(), []
+
+    def counted(name):
+        running.add(name)
+        started.append((name, set(running)))
+        try:
+            yield "relocate", StandinTask(0.05)
+        finally:
+            running.discard(name)
+
+    content = StandinContent()
+    with TaskWaiter(content, max_wait_seconds=1, progress=None) as waiter:
+        results = run_pipelines(waiter, {name: counted(name) for name in ("vm1", "vm2", "vm3")},
+                                admit=limits.admit, release=limits.release)
+
+    assert all(result["ok"] for result in results.values())
+    # vm1 and vm2 share no host; vm3 needs host-1 and host-4 and starts only after both were released
+    assert started == [("vm1", {"vm1"}), ("vm2", {"vm1", "vm2"}), ("vm3", {"vm3"})]
+    assert set(limits.running.values()) == {0}
+
+
+def test_pipelines_that_are_never_admitted_are_reported():
+    content = StandinContent()
+    pipelines = {"vm1": steps(("relocate", None)), "vm2": steps(("relocate", None))}
+    with TaskWaiter(content, max_wait_seconds=1, progress=None) as waiter:
+        results = run_pipelines(waiter, pipelines, admit=lambda name: name != "vm2")
+
+    assert results["vm1"]["ok"] is True
+    assert results["vm2"] == {"ok": False, "error": "not admitted", "steps": [], "seconds": 0}
@@ -0,0 +1,192 @@
+"""
+Stand-in for the TrueNAS middleware WebSocket endpoint: JSON-RPC 2.0 on ws://127.0.0.1:<port>/api/current over
+a minimal RFC 6455 server (unfragmented text frames, ping and close; no extensions).
+
+Every call is answered on its own thread, so calls that take different times are answered out of order, as the
+middleware does.  Methods are plain functions of the call's params; one raising CallError is answered with a
+JSON-RPC error.  start_job() returns a job id and publishes its core.get_jobs collection_update events.
+"""
+
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class CallError(Exception):
+    """
+    Answered as {"code", "message", "data": {"reason"}} like a middleware CallError.
+    """
+
+    def __init__(self, code, message, reason=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.reason = reason
+
+
+def read_exactly(connection, size):
+    data = b""
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("peer closed the connection")
+        data += chunk
+    return data
+
+
+def read_frame(connection):
+    """
+    Returns (opcode, payload) of one client frame (always masked).
+    """
+    first, second = read_exactly(connection, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", read_exactly(connection, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", read_exactly(connection, 8))[0]
+    mask = read_exactly(connection, 4) if second & 0x80 else b"\0\0\0\0"
+    payload = read_exactly(connection, length)
+    return first & 0x0F, bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+
+
+def frame(opcode, payload):
+    if len(payload) < 126:
+        header = struct.pack("!BB", 0x80 | opcode, len(payload))
+    elif len(payload) < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, len(payload))
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, len(payload))
+    return header + payload
+
+
+class StandinMiddleware:
+    """
+    Serves one client at a time on localhost.  api_key is the only key auth.login_with_api_key accepts;
+    methods maps further method names to functions.  calls logs (method, params) as they arrive.
+    """
+
+    def __init__(self, api_key="good-key", methods=None):
+        self.api_key = api_key
+        self.methods = {"auth.login_with_api_key": lambda key: key == self.api_key,
+                        "core.subscribe": lambda name: f"subscription-{name}"}
+        self.methods.update(methods or {})
+        self.calls = []
+        self.jobs = 0
+        self.connection = None
+        self.send_lock = threading.Lock()
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.listener.getsockname()[1]}/api/current"
+
+    def stop(self):
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)  # Wakes the accept() of the serving thread
+        except OSError:
+            pass
+        self.listener.close()
+        self.disconnect()
+        self.thread.join(timeout=5)
+
+    def disconnect(self):
+        """
+        Drop the client's connection without a close frame, like a middleware restart.
+        """
+        if self.connection is not None:
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def send(self, message):
+        with self.send_lock:
+            self.connection.sendall(frame(OPCODE_TEXT, json.dumps(message).encode()))
+
+    def publish_job(self, job_id, **fields):
+        self.send({"msg": "changed", "method": "collection_update",
+                   "params": {"msg": "changed", "collection": "core.get_jobs", "id": job_id, "fields": fields}})
+
+    def start_job(self, method, states, delay=0.05):
+        """
+        A method that starts a job: returns its id, then publishes each {field: value} of states after delay.
+        """
+        def start(*params):
+            self.jobs += 1
+            job_id = 100 + self.jobs
+
+            def run():
+                for fields in states:
+                    time.sleep(delay)
+                    self.publish_job(job_id, id=job_id, method=method, **fields)
+
+            threading.Thread(target=run, daemon=True).start()
+            return job_id
+
+        self.methods[method] = start
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connection = connection
+            try:
+                self._handshake(connection)
+                self._receive(connection)
+            except (ConnectionError, OSError):
+                pass
+            finally:
+                connection.close()
+
+    def _handshake(self, connection):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            request += connection.recv(4096)
+        headers = dict(line.split(": ", 1) for line in request.decode().split("\r\n")[1:] if ": " in line)
+        key = {name.lower(): value for name, value in headers.items()}["sec-websocket-key"]
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        connection.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                            f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+
+    def _receive(self, connection):
+        while True:
+            opcode, payload = read_frame(connection)
+            if opcode == OPCODE_CLOSE:
+                with self.send_lock:
+                    connection.sendall(frame(OPCODE_CLOSE, payload[:2]))
+                return
+            if opcode == OPCODE_PING:
+                with self.send_lock:
+                    connection.sendall(frame(OPCODE_PONG, payload))
+            elif opcode == OPCODE_TEXT:
+                request = json.loads(payload)
+                self.calls.append((request["method"], request["params"]))
+                threading.Thread(target=self._answer, args=(request,), daemon=True).start()
+
+    def _answer(self, request):
+        method = self.methods.get(request["method"])
+        try:
+            if method is None:
+                raise CallError(-32601, f"Method {request['method']!r} not found")
+            reply = {"result": method(*request["params"])}
+        except CallError as e:
+            reply = {"error": {"code": e.code, "message": e.message,
+                               "data": {"reason": e.reason} if e.reason is not None else None}}
+        try:
+            self.send({"jsonrpc": "2.0", "id": request["id"], **reply})
+        except OSError:
+            pass
@@ -0,0 +1,242 @@
+"""
+Stand-in for the parts of a vCenter server that vCenter.Tasks, vCenter.Inventory and the migration pipelines talk
+to: a PropertyCollector with RetrieveContents / CreateFilter / WaitForUpdatesEx / DestroyPropertyCollector, VMs and
+hosts whose properties a test sets, and tasks that finish by themselves after a set time.  The managed object types
+come from pyVmomi; the update sets are plain objects with the attributes of pyVmomi's.
+"""
+
+import itertools
+import time
+from types import SimpleNamespace
+
+from pyVmomi import vim, vmodl
+
+POLL_SECONDS = 0.01
+CANCELED = "The task was canceled by a user."
+
+ids = itertools.count(1)
+
+
+class StandinTask(vim.Task):
+    """
+    Runs for duration seconds (None: until cancelled), then succeeds with result, or fails with error if given.
+    CancelTask() ends it in error, as vCenter does for a cancelable task.
+    """
+
+    def __init__(self, duration=0.0, result=None, error=None):
+        super().__init__(f"task-{next(ids)}")
+        self.started = time.monotonic()
+        self.duration = duration
+        self.outcome = result
+        self.failure = error
+        self.cancelled = False
+
+    def CancelTask(self):
+        self.cancelled = True
+        self.duration = time.monotonic() - self.started
+        self.failure = CANCELED
+
+    def properties(self):
+        """
+        Current values of the task properties TaskWaiter asks for.
+        """
+        if self.duration is None or time.monotonic() - self.started < self.duration:
+            return {"info.state": "running", "info.progress": None, "info.error": None, "info.result": None}
+        if self.failure:
+            return {"info.state": "error", "info.progress": None, "info.error": self.failure, "info.result": None}
+        return {"info.state": "success", "info.progress": 100, "info.error": None, "info.result": self.outcome}
+
+
+class StandinHost(vim.HostSystem):
+    """
+    A destination host for vim.vm.RelocateSpec.
+    """
+
+    def __init__(self, moid, name):
+        super().__init__(moid)
+        self.host_name = name
+
+    @property
+    def name(self):
+        return self.host_name
+
+
+class StandinVM(vim.VirtualMachine):
+    """
+    Records the task methods called on it; RelocateVM_Task fails with relocate_error if given and calls
+    on_relocate() first, for tests that change the inventory while a migration runs.
+    """
+
+    def __init__(self, moid="vm-1", relocate_error=None, duration=0.01, on_relocate=None):
+        super().__init__(moid)
+        self.relocate_error = relocate_error
+        self.duration = duration
+        self.on_relocate = on_relocate
+        self.calls = []
+
+    def _task(self, method, spec=None, error=None):
+        self.calls.append((method, spec))
+        return StandinTask(self.duration, error=error)
+
+    def PowerOffVM_Task(self):
+        return self._task("PowerOffVM_Task")
+
+    def PowerOnVM_Task(self):
+        return self._task("PowerOnVM_Task")
+
+    def ReconfigVM_Task(self, spec):
+        return self._task("ReconfigVM_Task", spec)
+
+    def RelocateVM_Task(self, spec):
+        if self.on_relocate:
+            self.on_relocate()
+        return self._task("RelocateVM_Task", spec, self.relocate_error)
+
+
+class StandinFilter:
+    """
+    A property filter on one task; reports the properties that changed since its last report.
+    """
+
+    def __init__(self, collector, task):
+        self.collector = collector
+        self.task = task
+        self.reported = {}
+
+    def DestroyPropertyFilter(self):
+        self.collector.filters.remove(self)
+
+    def update(self):
+        current = self.task.properties()
+        changes = [SimpleNamespace(name=name, op="assign",
+                                   val=vmodl.MethodFault(msg=value) if name == "info.error" and value else value)
+                   for name, value in current.items() if name not in self.reported or self.reported[name] != value]
+        kind = "modify" if self.reported else "enter"
+        self.reported = current
+        if not changes:
+            return None
+        return SimpleNamespace(filter=self, objectSet=[SimpleNamespace(kind=kind, obj=self.task, changeSet=changes)])
+
+
+class StandinView(vim.view.ContainerView):
+    def __init__(self):
+        super().__init__("session[standin]view-1")
+
+    def DestroyView(self):
+        pass
+
+
+class StandinInventoryFilter:
+    """
+    A property filter on every object of the server, as Inventory creates through its ContainerView.
+    """
+
+    def __init__(self, collector, objects):
+        self.collector = collector
+        self.objects = objects
+        self.reported = {}
+
+    def DestroyPropertyFilter(self):
+        self.collector.filters.remove(self)
+
+    def update(self):
+        object_updates = []
+        for obj, properties in self.objects.items():
+            before = self.reported.get(obj)
+            changes = [SimpleNamespace(name=name, op="assign", val=value) for name, value in properties.items()
+                       if before is None or name not in before or before[name] != value]
+            if changes:
+                object_updates.append(SimpleNamespace(kind="enter" if before is None else "modify", obj=obj,
+                                                      changeSet=changes))
+        object_updates += [SimpleNamespace(kind="leave", obj=obj, changeSet=[])
+                           for obj in self.reported if obj not in self.objects]
+        self.reported = {obj: dict(properties) for obj, properties in self.objects.items()}
+        return SimpleNamespace(filter=self, objectSet=object_updates) if object_updates else None
+
+
+class StandinCollector:
+    """
+    WaitForUpdatesEx returns as soon as any filter has changes, or None after maxWaitSeconds without any.
+    objects holds {managed object: {property path: value}} for RetrieveContents and inventory filters.
+    """
+
+    def __init__(self, objects=None):
+        self.objects = {} if objects is None else objects
+        self.filters = []
+        self.created = []
+        self.version = 0
+        self.waits = 0
+        self.destroyed = False
+
+    def CreatePropertyCollector(self):
+        collector = StandinCollector(self.objects)
+        self.created.append(collector)
+        return collector
+
+    def DestroyPropertyCollector(self):
+        self.destroyed = True
+
+    def CreateFilter(self, spec, partialUpdates):
+        [object_spec] = spec.objectSet
+        if isinstance(object_spec.obj, StandinView):
+            property_filter = StandinInventoryFilter(self, self.objects)
+        else:
+            property_filter = StandinFilter(self, object_spec.obj)
+        self.filters.append(property_filter)
+        return property_filter
+
+    def RetrieveContents(self, specs):
+        return [SimpleNamespace(obj=obj, propSet=[SimpleNamespace(name=name, val=value)
+                                                  for name, value in properties.items()])
+                for obj, properties in self.objects.items()]
+
+    def WaitForUpdatesEx(self, version, options):
+        self.waits += 1
+        deadline = time.monotonic() + options.maxWaitSeconds
+        while True:
+            updates = [update for update in (f.update() for f in self.filters) if update is not None]
+            if updates:
+                self.version += 1
+                return SimpleNamespace(version=str(self.version), filterSet=updates, truncated=False)
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_SECONDS)
+
+
+class StandinContent:
+    """
+    The ServiceContent TaskWaiter and Inventory are given.  collector() is the private PropertyCollector a
+    TaskWaiter created.  add_host() / add_vm() / set() change what the server reports.
+    """
+
+    def __init__(self):
+        self.propertyCollector = StandinCollector()
+        self.viewManager = SimpleNamespace(CreateContainerView=lambda folder, types, recursive: StandinView())
+        self.rootFolder = None
+
+    def collector(self):
+        [collector] = self.propertyCollector.created
+        return collector
+
+    def add_host(self, moid, name, memory_mb=262144, used_mb=0, passthru=()):
+        host = StandinHost(moid, name)
+        self.propertyCollector.objects[host] = {
+            "name": name, "parent": None, "runtime.connectionState": "connected", "runtime.inMaintenanceMode": False,
+            "summary.hardware.memorySize": memory_mb << 20, "summary.quickStats.overallMemoryUsage": used_mb,
+            "config.pciPassthruInfo": list(passthru)}
+        return host
+
+    def add_vm(self, vm, name, host, power_state="poweredOn", memory_mb=4096, devices=()):
+        self.propertyCollector.objects[vm] = {
+            "name": name, "runtime.powerState": power_state, "runtime.host": host,
+            "config.hardware.device": list(devices), "config.hardware.memoryMB": memory_mb, "config.template": False}
+        return vm
+
+    def set(self, obj, properties):
+        """
+        Change {property path: value} of a host or VM.
+        """
+        self.propertyCollector.objects[obj].update(properties)
+
+    def remove(self, obj):
+        del self.propertyCollector.objects[obj]
@@ -0,0 +1,154 @@
+"""
+Indexed VM and host inventory fetched in one PropertyCollector round trip.
+
+A recursive ContainerView over the root folder covers every datacenter and nested folder; one RetrieveContents
+call returns only the properties listed below for all VMs and hosts, instead of one SOAP call per attribute.
+Records are indexed by MoRef id, by name and by host.  refresh() keeps them current through a PropertyCollector
+filter: WaitForUpdatesEx with the last version returns only what changed since (the first refresh re-reads
+everything once to obtain a version).
+"""
+
+from pyVmomi import vim, vmodl
+
+VM_PROPERTIES = ["name", "runtime.powerState", "runtime.host", "config.hardware.device", "config.hardware.memoryMB",
+                 "config.template"]
+HOST_PROPERTIES = ["name", "parent", "runtime.connectionState", "runtime.inMaintenanceMode",
+                   "summary.hardware.memorySize", "summary.quickStats.overallMemoryUsage", "config.pciPassthruInfo"]
+PASSTHROUGH_DEVICES = (vim.vm.device.VirtualPCIPassthrough, vim.vm.device.VirtualSriovEthernetCard)
+
+
+class InventoryError(Exception):
+    pass
+
+
+def passthrough_devices(devices):
+    return [device for device in devices or [] if isinstance(device, PASSTHROUGH_DEVICES)]
+
+
+class Inventory:
+    """
+    Name -> MoRef indexes over all VMs and hosts.  Use as a context manager or call close().
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.view = content.viewManager.CreateContainerView(content.rootFolder,
+                                                            [vim.VirtualMachine, vim.HostSystem], recursive=True)
+        self.collector = content.propertyCollector
+        self.filter = None
+        self.version = ""
+        self.records = {}
+        self.vms_by_name = {}
+        self.hosts_by_name = {}
+        self.vms_by_host = {}
+        self.duplicates = set()
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for destroy in (self.filter and self.filter.DestroyPropertyFilter, self.view.DestroyView):
+            if destroy:
+                try:
+                    destroy()
+                except vmodl.MethodFault:
+                    pass
+        self.filter = None
+
+    def filter_spec(self):
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(name="traverseView", path="view", skip=False,
+                                                                 type=vim.view.ContainerView)
+        return vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=self.view, skip=True, selectSet=[traversal])],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=VM_PROPERTIES),
+                     vmodl.query.PropertyCollector.PropertySpec(type=vim.HostSystem, pathSet=HOST_PROPERTIES)])
+
+    def load(self):
+        """
+        (Re)build every record and index from one RetrieveContents call.
+        """
+        self.records.clear()
+        for object_content in self.collector.RetrieveContents([self.filter_spec()]):
+            properties = {prop.name: prop.val for prop in object_content.propSet or []}
+            self._store(object_content.obj, properties)
+        self._reindex()
+
+    def refresh(self):
+        """
+        Apply the changes since the last refresh.  Returns the number of objects that changed.
+        """
+        if self.filter is None:
+            self.filter = self.collector.CreateFilter(self.filter_spec(), partialUpdates=False)
+            self.version = ""
+            self.records.clear()
+        changed = 0
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0)
+        while True:
+            update = self.collector.WaitForUpdatesEx(self.version, options)
+            if update is None:
+                break
+            self.version = update.version
+            for filter_update in update.filterSet:
+                for object_update in filter_update.objectSet:
+                    changed += 1
+                    if object_update.kind == "leave":
+                        self.records.pop(object_update.obj._moId, None)
+                        continue
+                    record = self.records.get(object_update.obj._moId)
+                    properties = dict(record["properties"]) if record and object_update.kind == "modify" else {}
+                    for change in object_update.changeSet:
+                        properties[change.name] = None if change.op == "remove" else change.val
+                    self._store(object_update.obj, properties)
+            if not update.truncated:
+                break
+        if changed:
+            self._reindex()
+        return changed
+
+    def _store(self, obj, properties):
+        record = {"obj": obj, "name": properties.get("name"), "properties": properties}
+        if isinstance(obj, vim.VirtualMachine):
+            host = properties.get("runtime.host")
+            record.update(kind="vm", power_state=str(properties.get("runtime.powerState")),
+                          host=host._moId if host is not None else None,
+                          pci=passthrough_devices(properties.get("config.hardware.device")),
+                          memory_mb=properties.get("config.hardware.memoryMB") or 0,
+                          template=bool(properties.get("config.template")))
+        else:
+            parent = properties.get("parent")
+            record.update(kind="host", cluster=parent._moId if isinstance(parent, vim.ClusterComputeResource) else None,
+                          connected=str(properties.get("runtime.connectionState")) == "connected",
+                          maintenance=bool(properties.get("runtime.inMaintenanceMode")),
+                          memory_mb=(properties.get("summary.hardware.memorySize") or 0) // (1024 * 1024),
+                          used_mb=properties.get("summary.quickStats.overallMemoryUsage") or 0,
+                          passthru=list(properties.get("config.pciPassthruInfo") or []))
+        self.records[obj._moId] = record
+
+    def _reindex(self):
+        self.vms_by_name, self.hosts_by_name, self.vms_by_host, self.duplicates = {}, {}, {}, set()
+        for moid, record in self.records.items():
+            index = self.vms_by_name if record["kind"] == "vm" else self.hosts_by_name
+            if record["name"] in index:
+                self.duplicates.add((record["kind"], record["name"]))
+            index[record["name"]] = moid
+            if record["kind"] == "vm" and record["host"]:
+                self.vms_by_host.setdefault(record["host"], set()).add(moid)
+
+    def _lookup(self, kind, name, index):
+        if (kind, name) in self.duplicates:
+            raise InventoryError(f"{kind} name '{name}' is not unique")
+        moid = index.get(name)
+        return self.records[moid] if moid is not None else None
+
+    def vm(self, name):
+        return self._lookup("vm", name, self.vms_by_name)
+
+    def host(self, name):
+        return self._lookup("host", name, self.hosts_by_name)
+
+    def vms_on_host(self, host_moid):
+        return [self.records[moid] for moid in sorted(self.vms_by_host.get(host_moid, ()))]
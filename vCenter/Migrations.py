@@ -0,0 +1,95 @@
+"""
+Plan and limit batches of VM migrations.
+
+plan_destinations() places each VM on the candidate host with the most free memory that still fits it, largest
+VMs first, preferring hosts in the VM's current cluster; every placement is subtracted from the host's free
+memory before the next VM is placed.  With a PassthroughIndex only hosts with free passthrough devices / VFs for
+the VM qualify, and VMs with such devices are placed before the others.
+
+MigrationLimits supplies the admit/release callbacks of run_pipelines() so that no host (as source or destination)
+and no cluster runs more than its share of migrations at once.
+"""
+
+from vCenter.Inventory import InventoryError
+
+MAX_PER_HOST = 2
+MAX_PER_CLUSTER = 4
+
+
+def free_memory_mb(host):
+    return host["memory_mb"] - host["used_mb"]
+
+
+def candidate_hosts(inventory, names=None, exclude=()):
+    """
+    Connected hosts outside maintenance mode: the named ones, or every host except the excluded moIds.
+    """
+    if names:
+        hosts = [inventory.host(name) for name in names]
+        missing = [name for name, host in zip(names, hosts) if host is None]
+        if missing:
+            raise InventoryError(f"host(s) not found: {', '.join(missing)}")
+    else:
+        hosts = [record for record in inventory.records.values() if record["kind"] == "host"]
+    return [host for host in hosts
+            if host["connected"] and not host["maintenance"] and host["obj"]._moId not in exclude]
+
+
+def plan_destinations(vms, hosts, inventory, passthrough=None):
+    """
+    Returns ({vm name: destination host record}, {vm name: reason it could not be placed}).
+    """
+    free = {host["obj"]._moId: free_memory_mb(host) for host in hosts}
+    placements, unplaced = {}, {}
+    for vm in sorted(vms, key=lambda record: (not record["pci"], -record["memory_mb"])):
+        source = inventory.records.get(vm["host"])
+        cluster = source["cluster"] if source else None
+        allowed = passthrough.hosts_for(vm) if passthrough else None
+        if allowed is not None and not allowed - {vm["host"]}:
+            unplaced[vm["name"]] = "no host with free passthrough devices / virtual functions for it"
+            continue
+        fitting = [host for host in hosts
+                   if host["obj"]._moId != vm["host"] and free[host["obj"]._moId] >= vm["memory_mb"]
+                   and (allowed is None or host["obj"]._moId in allowed)]
+        if not fitting:
+            unplaced[vm["name"]] = f"no host with {vm['memory_mb']} MB free"
+            continue
+        best = max(fitting, key=lambda host: (cluster is not None and host["cluster"] == cluster,
+                                              free[host["obj"]._moId]))
+        free[best["obj"]._moId] -= vm["memory_mb"]
+        if passthrough:
+            passthrough.move(vm, vm["host"], best["obj"]._moId)
+        placements[vm["name"]] = best
+    return placements, unplaced
+
+
+class MigrationLimits:
+    """
+    Counts running migrations per host and per cluster.  register() every migration before run_pipelines().
+    """
+
+    def __init__(self, inventory, max_per_host=MAX_PER_HOST, max_per_cluster=MAX_PER_CLUSTER):
+        self.inventory = inventory
+        self.max_per_host = max_per_host
+        self.max_per_cluster = max_per_cluster
+        self.migrations = {}
+        self.running = {}
+
+    def register(self, name, source_moid, destination_moid):
+        hosts = {moid for moid in (source_moid, destination_moid) if moid}
+        clusters = {self.inventory.records[moid]["cluster"] for moid in hosts if moid in self.inventory.records}
+        self.migrations[name] = [("host", moid) for moid in hosts] + [("cluster", c) for c in clusters if c]
+
+    def admit(self, name):
+        slots = self.migrations.get(name, [])
+        for kind, key in slots:
+            limit = self.max_per_host if kind == "host" else self.max_per_cluster
+            if self.running.get((kind, key), 0) >= limit:
+                return False
+        for slot in slots:
+            self.running[slot] = self.running.get(slot, 0) + 1
+        return True
+
+    def release(self, name):
+        for slot in self.migrations.get(name, []):
+            self.running[slot] -= 1
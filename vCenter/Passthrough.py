@@ -0,0 +1,120 @@
+"""
+Free passthrough devices and SR-IOV virtual functions per host, and which hosts can take a VM's devices.
+
+Built from each host's config.pciPassthruInfo and the devices of the VMs powered on there (assignments are made at
+power-on).  A VM needs
+
+    ("pci", id)     its DirectPath device: the destination must have an active passthrough device at the same PCI
+                    address that no running VM holds, because the pipeline re-adds the same backing
+    ("vf", pf id)   one virtual function per SR-IOV NIC on that physical function (address); ("vf", None) for
+                    cards that let vSphere pick the PF
+
+The capacity is kept as {requirement: {host moId: free count}}.  hosts_for() caches the fitting hosts per
+requirement set; a booking changes one host's count for a few requirements, so it re-checks only that host in the
+cached sets containing them instead of dropping the cache, and placing hundreds of VMs does not rescan the hosts.
+Dynamic DirectPath devices (matched by vendor/device id at power-on) are not indexed.
+"""
+
+from collections import Counter
+
+from pyVmomi import vim
+
+
+def device_requirements(vm_record):
+    """
+    Counter of the ("pci", id) / ("vf", pf id) a VM's passthrough devices need.
+    """
+    needs = Counter()
+    for device in vm_record["pci"]:
+        if isinstance(device, vim.vm.device.VirtualSriovEthernetCard):
+            backing = getattr(getattr(device, "sriovBacking", None), "physicalFunctionBacking", None)
+            needs[("vf", getattr(backing, "id", None))] += 1
+        else:
+            device_id = getattr(device.backing, "id", None)
+            if device_id:
+                needs[("pci", device_id)] += 1
+    return needs
+
+
+def describe_requirement(requirement):
+    kind, device_id = requirement
+    if kind == "pci":
+        return f"passthrough device {device_id}"
+    return f"virtual function on {device_id}" if device_id else "virtual function"
+
+
+class PassthroughIndex:
+    def __init__(self, inventory):
+        self.capacity = {}
+        self.cache = {}
+        self.cached_sets = {}
+        for record in inventory.records.values():
+            if record["kind"] == "host":
+                self._add_host(record)
+        for record in inventory.records.values():
+            if record["kind"] == "vm" and record["host"] and record["power_state"] == "poweredOn":
+                self._take(device_requirements(record), record["host"])
+
+    def _add_host(self, host):
+        moid = host["obj"]._moId
+        for info in host["passthru"]:
+            if isinstance(info, vim.host.SriovInfo) and info.sriovEnabled:
+                functions = info.numVirtualFunction or 0
+                self._adjust(("vf", info.id), moid, functions)
+                self._adjust(("vf", None), moid, functions)
+            elif info.passthruActive:
+                self._adjust(("pci", info.id), moid, 1)
+
+    def _adjust(self, requirement, host_moid, delta):
+        hosts = self.capacity.setdefault(requirement, {})
+        hosts[host_moid] = hosts.get(host_moid, 0) + delta
+        for signature in self.cached_sets.get(requirement, ()):
+            if self._fits(signature, host_moid):
+                self.cache[signature].add(host_moid)
+            else:
+                self.cache[signature].discard(host_moid)
+
+    def _fits(self, signature, host_moid):
+        return all(self.capacity.get(requirement, {}).get(host_moid, 0) >= count for requirement, count in signature)
+
+    def _take(self, needs, host_moid, sign=-1):
+        for requirement, count in needs.items():
+            self._adjust(requirement, host_moid, sign * count)
+            if requirement[0] == "vf" and requirement[1] is not None:
+                # A VF on a named PF also comes out of the host's "any PF" pool
+                self._adjust(("vf", None), host_moid, sign * count)
+
+    def hosts_for(self, vm_record):
+        """
+        moIds of the hosts with enough free devices / VFs for the VM (None: the VM has no passthrough devices).
+        The set is kept up to date by later bookings; copy it to keep a snapshot.
+        """
+        needs = device_requirements(vm_record)
+        if not needs:
+            return None
+        signature = frozenset(needs.items())
+        if signature not in self.cache:
+            hosts = None
+            for requirement, count in needs.items():
+                fitting = {moid for moid, free in self.capacity.get(requirement, {}).items() if free >= count}
+                hosts = fitting if hosts is None else hosts & fitting
+            self.cache[signature] = hosts
+            for requirement in needs:
+                self.cached_sets.setdefault(requirement, []).append(signature)
+        return self.cache[signature]
+
+    def missing(self, vm_record, host_moid):
+        """
+        Descriptions of the requirements the host cannot meet (empty if the VM fits).
+        """
+        return [describe_requirement(requirement) for requirement, count in device_requirements(vm_record).items()
+                if self.capacity.get(requirement, {}).get(host_moid, 0) < count]
+
+    def move(self, vm_record, source_moid, destination_moid):
+        """
+        Book the VM's devices on the destination (and free them on the source if it was running there).
+        """
+        needs = device_requirements(vm_record)
+        if source_moid and vm_record["power_state"] == "poweredOn":
+            self._take(needs, source_moid, sign=1)
+        self._take(needs, destination_moid)
@@ -0,0 +1,221 @@
+"""
+Wait for vSphere tasks through a PropertyCollector instead of polling task.info.
+
+Every task gets a filter on one private PropertyCollector; a single WaitForUpdatesEx call then reports state
+and progress changes for all of them, so a hundred running tasks cost one outstanding request, not a hundred
+polls.  Each task has its own deadline; a task that misses it is cancelled (best effort) and reported as
+timed out.
+
+run_pipelines() drives per-VM step sequences written as generators: a pipeline yields (label, task[, timeout])
+and is resumed with the task's result once it finishes, or has a TaskError thrown into it when it fails.  All
+pipelines advance concurrently, each step starting as soon as the previous one of the same VM completed.
+"""
+
+import time
+
+from pyVmomi import vim, vmodl
+
+TASK_PROPERTIES = ["info.state", "info.progress", "info.error", "info.result"]
+DONE_STATES = ("success", "error")
+DEFAULT_TIMEOUT = 600
+
+
+class TaskError(Exception):
+    """
+    A task ended in error or did not finish in time.
+    """
+
+    def __init__(self, label, message, timed_out=False):
+        super().__init__(f"{label}: {message}")
+        self.label = label
+        self.timed_out = timed_out
+
+
+def print_progress(label, progress):
+    print(f"  {label}: {progress}%")
+
+
+class TaskWaiter:
+    """
+    Tracks any number of tasks on one PropertyCollector.  Use as a context manager or call close().
+    """
+
+    def __init__(self, content, default_timeout=DEFAULT_TIMEOUT, max_wait_seconds=5, progress=print_progress):
+        self.collector = content.propertyCollector.CreatePropertyCollector()
+        self.default_timeout = default_timeout
+        self.max_wait_seconds = max_wait_seconds
+        self.progress = progress
+        self.version = ""
+        self.pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for entry in self.pending.values():
+            self._destroy_filter(entry)
+        self.pending.clear()
+        try:
+            self.collector.DestroyPropertyCollector()
+        except vmodl.MethodFault:
+            pass
+
+    def add(self, task, label, timeout=None, key=None):
+        """
+        Start tracking a task.  key (default label) identifies it in the results of wait_any().
+        """
+        spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=task)],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=TASK_PROPERTIES)])
+        started = time.monotonic()
+        self.pending[task._moId] = {
+            "task": task, "label": label, "key": label if key is None else key,
+            "filter": self.collector.CreateFilter(spec, partialUpdates=True),
+            "started": started, "deadline": started + (timeout or self.default_timeout),
+            "state": None, "progress": None, "error": None, "result": None,
+        }
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _destroy_filter(self, entry):
+        try:
+            entry["filter"].DestroyPropertyFilter()
+        except vmodl.MethodFault:
+            pass
+
+    def _apply(self, update):
+        for filter_update in update.filterSet:
+            for object_update in filter_update.objectSet:
+                entry = self.pending.get(object_update.obj._moId)
+                if entry is None:
+                    continue
+                for change in object_update.changeSet:
+                    if change.name == "info.state":
+                        entry["state"] = str(change.val)
+                    elif change.name == "info.progress":
+                        if change.val is not None and change.val != entry["progress"] and self.progress:
+                            self.progress(entry["label"], change.val)
+                        entry["progress"] = change.val
+                    elif change.name == "info.error":
+                        entry["error"] = change.val.msg if change.val is not None else None
+                    elif change.name == "info.result":
+                        entry["result"] = change.val
+
+    def _finished(self):
+        """
+        Remove and return the entries that succeeded, failed or ran out of time.
+        """
+        now = time.monotonic()
+        finished = []
+        for task_id, entry in list(self.pending.items()):
+            if entry["state"] in DONE_STATES:
+                pass
+            elif now >= entry["deadline"]:
+                entry["state"] = "timeout"
+                entry["error"] = f"did not finish within {entry['deadline'] - entry['started']:.0f}s"
+                try:
+                    entry["task"].CancelTask()
+                except vmodl.MethodFault:
+                    pass  # Not cancelable; it keeps running on the server
+            else:
+                continue
+            entry["seconds"] = now - entry["started"]
+            self._destroy_filter(entry)
+            del self.pending[task_id]
+            finished.append(entry)
+        return finished
+
+    def wait_any(self):
+        """
+        Block until at least one task finished (or timed out) and return the finished entries:
+        dicts with key, label, state ("success", "error" or "timeout"), result, error and seconds.
+        """
+        while self.pending:
+            finished = self._finished()
+            if finished:
+                return finished
+            next_deadline = min(entry["deadline"] for entry in self.pending.values())
+            wait = max(1, min(self.max_wait_seconds, int(next_deadline - time.monotonic()) + 1))
+            options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=wait)
+            update = self.collector.WaitForUpdatesEx(self.version, options)
+            if update is not None:
+                self.version = update.version
+                self._apply(update)
+        return []
+
+    def wait_all(self, tasks, timeout=None):
+        """
+        Wait for {label: task}.  Returns {label: entry} once every one of them finished.
+        """
+        for label, task in tasks.items():
+            self.add(task, label, timeout)
+        results = {}
+        while len(results) < len(tasks):
+            for entry in self.wait_any():
+                results[entry["key"]] = entry
+        return results
+
+
+def run_pipelines(waiter, pipelines, admit=None, release=None):
+    """
+    Run {name: generator} concurrently.  A generator yields (label, task) or (label, task, timeout) and gets
+    the task's result back, or a TaskError thrown in on failure.
+
+    admit(name) -> bool may hold a pipeline back (e.g. to limit concurrent migrations); held pipelines are
+    retried whenever another one finishes, and release(name) is called when a pipeline ends.
+    Returns {name: {"ok", "error", "steps": [(label, state, seconds)], "seconds"}}.
+    """
+    results = {name: {"ok": None, "error": None, "steps": [], "started": None, "seconds": None}
+               for name in pipelines}
+    waiting = list(pipelines)
+
+    def finish(name, error=None):
+        result = results[name]
+        result["ok"] = error is None
+        result["error"] = None if error is None else str(error)
+        result["seconds"] = time.monotonic() - result["started"]
+        if release:
+            release(name)
+
+    def advance(name, value=None, error=None):
+        generator = pipelines[name]
+        try:
+            step = generator.throw(error) if error is not None else generator.send(value)
+        except StopIteration:
+            finish(name)
+            return
+        except Exception as e:  # A failed step that the pipeline did not handle ends only this pipeline
+            finish(name, e)
+            return
+        label, task, timeout = (tuple(step) + (None,))[:3]
+        waiter.add(task, label, timeout, key=(name, label))
+
+    def start_admitted():
+        for name in list(waiting):
+            if admit is None or admit(name):
+                waiting.remove(name)
+                results[name]["started"] = time.monotonic()
+                advance(name)
+
+    start_admitted()
+    while len(waiter) or waiting:
+        if not len(waiter):
+            # Nothing running and the rest cannot be admitted: report them instead of waiting forever
+            for name in waiting:
+                results[name].update(ok=False, error="not admitted", seconds=0)
+            break
+        for entry in waiter.wait_any():
+            name, label = entry["key"]
+            results[name]["steps"].append((label, entry["state"], entry["seconds"]))
+            if entry["state"] == "success":
+                advance(name, entry["result"])
+            else:
+                advance(name, error=TaskError(label, entry["error"], timed_out=entry["state"] == "timeout"))
+        start_admitted()
+    for result in results.values():
+        del result["started"]
+    return results
@@ -0,0 +1,8 @@
+"""
+vCenter helpers used by vSphere.py.  Requires pyVmomi.
+
+    Inventory   VM and host records for the whole vCenter from one RetrieveContents call, indexed by name
+    Migrations  destination planning by free memory and per-host/per-cluster migration limits
+    Passthrough free passthrough devices / SR-IOV VFs per host and the hosts that can take a VM's devices
+    Tasks       wait for many tasks at once and chain them into per-VM pipelines
+"""
@@ -1,13 +1,21 @@
+import argparse
 import json
 import os
 import ssl
+import sys
+
 from pyVim import connect
 from pyVmomi import vim
 
+from vCenter.Inventory import Inventory, InventoryError
+from vCenter.Migrations import MAX_PER_CLUSTER, MAX_PER_HOST, MigrationLimits, candidate_hosts, plan_destinations
+from vCenter.Passthrough import PassthroughIndex
+from vCenter.Tasks import TaskError, TaskWaiter, print_progress, run_pipelines
+
 # Path to Options.json
 options_file = "Options.json"
 
-# Required fields for vsphere.options
+# Required fields for vsphere.options (vm_name and host_name only when no batch is given on the command line)
 required_vsphere_fields = [
     "vcenter",
     "username",
@@ -16,123 +24,247 @@ required_vsphere_fields = [
     "host_name"
 ]
 
-# Load Options.json
-if not os.path.exists(options_file):
-    print(f"{options_file} not found!")
-    exit(1)
-
-with open(options_file, "r") as file:
-    options = json.load(file)
-
-# Validate that all required fields exist, prompt user for missing ones (without saving to file)
-if "vsphere" not in options or "options" not in options["vsphere"]:
-    print("Missing 'vsphere.options' in Options.json!")
-    exit(1)
-
-vsphere_options = options["vsphere"]["options"]
-for field in required_vsphere_fields:
-    if field not in vsphere_options:
-        user_input = input(f"Enter value for '{field}': ")
-        vsphere_options[field] = user_input  # Temporarily populate missing values
-
-# Assign variables from Options.json or user input
-vcenter = vsphere_options["vcenter"]
-username = vsphere_options["username"]
-password = vsphere_options["password"]
-vm_name = vsphere_options["vm_name"]
-host_name = vsphere_options["host_name"]
-
-# Disable SSL warnings (for self-signed certificates)
-context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-context.verify_mode = ssl.CERT_NONE
-
-# Connect to vCenter Server
-try:
-    service_instance = connect.SmartConnect(host=vcenter, user=username, pwd=password, sslContext=context)
-    content = service_instance.content
+# Seconds each step may take before it is cancelled and the migration reported as failed
+TASK_TIMEOUTS = {
+    "power off": 300,
+    "remove PCI device": 300,
+    "relocate": 3600,
+    "re-add PCI device": 300,
+    "power on": 300,
+}
+
+
+def load_vsphere_options(required_fields=required_vsphere_fields):
+    """
+    Read vsphere.options from Options.json, prompting for missing fields (without saving them).
+    """
+    if not os.path.exists(options_file):
+        print(f"{options_file} not found!")
+        sys.exit(1)
+
+    with open(options_file, "r") as file:
+        options = json.load(file)
+
+    if "vsphere" not in options or "options" not in options["vsphere"]:
+        print("Missing 'vsphere.options' in Options.json!")
+        sys.exit(1)
+
+    vsphere_options = options["vsphere"]["options"]
+    for field in required_fields:
+        if field not in vsphere_options:
+            vsphere_options[field] = input(f"Enter value for '{field}': ")
+    return vsphere_options
+
+
+def connect_vcenter(vcenter, username, password):
+    # Disable SSL verification (for self-signed certificates)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    try:
+        service_instance = connect.SmartConnect(host=vcenter, user=username, pwd=password, sslContext=context)
+    except Exception as e:
+        print(f"Failed to connect to vCenter: {e}")
+        sys.exit(1)
     print("Connected to vCenter Server!")
-except Exception as e:
-    print(f"Failed to connect to vCenter: {e}")
-    exit(1)
-
-# Locate the VM
-vm = None
-for child in content.rootFolder.childEntity:
-    datacenter = child
-    vm_folder = datacenter.vmFolder
-    vm_list = vm_folder.childEntity
-    for v in vm_list:
-        if v.name == vm_name:
-            vm = v
-            break
-
-if not vm:
-    print(f"VM '{vm_name}' not found!")
-    connect.Disconnect(service_instance)
-    exit(1)
-
-# Power off the VM
-if vm.runtime.powerState == vim.VirtualMachinePowerState.poweredOn:
-    print(f"Powering off VM: {vm_name}")
-    task = vm.PowerOffVM_Task()
-    task_result = task.info.state
-    if task_result == "success":
-        print("VM Powered Off")
-    else:
-        print(f"Failed to power off the VM: {task_result}")
-
-# Remove PCI passthrough device
-print("Removing PCI passthrough devices...")
-pci_device = None
-for device in vm.config.hardware.device:
-    if isinstance(device, vim.vm.device.VirtualPCIController):
-        pci_device = device
-        break
-
-if pci_device:
-    device_spec = vim.vm.device.VirtualDeviceSpec()
-    device_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.remove
-    device_spec.device = pci_device
+    return service_instance
 
-    spec = vim.vm.ConfigSpec()
-    spec.deviceChange = [device_spec]
-
-    task = vm.ReconfigVM_Task(spec=spec)
-    print("PCI passthrough device removed.")
-
-# Perform migration (if needed)
-host = None
-host_list = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], recursive=True).view
-for h in host_list:
-    if h.name == host_name:
-        host = h
-        break
-
-if host:
-    print(f"Migrating VM to host: {host_name}")
-    relocate_spec = vim.vm.RelocateSpec(host=host)
-    task = vm.RelocateVM_Task(spec=relocate_spec)
-    print("Migration completed.")
-else:
-    print(f"Host '{host_name}' not found! Skipping migration.")
-
-# Add the PCI passthrough device back
-if pci_device:
-    print("Re-adding PCI passthrough device...")
-    device_spec = vim.vm.device.VirtualDeviceSpec()
-    device_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
-    device_spec.device = pci_device
 
+def device_change(devices, operation):
     spec = vim.vm.ConfigSpec()
-    spec.deviceChange = [device_spec]
-    task = vm.ReconfigVM_Task(spec=spec)
-    print("PCI passthrough device re-added.")
-
-# Power on the VM
-print("Powering on VM...")
-task = vm.PowerOnVM_Task()
-print("VM Powered On")
-
-# Disconnect from vCenter
-connect.Disconnect(service_instance)
-print("Disconnected from vCenter Server.")
\ No newline at end of file
+    spec.deviceChange = []
+    for device in devices:
+        device_spec = vim.vm.device.VirtualDeviceSpec()
+        device_spec.operation = operation
+        device_spec.device = device
+        spec.deviceChange.append(device_spec)
+    return spec
+
+
+def step(label, task):
+    return label, task, TASK_TIMEOUTS[label]
+
+
+def migrate_pipeline(vm_record, host):
+    """
+    Power off -> remove PCI device -> relocate -> re-add PCI device -> power on, each step started when the
+    previous task finished.  The device is re-added even if the relocation fails.  Only a VM this pipeline
+    powered off is powered on again; one that was off (e.g. on a host being evacuated) stays off.
+    vm_record comes from the Inventory; its "pci" entries are the passthrough and SR-IOV devices.
+    """
+    vm, name = vm_record["obj"], vm_record["name"]
+    was_on = vm_record["power_state"] == vim.VirtualMachinePowerState.poweredOn
+    if was_on:
+        print(f"{name}: Powering off VM")
+        yield step("power off", vm.PowerOffVM_Task())
+        print(f"{name}: VM Powered Off")
+
+    pci_devices = vm_record["pci"]
+    if pci_devices:
+        print(f"{name}: Removing {len(pci_devices)} PCI passthrough device(s)...")
+        yield step("remove PCI device", vm.ReconfigVM_Task(
+            spec=device_change(pci_devices, vim.vm.device.VirtualDeviceSpec.Operation.remove)))
+        print(f"{name}: PCI passthrough devices removed.")
+
+    relocate_error = None
+    if host:
+        print(f"{name}: Migrating VM to host: {host.name}")
+        try:
+            yield step("relocate", vm.RelocateVM_Task(spec=vim.vm.RelocateSpec(host=host)))
+            print(f"{name}: Migration completed.")
+        except TaskError as e:
+            relocate_error = e
+            print(f"{name}: Migration failed: {e}")
+
+    if pci_devices:
+        print(f"{name}: Re-adding PCI passthrough devices...")
+        yield step("re-add PCI device", vm.ReconfigVM_Task(
+            spec=device_change(pci_devices, vim.vm.device.VirtualDeviceSpec.Operation.add)))
+        print(f"{name}: PCI passthrough devices re-added.")
+
+    if was_on:
+        print(f"{name}: Powering on VM...")
+        yield step("power on", vm.PowerOnVM_Task())
+        print(f"{name}: VM Powered On")
+    if relocate_error:
+        raise relocate_error
+
+
+def admitted_pipeline(inventory, name, host):
+    """
+    migrate_pipeline() for the VM as it is when its migration is admitted: a VM held back by the limits may have
+    been powered off or moved in the meantime, and the destination may have left service.
+    """
+    inventory.refresh()
+    vm_record = inventory.vm(name)
+    if vm_record is None:
+        raise InventoryError(f"VM '{name}' no longer exists")
+    if host:
+        host_record = inventory.records.get(host._moId)
+        if host_record is None or not host_record["connected"] or host_record["maintenance"]:
+            raise InventoryError(f"host '{host.name}' is no longer connected and out of maintenance mode")
+    yield from migrate_pipeline(vm_record, host)
+
+
+def print_report(plan, results):
+    for name, host in plan.items():
+        result = results[name]
+        status = "ok" if result["ok"] else "FAILED"
+        print(f"{name} -> {host.name if host else '(same host)'}: {status} in {result['seconds'] or 0:.1f}s")
+        for label, state, seconds in result["steps"]:
+            print(f"  {label:<18} {state:<8} {seconds:6.1f}s")
+        if not result["ok"]:
+            print(f"  error: {result['error']}")
+
+
+def run_batch(content, inventory, plan, max_per_host, max_per_cluster):
+    """
+    Migrate {vm name: destination HostSystem (or None)} concurrently within the host/cluster limits.
+    A failed VM does not stop the others, and each migration starts from the inventory as refreshed when it is
+    admitted.  Returns the run_pipelines() results.
+    """
+    limits = MigrationLimits(inventory, max_per_host, max_per_cluster)
+    pipelines = {}
+    for name, host in plan.items():
+        vm_record = inventory.vm(name)
+        limits.register(name, vm_record["host"], host._moId if host else None)
+        pipelines[name] = admitted_pipeline(inventory, name, host)
+    # Interleaved progress lines of many VMs are noise; the report at the end has the timings
+    with TaskWaiter(content, progress=print_progress if len(plan) == 1 else None) as waiter:
+        return run_pipelines(waiter, pipelines, admit=limits.admit, release=limits.release)
+
+
+def batch_plan(inventory, vm_names, from_hosts, to_hosts):
+    """
+    Destinations for the named VMs and every (non-template) VM on the source hosts.
+    Returns ({vm name: HostSystem}, {vm name: reason it is skipped}).
+    """
+    vms, skipped = {}, {}
+    for name in vm_names:
+        record = inventory.vm(name)
+        if record is None:
+            skipped[name] = "not found"
+        else:
+            vms[name] = record
+    sources = set()
+    for host_name in from_hosts:
+        host = inventory.host(host_name)
+        if host is None:
+            raise InventoryError(f"host '{host_name}' not found")
+        sources.add(host["obj"]._moId)
+        for record in inventory.vms_on_host(host["obj"]._moId):
+            if record["template"]:
+                continue
+            vms.setdefault(record["name"], record)
+    placements, unplaced = plan_destinations(list(vms.values()), candidate_hosts(inventory, to_hosts, sources),
+                                             inventory, PassthroughIndex(inventory))
+    skipped.update(unplaced)
+    return {name: host["obj"] for name, host in placements.items()}, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate PCI passthrough VMs between hosts.")
+    parser.add_argument("--vm", action="append", default=[], help="VM to migrate (repeatable)")
+    parser.add_argument("--from-host", action="append", default=[], help="Migrate every VM off this host (repeatable)")
+    parser.add_argument("--to-host", action="append", default=[],
+                        help="Allowed destination (repeatable; default every connected host not in maintenance)")
+    parser.add_argument("--max-per-host", type=int, help=f"Concurrent migrations per host (default {MAX_PER_HOST})")
+    parser.add_argument("--max-per-cluster", type=int,
+                        help=f"Concurrent migrations per cluster (default {MAX_PER_CLUSTER})")
+    parser.add_argument("--dry-run", action="store_true", help="Print the batch plan without migrating")
+    args = parser.parse_args()
+
+    batch = bool(args.vm or args.from_host)
+    vsphere_options = load_vsphere_options(required_vsphere_fields[:3] if batch else required_vsphere_fields)
+    max_per_host = args.max_per_host or vsphere_options.get("max_per_host", MAX_PER_HOST)
+    max_per_cluster = args.max_per_cluster or vsphere_options.get("max_per_cluster", MAX_PER_CLUSTER)
+
+    service_instance = connect_vcenter(vsphere_options["vcenter"], vsphere_options["username"],
+                                       vsphere_options["password"])
+    content = service_instance.content
+    try:
+        with Inventory(content) as inventory:
+            if batch:
+                plan, skipped = batch_plan(inventory, args.vm, args.from_host, args.to_host)
+                for name, host in plan.items():
+                    print(f"Plan: {name} -> {host.name}")
+                for name, reason in skipped.items():
+                    print(f"Skipped: {name}: {reason}")
+            else:
+                vm_name = vsphere_options["vm_name"]
+                host_name = vsphere_options["host_name"]
+                vm_record = inventory.vm(vm_name)
+                host_record = inventory.host(host_name)
+                if not vm_record:
+                    print(f"VM '{vm_name}' not found!")
+                    sys.exit(1)
+                host = host_record["obj"] if host_record else None
+                if not host:
+                    print(f"Host '{host_name}' not found! Skipping migration.")
+                elif host._moId != vm_record["host"]:
+                    # Check before anything is powered off: the devices must be free on the destination
+                    missing = PassthroughIndex(inventory).missing(vm_record, host._moId)
+                    if missing:
+                        print(f"Host '{host_name}' cannot take the VM's devices, no free {', '.join(missing)}")
+                        sys.exit(1)
+                plan, skipped = {vm_name: host}, {}
+
+            if args.dry_run or not plan:
+                sys.exit(1 if skipped else 0)
+            results = run_batch(content, inventory, plan, max_per_host, max_per_cluster)
+        print_report(plan, results)
+        failed = [name for name, result in results.items() if not result["ok"]]
+        if failed or skipped:
+            print(f"{len(plan) - len(failed)}/{len(plan) + len(skipped)} VM(s) migrated")
+            sys.exit(1)
+    except InventoryError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        # Disconnect from vCenter
+        connect.Disconnect(service_instance)
+        print("Disconnected from vCenter Server.")
+
+
+if __name__ == "__main__":
+    main()